@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+'''
+Micro benchmark of the base board hex codec
+
+Encodes and decodes a 255 byte spi_loopback transfer with the previous per byte
+Python loops and with the bulk bytes.hex()/bytes.fromhex() path now used by
+Base_Board_Rev3. Reports time per transfer and the peak memory traced while
+handling one transfer. No hardware or serial port is needed.
+'''
+
+# ArgParse for parsing the benchmark settings
+import argparse
+
+import random
+import time
+import tracemalloc
+
+# the main classes here
+from uMux_IF_Chain.base_board import base_board_rev3
+
+def legacy_encode(chip_select, data_array):
+    # Copy of the per byte path that Base_Board_Rev3 used before the bulk codec
+    for i in data_array:
+        if(type(i) != int):
+            raise TypeError('Type in the list must be integer')
+        if(i < 0):
+            raise ValueError('negative')
+        if(i > 255):
+            raise ValueError('above 255')
+    data_adjust = [0x00] * len(data_array)
+    for i in range(len(data_array)):
+        data_adjust[i] = data_array[i]
+    data_str = ''
+    for i in data_adjust:
+        data_str = data_str + hex(i)[2:].rjust(2,'0').upper()
+    nbytes_str = hex(len(data_array))[2:].rjust(2,'0')
+    cs_str = hex(chip_select)[2:].rjust(2,'0')
+    return 'SPI:WRITE_READ:' + cs_str + "," + nbytes_str + ',' + data_str
+
+def legacy_decode(data):
+    nBytes = int((len(data))/2)
+    ret_array = [int(0)] * nBytes
+    data2 = [data[i:i + 2] for i in range(0, len(data), 2)]
+    for i in range(len(ret_array)):
+        ret_array[i] = int(data2[i], base=16)
+    return ret_array
+
+def bulk_encode(bb, chip_select, data_array):
+    # Same steps as Base_Board_Rev3.spi_write_read_nowait() up to the submit
+    data = bb._to_bytes(data_array)
+    return 'SPI:WRITE_READ:%02x,%02x,%s' % (chip_select, len(data), data.hex().upper())
+
+def measure(name, encode, decode, payload, reply, n_iter):
+    start = time.perf_counter()
+    for i in range(n_iter):
+        encode(payload)
+        decode(reply)
+    per_xfer = (time.perf_counter() - start) / n_iter
+
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    base = tracemalloc.get_traced_memory()[0]
+    encode(payload)
+    decode(reply)
+    peak = tracemalloc.get_traced_memory()[1] - base
+    tracemalloc.stop()
+    print("\t{:>28} : {:8.2f} us/transfer   peak {:6d} bytes/transfer".format(name, per_xfer * 1e6, peak))
+    return per_xfer
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--num_iter", help="Transfers per measurement", type=int, default=20000)
+    parser.add_argument("-b", "--nbytes", help="Transfer size in bytes", type=int, default=255)
+    args = parser.parse_args()
+
+    # The codec methods do not touch the serial port, skip __init__ so no port is opened
+    bb = base_board_rev3.Base_Board_Rev3.__new__(base_board_rev3.Base_Board_Rev3)
+    bb.return_bytes = False
+
+    payload_list = [random.randint(0, 255) for p in range(args.nbytes)]
+    payload_bytes = bytearray(payload_list)
+    reply = bytes(payload_bytes).hex().upper()
+
+    print("Hex codec benchmark, {} byte spi_loopback transfer".format(args.nbytes))
+    legacy = measure("legacy list", lambda d: legacy_encode(0x1, d), legacy_decode, payload_list, reply, args.num_iter)
+    bulk_list = measure("bulk list", lambda d: bulk_encode(bb, 0x1, d), bb._strHexToByteArray, payload_list, reply, args.num_iter)
+    bulk_bytes = measure("bulk bytearray", lambda d: bulk_encode(bb, 0x1, d), bb._strHexToByteArray, payload_bytes, reply, args.num_iter)
+    bb.return_bytes = True
+    bulk_ret = measure("bulk bytearray, return_bytes", lambda d: bulk_encode(bb, 0x1, d), bb._strHexToByteArray, payload_bytes, reply, args.num_iter)
+    print("\tSpeed up list : {:.1f}x   bytearray : {:.1f}x   return_bytes : {:.1f}x".format(
+        legacy / bulk_list, legacy / bulk_bytes, legacy / bulk_ret))
+
+if (__name__ == '__main__'):
+    main()
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+'''
+Benchmark of the base board receive path
+
+Runs the firmware simulator on a pseudo terminal in a separate process and sends
+the same command stream through Base_Board_Rev3 twice, once with one pyserial
+read_until() per response line and once with the buffered Line_Reader. Host CPU
+time per command is reported for both. POSIX only.
+'''
+
+# ArgParse for parsing the benchmark settings
+import argparse
+
+import time
+
+# the main classes here
+from uMux_IF_Chain.base_board import base_board_rev3
+from uMux_IF_Chain.base_board import firmware_sim
+from uMux_IF_Chain.base_board.line_reader import Line_Reader
+
+def run(bb, n_cmds):
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    for i in range(n_cmds):
+        bb.spi_write(0x1, [0x86, 0x00, 0x00, 0x00, 0x00, 0x00])
+        bb.spi_read(0x1, 6)
+    cpu = time.process_time() - cpu_start
+    wall = time.perf_counter() - wall_start
+    return (cpu, wall)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--num_cmds", help="Number of write/read command pairs per run", type=int, default=5000)
+    parser.add_argument("-p", "--pipeline_depth", help="Base board pipeline depth", type=int, default=1)
+    args = parser.parse_args()
+
+    sim = firmware_sim.Base_Board_Sim(n_if_boards=1)
+    bb = base_board_rev3.Base_Board_Rev3(sim.serve_pty(separate_process=True))
+    bb.auto_print = 0
+    bb.pipeline_depth = args.pipeline_depth
+    n_cmds = 2 * args.num_cmds     # two base board commands per pair
+
+    print("Receive path benchmark, {} commands, pipeline_depth = {}".format(n_cmds, args.pipeline_depth))
+    results = {}
+    for name in ["read_until", "Line_Reader"]:
+        if(name == "read_until"):
+            bb.line_reader = None
+        else:
+            bb.line_reader = Line_Reader(bb.com)
+        run(bb, 100)    # warm up
+        results[name] = run(bb, args.num_cmds)
+        cpu, wall = results[name]
+        print("\t{:>12} : {:8.2f} us CPU/cmd   {:8.2f} us wall/cmd".format(
+            name, cpu / n_cmds * 1e6, wall / n_cmds * 1e6))
+
+    ratio = results["read_until"][0] / results["Line_Reader"][0]
+    print("\tHost CPU reduction : {:.2f}x".format(ratio))
+    print("\tLine_Reader port reads per line : {:.2f}".format(bb.line_reader.reads / bb.line_reader.lines))
+    bb.close()
+
+if (__name__ == '__main__'):
+    main()
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+'''
+Benchmark of trace record and replay
+
+Records a session against the firmware simulator on a pseudo terminal in a separate
+process, then replays the trace at the recorded pace and as fast as possible and
+checks that the host sees the same results. Reading the trace back through mmap is
+timed too. POSIX only.
+'''
+
+# ArgParse for parsing the benchmark settings
+import argparse
+
+import os
+import tempfile
+import time
+
+# the main classes here
+from uMux_IF_Chain.base_board import base_board_rev3
+from uMux_IF_Chain.base_board import firmware_sim
+from uMux_IF_Chain.base_board.trace import Recording_Transport, Replay_Transport, Trace_Reader
+from uMux_IF_Chain.uMux_IF import uMux_IF_Rev1
+
+def session(port, protocol, n_iter):
+    bb = base_board_rev3.Base_Board_Rev3(port, protocol)
+    bb.auto_print = 0
+    bb.get_device_info()
+    ifb = uMux_IF_Rev1.if_boards(bb)
+    results = []
+    for i in range(n_iter):
+        board = ifb[i % len(ifb)]
+        board.nulling_dn_set(i, i)
+        results.append(board.nulling_dn_get())
+        results.append(board.read_temperatures_C())
+    bb.close()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--num_iter", help="Iterations of the workload", type=int, default=200)
+    parser.add_argument("-d", "--response_delay", help="Seconds added before each simulator response", type=float, default=0.001)
+    parser.add_argument("-p", "--protocol", help="ascii or binary", default='ascii')
+    parser.add_argument("-f", "--fault_rate", help="Fraction of responses the simulator damages", type=float, default=0.0)
+    args = parser.parse_args()
+
+    trace_file = os.path.join(tempfile.mkdtemp(), 'session.trace')
+    sim = firmware_sim.Base_Board_Sim(response_delay_s=args.response_delay, fault_rate=args.fault_rate)
+    print("Trace benchmark, {} iterations, {} protocol".format(args.num_iter, args.protocol))
+    start = time.perf_counter()
+    recorded = session(Recording_Transport(sim.serve_pty(separate_process=True), trace_file), args.protocol, args.num_iter)
+    rec_s = time.perf_counter() - start
+    print("\t          recorded : {:7.3f} s   {} bytes".format(rec_s, os.path.getsize(trace_file)))
+
+    start = time.perf_counter()
+    summary = Trace_Reader(trace_file).summary()
+    print("\t   mmap read back  : {:7.3f} s   {} records".format(time.perf_counter() - start, summary['records']))
+
+    for speed in [1.0, 0]:
+        replay = Replay_Transport(trace_file, speed)
+        start = time.perf_counter()
+        replayed = session(replay, args.protocol, args.num_iter)
+        replay_s = time.perf_counter() - start
+        print("\treplay {:>11} : {:7.3f} s   {:.1f}x   results match : {}   mismatched writes : {}".format(
+            "recorded" if(speed > 0) else "max speed", replay_s, rec_s / replay_s, replayed == recorded, replay.mismatches))
+
+if (__name__ == '__main__'):
+    main()
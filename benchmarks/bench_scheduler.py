@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+'''
+Benchmark of control latency on a base board shared with bulk and telemetry traffic
+
+Runs the firmware simulator on a pseudo terminal in a separate process. One thread
+keeps SPI loopback bursts and LMX register dumps going on one IF board, another
+polls temperatures and lock status on a second one, while the main thread times
+operator commands on a third. Runs with the plain io lock and with the priority
+scheduler alternate for a number of rounds, the one that goes first swapping each
+round, since a single pair of runs is at the mercy of whatever else the host is doing.
+The control latency of every run, the median over the rounds, how many rounds the
+scheduler won, and the queue wait of each class in the last round are reported.
+POSIX only.
+'''
+
+# ArgParse for parsing the benchmark settings
+import argparse
+
+import threading
+import time
+
+import numpy as np
+
+# the main classes here
+from uMux_IF_Chain.base_board import base_board_rev3
+from uMux_IF_Chain.base_board import firmware_sim
+from uMux_IF_Chain.base_board.scheduler import PRIORITY
+from uMux_IF_Chain.uMux_IF import uMux_IF_Rev1
+
+def run(port, use_scheduler, n_cmds, telemetry_period_s, bulk_rate_hz):
+    bb = base_board_rev3.Base_Board_Rev3(port)
+    bb.auto_print = 0
+    sched = None
+    if(use_scheduler):
+        sched = bb.enable_scheduler()
+        if(bulk_rate_hz > 0):
+            sched.set_rate_limit(PRIORITY.BULK, bulk_rate_hz, burst=16)
+    ifb = [uMux_IF_Rev1.UMux_IF_Rev1(bb, 0x1 << i) for i in range(3)]
+    for board in ifb:
+        board.debug = 0
+    stop = threading.Event()
+
+    def bulk():
+        while(not stop.is_set()):
+            ifb[2].spi_loopback(255, 20)
+            ifb[2].synth_reg_dump()
+
+    def telemetry():
+        with bb.priority(PRIORITY.TELEMETRY):
+            while(not stop.is_set()):
+                ifb[1].read_temperatures_C()
+                ifb[1].synth_lock_status()
+                stop.wait(telemetry_period_s)
+
+    threads = [threading.Thread(target=bulk), threading.Thread(target=telemetry)]
+    for t in threads:
+        t.start()
+    time.sleep(0.2)     # let the load settle
+
+    lat = np.empty(n_cmds)
+    for i in range(n_cmds):
+        start = time.perf_counter()
+        ifb[0].nulling_up_set(i & 0xFF, 0x80)
+        lat[i] = time.perf_counter() - start
+        time.sleep(0.002)
+
+    stop.set()
+    for t in threads:
+        t.join()
+    bb.close()
+    return lat, None if(sched is None) else sched.stats()
+
+def latency_stats(lat) -> dict:
+    lat = lat * 1e3
+    return {'mean': lat.mean(), 'p50': np.percentile(lat, 50), 'p99': np.percentile(lat, 99), 'max': lat.max()}
+
+def print_stats(name, stats):
+    print("\t{:>9} : mean {:7.3f}  p50 {:7.3f}  p99 {:7.3f}  max {:7.3f}".format(
+        name, stats['mean'], stats['p50'], stats['p99'], stats['max']))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--num_cmds", help="Control commands timed per run", type=int, default=500)
+    parser.add_argument("-t", "--telemetry_period", help="Seconds between telemetry polls", type=float, default=0.01)
+    parser.add_argument("-b", "--bulk_rate", help="Bulk commands per second with the scheduler, 0 for no limit", type=float, default=0)
+    parser.add_argument("-R", "--rounds", help="Runs of each kind, alternated", type=int, default=5)
+    parser.add_argument("-r", "--link_rate", help="Link bytes per second, 0 for the bare pseudo terminal", type=float, default=1e6)
+    args = parser.parse_args()
+
+    print("Scheduler benchmark, {} control commands, link_rate = {:g} B/s, {} rounds, latency in ms".format(
+        args.num_cmds, args.link_rate, args.rounds))
+    results = {False: [], True: []}
+    sched_stats = None
+    for rnd in range(args.rounds):
+        print("\tround {}".format(rnd + 1))
+        for use_scheduler in ([False, True] if(rnd % 2 == 0) else [True, False]):
+            sim = firmware_sim.Base_Board_Sim(n_if_boards=3, link_rate_Bps=args.link_rate)
+            lat, stats = run(sim.serve_pty(separate_process=True), use_scheduler, args.num_cmds,
+                             args.telemetry_period, args.bulk_rate)
+            results[use_scheduler].append(latency_stats(lat))
+            print_stats("scheduler" if(use_scheduler) else "io lock", results[use_scheduler][-1])
+            if(stats is not None):
+                sched_stats = stats
+
+    print("\tmedian over {} rounds".format(args.rounds))
+    for use_scheduler in [False, True]:
+        print_stats("scheduler" if(use_scheduler) else "io lock",
+                    {key: np.median([x[key] for x in results[use_scheduler]]) for key in results[use_scheduler][0]})
+    for key in ['p99', 'max']:
+        wins = sum(sched[key] < plain[key] for plain, sched in zip(results[False], results[True]))
+        print("\tscheduler {} lower in {} of {} rounds".format(key, wins, args.rounds))
+    for name, cls_stats in sched_stats.items():
+        print("\t{:>9} queue wait : {:6d} cmds  mean {:7.3f}  p99 {:7.3f}  max {:7.3f}".format(
+            name, cls_stats['commands'], cls_stats['mean_s'] * 1e3, cls_stats['p99_s'] * 1e3,
+            cls_stats['max_s'] * 1e3))
+
+if (__name__ == '__main__'):
+    main()
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+'''
+Latency and jitter benchmark of the base board transports
+
+Runs the firmware simulator in a separate process, behind a pseudo terminal for the
+pyserial and raw fd transports and behind a local TCP port for the socket transport,
+plus the in process loop:// transport. The round trip of one lockstep command is
+timed many times over each and the latency distribution is reported. POSIX only.
+'''
+
+# ArgParse for parsing the benchmark settings
+import argparse
+
+import time
+
+import numpy as np
+
+# the main classes here
+from uMux_IF_Chain.base_board import base_board_rev3
+from uMux_IF_Chain.base_board import firmware_sim
+
+def run(bb, n_cmds) -> np.ndarray:
+    lat = np.empty(n_cmds)
+    for i in range(n_cmds):
+        start = time.perf_counter()
+        bb.spi_read(0x1, 6)
+        lat[i] = time.perf_counter() - start
+    return lat
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--num_cmds", help="Commands timed per transport", type=int, default=5000)
+    args = parser.parse_args()
+
+    ports = [("pyserial", firmware_sim.Base_Board_Sim(n_if_boards=1).serve_pty(separate_process=True)),
+             ("raw fd", "raw:" + firmware_sim.Base_Board_Sim(n_if_boards=1).serve_pty(separate_process=True)),
+             ("socket", firmware_sim.Base_Board_Sim(n_if_boards=1).serve_tcp(separate_process=True)),
+             ("loop", "loop://")]
+
+    print("Transport benchmark, {} commands each, latency in us".format(args.num_cmds))
+    print("\t{:>10} : {:>8} {:>8} {:>8} {:>8} {:>8} {:>8}".format("transport", "mean", "p50", "p90", "p99", "max", "stdev"))
+    for name, port in ports:
+        bb = base_board_rev3.Base_Board_Rev3(port)
+        bb.auto_print = 0
+        run(bb, 200)    # warm up
+        lat = run(bb, args.num_cmds) * 1e6
+        p50, p90, p99 = np.percentile(lat, [50, 90, 99])
+        print("\t{:>10} : {:8.1f} {:8.1f} {:8.1f} {:8.1f} {:8.1f} {:8.1f}".format(
+            name, lat.mean(), p50, p90, p99, lat.max(), lat.std()))
+        bb.close()
+
+if (__name__ == '__main__'):
+    main()
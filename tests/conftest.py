@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+'''
+Fixtures shared by the tests, a base board talking to the in process firmware simulator
+'''
+# System level imports
+import pytest
+
+# local imports
+from uMux_IF_Chain.base_board import base_board_rev3
+from uMux_IF_Chain.base_board import capabilities
+from uMux_IF_Chain.base_board import discovery
+from uMux_IF_Chain.base_board import firmware_sim
+from uMux_IF_Chain.base_board.transport import Loopback_Transport
+from uMux_IF_Chain.uMux_IF import uMux_IF_Rev1
+
+@pytest.fixture(autouse=True)
+def cache_files(tmp_path, monkeypatch):
+    '''Keep the discovery and capabilities caches out of the home directory'''
+    monkeypatch.setattr(discovery, 'CACHE_FILE', str(tmp_path / 'base_boards.json'))
+    monkeypatch.setattr(capabilities, 'CACHE_FILE', str(tmp_path / 'capabilities.json'))
+
+@pytest.fixture
+def sim():
+    return firmware_sim.Base_Board_Sim(n_if_boards=4)
+
+def open_base_board(sim, protocol='ascii'):
+    bb = base_board_rev3.Base_Board_Rev3(Loopback_Transport(sim), protocol)
+    bb.auto_print = 0
+    return bb
+
+@pytest.fixture
+def bb(sim):
+    bb = open_base_board(sim)
+    bb.probe_capabilities()
+    yield bb
+    bb.close()
+
+@pytest.fixture
+def ifbs(bb):
+    return uMux_IF_Rev1.if_boards(bb)
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+'''
+The asyncio client against the firmware simulator
+'''
+# System level imports
+import asyncio
+
+import pytest
+
+# local imports
+from uMux_IF_Chain.base_board import firmware_sim
+from uMux_IF_Chain.base_board.async_base_board import Async_Base_Board
+from uMux_IF_Chain.base_board.transport import Loopback_Transport, termios
+from uMux_IF_Chain.uMux_IF import async_uMux_IF_Rev1, uMux_IF_Rev1
+
+from conftest import open_base_board
+
+async def _session(port, protocol):
+    bb = await Async_Base_Board.connect(port, protocol)
+    bb.auto_print = 0
+    try:
+        ifbs = await async_uMux_IF_Rev1.if_boards(bb, debug=0)
+        fwids = await asyncio.gather(*[ifb.read_FWID() for ifb in ifbs])
+        temps = await asyncio.gather(*[ifb.read_temperatures_C() for ifb in ifbs])
+        await ifbs[0].nulling_up_set(100, 200)
+        nulling = await ifbs[0].nulling_up_get()
+        clk = await bb.clk_reference()
+        used = bb.protocol
+    finally:
+        await bb.close()
+    return fwids, temps, nulling, clk, used
+
+def _check(result, protocol):
+    fwids, temps, nulling, clk, used = result
+    assert fwids == [list(b'uMux_IF_Rev1 FW ')] * 4
+    assert temps == [(35.0 + i, 30.0 + i) for i in range(4)]
+    assert nulling == (100, 200)
+    assert clk == 'LOCKED'
+    assert used == protocol
+
+@pytest.mark.parametrize('protocol', ['ascii', 'binary'])
+def test_async_loopback(protocol):
+    sim = firmware_sim.Base_Board_Sim()
+    _check(asyncio.run(_session(Loopback_Transport(sim), protocol)), protocol)
+
+@pytest.mark.skipif(termios is None, reason='POSIX only')
+def test_async_pty():
+    sim = firmware_sim.Base_Board_Sim()
+    _check(asyncio.run(_session(sim.serve_pty(), 'binary')), 'binary')
+
+def test_async_synth_init_matches_blocking():
+    '''The shared register math writes the same synth registers from both clients'''
+    sim = firmware_sim.Base_Board_Sim(n_if_boards=1)
+    bb = open_base_board(sim)
+    uMux_IF_Rev1.if_boards(bb)[0].synth_init()
+    bb.close()
+    blocking = dict(sim.if_boards[1].synth_regs)
+
+    async def run():
+        bb = await Async_Base_Board.connect(Loopback_Transport(sim))
+        bb.auto_print = 0
+        try:
+            ifb = (await async_uMux_IF_Rev1.if_boards(bb, debug=0))[0]
+            await ifb.synth_init()
+        finally:
+            await bb.close()
+    sim.if_boards[1].synth_regs.clear()
+    asyncio.run(run())
+    assert len(blocking) > 0
+    assert sim.if_boards[1].synth_regs == blocking
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+'''
+Base board SPI and I2C batches
+'''
+# System level imports
+import pytest
+
+# local imports
+from uMux_IF_Chain.uMux_IF import commands
+from uMux_IF_Chain.uMux_IF import uMux_IF_Rev1
+
+from conftest import open_base_board
+
+_SET = commands.lookup('NULLING_UP', commands.W)
+_GET = commands.lookup('NULLING_UP', commands.R)
+
+def _set_and_get(cs, dac_I, dac_Q) -> list:
+    return [(cs, _SET.encode(dac_I, dac_Q), 0), (cs, None, 6), (cs, _GET.encode(), 0), (cs, None, 6)]
+
+@pytest.mark.parametrize('protocol', ['ascii', 'binary'])
+@pytest.mark.parametrize('probe', [False, True])
+def test_spi_batch_results(sim, protocol, probe):
+    bb = open_base_board(sim, protocol)
+    if(probe):
+        bb.probe_capabilities()
+        assert bb.batch_supported()
+    c = sim.commands
+    rets = bb.spi_batch(_set_and_get(0x1, 100, 200) + _set_and_get(0x2, 300, 400))
+    assert rets[0::2] == [True] * 4
+    assert (_GET.decode(rets[3])[1:], _GET.decode(rets[7])[1:]) == ((100, 200), (300, 400))
+    assert rets[5][0] & 0x01
+    assert (sim.commands - c) == (1 if(probe) else 8)
+
+def test_spi_batch_split_at_max_payload(sim, bb):
+    bb.capabilities.max_payload = {bb.protocol: 32}
+    c = sim.commands
+    rets = bb.spi_batch(_set_and_get(0x1, 100, 200) * 4)
+    assert [_GET.decode(ret)[1:] for ret in rets[3::4]] == [(100, 200)] * 4
+    assert (sim.commands - c) > 1
+
+@pytest.mark.parametrize('protocol', ['ascii', 'binary'])
+def test_i2c_batch(sim, bb, protocol):
+    if(protocol == 'binary'):
+        bb.negotiate_protocol()
+    c = sim.commands
+    rets = bb.i2c_batch([(0x48, [0x00], 2), (0x49, [0x00], 2), (0x48, [0x01, 0x60], 0)])
+    assert [bb.tmp_center.convert_int2temp_C(rets[0]), bb.tmp_power_converter.convert_int2temp_C(rets[1])] == [sim.i2c_devices[0x48].temp_C, sim.i2c_devices[0x49].temp_C]
+    assert rets[2] is True
+    assert (sim.commands - c) == 1
+
+def test_synth_init_batched(sim, bb, ifbs):
+    c = sim.commands
+    ifbs[0].synth_init()
+    assert (sim.commands - c) == 3
+    assert sim.if_boards[ifbs[0]._cs].synth_cal_done
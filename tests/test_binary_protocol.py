@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+'''
+Framing of the binary protocol and the fallback to ASCII
+'''
+# System level imports
+import pytest
+
+# local imports
+from uMux_IF_Chain.base_board import binary_protocol
+from uMux_IF_Chain.uMux_IF import uMux_IF_Rev1
+
+from conftest import open_base_board
+
+@pytest.mark.parametrize('payload', [b'', b'\x00', b'\x00' * 300, bytes(range(256)) * 2])
+def test_frame_round_trip(payload):
+    frame = binary_protocol.encode_frame(0x21, 0x1FF, payload)
+    assert frame.endswith(binary_protocol.FRAME_DELIMITER)
+    assert frame.count(binary_protocol.FRAME_DELIMITER) == 1
+    assert binary_protocol.decode_frame(frame) == (0x21, 0xFF, payload)
+
+def test_frame_crc_mismatch():
+    frame = bytearray(binary_protocol.encode_frame(0x21, 1, b'abc'))
+    frame[-3] ^= 0x01
+    with pytest.raises(ValueError):
+        binary_protocol.decode_frame(bytes(frame))
+
+@pytest.mark.parametrize('protocol', ['ascii', 'binary'])
+def test_protocols_agree(sim, protocol):
+    bb = open_base_board(sim, protocol)
+    assert bb.protocol == protocol
+    assert sim.protocol == protocol
+    ifb = uMux_IF_Rev1.if_boards(bb)[1]
+    assert bytes(ifb.read_FWID()) == b'uMux_IF_Rev1 FW '
+    assert ifb.read_temperatures_C() == (36.0, 31.0)
+    assert bb.read_temp_C() == [28.5, 41.25]
+    bb.close()
+    assert sim.protocol == 'ascii'
+
+def test_binary_falls_back_on_old_firmware(sim):
+    sim.binary = False
+    bb = open_base_board(sim, 'binary')
+    assert bb.protocol == 'ascii'
+    assert bb.clk_reference() == 'LOCKED'
+
+def test_spi_loopback_binary(sim):
+    bb = open_base_board(sim, 'binary')
+    ifb = uMux_IF_Rev1.if_boards(bb)[0]
+    assert ifb.spi_loopback(255, 4) == 0
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+'''
+Writes broadcast to a group of IF boards on the chip select mask
+'''
+# System level imports
+import pytest
+
+# local imports
+from uMux_IF_Chain.devices import lmx2592
+from uMux_IF_Chain.uMux_IF import uMux_IF_Rev1
+
+def _bring_up(target):
+    target.synth_init()
+    target.base_band_loop_back_disable()
+    target.nulling_up_set(100, 200)
+    target.nulling_dn_set(300, 400)
+    return target.synth_set_Frequency_MHz(5000)
+
+@pytest.mark.parametrize('verify_each', [True, False])
+def test_group_sets_every_board(sim, ifbs, verify_each):
+    group = uMux_IF_Rev1.broadcast(ifbs, verify_each)
+    assert _bring_up(group) == 5000
+    assert group.fallbacks == 0
+    assert len(group.last_rets) == len(ifbs)
+    for ifb in ifbs:
+        board = sim.if_boards[ifb._cs]
+        assert (board.bb_loopback, board.nulling_up, board.nulling_dn) == (0, [100, 200], [300, 400])
+        assert board.synth_cal_done
+        # The cache of each board is kept, and agrees with the board
+        assert ifb.nulling_up_get() == (100, 200)
+        assert ifb.synth_get_Frequency_MHz() == 5000
+        assert ifb.synth_get_Frequency_MHz(max_age_s=0) == 5000
+
+def test_group_costs_one_board(sim, ifbs):
+    c, spi = sim.commands, sim.spi_bytes
+    for ifb in ifbs:
+        _bring_up(ifb)
+    each = (sim.commands - c, sim.spi_bytes - spi)
+    for board in sim.if_boards.values():
+        board.power_on_reset()
+    c, spi = sim.commands, sim.spi_bytes
+    _bring_up(uMux_IF_Rev1.broadcast(ifbs, verify_each=False))
+    assert (sim.commands - c) < each[0]
+    assert (sim.spi_bytes - spi) < each[1]
+
+def test_reads_run_per_board(ifbs):
+    group = uMux_IF_Rev1.broadcast(ifbs)
+    assert group.read_temperatures_C() == [(35.0, 30.0), (36.0, 31.0), (37.0, 32.0), (38.0, 33.0)]
+
+def test_different_synth_writes_fall_back(sim, ifbs):
+    group = uMux_IF_Rev1.broadcast(ifbs)
+    group.synth_init()
+    # A synth on another reference needs other register values for the same frequency
+    ifbs[1]._lmx._pll = lmx2592._PLL_Config(200)
+    assert group.synth_set_Frequency_MHz(5123.4) == 5123.4
+    assert group.fallbacks == 1
+    for ifb in ifbs:
+        assert ifb.synth_get_Frequency_MHz(max_age_s=0) == 5123.4
+    writes = [sim.if_boards[ifb._cs].synth_regs for ifb in ifbs]
+    assert writes[0] == writes[2]
+    assert writes[0] != writes[1]
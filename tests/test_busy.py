@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+'''
+RET_VAL reads repeated while the MCU reports BUSY
+'''
+# System level imports
+import time
+
+# local imports
+from uMux_IF_Chain.uMux_IF import commands
+
+_TEMP_READ = commands.lookup('TEMP_READ', commands.R).opcode
+
+def test_read_waits_out_busy(sim, ifbs):
+    ifb = ifbs[0]
+    sim.if_boards[ifb._cs].command_time_s[_TEMP_READ] = 0.05
+    start = time.monotonic()
+    assert ifb.read_temperatures_C() == (35.0, 30.0)
+    elapsed = time.monotonic() - start
+    assert ifb.busy_polls > 0
+    # Polls back off to busy_poll_max_s, so the wait ends within one of those of the MCU
+    assert 0.05 <= elapsed < 0.05 + ifb.busy_poll_max_s + 0.05
+
+def test_no_polls_when_not_busy(sim, ifbs):
+    ifb = ifbs[0]
+    sim.if_boards[ifb._cs].command_time_s[_TEMP_READ] = 0.0
+    ifb.read_temperatures_C()
+    ifb.nulling_up_set(1, 2)
+    assert ifb.busy_polls == 0
+
+def test_busy_timeout(sim, ifbs, capsys):
+    ifb = ifbs[0]
+    sim.if_boards[ifb._cs].command_time_s[_TEMP_READ] = 10.0
+    ifb.busy_timeout_s = 0.05
+    start = time.monotonic()
+    assert ifb.read_temperatures_C() == (None, None)
+    assert time.monotonic() - start < 1.0
+    out = capsys.readouterr().out
+    assert 'still busy after 0.05 s' in out
+    assert 'Read Local Tempereatures Failed' in out
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+'''
+IF board state cache
+'''
+
+def test_repeated_writes_skipped(sim, ifbs):
+    ifb = ifbs[0]
+    ifb.nulling_up_set(100, 200)
+    ifb.base_band_loop_back_disable()
+    c = sim.commands
+    ifb.nulling_up_set(100, 200)
+    ifb.base_band_loop_back_disable()
+    assert (ifb.nulling_up_get(), ifb.base_band_loop_back_get()) == ((100, 200), False)
+    assert sim.commands == c
+    assert (ifb.writes_skipped, ifb.cache_hits) == (2, 2)
+
+def test_max_age_and_invalidate(sim, ifbs):
+    ifb = ifbs[0]
+    ifb.nulling_up_set(100, 200)
+    # Another program changed the board behind our back
+    sim.if_boards[ifb._cs].nulling_up = [1, 2]
+    assert ifb.nulling_up_get() == (100, 200)
+    assert ifb.nulling_up_get(max_age_s=0) == (1, 2)
+    sim.if_boards[ifb._cs].nulling_up = [3, 4]
+    ifb.invalidate()
+    c = sim.commands
+    assert ifb.nulling_up_get() == (3, 4)
+    assert sim.commands > c
+
+def test_cache_dropped_on_reset(sim, ifbs):
+    ifb = ifbs[0]
+    ifb.nulling_up_set(100, 200)
+    ifb.mcu_reset()
+    assert ifb.nulling_up_get() == (8192, 8192)
+    ifb.nulling_up_set(100, 200)
+    sim.if_boards[ifb._cs].power_on_reset()
+    # The reset is seen in the next RET_VAL, which drops the cache
+    ifb.base_band_loop_back_get(max_age_s=0)
+    assert ifb.nulling_up_get() == (8192, 8192)
+    assert ifb.health.unexpected_resets == 1
+
+def test_frequency_set_always_programs(sim, ifbs):
+    ifb = ifbs[0]
+    ifb.synth_init()
+    assert ifb.synth_set_Frequency_MHz(5000) == 5000
+    c = sim.commands
+    assert ifb.synth_set_Frequency_MHz(5000) == 5000
+    assert sim.commands > c
+    assert sim.if_boards[ifb._cs].synth_cal_done
+    c = sim.commands
+    assert ifb.synth_get_Frequency_MHz() == 5000
+    assert sim.commands == c
+
+def test_cache_off(sim, ifbs):
+    ifb = ifbs[0]
+    ifb.cache_max_age_s = 0
+    ifb.nulling_up_set(100, 200)
+    c = sim.commands
+    ifb.nulling_up_set(100, 200)
+    assert ifb.nulling_up_get() == (100, 200)
+    # A write and a RET_VAL read each
+    assert sim.commands - c == 4
+    assert (ifb.writes_skipped, ifb.cache_hits) == (0, 0)
+
+def test_cache_dropped_on_hard_reset(sim, bb, ifbs):
+    ifb = ifbs[0]
+    ifb.nulling_up_set(100, 200)
+    bb.spi_hard_reset(ifb._cs)
+    sim.if_boards[ifb._cs].nulling_up = [5, 6]
+    assert ifb.nulling_up_get() == (5, 6)
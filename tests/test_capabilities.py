@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+'''
+Capability probing of the base board and IF boards, and the cache kept on disk
+'''
+# System level imports
+import os
+
+# local imports
+from uMux_IF_Chain.base_board import base_board_rev3, capabilities
+from uMux_IF_Chain.base_board.transport import Loopback_Transport
+from uMux_IF_Chain.uMux_IF import uMux_IF_Rev1
+
+from conftest import open_base_board
+
+def test_capabilities_probed_once(sim):
+    c = sim.commands
+    assert open_base_board(sim).probe_capabilities().supports('SPI:BATCH:')
+    probed = sim.commands - c
+    c = sim.commands
+    caps = open_base_board(sim).probe_capabilities()
+    assert caps.supports('SPI:BATCH:')
+    assert (sim.commands - c) < probed
+    assert os.path.exists(capabilities.CACHE_FILE)
+
+def test_old_firmware(sim, capsys):
+    sim.binary = False
+    sim.max_payload = 100
+    c = sim.commands
+    caps = open_base_board(sim).probe_capabilities()
+    probed = sim.commands - c
+    assert not caps.binary
+    assert caps.max_payload == {'ascii': 64}
+    # Rejected probes are expected, nothing is printed for them
+    assert 'ERROR' not in capsys.readouterr().out
+    # Known old firmware is not asked for binary framing again
+    c = sim.commands
+    bb = base_board_rev3.Base_Board_Rev3(Loopback_Transport(sim), 'auto')
+    assert bb.protocol == 'ascii'
+    assert bb.capabilities.max_payload == {'ascii': 64}
+    assert sim.commands - c < probed
+
+def test_refresh(sim):
+    bb = open_base_board(sim)
+    bb.probe_capabilities()
+    sim.max_payload = 100
+    assert bb.probe_capabilities().max_payload['ascii'] == capabilities.MAX_SPI_BYTES
+    assert bb.probe_capabilities(refresh=True).max_payload['ascii'] == 64
+
+def test_if_board_capabilities(sim, ifbs, capsys):
+    ifb = ifbs[0]
+    assert not ifb.supports('ISR')
+    caps = ifb.capabilities
+    assert set(caps.commands) == set(uMux_IF_Rev1._OPTIONAL_CMDS)
+    assert ifb.health.summary()['invalid_cmds'] == 0
+    assert 'ERROR' not in capsys.readouterr().out
+    # Another session with the same board only looks it up
+    c = sim.commands
+    other = uMux_IF_Rev1.UMux_IF_Rev1(ifb._bb, ifb._cs)
+    other.firmware_id = ifb.firmware_id
+    other.board_serial_number = ifb.board_serial_number
+    assert not other.supports('NULLING_CTRL')
+    assert sim.commands == c
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+'''
+The commands table against the command frames UMux_IF_Rev1 used to build by hand
+'''
+# System level imports
+import pytest
+
+# local imports
+from uMux_IF_Chain.uMux_IF import commands
+
+def _frame(cmd, *data) -> list:
+    '''[opcode << 1 | R/W] followed by data and zero padding, as the hand-built lists were'''
+    array = [0x00] * commands.CMD_LEN
+    array[0] = (cmd.opcode << 1) | cmd.rw
+    array[1:1 + len(data)] = data
+    return array
+
+def _temp_threshold(temp_C) -> tuple:
+    temp_var = int(temp_C / 0.0625)
+    return (0xFF & (temp_var >> 4), 0xFF & (temp_var << 4))
+
+# (name, R/W): (values given to encode(), argument bytes of the hand-built frame)
+_ARGS = {
+    ('FW_BB_LB', commands.W):       ((0x01,), (0x01,)),
+    ('FW_SOFT_RST', commands.W):    ((0x55443322,), (0x55, 0x44, 0x33, 0x22)),
+    ('TEMP_THLD', commands.W):      (((int(85.5 / 0.0625) << 4) & 0xFFFF,) * 2, _temp_threshold(85.5) * 2),
+    ('NULLING_UP', commands.W):     ((1000 << 2, 16383 << 2), ((1000 << 2) >> 8, (1000 << 2) & 0xFF,
+                                                               (16383 << 2) >> 8, (16383 << 2) & 0xFF)),
+    ('NULLING_DN', commands.W):     ((8192 << 2, 0), ((8192 << 2) >> 8, 0x00, 0x00, 0x00)),
+    ('SYNTH_WRITE', commands.W):    ((0x2C, bytes([0x12, 0x34])), (0x2C, 0x12, 0x34)),
+    ('SYNTH_WRITE', commands.R):    ((0x2C,), (0x2C,)),
+    ('SPI_LOOPBACK', commands.W):   ((255,), (255,)),
+    ('PROG_EEPROM', commands.W):    ((112,), (112,)),
+}
+
+@pytest.mark.parametrize('row', commands.TABLE, ids=lambda row: '{}_{}'.format(row[0], 'RW'[row[2]]))
+def test_row_encodes_to_hand_built_frame(row):
+    cmd = commands.lookup(row[0], row[2])
+    values, data = _ARGS.get((cmd.name, cmd.rw), ((), ()))
+    assert len(values) == len(cmd.arg_fields)
+    frame = cmd.encode(*values)
+    assert len(frame) == commands.CMD_LEN
+    assert list(frame) == _frame(cmd, *data)
+    assert commands.from_bytes(frame) is cmd
+
+def test_decode_matches_hand_built_reads():
+    ret = [0x02, 0x23, 0x00, 0x1E, 0x00, 0x00]
+    assert commands.lookup('TEMP_READ', commands.R).decode(ret) == (0x02, bytes(ret[1:3]), bytes(ret[3:5]))
+    ret = [0x02, 0x0F, 0xA0, 0xFF, 0xFC, 0x00]
+    assert commands.lookup('NULLING_UP', commands.R).decode(ret) == (0x02, (ret[1] << 8) | ret[2], (ret[3] << 8) | ret[4])
+    assert commands.lookup('SYNTH_WRITE', commands.R).decode(ret)[1] == bytes(ret[1:3])
+    assert commands.lookup('FW_ID', commands.R).decode([0x02, 16, 0, 0, 0, 0]) == (0x02, 16)
+    # A lost or short RET_VAL reads as a failed command
+    assert commands.lookup('NULLING_UP', commands.R).decode(None) == (0, None, None)
+    assert commands.lookup('TEMP_READ', commands.R).decode([0x02]) == (0, None, None)
+
+def test_describe():
+    frame = commands.lookup('NULLING_UP', commands.W).encode(0x0FA0, 0xFFFC)
+    assert commands.describe(frame) == 'NULLING_UP W dac_I=0xFA0 dac_Q=0xFFFC'
+    assert commands.describe(b'\x00' * 112) == 'DATA[112]'
+
+def test_slow_rows():
+    assert commands.slow_opcodes() == {0x20, 0x21, 0x60}
+    assert [cmd.name for cmd in commands.COMMANDS.values() if(cmd.i2c)] == ['TEMP_THLD', 'TEMP_THLD', 'TEMP_READ']
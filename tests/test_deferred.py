@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+'''
+Deferred IF board calls sent as one batch
+'''
+# System level imports
+import threading
+
+import pytest
+
+def test_deferred_calls_share_a_round_trip(sim, ifbs):
+    ifb = ifbs[0]
+    c = sim.commands
+    with ifb.batch() as b:
+        up = b.nulling_up_set(100, 200)
+        dn = ifb.nulling_dn_set(300, 400)
+        lb = b.base_band_loop_back_disable()
+        assert not up.done()
+    assert [up.result(), dn.result(), lb.result()] == [None, None, None]
+    assert (sim.commands - c) == 1
+    assert (b.round_trips, b.live_calls) == (1, 0)
+    board = sim.if_boards[ifb._cs]
+    assert (board.nulling_up, board.nulling_dn, board.bb_loopback) == ([100, 200], [300, 400], 0)
+    assert ifb.nulling_dn_get() == (300, 400)
+    assert ifb.health.replies == 3
+
+def test_deferred_read_finishes_live(sim, ifbs):
+    ifb = ifbs[0]
+    with ifb.batch() as b:
+        up = b.nulling_up_set(100, 200)
+        get = b.nulling_up_get(max_age_s=0)
+        temps = b.read_temperatures_C()
+        loop = b.spi_loopback(16, 2)
+    assert (up.result(), get.result(), temps.result(), loop.result()) == (None, (100, 200), (35.0, 30.0), 0)
+    # The get ends the round trip with its read, the temperatures and loopback finish live
+    assert b.live_calls == 2
+
+def test_deferred_call_that_raises(sim, ifbs):
+    ifb = ifbs[0]
+    c = sim.commands
+    with ifb.batch() as b:
+        bad = b.synth_set_Frequency_MHz('abc')
+        good = b.nulling_up_set(1, 2)
+    assert isinstance(bad.exception(), TypeError)
+    assert good.result() is None
+    assert (sim.commands - c) == 1
+    assert sim.if_boards[ifb._cs].nulling_up == [1, 2]
+
+def test_deferred_recording_is_quiet(ifbs, capsys):
+    ifb = ifbs[0]
+    ifb.debug = 1
+    with ifb.batch() as b:
+        b.nulling_up_set(2**15, 1)
+    out = capsys.readouterr().out
+    assert out.count("Value too high") == 1
+    assert (ifb.debug, ifb.print_errors) == (1, True)
+
+def test_exception_in_block_cancels(ifbs):
+    ifb = ifbs[0]
+    with pytest.raises(KeyError):
+        with ifb.batch() as b:
+            f = b.nulling_up_set(5, 5)
+            raise KeyError()
+    assert f.cancelled()
+    assert ifb._batch is None
+
+def test_other_threads_run_live(sim, ifbs):
+    ifb = ifbs[0]
+    results = []
+    with ifb.batch() as b:
+        up = b.nulling_up_set(1, 2)
+        thread = threading.Thread(target=lambda: results.append(ifb.nulling_dn_set(3, 4)))
+        thread.start()
+        thread.join()
+        # Done before the block has exited
+        assert results == [None]
+        assert sim.if_boards[ifb._cs].nulling_dn == [3, 4]
+    assert up.result() is None
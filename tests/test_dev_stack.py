@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+'''
+The 32 bit DEV_STACK mask and sparse IF board stacks
+'''
+# System level imports
+import pytest
+
+# local imports
+from uMux_IF_Chain.base_board import base_board_rev3, firmware_sim
+from uMux_IF_Chain.uMux_IF import uMux_IF_Rev1
+
+from conftest import open_base_board
+
+def test_chip_selects():
+    assert base_board_rev3.chip_selects(0) == []
+    assert base_board_rev3.chip_selects(0xF) == [0x1, 0x2, 0x4, 0x8]
+    assert base_board_rev3.chip_selects(0x80000101) == [0x1, 0x100, 0x80000000]
+    assert base_board_rev3.chip_selects(0xFFFFFFFF) == [0x1 << i for i in range(32)]
+
+@pytest.mark.parametrize('protocol', ['ascii', 'binary'])
+def test_sparse_stack_past_slot_8(protocol):
+    sim = firmware_sim.Base_Board_Sim(slots=[0, 9, 17, 31])
+    bb = open_base_board(sim, protocol)
+    assert bb.spi_get_dev_stack() == 0x80020201
+    assert bb.spi_get_chip_selects() == [0x1, 0x200, 0x20000, 0x80000000]
+    ifbs = uMux_IF_Rev1.if_boards(bb)
+    assert [ifb.slot for ifb in ifbs] == [0, 9, 17, 31]
+    for ifb in ifbs:
+        ifb.nulling_up_set(ifb.slot, ifb.slot + 1)
+        assert ifb.read_FWID() == list(b'uMux_IF_Rev1 FW ')
+    assert [sim.if_boards[ifb._cs].nulling_up for ifb in ifbs] == [[slot, slot + 1] for slot in (0, 9, 17, 31)]
+
+def test_empty_stack():
+    sim = firmware_sim.Base_Board_Sim(slots=[])
+    bb = open_base_board(sim)
+    assert bb.spi_get_dev_stack() == 0
+    assert uMux_IF_Rev1.if_boards(bb) == []
+    # A known mask is taken as given
+    assert [ifb.slot for ifb in uMux_IF_Rev1.if_boards(bb, dev_stack=0x5)] == [0, 2]
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+'''
+Finding base boards and the port cache kept on disk
+'''
+# System level imports
+import os
+import pty
+import threading
+import time
+
+# local imports
+from uMux_IF_Chain.base_board import base_board_rev3, discovery
+
+def test_port_cache_concurrent_updates(tmp_path):
+    cache_file = str(tmp_path / 'ports.json')
+    def add(n):
+        for i in range(20):
+            discovery.update_cache(lambda cache: dict(cache, **{'SN{}-{}'.format(n, i): '/dev/ttyACM{}'.format(n)}),
+                                   cache_file)
+    threads = [threading.Thread(target=add, args=(n,)) for n in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(discovery.load_cache(cache_file)) == 80
+    assert os.listdir(tmp_path) == ['ports.json']
+
+def test_discover_on_pty(sim):
+    port = sim.serve_pty()
+    found = discovery.discover([port])
+    assert list(found) == [sim.serial_number]
+    assert discovery.load_cache() == {sim.serial_number: port}
+
+def test_open_by_serial_number(sim):
+    port = sim.serve_pty()
+    discovery.discover([port])
+    bb = base_board_rev3.Base_Board_Rev3('sn:' + sim.serial_number)
+    bb.auto_print = 0
+    try:
+        assert bb.clk_reference() == 'LOCKED'
+    finally:
+        bb.close()
+
+def test_silent_port_costs_one_round(sim):
+    master, slave = pty.openpty()
+    try:
+        start = time.monotonic()
+        found = discovery.discover([sim.serve_pty(), os.ttyname(slave)])
+        assert list(found) == [sim.serial_number]
+        assert time.monotonic() - start < 2.0
+    finally:
+        os.close(master)
+        os.close(slave)
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+'''
+Board_Health decoded from the RET_VAL status bytes
+'''
+# local imports
+from uMux_IF_Chain.uMux_IF.uMux_IF_Rev1 import Board_Health, HEALTH_EVENT, _RET_VAL
+
+def test_update_counts_and_events(capsys):
+    health = Board_Health(0x2)
+    events = []
+    health.subscribe(lambda h, event, status: events.append(event))
+    # Power on reset on the first reply, not an event
+    health.update(_RET_VAL.MASK_MCU_RST_DONE | _RET_VAL.MASK_WRITE_GOOD)
+    health.update(_RET_VAL.MASK_OVERHEAT | _RET_VAL.MASK_READ_GOOD)
+    health.update(_RET_VAL.MASK_OVERHEAT | _RET_VAL.MASK_I2C_NACK)
+    health.update(_RET_VAL.MASK_READ_GOOD)
+    health.update(_RET_VAL.MASK_MCU_RST_DONE)
+    health.expect_reset()
+    health.update(_RET_VAL.MASK_MCU_RST_DONE)
+    with health.expected(_RET_VAL.MASK_INVALID_CMD):
+        health.update(_RET_VAL.MASK_INVALID_CMD)
+    health.update(_RET_VAL.MASK_INVALID_CMD)
+    assert events == [HEALTH_EVENT.OVERHEAT, HEALTH_EVENT.I2C_NACK, HEALTH_EVENT.OVERHEAT_CLEARED,
+                      HEALTH_EVENT.MCU_RESET, HEALTH_EVENT.INVALID_CMD]
+    assert health.summary() == {'replies': 8, 'overheating': False, 'overheat_replies': 2, 'i2c_nacks': 1,
+                                'invalid_cmds': 1, 'mcu_resets': 3, 'unexpected_resets': 1}
+    out = capsys.readouterr().out
+    assert 'WARNING: IF board _cs=0x2 reports overheating' in out
+    assert 'WARNING: IF board _cs=0x2 MCU reset unexpectedly' in out
+
+def test_failing_subscriber(capsys):
+    health = Board_Health(0x1)
+    health.subscribe(lambda h, event, status: 1 / 0)
+    health.update(_RET_VAL.MASK_I2C_NACK)
+    assert health.i2c_nacks == 1
+    assert 'ERROR: Board health subscriber' in capsys.readouterr().out
+
+def test_simulated_board(sim, ifbs, capsys):
+    ifb = ifbs[0]
+    board = sim.if_boards[ifb._cs]
+    events = []
+    ifb.health.subscribe(lambda h, event, status: events.append(event))
+    ifb.read_FWID()
+    board.synth_temp_C = 120.0
+    ifb.nulling_up_set(1, 2)
+    assert ifb.health.overheating
+    board.synth_temp_C = 35.0
+    board.i2c_fault = True
+    ifb.print_errors = False
+    assert ifb.read_temperatures_C() == (None, None)
+    board.i2c_fault = False
+    ifb.mcu_reset()
+    ifb.read_FWID()
+    assert events == [HEALTH_EVENT.OVERHEAT, HEALTH_EVENT.OVERHEAT_CLEARED, HEALTH_EVENT.I2C_NACK]
+    assert ifb.health.unexpected_resets == 0
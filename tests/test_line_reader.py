@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+'''
+Line_Reader splitting of buffered lines, partial lines and deadlines
+'''
+# System level imports
+import threading
+import time
+
+import pytest
+import serial
+
+# local imports
+from uMux_IF_Chain.base_board.line_reader import Line_Reader
+
+@pytest.fixture
+def port():
+    com = serial.serial_for_url('loop://', timeout=5)
+    yield com
+    com.close()
+
+def test_lines_split_from_one_read(port):
+    reader = Line_Reader(port)
+    port.write(b'!RCVD\n0x1234\n!RC')
+    time.sleep(0.01)
+    assert reader.read_until() == b'!RCVD\n'
+    assert reader.read_until() == b'0x1234\n'
+    assert reader.reads == 1
+    assert not reader.lines_waiting()
+
+def test_partial_line_completed_later(port):
+    reader = Line_Reader(port)
+    port.write(b'!RC')
+    threading.Timer(0.05, port.write, (b'VD\n',)).start()
+    assert reader.read_until(timeout=2.0) == b'!RCVD\n'
+
+def test_partial_line_returned_on_timeout(port):
+    reader = Line_Reader(port)
+    port.write(b'!RC')
+    start = time.monotonic()
+    assert reader.read_until(timeout=0.05) == b'!RC'
+    elapsed = time.monotonic() - start
+    # The deadline is kept by the reader, not by the 5 s port timeout, which is left alone
+    assert 0.05 <= elapsed < 1.0
+    assert port.timeout == 5
+
+def test_timeout_with_nothing_received(port):
+    reader = Line_Reader(port)
+    assert reader.read_until(timeout=0.02) == b''
+
+def test_reset_drops_buffered_lines(port):
+    reader = Line_Reader(port)
+    port.write(b'a\nb\n')
+    time.sleep(0.01)
+    assert reader.read_until() == b'a\n'
+    reader.reset()
+    assert reader.read_until(timeout=0.01) == b''
+
+class _Read_Some_Port:
+    '''Backend with the read_some() of the transport module'''
+    timeout = 5
+    def __init__(self, chunks):
+        self.chunks = list(chunks)
+        self.timeouts = []
+
+    def read_some(self, size, timeout):
+        self.timeouts.append(timeout)
+        return self.chunks.pop(0) if(len(self.chunks) > 0) else b''
+
+def test_read_some_backend_gets_the_deadline():
+    com = _Read_Some_Port([b'ab', b'c\nd', b'\n'])
+    reader = Line_Reader(com)
+    assert reader.read_until(timeout=1.0) == b'abc\n'
+    assert reader.read_until(timeout=1.0) == b'd\n'
+    assert reader.read_until(timeout=0.0) == b''
+    assert all((timeout is not None) and (timeout <= 1.0) for timeout in com.timeouts)
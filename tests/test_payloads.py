@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+'''
+Payload types taken by the base board write methods and the hex codec
+'''
+# System level imports
+import numpy as np
+import pytest
+
+# local imports
+from uMux_IF_Chain.uMux_IF import commands
+
+_SET = commands.lookup('NULLING_UP', commands.W)
+
+@pytest.mark.parametrize('payload', [
+    list(_SET.encode(400, 800)),
+    _SET.encode(400, 800),
+    bytearray(_SET.encode(400, 800)),
+    memoryview(_SET.encode(400, 800)),
+    np.frombuffer(_SET.encode(400, 800), dtype=np.uint8),
+    np.array(list(_SET.encode(400, 800)), dtype=np.int64),
+])
+def test_payload_types(sim, bb, payload):
+    assert bb.spi_write(0x1, payload)
+    assert sim.if_boards[0x1].nulling_up == [100, 200]
+
+@pytest.mark.parametrize('payload, error', [
+    ([0, 256], ValueError),
+    ([0, -1], ValueError),
+    (np.array([1.0, 2.0]), TypeError),
+    ('abc', TypeError),
+    ([0, 'a'], TypeError),
+])
+def test_payload_checked(bb, payload, error):
+    with pytest.raises(error):
+        bb._to_bytes(payload)
+
+def test_return_bytes(bb):
+    bb.spi_write(0x1, _SET.encode(400, 800))
+    assert isinstance(bb.spi_read(0x1, 6), list)
+    bb.return_bytes = True
+    bb.spi_write(0x1, commands.lookup('NULLING_UP', commands.R).encode())
+    ret = bb.spi_read(0x1, 6)
+    assert isinstance(ret, bytes)
+    assert commands.lookup('NULLING_UP', commands.R).decode(ret)[1:] == (400, 800)
+
+def test_hex_codec_round_trip(bb):
+    data = bytes(range(256))
+    assert bb._strHexToByteArray(data.hex().upper()) == list(data)
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+'''
+Periodic reports taken out of the receive path and published
+'''
+# System level imports
+import pytest
+
+# local imports
+from uMux_IF_Chain.base_board import binary_protocol, periodic
+from uMux_IF_Chain.base_board.binary_protocol import _BIN_STATUS
+from uMux_IF_Chain.uMux_IF import uMux_IF_Rev1
+
+from conftest import open_base_board
+
+def test_parse():
+    line = 'PER:7:TEMP_CENTER=35.5000,SI_LOCK=1,DEV_STACK=0x0000000F,MODE=RUN'
+    sample = periodic.parse_line(line)
+    assert sample.count == 7
+    assert sample.fields == {'TEMP_CENTER': 35.5, 'SI_LOCK': 1, 'DEV_STACK': 0xF, 'MODE': 'RUN'}
+    frame = binary_protocol.encode_frame(_BIN_STATUS.PERIODIC, 7, line.encode())
+    assert periodic.is_report_frame(frame)
+    assert periodic.parse_frame(frame).fields == sample.fields
+    assert not periodic.is_report_frame(binary_protocol.encode_frame(_BIN_STATUS.OKAY, 7, line.encode()))
+    for bad in ['PER:x:A=1', 'PER:1:A', 'PER:1', 'RCVD:1:A=1']:
+        assert periodic.parse_line(bad) is None
+
+def test_monitor_counts_gaps_and_errors(capsys):
+    monitor = periodic.Periodic_Monitor(history=2)
+    seen = []
+    monitor.subscribe(seen.append)
+    monitor.subscribe(lambda sample: 1 / 0)
+    for count in [0, 1, 4]:
+        monitor.publish_line('PER:{}:A={}'.format(count, count))
+    monitor.publish_line('PER:garbage')
+    assert [s.count for s in seen] == [0, 1, 4]
+    assert (monitor.count, monitor.lost, monitor.errors) == (3, 2, 1)
+    assert [s.count for s in monitor.samples] == [1, 4]
+    assert monitor.latest['A'] == 4
+    out = capsys.readouterr().out
+    assert 'ERROR: Periodic report subscriber' in out
+    assert 'WARNING: Malformed periodic report' in out
+
+@pytest.mark.parametrize('protocol', ['ascii', 'binary'])
+def test_reports_between_responses(sim, protocol):
+    # A report ahead of every response
+    sim.periodic_interval_s = 0.0
+    bb = open_base_board(sim, protocol)
+    bb.enable_periodic_checking(listen=False)
+    ifb = uMux_IF_Rev1.if_boards(bb)[0]
+    for i in range(20):
+        ifb.nulling_up_set(i, 2 * i)
+        assert ifb.nulling_up_get(max_age_s=0) == (i, 2 * i)
+        assert bb.clk_reference() == 'LOCKED'
+    bb.disable_periodic_checking()
+    assert bb.periodic.count > 40
+    assert (bb.periodic.lost, bb.periodic.errors) == (0, 0)
+    assert bb.periodic.latest['SI_LOCK'] == 1
+    bb.close()
+
+def test_listener_reads_idle_port(sim):
+    sim.periodic_interval_s = 0.01
+    bb = open_base_board(sim)
+    bb.enable_periodic_checking()
+    try:
+        sample = bb.periodic.wait(timeout=2)
+        assert sample is not None
+        assert sample['DEV_STACK'] == 0xF
+    finally:
+        bb.disable_periodic_checking()
+        bb.close()
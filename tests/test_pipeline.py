@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+'''
+Command_Future and the pipelined command window of Base_Board_Rev3
+'''
+# local imports
+from uMux_IF_Chain.uMux_IF import commands
+from uMux_IF_Chain.uMux_IF import uMux_IF_Rev1
+
+from conftest import open_base_board
+
+_SET = commands.lookup('NULLING_UP', commands.W)
+_GET = commands.lookup('NULLING_UP', commands.R)
+
+def test_window_bounds_commands_in_flight(sim, bb):
+    bb.pipeline_depth = 4
+    futs = []
+    for i in range(10):
+        # The DAC values are left aligned in the command, the board keeps value >> 2
+        futs.append(bb.spi_write_nowait(0x1, _SET.encode(i << 2, i << 2)))
+        futs.append(bb.spi_read_nowait(0x1, 6))
+        assert len(bb._pending) <= 4
+    assert not futs[-1].done()
+    assert futs[-1].result()[0] & 0x01
+    # Responses are read in order, so every earlier command is done too
+    assert all(fut.done() for fut in futs)
+    assert sim.if_boards[0x1].nulling_up == [9, 9]
+
+def test_lockstep_by_default(bb):
+    fut = bb.spi_write_nowait(0x1, _SET.encode(1, 2))
+    bb.spi_write_nowait(0x1, _SET.encode(3, 4))
+    assert fut.done()
+
+def test_callbacks_in_order(bb):
+    bb.pipeline_depth = 8
+    order = []
+    bb.spi_write(0x1, _SET.encode(100, 200))
+    bb.spi_read(0x1, 6)
+    bb.spi_write_nowait(0x1, _GET.encode(), lambda fut: order.append(('write', fut.result())))
+    fut = bb.spi_read_nowait(0x1, 6, lambda fut: order.append(('read', _GET.decode(fut.result())[1:])))
+    fut.add_done_callback(lambda fut: order.append('added'))
+    bb.drain()
+    assert order == [('write', True), ('read', (100, 200)), 'added']
+    fut.add_done_callback(lambda fut: order.append('late'))
+    assert order[-1] == 'late'
+    assert len(bb._pending) == 0
+
+def test_pipelined_synth_writes(sim):
+    # Without SPI:BATCH probed the register writes go out one command each
+    bb = open_base_board(sim)
+    bb.pipeline_depth = 8
+    ifb = uMux_IF_Rev1.if_boards(bb)[0]
+    c = sim.commands
+    ifb.synth_init()
+    assert ifb.write_failures == 0
+    assert sim.if_boards[ifb._cs].synth_regs
+    assert (sim.commands - c) > 40
+
+def test_pipelined_synth_write_busy(sim, ifbs):
+    ifb = ifbs[0]
+    ifb._bb.pipeline_depth = 8
+    ifb.print_errors = False
+    sim.if_boards[ifb._cs].command_time_s[0x43] = 1.0
+    ifb._synth_write_array([0x00, 0x12, 0x34])
+    ifb._bb.drain()
+    assert (ifb.busy_writes, ifb.write_failures) == (1, 0)
+
+def test_pipelined_synth_write_lost(sim, ifbs):
+    ifb = ifbs[0]
+    bb = ifb._bb
+    bb.pipeline_depth = 8
+    bb.print_errors = False
+    bb.resync_attempts = 1
+    ifb.print_errors = False
+    sim.fault_rate = 1.0
+    ifb._synth_write_array([0x00, 0x12, 0x34])
+    # Drained on another call, the lost RET_VAL must not raise there
+    bb.drain()
+    sim.fault_rate = 0.0
+    assert ifb.write_failures == 1
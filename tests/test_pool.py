@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+'''
+Base_Board_Pool on several simulated base boards
+'''
+# System level imports
+import threading
+
+import pytest
+
+# local imports
+from uMux_IF_Chain.base_board import firmware_sim
+from uMux_IF_Chain.base_board.pool import Base_Board_Pool
+from uMux_IF_Chain.base_board.transport import Loopback_Transport
+
+@pytest.fixture
+def sims():
+    return [firmware_sim.Base_Board_Sim(n_if_boards=n) for n in (1, 2, 4)]
+
+@pytest.fixture
+def pool(sims):
+    pool = Base_Board_Pool([Loopback_Transport(sim) for sim in sims])
+    yield pool
+    pool.close()
+
+def test_bring_up(pool, sims):
+    assert len(pool) == 3
+    assert all(res.ok for res in pool.get_device_info().values())
+    ifb = pool.if_boards()
+    assert [len(boards) for boards in ifb.values()] == [1, 2, 4]
+    results = pool.synth_init(ifb)
+    assert [res.value for res in results.values()] == [1, 2, 4]
+    assert all(len(board.synth_regs) > 0 for sim in sims for board in sim.if_boards.values())
+
+def test_map_runs_ports_in_parallel(pool):
+    # Only passes when all three jobs are running at the same time
+    barrier = threading.Barrier(3, timeout=5)
+    results = pool.map(lambda bb: barrier.wait() is not None)
+    assert pool.errors(results) == {}
+
+def test_error_on_one_port(pool):
+    first = list(pool.boards)[0]
+    def job(bb):
+        if(bb is pool[first]):
+            raise RuntimeError('port on fire')
+        return bb.spi_get_dev_stack()
+    results = pool.map(job)
+    errors = pool.errors(results)
+    assert list(errors) == [first]
+    assert errors[first].error == 'RuntimeError: port on fire'
+    assert 'port on fire' in errors[first].traceback
+    assert [res.value for res in results.values() if(res.ok)] == [0x3, 0xF]
+
+def test_port_that_fails_to_open(sims, capsys):
+    with Base_Board_Pool([Loopback_Transport(sims[0]), '/dev/does_not_exist']) as pool:
+        assert len(pool) == 1
+        assert list(pool.open_errors) == ['/dev/does_not_exist']
+        assert not pool.open_errors['/dev/does_not_exist'].ok
+    assert 'ERROR: Failed to open base board on /dev/does_not_exist' in capsys.readouterr().out
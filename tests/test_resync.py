@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+'''
+Recovery from lost or damaged responses
+'''
+# System level imports
+import pytest
+
+# local imports
+from uMux_IF_Chain.base_board import firmware_sim
+from uMux_IF_Chain.uMux_IF import uMux_IF_Rev1
+
+from conftest import open_base_board
+
+@pytest.mark.parametrize('protocol', ['ascii', 'binary'])
+def test_resync_after_faults(protocol):
+    '''
+    Damaged responses are resynchronised on and the reads sent again. A read can still
+    fail when its retries run out, but it never returns damaged data.
+    '''
+    sim = firmware_sim.Base_Board_Sim(n_if_boards=2, fault_rate=0.05, fault_seed=1)
+    bb = open_base_board(sim, protocol)
+    bb.print_errors = False
+    ifb = uMux_IF_Rev1.if_boards(bb)[0]
+    ifb.print_errors = False
+    failed = 0
+    for i in range(100):
+        fwid = ifb.read_FWID()
+        temps = ifb.read_temperatures_C()
+        assert fwid in (None, list(b'uMux_IF_Rev1 FW '))
+        assert temps in ((None, None), (35.0, 30.0))
+        failed += (fwid is None) + (temps == (None, None))
+        # ASCII text replies have no checksum, only hex encoded data is sure to be checked
+        if(protocol == 'binary'):
+            assert bb.clk_reference() in (None, 'LOCKED')
+        else:
+            bb.clk_reference()
+    assert failed <= 5
+    assert sim.faults > 0
+    assert bb.recovery_stats()['recoveries'] > 0
+    assert bb.recovery_stats()['resync_failures'] == 0
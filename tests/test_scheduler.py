@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+'''
+Command_Scheduler priority order, rate limits and reentrancy
+'''
+# System level imports
+import threading
+import time
+
+import pytest
+
+# local imports
+from uMux_IF_Chain.base_board.scheduler import Command_Scheduler, PRIORITY
+from uMux_IF_Chain.uMux_IF import uMux_IF_Rev1
+
+def _queue(sched, order, priority_class, tag):
+    def run():
+        with sched.priority(priority_class):
+            with sched.admit():
+                order.append(tag)
+    thread = threading.Thread(target=run)
+    n_waiting = len(sched._waiters)
+    thread.start()
+    # One at a time, so arrival order within a class is known
+    while(len(sched._waiters) == n_waiting):
+        time.sleep(0.001)
+    return thread
+
+def test_served_in_priority_order():
+    sched = Command_Scheduler()
+    order = []
+    sched.acquire()
+    threads = [_queue(sched, order, PRIORITY.BULK, 'bulk 1'),
+               _queue(sched, order, PRIORITY.TELEMETRY, 'telemetry'),
+               _queue(sched, order, PRIORITY.BULK, 'bulk 2'),
+               _queue(sched, order, PRIORITY.CONTROL, 'control')]
+    sched.release()
+    for thread in threads:
+        thread.join(5)
+    assert order == ['control', 'telemetry', 'bulk 1', 'bulk 2']
+    assert sched.stats()['bulk']['commands'] == 2
+
+def test_reentrant():
+    sched = Command_Scheduler()
+    with sched:
+        with sched.admit():
+            assert sched.owned()
+        assert sched.owned()
+    assert not sched.owned()
+    # Nested commands are part of the outer turn
+    assert sched.stats()['control']['commands'] == 0
+    with pytest.raises(RuntimeError):
+        sched.release()
+
+def test_priority_class_is_per_thread():
+    sched = Command_Scheduler(default_class=PRIORITY.TELEMETRY)
+    seen = []
+    with sched.priority(PRIORITY.BULK):
+        thread = threading.Thread(target=lambda: seen.append(sched.current_class()))
+        thread.start()
+        thread.join()
+        assert sched.current_class() == PRIORITY.BULK
+    assert seen == [PRIORITY.TELEMETRY]
+    assert sched.current_class() == PRIORITY.TELEMETRY
+    with pytest.raises(ValueError):
+        with sched.priority(7):
+            pass
+
+def test_rate_limit():
+    sched = Command_Scheduler()
+    sched.set_rate_limit(PRIORITY.BULK, 100, burst=5)
+    start = time.monotonic()
+    with sched.priority(PRIORITY.BULK):
+        for i in range(25):
+            with sched.admit():
+                pass
+    # The burst goes at once, the other 20 at 100 per second
+    assert time.monotonic() - start >= 0.18
+    # Other classes are not held back
+    start = time.monotonic()
+    for i in range(25):
+        with sched.admit():
+            pass
+    assert time.monotonic() - start < 0.1
+    sched.set_rate_limit(PRIORITY.BULK, None)
+    with pytest.raises(ValueError):
+        sched.set_rate_limit(PRIORITY.BULK, 0)
+
+def test_base_board_scheduler(bb):
+    sched = bb.enable_scheduler()
+    assert bb.enable_scheduler() is sched
+    ifb = uMux_IF_Rev1.if_boards(bb)[0]
+    with bb.priority(PRIORITY.BULK):
+        assert ifb.spi_loopback(16, 4) == 0
+    assert ifb.read_FWID() == list(b'uMux_IF_Rev1 FW ')
+    stats = sched.stats()
+    assert stats['bulk']['commands'] > 0
+    assert stats['control']['commands'] > 0
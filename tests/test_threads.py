@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+'''
+Threads sharing one base board session
+'''
+# System level imports
+import threading
+
+import pytest
+
+# local imports
+from uMux_IF_Chain.base_board import base_board_rev3, firmware_sim
+from uMux_IF_Chain.base_board.transport import Loopback_Transport, termios
+from uMux_IF_Chain.uMux_IF import uMux_IF_Rev1
+
+def _run(threads):
+    errors = []
+    def guard(fn):
+        def run():
+            try:
+                fn()
+            except Exception as e:
+                errors.append(e)
+        return run
+    threads = [threading.Thread(target=guard(fn)) for fn in threads]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(60)
+    assert errors == []
+
+def _control_and_telemetry(port, n=200):
+    '''Control on one IF board, telemetry on both and on the base board, each in its own thread'''
+    bb = base_board_rev3.Base_Board_Rev3(port)
+    bb.auto_print = 0
+    ifbs = uMux_IF_Rev1.if_boards(bb)
+    mismatches = []
+    def control():
+        for i in range(n):
+            ifbs[0].nulling_up_set(i, n - i)
+            value = ifbs[0].nulling_up_get(max_age_s=0)
+            if(value != (i, n - i)):
+                mismatches.append(('nulling_up', i, value))
+    def telemetry():
+        for i in range(n):
+            # The simulator reads each board one degree warmer than the one before
+            for slot, ifb in enumerate(ifbs[:2]):
+                if(ifb.read_temperatures_C() != (35.0 + slot, 30.0 + slot)):
+                    mismatches.append(('temperatures', slot, i))
+            if(bb.clk_reference() != 'LOCKED'):
+                mismatches.append(('clk_reference', i))
+    def info():
+        for i in range(n):
+            if(ifbs[1].read_FWID() != list(b'uMux_IF_Rev1 FW ')):
+                mismatches.append(('FWID', i))
+    try:
+        _run([control, telemetry, info])
+    finally:
+        bb.close()
+    assert mismatches == []
+
+def test_threads_share_loopback():
+    _control_and_telemetry(Loopback_Transport(firmware_sim.Base_Board_Sim()))
+
+@pytest.mark.skipif(termios is None, reason='POSIX only')
+def test_threads_share_pty():
+    _control_and_telemetry(firmware_sim.Base_Board_Sim().serve_pty(), 50)
+
+def test_transaction_lock_per_chip_select(sim):
+    bb = base_board_rev3.Base_Board_Rev3(Loopback_Transport(sim))
+    assert bb.transaction(0) is bb.transaction(0)
+    assert bb.transaction(0) is not bb.transaction(1)
+    # A transaction on one board does not hold up another
+    entered = threading.Event()
+    with bb.transaction(0):
+        threading.Thread(target=lambda: bb.transaction(1).acquire() and entered.set()).start()
+        assert entered.wait(5)
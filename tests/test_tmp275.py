@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+'''
+TMP275 readings served from a cache for one conversion time
+'''
+# System level imports
+import time
+
+# local imports
+from uMux_IF_Chain.devices.tmp275 import TMP275
+
+class _Bus:
+    '''I2C bus with one TMP275 reading 25 C'''
+    def __init__(self):
+        self.writes = []
+        self.reads = 0
+
+    def write(self, addr, data):
+        self.writes.append(list(data))
+
+    def write_read(self, addr, nbytes, data):
+        self.reads += 1
+        return [0x19, 0x00]
+
+def _tmp275():
+    bus = _Bus()
+    tmp = TMP275(0x48)
+    tmp.link_methods(bus.write, bus.write_read)
+    return tmp, bus
+
+def test_fresh_reading_from_cache():
+    tmp, bus = _tmp275()
+    assert tmp.read_temp_C() == 25.0
+    assert tmp.read_temp_F() == 77.0
+    assert (bus.reads, tmp.i2c_reads, tmp.cache_hits) == (1, 1, 1)
+    assert tmp.read_temp_C(max_age_s=0) == 25.0
+    assert bus.reads == 2
+    # The register has converted again after 27.5 ms at the default 9 bits
+    time.sleep(tmp.conversion_time_s)
+    tmp.read_temp_C()
+    assert bus.reads == 3
+
+def test_config_device():
+    tmp, bus = _tmp275()
+    tmp.read_temp_C()
+    tmp.config_device(12)
+    assert bus.writes == [[0x01, 0x60]]
+    assert tmp.conversion_time_s == 0.220
+    # The resolution change drops the cached reading
+    tmp.read_temp_C()
+    assert bus.reads == 2
+
+def test_bad_resolution(capsys):
+    tmp, bus = _tmp275()
+    tmp.config_device(13)
+    assert (tmp.resolution, bus.writes) == (9, [])
+    assert 'ERROR: TMP275 resolution' in capsys.readouterr().out
+
+def test_shutdown_one_shot():
+    tmp, bus = _tmp275()
+    tmp.config_device(9, shutdown=True)
+    start = time.monotonic()
+    assert tmp.read_temp_C() == 25.0
+    assert time.monotonic() - start >= tmp.conversion_time_s
+    assert bus.writes == [[0x01, 0x01], [0x01, 0x81]]
+
+def test_base_board_sensors(sim, bb):
+    c = sim.commands
+    first = bb.read_temp_C()
+    assert sim.commands - c == 2
+    c = sim.commands
+    assert bb.read_temp_C() == first
+    assert sim.commands == c
+    bb.read_temp_C(max_age_s=0)
+    assert sim.commands - c == 2
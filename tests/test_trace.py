@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+'''
+Recording a session to a trace file and replaying it
+'''
+# System level imports
+import pytest
+
+# local imports
+from uMux_IF_Chain.base_board import base_board_rev3, firmware_sim
+from uMux_IF_Chain.base_board.trace import Recording_Transport, Replay_Transport, Trace_Reader
+from uMux_IF_Chain.base_board.transport import Loopback_Transport, termios
+from uMux_IF_Chain.uMux_IF import uMux_IF_Rev1
+
+def _session(port, protocol):
+    bb = base_board_rev3.Base_Board_Rev3(port, protocol)
+    bb.auto_print = 0
+    try:
+        results = [bb.clk_reference()]
+        for i, ifb in enumerate(uMux_IF_Rev1.if_boards(bb)):
+            ifb.nulling_dn_set(10 * i, 20 * i)
+            results.append(ifb.nulling_dn_get(max_age_s=0))
+            results.append(ifb.read_temperatures_C())
+    finally:
+        bb.close()
+    return results
+
+def _record_and_replay(port, trace_file, protocol):
+    recorded = _session(Recording_Transport(port, trace_file), protocol)
+    summary = Trace_Reader(trace_file).summary()
+    assert (summary['tx_bytes'] > 0) and (summary['rx_bytes'] > 0)
+    replay = Replay_Transport(trace_file)
+    assert _session(replay, protocol) == recorded
+    assert (replay.mismatches, replay.overrun_bytes) == (0, 0)
+    assert replay.finished
+    return recorded
+
+@pytest.mark.parametrize('protocol', ['ascii', 'binary'])
+def test_record_and_replay_loopback(tmp_path, protocol):
+    sim = firmware_sim.Base_Board_Sim()
+    recorded = _record_and_replay(Loopback_Transport(sim), str(tmp_path / 'session.trace'), protocol)
+    assert recorded[1:3] == [(0, 0), (35.0, 30.0)]
+
+@pytest.mark.skipif(termios is None, reason='POSIX only')
+@pytest.mark.parametrize('prefix', ['', 'raw:'])
+def test_record_and_replay_pty(tmp_path, prefix):
+    '''pyserial has no read_some() of its own, the raw transport does'''
+    sim = firmware_sim.Base_Board_Sim()
+    _record_and_replay(prefix + sim.serve_pty(), str(tmp_path / 'session.trace'), 'ascii')
+
+def test_replay_reports_differing_writes(tmp_path, capsys):
+    trace_file = str(tmp_path / 'session.trace')
+    _session(Recording_Transport(Loopback_Transport(firmware_sim.Base_Board_Sim()), trace_file), 'ascii')
+    replay = Replay_Transport(trace_file)
+    bb = base_board_rev3.Base_Board_Rev3(replay)
+    bb.auto_print = 0
+    bb.print_errors = False
+    bb.spi_get_dev_stack()
+    bb.close()
+    assert replay.mismatches > 0
+    assert 'WARNING: Replay differs from the recording' in capsys.readouterr().out
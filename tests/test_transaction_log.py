@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+'''
+Transaction_Log ring buffer and the base board traffic it records
+'''
+# System level imports
+import pytest
+
+# local imports
+from uMux_IF_Chain.base_board import transaction_log
+from uMux_IF_Chain.base_board.binary_protocol import _BIN_OP
+from uMux_IF_Chain.base_board.transaction_log import Transaction_Log, LOG_DIR
+from uMux_IF_Chain.uMux_IF import uMux_IF_Rev1
+
+from conftest import open_base_board
+
+def test_ring_wraparound():
+    log = Transaction_Log(capacity=8, payload_bytes=4)
+    for i in range(20):
+        log.record(LOG_DIR.TX, _BIN_OP.SPI_WRITE, 0x1, bytes([i] * 6), seq=i)
+    assert (log.count, len(log)) == (20, 8)
+    # Oldest first, the first 12 are overwritten
+    assert list(log.records()['seq']) == list(range(12, 20))
+    # The write position is at 4, so the last 6 records straddle the end of the buffer
+    assert list(log.records(6)['seq']) == list(range(14, 20))
+    assert list(log.records(3)['seq']) == [17, 18, 19]
+    assert list(log.records(100)['seq']) == list(range(12, 20))
+    # The payload is cut at payload_bytes, the length is not
+    rec = log.records(1)[0]
+    assert (bytes(rec['payload']), rec['length']) == (bytes([19] * 4), 6)
+    log.clear()
+    assert len(log.records()) == 0
+
+def test_filter_and_save(tmp_path):
+    log = Transaction_Log(capacity=4)
+    for i in range(6):
+        log.record(LOG_DIR.TX if(i % 2 == 0) else LOG_DIR.RX, _BIN_OP.SPI_READ, 0x1 << (i % 3), seq=i)
+    assert list(log.filter(cs=0x2)['seq']) == [4]
+    assert list(log.filter(direction=LOG_DIR.RX)['seq']) == [3, 5]
+    path = str(tmp_path / 'log.npy')
+    log.save(path)
+    assert list(transaction_log.load(path)['seq']) == [2, 3, 4, 5]
+    log.save(str(tmp_path / 'log.txt'))
+    assert len(open(str(tmp_path / 'log.txt')).read().splitlines()) == 4
+
+@pytest.mark.parametrize('protocol', ['ascii', 'binary'])
+def test_base_board_logging(sim, protocol):
+    bb = open_base_board(sim, protocol)
+    log = bb.enable_logging(capacity=16)
+    ifb = uMux_IF_Rev1.if_boards(bb)[1]
+    for i in range(10):
+        ifb.read_FWID()
+    assert log.count > 16
+    assert len(log) == 16
+    spi = log.filter(cs=ifb._cs, cmd=_BIN_OP.SPI_WRITE, direction=LOG_DIR.TX)
+    assert len(spi) > 0
+    assert all(line.split()[2] == 'TX' for line in transaction_log.format_records(spi))
+
+def test_dump_on_error(sim, tmp_path):
+    # Binary, so every damaged response is caught by its CRC
+    bb = open_base_board(sim, 'binary')
+    bb.print_errors = False
+    dump_file = str(tmp_path / 'dump.txt')
+    bb.enable_logging(dump_on_error=4, dump_file=dump_file)
+    assert bb.clk_reference() == 'LOCKED'
+    assert bb.clk_reference() == 'LOCKED'
+    sim.fault_rate = 1.0
+    bb.clk_reference()
+    lines = open(dump_file).read().splitlines()
+    # Every error event appends the 4 records leading up to it, itself included
+    assert (len(lines) >= 4) and (len(lines) % 4 == 0)
+    assert lines[3].split()[2] == 'EV'
+    assert 'LOCKED' in '\n'.join(lines[:3])
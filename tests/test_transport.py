@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+'''
+The raw file descriptor, TCP and loopback transports
+'''
+# System level imports
+import socket
+
+import pytest
+import serial
+
+# local imports
+from uMux_IF_Chain.base_board import base_board_rev3, firmware_sim, transport
+from uMux_IF_Chain.base_board.line_reader import Line_Reader
+from uMux_IF_Chain.uMux_IF import uMux_IF_Rev1
+
+def _session(port):
+    bb = base_board_rev3.Base_Board_Rev3(port)
+    bb.auto_print = 0
+    try:
+        ifb = uMux_IF_Rev1.if_boards(bb)[0]
+        assert ifb.read_FWID() == list(b'uMux_IF_Rev1 FW ')
+        assert ifb.spi_loopback(255, 4) == 0
+        return type(bb.com)
+    finally:
+        bb.close()
+
+def test_open_transport_picks_backend():
+    assert isinstance(transport.open_transport('loop://'), transport.Loopback_Transport)
+    with pytest.raises(ValueError):
+        transport.open_transport('socket://localhost')
+    com = transport.Loopback_Transport()
+    assert transport.open_transport(com) is com
+
+def test_loopback_session():
+    assert _session(transport.Loopback_Transport(firmware_sim.Base_Board_Sim())) is transport.Loopback_Transport
+
+@pytest.mark.skipif(transport.termios is None, reason='POSIX only')
+def test_raw_fd_session():
+    sim = firmware_sim.Base_Board_Sim()
+    assert _session('raw:' + sim.serve_pty()) is transport.Raw_Fd_Transport
+
+@pytest.mark.skipif(transport.termios is None, reason='POSIX only')
+def test_raw_fd_read_some_times_out():
+    sim = firmware_sim.Base_Board_Sim()
+    com = transport.Raw_Fd_Transport(sim.serve_pty(), timeout=5)
+    try:
+        assert com.read_some(64, 0.05) == b''
+        assert com.timeout == 5
+    finally:
+        com.close()
+
+def test_tcp_session():
+    sim = firmware_sim.Base_Board_Sim()
+    assert _session(sim.serve_tcp()) is transport.Tcp_Transport
+
+def test_tcp_peer_close_raises():
+    server = socket.create_server(('127.0.0.1', 0))
+    with server:
+        com = transport.Tcp_Transport('127.0.0.1', server.getsockname()[1], timeout=5)
+        conn, _ = server.accept()
+        conn.sendall(b'!RCVD\n')
+        conn.close()
+        try:
+            reader = Line_Reader(com)
+            # Lines sent before the close are still delivered
+            assert reader.read_until(timeout=0.5) == b'!RCVD\n'
+            with pytest.raises(serial.SerialException):
+                reader.read_until(timeout=None)
+        finally:
+            com.close()
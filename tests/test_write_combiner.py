@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+'''
+Write_Combiner packing of command lines into USB CDC packets
+'''
+# System level imports
+import threading
+import time
+
+import pytest
+
+# local imports
+from uMux_IF_Chain.base_board.write_combiner import Write_Combiner
+from uMux_IF_Chain.uMux_IF import uMux_IF_Rev1
+
+from conftest import open_base_board
+
+class _Port:
+    def __init__(self):
+        self.writes = []
+        self.written = threading.Event()
+
+    def write(self, data) -> int:
+        self.writes.append(bytes(data))
+        self.written.set()
+        return len(data)
+
+@pytest.fixture
+def port():
+    return _Port()
+
+def test_full_packets_go_out_at_once(port):
+    wc = Write_Combiner(port, packet_size=64, deadline_s=10.0)
+    for i in range(10):
+        wc.write(b'x' * 15)
+    # 150 bytes queued, each whole packet written once it fills, 22 bytes held back
+    assert [len(x) for x in port.writes] == [64, 64]
+    assert wc.bytes_sent == 128
+    wc.close()
+    assert sum(len(x) for x in port.writes) == 150
+    assert wc.packets_sent == 3
+
+def test_partial_packet_sent_on_deadline(port):
+    wc = Write_Combiner(port, packet_size=64, deadline_s=0.01)
+    start = time.monotonic()
+    wc.write(b'*IDN?\n')
+    assert port.written.wait(1.0)
+    assert time.monotonic() - start >= 0.01
+    assert port.writes == [b'*IDN?\n']
+    wc.close()
+
+def test_flush_through_rounds_to_packets(port):
+    wc = Write_Combiner(port, packet_size=16, deadline_s=10.0)
+    wc.write(b'a' * 10)
+    wc.write(b'b' * 10)
+    end = wc.bytes_queued
+    wc.write(b'c' * 10)
+    assert port.writes == [b'a' * 10 + b'b' * 6]
+    # The second line ends at byte 20, the packet it ends in goes out, here all that is left
+    wc.flush(through=end)
+    assert port.writes[1:] == [b'b' * 4 + b'c' * 10]
+    wc.write(b'd' * 4)
+    wc.flush(through=wc.bytes_queued - 4)
+    assert len(port.writes) == 2
+    wc.flush()
+    assert port.writes[-1] == b'd' * 4
+    wc.close()
+
+def test_close_stops_flusher(port):
+    wc = Write_Combiner(port)
+    wc.write(b'x')
+    wc.close()
+    assert not wc._flusher.is_alive()
+    assert port.writes == [b'x']
+
+def test_rejects_bad_packet_size(port):
+    with pytest.raises(ValueError):
+        Write_Combiner(port, packet_size=0)
+
+def test_combined_session(sim):
+    # Single register writes, short lines that share packets
+    bb = open_base_board(sim)
+    bb.pipeline_depth = 16
+    wc = bb.enable_write_combining(packet_size=64, deadline_s=0.002)
+    ifb = uMux_IF_Rev1.if_boards(bb)[0]
+    ifb.synth_init()
+    assert ifb.synth_set_Frequency_MHz(5000) == 5000
+    assert ifb.write_failures == 0
+    assert wc.lines_per_packet() > 1.0
+    bb.disable_write_combining()
+    assert bb.write_combiner is None
@@ -0,0 +1,545 @@
+# -*- coding: utf-8 -*-
+'''
+Module async_base_board
+=================================
+asyncio client for the base board. Async_Base_Board builds its commands exactly like
+Base_Board_Rev3, but the port is watched by the event loop instead of being read with
+blocking calls, so one thread can drive several base boards and serve other clients
+at the same time. The blocking methods of Base_Board_Rev3 are coroutines here and
+the *_nowait methods return an asyncio future.
+'''
+# System level imports
+import asyncio
+import collections
+import time
+
+# local imports
+from uMux_IF_Chain.base_board import capabilities
+from uMux_IF_Chain.base_board import binary_protocol
+from uMux_IF_Chain.base_board import periodic
+from uMux_IF_Chain.base_board import base_board_rev3
+from uMux_IF_Chain.base_board.base_board_rev3 import Base_Board_Rev3, Command_Future
+from uMux_IF_Chain.base_board.binary_protocol import _BIN_OP, _BIN_STATUS
+
+class Async_Base_Board(Base_Board_Rev3):
+    '''
+    Base_Board_Rev3 driven by an asyncio event loop, use it from that loop only. Build
+    it with connect(), which opens the port in a worker thread and then negotiates the
+    protocol asked for.
+    Ports with a file descriptor (pyserial on POSIX, raw:, socket://) are watched with
+    add_reader(), others such as loop:// are polled every poll_interval_s while
+    responses are outstanding.
+    '''
+    def __init__(self, port='', protocol='ascii'):
+        super().__init__(port)
+        self.poll_interval_s = 0.001
+        self.chunk_size = 4096          # Most bytes taken from the port per read
+        self._loop = None
+        self._fd = None
+        self._poll_handle = None
+        self._flush_handle = None
+        self._rx = bytearray()
+        self._backlog = collections.deque() # Commands waiting for room in the pipeline
+        self._idle = asyncio.Event()        # Nothing queued or in flight
+        self._idle.set()
+        self._deadline = None               # Timer on the response of the oldest command
+        self._head_start = 0.0              # When that timer was started
+        self._stage = 0                     # ASCII lines of the oldest response read so far
+        self._status_str = None
+        self._hold = False                  # Protocol switch in progress, send nothing else
+        self._recovering = False
+        self._sync_waiter = None            # Future set by the reply to a sync probe
+        self._sync_prev = None
+        self._async_locks = {}
+        self._want_protocol = protocol      # Negotiated by connect()
+        self._periodic_on = False           # Keep polling a port without a file descriptor for reports
+
+    @classmethod
+    async def connect(cls, port='', protocol='ascii'):
+        '''Open the base board in a worker thread and attach it to the running loop'''
+        loop = asyncio.get_running_loop()
+        bb = await loop.run_in_executor(None, cls, port, protocol)
+        bb._attach()
+        if(bb._want_protocol == 'auto'):
+            # Capabilities are probed by the blocking Base_Board_Rev3, here only the cache is used
+            auto_print = bb.auto_print
+            bb.auto_print = 0
+            await bb.get_device_info()
+            bb.auto_print = auto_print
+            bb.capabilities = capabilities.lookup(capabilities.firmware_key(bb))
+            if((bb.capabilities is None) or bb.capabilities.binary):
+                await bb.negotiate_protocol()
+        elif(bb._want_protocol != 'ascii'):
+            await bb.negotiate_protocol()
+        return bb
+
+    def _attach(self):
+        if(self._loop is not None):
+            return
+        self._loop = asyncio.get_running_loop()
+        # reads only take what has already arrived
+        self.com.timeout = 0
+        # the event loop does the reading from here on
+        self.line_reader = None
+        try:
+            self._fd = self.com.fileno()
+        except (AttributeError, OSError, ValueError):
+            self._fd = None
+        if(self._fd is not None):
+            self._loop.add_reader(self._fd, self._on_readable)
+
+    def _detach(self):
+        for handle in (self._deadline, self._poll_handle, self._flush_handle):
+            if(handle is not None):
+                handle.cancel()
+        self._deadline = None
+        self._poll_handle = None
+        self._flush_handle = None
+        if(self._fd is not None):
+            self._loop.remove_reader(self._fd)
+            self._fd = None
+
+    async def close(self):
+        '''Close the port, the firmware is put back in ASCII mode for the next session'''
+        if(self._loop is None):
+            super().close()
+            return
+        await self.drain()
+        if(self.protocol == 'binary'):
+            await self.set_ascii_protocol()
+        self.disable_write_combining()
+        self._detach()
+        self.com.close()
+
+    def transaction(self, chip_select: int):
+        '''
+        asyncio.Lock for an exchange of several commands with one device, use as
+            async with bb.transaction(cs):
+        '''
+        lock = self._async_locks.get(chip_select)
+        if(lock is None):
+            lock = asyncio.Lock()
+            self._async_locks[chip_select] = lock
+        return lock
+
+    async def drain(self):
+        '''Wait until every queued command has been answered'''
+        await self._idle.wait()
+
+    async def negotiate_protocol(self) -> str:
+        '''Base_Board_Rev3.negotiate_protocol(), waits for the commands in flight first'''
+        await self.drain()
+        if(self.protocol == 'binary'):
+            return self.protocol
+        reply = await self._exclusive(Command_Future(self, binary_protocol.NEGOTIATE_CMD, False))
+        if(reply == binary_protocol.NEGOTIATE_REPLY):
+            self.protocol = 'binary'
+        else:
+            # Whatever an older firmware said about the request is of no use
+            self._reset_rx()
+        self._release()
+        if(self.auto_print > 0):
+            print("Base_Board_Rev3 protocol : " + self.protocol)
+        return self.protocol
+
+    async def set_ascii_protocol(self):
+        '''Put the firmware back on the ASCII line protocol'''
+        await self.drain()
+        if(self.protocol != 'binary'):
+            return
+        fut = Command_Future(self, '', False, self._decode_status("PROTO_ASCII"))
+        fut.opcode = _BIN_OP.PROTO_ASCII
+        await self._exclusive(fut)
+        self.protocol = 'ascii'
+        self._release()
+
+    def _exclusive(self, fut: Command_Future):
+        '''Send fut alone on the wire, nothing else goes out until _release()'''
+        self._attach()
+        self._hold = True
+        self._idle.clear()
+        afut = self._future_of(fut)
+        self._transmit(fut)
+        self._sent()
+        return afut
+
+    def _release(self):
+        self._hold = False
+        self._next()
+
+    async def resync(self) -> bool:
+        '''
+        Base_Board_Rev3.resync(). Responses to commands still in flight are lost, use
+        drain() first when that matters.
+        '''
+        self._attach()
+        self._recovering = True
+        try:
+            return await self._resync()
+        finally:
+            self._recovering = False
+            self._next()
+
+    async def _resync(self) -> bool:
+        self.resync_count += 1
+        self.flush()
+        for attempt in range(self.resync_attempts):
+            self._reset_rx()
+            if(self.fw_identity == ''):
+                # Without a known reply to match, let stale replies arrive and drop them too
+                await asyncio.sleep(self.resync_quiet_s)
+                self._reset_rx()
+            self._sync_prev = None
+            self._sync_waiter = self._loop.create_future()
+            try:
+                if(self._write_bytes(self._sync_probe())):
+                    self.flush()
+                    self._kick()
+                    await asyncio.wait_for(self._sync_waiter, self.resync_timeout_s)
+                    return True
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                self._sync_waiter = None
+        self.resync_failures += 1
+        return False
+
+    def _reset_rx(self):
+        self.com.reset_input_buffer()
+        self._rx.clear()
+
+    def _issue(self, fut: Command_Future):
+        '''Queue the command, it goes out once there is room in the pipeline'''
+        self._attach()
+        afut = self._future_of(fut)
+        self._backlog.append(fut)
+        self._idle.clear()
+        self._pump()
+        return afut
+
+    def _future_of(self, fut: Command_Future):
+        afut = self._loop.create_future()
+        def done(fut):
+            if(not afut.done()):
+                afut.set_result(fut.result())
+        fut.add_done_callback(done)
+        return afut
+
+    def _wait_for_window(self):
+        # _pump() only transmits when there is room
+        pass
+
+    def _pump(self):
+        while((len(self._backlog) > 0) & (not self._hold) & (not self._recovering)
+              & (len(self._pending) < max(1, self.pipeline_depth))):
+            self._transmit(self._backlog.popleft())
+        self._sent()
+
+    def _sent(self):
+        if(len(self._pending) > 0):
+            self._kick()
+            if(self._deadline is None):
+                self._arm_deadline()
+        elif((len(self._backlog) == 0) & (not self._hold)):
+            self._idle.set()
+        # everything queued in this pass of the loop goes out together
+        if((self.write_combiner is not None) & (self._flush_handle is None)):
+            self._flush_handle = self._loop.call_soon(self._flush_soon)
+
+    def _flush_soon(self):
+        self._flush_handle = None
+        self.flush()
+
+    def _next(self):
+        '''The oldest command has been dealt with, move on to the next one'''
+        if(self._deadline is not None):
+            self._deadline.cancel()
+            self._deadline = None
+        self._stage = 0
+        self._pump()
+
+    def _arm_deadline(self):
+        if((len(self._pending) == 0) | self._recovering):
+            return
+        self._head_start = time.perf_counter()
+        self._deadline = self._loop.call_later(self._response_timeout(self._pending[0]), self._on_deadline)
+
+    def _on_deadline(self):
+        self._deadline = None
+        if(len(self._pending) > 0):
+            fut = self._pending[0]
+            self._recover(fut, "no response frame" if(fut.opcode is not None) else "no response")
+
+    def _kick(self):
+        '''Make sure a port without a file descriptor gets polled'''
+        if(self._fd is None):
+            # a response may already be waiting, don't sit out the rest of the interval
+            if(self._poll_handle is not None):
+                self._poll_handle.cancel()
+            self._poll_handle = self._loop.call_soon(self._poll)
+
+    def _poll(self):
+        self._poll_handle = None
+        self._on_readable()
+        if((len(self._pending) > 0) | (self._sync_waiter is not None) | self._periodic_on):
+            self._poll_handle = self._loop.call_later(self.poll_interval_s, self._poll)
+
+    def _on_readable(self):
+        try:
+            data = self.com.read(self.chunk_size)
+        except OSError as e:
+            self._port_lost(str(e))
+            return
+        if(len(data) == 0):
+            if(self._fd is not None):
+                # readable with nothing to read, the other end hung up
+                self._port_lost("port closed")
+            return
+        self._rx += data
+        while(True):
+            if(self.protocol == 'binary'):
+                terminator = binary_protocol.FRAME_DELIMITER
+            else:
+                terminator = self._termination.encode()
+            idx = self._rx.find(terminator)
+            if(idx < 0):
+                break
+            raw = bytes(self._rx[:idx + len(terminator)])
+            del self._rx[:idx + len(terminator)]
+            if(self.protocol == 'binary'):
+                self._on_frame(raw)
+            else:
+                self._on_line(raw[:-len(terminator)].decode(errors='replace'))
+
+    def _port_lost(self, reason: str):
+        print("\tCRIT ERROR: Lost the base board port : " + reason)
+        if(self.log is not None):
+            self.log.error("port lost, " + reason)
+        self._detach()
+        in_flight = list(self._pending) + list(self._backlog)
+        self._pending.clear()
+        self._backlog.clear()
+        for fut in in_flight:
+            self._resolve(fut, None, None)
+        self._idle.set()
+
+    def _on_line(self, line: str):
+        if(periodic.is_report_line(line)):
+            self.periodic.publish_line(line)
+            return
+        if(self._sync_waiter is not None):
+            if(self._is_sync_reply(self._sync_prev, line) & (not self._sync_waiter.done())):
+                self._sync_waiter.set_result(True)
+            self._sync_prev = line
+            return
+        if(self._recovering):
+            return
+        if(len(self._pending) == 0):
+            print("\tWARNING: Base board sent a line with no command in flight : " + repr(line))
+            return
+        fut = self._pending[0]
+        if(self._stage == 0):
+            self.rcvd_str = line
+            if(line != "!RCVD"):
+                print("ERROR: Firmware didn't understand the sent command: \n\tsent_str: " +
+                               fut.cmd_str + self._termination + "\n\trcvd_str: " + line)
+                self._recover(fut, "expected !RCVD, got " + repr(line))
+                return
+            elif(self.auto_print > 1):
+                print('\t' + line)
+            self._stage = 1
+        elif(self._stage == 1):
+            self.ret_str = line
+            if(self.auto_print > 1):
+                print('\t' + line)
+            if(fut.expect_data & self._is_okay(line)):
+                self._status_str = line
+                self._stage = 2
+                return
+            self._complete(fut, line, None)
+        else:
+            data = self._hex_to_bytes(line)
+            if((data is None) or ((fut.nbytes_read > 0) & (len(data) != fut.nbytes_read))):
+                self._recover(fut, "bad data line " + repr(line))
+                return
+            self.ret_str = line
+            self.ret_str_data = line
+            self._complete(fut, self._status_str, data)
+
+    def _on_frame(self, raw: bytes):
+        if(periodic.is_report_frame(raw)):
+            self.periodic.publish_frame(raw)
+            return
+        if(self._sync_waiter is not None):
+            if(self._is_sync_frame(raw) & (not self._sync_waiter.done())):
+                self._sync_waiter.set_result(True)
+            return
+        if(self._recovering):
+            return
+        if(len(self._pending) == 0):
+            print("\tWARNING: Base board sent a frame with no command in flight : " + raw.hex())
+            return
+        fut = self._pending[0]
+        try:
+            status, seq, payload = binary_protocol.decode_frame(raw)
+        except ValueError as e:
+            self._recover(fut, "bad response frame, " + str(e))
+            return
+        if(status == _BIN_STATUS.CRC_ERROR):
+            # The request was damaged on the way in and never ran, so any command can go again
+            self._pending.popleft()
+            if(fut.tries < self.max_retries):
+                fut.tries += 1
+                self.retry_count += 1
+                self._transmit(fut)
+            else:
+                print("ERROR: Firmware keeps rejecting the CRC of op=0x{:02X} {}".format(fut.opcode, fut.cmd_str))
+                self._resolve(fut, None, None)
+            self._next()
+            return
+        if(seq != fut.seq):
+            self._recover(fut, "response sequence {} does not match request {}".format(seq, fut.seq))
+            return
+        if(status == _BIN_STATUS.INVALID):
+            print("ERROR: Firmware didn't understand the sent command: op=0x{:02X} {}".format(fut.opcode, fut.cmd_str))
+            self._complete(fut, None, None)
+            return
+        status_str, data = self._frame_response(fut, status, payload)
+        self._complete(fut, status_str, data)
+
+    def _complete(self, fut: Command_Future, status_str, data):
+        self._pending.popleft()
+        self._resolve(fut, status_str, data)
+        self._next()
+
+    def _recover(self, fut: Command_Future, reason: str):
+        '''Base_Board_Rev3._recover(), the resync runs as a task while new commands wait'''
+        print("\tERROR: Lost sync with the base board on '" + fut.cmd_str + "' : " + reason)
+        if(self.log is not None):
+            self.log.error(reason, fut._log_cmd, fut._log_cs, fut.seq)
+        in_flight = list(self._pending)
+        self._pending.clear()
+        self._recovering = True
+        if(self._deadline is not None):
+            self._deadline.cancel()
+            self._deadline = None
+        self._loop.create_task(self._recover_task(in_flight, self._head_start))
+
+    async def _recover_task(self, in_flight: list, start: float):
+        synced = await self._resync()
+
+        self.recovery_count += 1
+        self.recovery_time_s = time.perf_counter() - start
+        self.recovery_time_total_s += self.recovery_time_s
+        self.recovery_time_max_s = max(self.recovery_time_max_s, self.recovery_time_s)
+        if(synced):
+            print("\tWARNING: Base board back in sync after {:.1f} ms".format(self.recovery_time_s * 1e3))
+        else:
+            print("\tCRIT ERROR: Base board did not answer the sync probe")
+
+        resend = []
+        for x in in_flight:
+            if(synced & x.idempotent & (x.tries < self.max_retries)):
+                x.tries += 1
+                self.retry_count += 1
+                resend.append(x)
+            else:
+                print("\tERROR: Response lost for '" + x.cmd_str + "'")
+                self._resolve(x, None, None)
+        self._backlog.extendleft(reversed(resend))
+        self._recovering = False
+        self._next()
+
+    async def get_device_info(self):
+        # All five queries go out together when pipelining is enabled
+        (self.fw_identity, self.fw_serial_number, self.fw_version, self.fw_description,
+         self.fw_timestamp) = await asyncio.gather(
+            *[self.submit(cmd, idempotent=True) for cmd in ("*IDN?", "*SN?", "*FW_VER?", "*FW_DESC?", "*FW_TIMESTAMP?")])
+
+        if(self.auto_print > 0):
+            print(self.fw_identity)
+            print('\t' + self.fw_description)
+            print('\t' + self.fw_serial_number)
+            print('\t' + self.fw_version)
+            print('\t' + self.fw_timestamp)
+
+    async def clk_reference(self) -> str:
+        ret_str = await self.submit('I2C:SI_LOCK?', idempotent=True)
+        if(ret_str is None):
+            ret_str = ''
+
+        if(self.auto_print > 0):
+            print('\t' + ret_str)
+        return ret_str
+
+    async def i2c_write(self, i2c_addr: int, data_array):
+        return await self.i2c_write_nowait(i2c_addr, data_array)
+
+    async def i2c_write_read(self, i2c_addr: int, nbytes_read: int, data_array) -> list:
+        return await self.i2c_write_read_nowait(i2c_addr, nbytes_read, data_array)
+
+    async def i2c_read(self, i2c_addr: int, num_bytes: int) -> list:
+        return await self.i2c_read_nowait(i2c_addr, num_bytes)
+
+    async def i2c_scan_addr(self) -> list:
+        return await self.i2c_scan_addr_nowait()
+
+    async def spi_write(self, chip_select: int, data_array):
+        return await self.spi_write_nowait(chip_select, data_array)
+
+    async def spi_write_read(self, chip_select: int, nbytes_read: int, data_array) -> list:
+        return await self.spi_write_read_nowait(chip_select, nbytes_read, data_array)
+
+    async def spi_read(self, chip_select: int, num_bytes: int) -> list:
+        return await self.spi_read_nowait(chip_select, num_bytes)
+
+    async def spi_get_dev_stack(self) -> int:
+        return await self.spi_get_dev_stack_nowait()
+
+    async def spi_get_chip_selects(self) -> list:
+        dev_stack = await self.spi_get_dev_stack()
+        if(dev_stack is None):
+            return []
+        return base_board_rev3.chip_selects(dev_stack)
+
+    async def spi_hard_reset(self, chip_select: int):
+        return await self.spi_hard_reset_nowait(chip_select)
+
+    async def spi_batch(self, transactions) -> list:
+        sent = self._batch_nowait('SPI', transactions)
+        return self._batch_results(sent, await asyncio.gather(*[x[0] for x in sent]))
+
+    async def i2c_batch(self, transactions) -> list:
+        sent = self._batch_nowait('I2C', transactions)
+        return self._batch_results(sent, await asyncio.gather(*[x[0] for x in sent]))
+
+    async def enable_periodic_checking(self):
+        '''Reports are published through self.periodic as the event loop reads them, no listener thread is needed'''
+        await self.submit("*FW_START_PER", idempotent=True)
+        self._periodic_on = True
+        self._kick()
+
+    async def disable_periodic_checking(self):
+        self._periodic_on = False
+        await self.submit("*FW_STOP_PER", idempotent=True)
+
+    def start_periodic_listener(self, interval_s=0.01):
+        raise RuntimeError("Async_Base_Board reads periodic reports on the event loop, there is no listener thread")
+
+    async def _read_tmp275_C(self, tmp, max_age_s=None):
+        '''TMP275.read_temp_C() without blocking the event loop'''
+        temp = tmp.cached_temp_C(max_age_s)
+        if(temp is not None):
+            return temp
+        if(tmp.shutdown):
+            # both sensors are read with gather(), so their conversions overlap
+            await self.i2c_write(tmp.i2c_addr, [0x01, tmp.config_byte(one_shot=True)])
+            await asyncio.sleep(tmp.conversion_time_s)
+        return tmp.store_temp_C(await self.i2c_write_read(tmp.i2c_addr, 0x2, [0x00]))
+
+    async def read_temp_C(self, max_age_s=None):
+        return list(await asyncio.gather(self._read_tmp275_C(self.tmp_center, max_age_s),
+                                         self._read_tmp275_C(self.tmp_power_converter, max_age_s)))
+
+    async def read_temp_F(self, max_age_s=None):
+        return [None if(temp is None) else (temp * 1.8 + 32) for temp in await self.read_temp_C(max_age_s)]
@@ -6,116 +6,844 @@ This module is responsible for communicating with any development board
 that contains a tyr command processor.
 '''
 # System level imports
-import serial
+import collections
+import contextlib
+import functools
+import threading
 import time
 
+import numpy as np
+
 # local imports
 from uMux_IF_Chain.devices import tmp275
+from uMux_IF_Chain.base_board.write_combiner import Write_Combiner
+from uMux_IF_Chain.base_board.line_reader import Line_Reader
+from uMux_IF_Chain.base_board import binary_protocol
+from uMux_IF_Chain.base_board import transport
+from uMux_IF_Chain.base_board import discovery
+from uMux_IF_Chain.base_board import capabilities
+from uMux_IF_Chain.base_board.capabilities import Capabilities
+from uMux_IF_Chain.base_board import transaction_log
+from uMux_IF_Chain.base_board import periodic
+from uMux_IF_Chain.base_board.periodic import Periodic_Monitor
+from uMux_IF_Chain.base_board.transaction_log import Transaction_Log, LOG_DIR, LOG_STATUS
+from uMux_IF_Chain.base_board.scheduler import Command_Scheduler, PRIORITY
+from uMux_IF_Chain.base_board.binary_protocol import _BIN_OP, _BIN_STATUS
+
+# DEV_STACK is a 32 bit mask with a bit per IF board slot, the chip select of a board is its bit
+MAX_IF_BOARDS = 32
+
+def chip_selects(dev_stack: int) -> list:
+    '''Chip select of every IF board in a DEV_STACK mask, lowest slot first, empty slots skipped'''
+    out = []
+    while(dev_stack):
+        cs = dev_stack & -dev_stack
+        out.append(cs)
+        dev_stack ^= cs
+    return out
+
+def _locked(method):
+    '''Hold the base board io lock for the duration of the method'''
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+def _scheduled(method):
+    '''Wait for the port in priority order when a scheduler is enabled, then hold the io lock'''
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if(self.scheduler is None):
+            with self._lock:
+                return method(self, *args, **kwargs)
+        with self.scheduler.admit():
+            return method(self, *args, **kwargs)
+    return wrapper
+
+class Command_Future:
+    '''
+    Handle for a command that has been sent to the firmware but whose response
+    may not have been read back yet. Calling result() reads responses off of the
+    serial port, in order, until this command has completed.
+    '''
+    def __init__(self, base_board, cmd_str: str, expect_data: bool, decode=None):
+        self._bb = base_board
+        self.cmd_str = cmd_str          # Command string that was sent, without termination
+        self.expect_data = expect_data  # Firmware sends a data line after a good status line
+        self._decode = decode           # decode(status_str, data_bytes) -> result
+        self.opcode = None              # Binary protocol opcode, None for an ASCII line
+        self.payload = b''              # Binary protocol payload, kept to resend the frame
+        self.seq = 0                    # Binary protocol sequence number
+        self.nbytes_read = 0            # Data bytes the response carries, sizes its deadline
+        self.idempotent = False         # Safe to send again when its response was lost
+        self.tries = 0                  # Resends after a resync
+        self._tx_end = None             # Write combiner position of the end of this command
+        self._log_cmd = 0               # Transaction log command code and chip select
+        self._log_cs = 0
+        self._callbacks = []
+        self._done = False
+        self._result = None
+
+    def done(self) -> bool:
+        return self._done
+
+    def result(self):
+        '''Block until the firmware has responded to this command and return the decoded result'''
+        while(not self._done):
+            # another thread may read this response while we wait on the lock
+            with self._bb._lock:
+                if(not self._done):
+                    self._bb._complete_oldest()
+        return self._result
+
+    def add_done_callback(self, fn):
+        '''fn(future) is called once the response is read, right away if it already has been'''
+        if(self._done):
+            fn(self)
+        else:
+            self._callbacks.append(fn)
+
+    def _set_result(self, result):
+        self._result = result
+        self._done = True
+        for fn in self._callbacks:
+            fn(self)
+        self._callbacks = []
 
 class Base_Board_Rev3:
-    def __init__(self, port=''):
+    def __init__(self, port='', protocol='ascii'):
+        '''
+            port     : serial port the base board enumerates as, a transport URL such as
+                       raw:/dev/ttyACM0, socket://host:port or loop://, or a transport object.
+                       sn:<serial number> finds the port of that board, see discovery
+            protocol : 'ascii' for the line protocol, 'binary' to negotiate binary framing
+                       and fall back to ASCII when the firmware lacks it, 'auto' to go by
+                       the firmware capabilities, probed once per firmware and cached
+        '''
         if(port == ''):
             raise IOError("There is no default serial com port, user must tell Base_Board_Rev3 what port to use")
+        if(isinstance(port, str) and port.startswith('sn:')):
+            port = discovery.find_port(port[len('sn:'):])
         self.port = port    # Serial port we are supposed to communicate with
-        self.com = serial.Serial(port=self.port, timeout=6, write_timeout=6) # PySerial object
+        self.com = transport.open_transport(self.port, timeout=6, write_timeout=6) # PySerial like object
         self.ret_int = 0         # Number of bytes sent to the VCP
         self.sent_str = ''       # holder for the string that was sent to the device
         self.rcvd_str = ''       # place to hold that the command was received by the firmware
         self.ret_str = ''        # Place to hold the returned string for the last command
         self.ret_str_data = ''   # Place to hold returned data so it is not overwritten
         self.auto_print = 1      # Shall I print to console?
+        self.print_errors = True # Print errors and warnings, off while probing what the firmware rejects
+        self.return_bytes = False # Read methods return bytes instead of a list of int
         self._termination = '\n' # Expected string line termination
+        # Command pipelining, number of commands allowed on the wire before waiting
+        # on the oldest response. 1 is the classic write -> wait for response behavior
+        self.pipeline_depth = 1
+        self._pending = collections.deque()
+        # Threads share the session, every command is atomic under _lock and multi-command
+        # exchanges with one device take its transaction() lock
+        self._lock = threading.RLock()
+        self._transaction_locks = {}
+        # Optional priority scheduling of the port between threads, see enable_scheduler()
+        self.scheduler = None
+        # Optional write combining, None sends every command line as its own write
+        self.write_combiner = None
+        # Buffered receive path, None falls back to one pyserial read_until() per line
+        self.line_reader = Line_Reader(self.com, self._termination.encode())
+        # Wire protocol, switched to 'binary' by negotiate_protocol()
+        self.protocol = 'ascii'
+        self._seq = 0
+        self._sync_seq = 0
+        # Response deadlines and recovery from lost or garbled responses. A response is
+        # given response_timeout_s plus byte_timeout_s per data byte before the link is
+        # resynchronised on the reply to sync_cmd
+        self.response_timeout_s = 0.1
+        self.byte_timeout_s = 20e-6
+        self.resync_timeout_s = 0.1     # Allowed for each sync probe reply
+        self.resync_attempts = 3
+        self.resync_quiet_s = 0.02      # Wait for stale replies when fw_identity is not known yet
+        self.sync_cmd = '*IDN?'
+        self.max_retries = 2            # Resends of an idempotent command
+        # Recovery statistics, see recovery_stats()
+        self.resync_count = 0
+        self.resync_failures = 0
+        self.recovery_count = 0         # Resyncs forced by a lost or garbled response
+        self.retry_count = 0
+        self.recovery_time_s = 0.0      # Last recovery, from the missed deadline to back in sync
+        self.recovery_time_total_s = 0.0
+        self.recovery_time_max_s = 0.0
         # Firmware information
         self.fw_identity = ''
         self.fw_serial_number = ''
         self.fw_version = ''
         self.fw_description = ''
         self.fw_timestamp = ''
+        self.capabilities = None    # Capabilities of the firmware, see probe_capabilities()
+        self.batch_max_bytes = 1024 # Request and reply bytes of one SPI:BATCH / I2C:BATCH command
+        self.hard_resets = 0        # spi_hard_reset() calls, IF boards drop the state they cache when it changes
         # Local Devices
         self.tmp_center = tmp275.TMP275(0x48)
         self.tmp_center.link_methods(self.i2c_write, self.i2c_write_read)
         self.tmp_power_converter = tmp275.TMP275(0x49)
         self.tmp_power_converter.link_methods(self.i2c_write, self.i2c_write_read)
 
-        #dangerous, keeps a lot of data around
-        self._enable_logging = False
-        self._log = []
+        # Transaction log, a fixed size ring buffer, see enable_logging()
+        self.log = None
+        # Unsolicited reports of periodic checking, taken out of the receive path
+        self.periodic = Periodic_Monitor()
+        self._listener = None
+        self._listener_stop = threading.Event()
         self._com_delay_s = 0.00
 
+        if(protocol == 'auto'):
+            # Firmware known to lack binary framing is not kept waiting on the negotiation
+            if(self.probe_capabilities().binary):
+                self.negotiate_protocol()
+        elif(protocol != 'ascii'):
+            self.negotiate_protocol()
+
     def close(self):
-        '''Close the serial port'''
-        self.com.close()
+        '''Close the serial port, the firmware is put back in ASCII mode for the next session'''
+        self.stop_periodic_listener()
+        with self._lock:
+            self.drain()
+            if(self.protocol == 'binary'):
+                self.set_ascii_protocol()
+            self.disable_write_combining()
+            self.com.close()
 
     def open(self):
         '''Open the serial port'''
         self.com.open()
 
-    def _byteArrayToStrHex(self, dataArray: list) -> str:
-        data_str = ''
-        for i in dataArray:
-            data_str = data_str + hex(i)[2:].rjust(2,'0').upper()
-
-        return data_str
-    
-    def _write(self, str_in: str):
-        '''Write to the Serial com port'''
-        #clear previous transaction status
-        self.rcvd_str = ''
+    @_locked
+    def enable_write_combining(self, packet_size=64, deadline_s=0.002):
+        '''
+        Pack command lines into full USB CDC packets (64 for full speed, 512 for high speed)
+        Partial packets are sent after deadline_s, by flush(), or when a response is needed.
+        Only useful with pipeline_depth > 1, lockstep commands have to flush every line.
+        '''
+        self.disable_write_combining()
+        self.write_combiner = Write_Combiner(self.com, packet_size, deadline_s)
+        return self.write_combiner
+
+    @_locked
+    def disable_write_combining(self):
+        if(self.write_combiner is not None):
+            self.write_combiner.close()
+        self.write_combiner = None
+
+    @_locked
+    def flush(self):
+        '''Send any command lines held by the write combiner'''
+        if(self.write_combiner is not None):
+            self.write_combiner.flush()
+
+    @_locked
+    def negotiate_protocol(self, timeout_s=0.5) -> str:
+        '''
+        Ask the firmware to switch to binary framing. Firmware that does not know the
+        request answers with something else, or nothing within timeout_s, and the
+        session stays on the ASCII protocol. Returns the protocol in use.
+        '''
+        self.drain()
+        if(self.protocol == 'binary'):
+            return self.protocol
+        reply = ''
+        if(self._send(binary_protocol.NEGOTIATE_CMD)):
+            self.flush()
+            deadline = self._deadline(timeout_s)
+            if(self._read_line("negotiate:read_until", timeout_s) == "!RCVD"):
+                reply = self._read_line("negotiate:read_until", max(self._time_left(deadline), 0.001))
+
+        if(reply == binary_protocol.NEGOTIATE_REPLY):
+            self.protocol = 'binary'
+            if(self.line_reader is not None):
+                self.line_reader.terminator = binary_protocol.FRAME_DELIMITER
+        else:
+            # Whatever an older firmware said about the request is of no use
+            self.com.reset_input_buffer()
+            if(self.line_reader is not None):
+                self.line_reader.reset()
+        if(self.auto_print > 0):
+            print("Base_Board_Rev3 protocol : " + self.protocol)
+        return self.protocol
+
+    @_locked
+    def probe_capabilities(self, refresh=False) -> Capabilities:
+        '''
+        Find what the firmware supports, see the capabilities module. Looked up in the
+        cache when this firmware version and serial number have been probed before.
+            refresh : probe again even when cached
+        '''
+        self.capabilities = capabilities.base_board_capabilities(self, refresh)
+        return self.capabilities
+
+    @_locked
+    def set_ascii_protocol(self):
+        '''Put the firmware back on the ASCII line protocol'''
+        if(self.protocol != 'binary'):
+            return
+        self._submit_frame(_BIN_OP.PROTO_ASCII, b'', False, self._decode_status("PROTO_ASCII")).result()
+        self.protocol = 'ascii'
+        if(self.line_reader is not None):
+            self.line_reader.terminator = self._termination.encode()
+
+    def _byteArrayToStrHex(self, dataArray) -> str:
+        '''Hex encode a uint8 payload in one pass'''
+        return self._to_bytes(dataArray).hex().upper()
+
+    def _to_bytes(self, data_array):
+        '''
+        Check a uint8 payload and return it as a bytes like object, without copying when it
+        already is one. Accepts bytes, bytearray, memoryview, NumPy arrays and lists of int.
+        '''
+        if(isinstance(data_array, (bytes, bytearray))):
+            return data_array
+        if(isinstance(data_array, memoryview)):
+            if(data_array.format == 'B'):
+                return data_array if(data_array.ndim == 1) else data_array.cast('B')
+            data_array = np.asarray(data_array)
+        if(isinstance(data_array, np.ndarray)):
+            if(data_array.dtype == np.uint8):
+                return memoryview(np.ascontiguousarray(data_array).reshape(-1))
+            if(not np.issubdtype(data_array.dtype, np.integer)):
+                raise TypeError('Type in the array must be integer, not ' + str(data_array.dtype))
+            if(data_array.size > 0):
+                if(data_array.min() < 0):
+                    raise ValueError('Numbers in list must conform to the uint8 range, ' + str(data_array.min()) + ' is negative')
+                if(data_array.max() > 255):
+                    raise ValueError('Numbers in list must conform to the uint8 range, ' + str(data_array.max()) + ' is above 255')
+            return data_array.astype(np.uint8).tobytes()
+        if(isinstance(data_array, (int, str))):
+            raise TypeError('data_array must be a sequence of integers')
+        # bytes() checks the type and range of every element in C
+        try:
+            return bytes(data_array)
+        except TypeError:
+            raise TypeError('Type in the list must be integer')
+        except ValueError:
+            for i in data_array:
+                if(i < 0):
+                    raise ValueError('Numbers in list must conform to the uint8 range, ' + str(i) + ' is negative')
+                if(i > 255):
+                    raise ValueError('Numbers in list must conform to the uint8 range, ' + str(i) + ' is above 255')
+            raise
+
+    def _strHexToByteArray(self, data_str: str):
+        '''Decode a hex data line in one pass, a list of int unless return_bytes is set'''
+        data = bytes.fromhex(data_str)
+        if(self.return_bytes):
+            return data
+        return list(data)
+
+    def _send(self, str_in: str) -> bool:
+        '''Write a command line to the Serial com port without waiting on the response'''
         if(self.auto_print > 0):
             print(str_in)
         #Append the termination character self._termination
         self.sent_str = str_in + self._termination
         #write to the serial interface and then compare the number of bytes sent
-        if(self._enable_logging):
-            self._log.append("_write:  sent_str : " + self.sent_str)
-
-        self.ret_int = self.com.write(self.sent_str.encode())
+        return self._write_bytes(self.sent_str.encode())
+
+    def transaction(self, chip_select: int):
+        '''
+        Lock for an exchange of several commands with one device, use as
+            with bb.transaction(cs):
+        Other threads can still send commands to other chip selects in between, single
+        commands are always atomic. Don't start a transaction from a done callback.
+        '''
+        with self._lock:
+            lock = self._transaction_locks.get(chip_select)
+            if(lock is None):
+                lock = threading.RLock()
+                self._transaction_locks[chip_select] = lock
+        return lock
+
+    def enable_scheduler(self, default_class=PRIORITY.CONTROL) -> Command_Scheduler:
+        '''
+        Serve threads waiting for the port in priority order, control before telemetry
+        before bulk, instead of in whatever order they grab it. Call it before other
+        threads start using the base board. Returns the scheduler, for its rate limits
+        and queue wait statistics.
+        '''
+        if(self.scheduler is not None):
+            return self.scheduler
+        with self._lock:
+            self.drain()
+            self.scheduler = Command_Scheduler(default_class)
+            self._lock = self.scheduler
+        return self.scheduler
+
+    def priority(self, priority_class: int):
+        '''
+        Context in which the commands of this thread run in priority_class, use as
+            with bb.priority(PRIORITY.BULK):
+        Does nothing when no scheduler is enabled.
+        '''
+        if(self.scheduler is None):
+            return contextlib.nullcontext()
+        return self.scheduler.priority(priority_class)
+
+    def _write_bytes(self, frame) -> bool:
+        '''Hand an encoded command to the port, or the write combiner when it is enabled'''
+        if(self.write_combiner is not None):
+            self.ret_int = self.write_combiner.write(frame)
+        else:
+            self.ret_int = self.com.write(frame)
         #check length
-        if(self.ret_int != len(self.sent_str)):
-            print("\tCRIT ERROR: Failed to send all of the bytes within the timeout period!!")
-            return
+        if(self.ret_int != len(frame)):
+            self._print_error("\tCRIT ERROR: Failed to send all of the bytes within the timeout period!!")
+            return False
+        return True
+
+    def _read_line(self, log_name: str, timeout=None) -> str:
+        '''
+        Read one line from the serial com port and strip the termination, None on timeout.
+        Periodic reports on the way are published, the timeout covers them too.
+        '''
+        deadline = self._deadline(timeout)
+        while(True):
+            temp_str = self._read_any_line(timeout)
+            if((temp_str is None) or (not periodic.is_report_line(temp_str))):
+                return temp_str
+            self.periodic.publish_line(temp_str)
+            timeout = self._time_left(deadline)
+            if(timeout == 0):
+                return None
+
+    def _read_any_line(self, timeout=None) -> str:
+        '''_read_line() without taking periodic reports out'''
+        if(self.line_reader is not None):
+            temp_str = self.line_reader.read_until(timeout).decode(errors='replace')
+        else:
+            # pyserial alone only has the port timeout
+            temp_str = self.com.read_until().decode(errors='replace')
+        if(not temp_str.endswith(self._termination)):
+            return None
+        return temp_str[:-1]
+
+    def _read_frame(self, timeout=None) -> bytes:
+        '''Read one binary protocol frame including its delimiter, None on timeout, publishing periodic reports'''
+        deadline = self._deadline(timeout)
+        while(True):
+            raw = self._read_any_frame(timeout)
+            if((raw is None) or (not periodic.is_report_frame(raw))):
+                return raw
+            self.periodic.publish_frame(raw)
+            timeout = self._time_left(deadline)
+            if(timeout == 0):
+                return None
+
+    def _read_any_frame(self, timeout=None) -> bytes:
+        if(self.line_reader is not None):
+            raw = self.line_reader.read_until(timeout)
+        else:
+            raw = self.com.read_until(binary_protocol.FRAME_DELIMITER)
+        if(raw[-1:] != binary_protocol.FRAME_DELIMITER):
+            return None
+        return raw
 
-        self.rcvd_str = self.com.read_until().decode()
+    def _deadline(self, timeout):
+        '''time.monotonic() a read with this timeout gives up at, None for no limit'''
+        if(timeout is None):
+            timeout = self.com.timeout
+        return None if(timeout is None) else time.monotonic() + timeout
 
-        if(self._enable_logging):
-            self._log.append("_write:read_until : " + self.rcvd_str)
+    def _time_left(self, deadline):
+        if(deadline is None):
+            return None
+        return max(deadline - time.monotonic(), 0)
 
-        self.rcvd_str = self.rcvd_str[:-1]
+    def _response_timeout(self, fut: Command_Future) -> float:
+        '''Deadline for a response, sized to the data it carries (hex encoded in the worst case)'''
+        return self.response_timeout_s + (fut.nbytes_read << 1) * self.byte_timeout_s
 
+    def _read(self, timeout=None) -> bool:
+        '''Read from the serial com port using read_until(), False on timeout'''
+        if(self._com_delay_s > 0):
+            time.sleep(self._com_delay_s)
+        if(timeout is None):
+            timeout = self.response_timeout_s
+        ret_str = self._read_line(" _read:read_until", timeout)
+        self.ret_str = '' if(ret_str is None) else ret_str
+        if(self.auto_print > 1):
+                print('\t' + self.ret_str)
+        return ret_str is not None
+
+    @_scheduled
+    def submit(self, cmd_str: str, expect_data=False, decode=None, callback=None,
+               nbytes_read=0, idempotent=False) -> Command_Future:
+        '''
+        Send a command without waiting for its response. Up to pipeline_depth commands
+        are kept in flight, when the window is full the oldest response is read first.
+        Responses come back in the order the commands were sent.
+            cmd_str     : command line, without termination
+            expect_data : firmware follows a good status line with a data line
+            decode      : decode(status_str, data_bytes) -> result, default returns status_str
+            callback    : callback(future) when the response has been read
+            nbytes_read : data bytes in the response, sizes the response deadline
+            idempotent  : the command is sent again if its response is lost
+        In binary mode the line is tunneled through an ASCII_CMD frame.
+        '''
+        if(self.protocol == 'binary'):
+            return self._submit_frame(_BIN_OP.ASCII_CMD, cmd_str.encode(), expect_data, decode, callback,
+                                      cmd_str, nbytes_read, idempotent)
+
+        fut = Command_Future(self, cmd_str, expect_data, decode)
+        fut.nbytes_read = nbytes_read
+        fut.idempotent = idempotent
+        if(callback is not None):
+            fut.add_done_callback(callback)
+        return self._issue(fut)
+
+    @_scheduled
+    def _submit_frame(self, opcode: int, payload, expect_data, decode, callback=None, cmd_str='',
+                      nbytes_read=0, idempotent=False) -> Command_Future:
+        '''Binary protocol counterpart of submit()'''
+        fut = Command_Future(self, cmd_str, expect_data, decode)
+        fut.opcode = opcode
+        fut.payload = bytes(payload)
+        fut.nbytes_read = nbytes_read
+        fut.idempotent = idempotent
+        if(callback is not None):
+            fut.add_done_callback(callback)
+        return self._issue(fut)
+
+    def _issue(self, fut: Command_Future):
+        '''Send a newly built command, returns what submit() hands back for it'''
+        self._transmit(fut)
+        return fut
+
+    def _transmit(self, fut: Command_Future):
+        '''Put a command on the wire and queue it for its response, also used to resend one'''
+        self._wait_for_window()
+        if(fut.opcode is None):
+            sent = self._send(fut.cmd_str)
+        else:
+            fut.seq = self._seq
+            self._seq = (self._seq + 1) & 0xFF
+            frame = binary_protocol.encode_frame(fut.opcode, fut.seq, fut.payload)
+            if(self.auto_print > 0):
+                print("BIN op=0x{:02X} seq={} len={} {}".format(fut.opcode, fut.seq, len(fut.payload), fut.cmd_str))
+            sent = self._write_bytes(frame)
+        if(not sent):
+            self._resolve(fut, None, None)
+            return
+        if(self.log is not None):
+            self._log_command(fut)
+        self._enqueue(fut)
+
+    def _wait_for_window(self):
+        while(len(self._pending) >= max(1, self.pipeline_depth)):
+            self._complete_oldest()
+
+    def _enqueue(self, fut: Command_Future):
+        if(self.write_combiner is not None):
+            fut._tx_end = self.write_combiner.bytes_queued
+        self._pending.append(fut)
+
+    @_locked
+    def drain(self):
+        '''Read back the responses of every command still in flight'''
+        while(len(self._pending) > 0):
+            self._complete_oldest()
+
+    @_locked
+    def _complete_oldest(self):
+        '''Read the response of the oldest in flight command and resolve its future'''
+        fut = self._pending.popleft()
+        # The response can't arrive while its command is sitting in the write combiner
+        if((self.write_combiner is not None) & (fut._tx_end is not None)):
+            self.write_combiner.flush(fut._tx_end)
+        start = time.perf_counter()
+        timeout = self._response_timeout(fut)
+        if(fut.opcode is not None):
+            self._complete_frame(fut, start, timeout)
+            return
+
+        self.rcvd_str = self._read_line("_write:read_until", timeout)
         if(self.rcvd_str != "!RCVD"):
-            print("ERROR: Firmware didn't understand the sent command: \n\tsent_str: " + 
-                           self.sent_str + "\n\trcvd_str: " + self.rcvd_str)
+            # Without a checksum a rejected command and a garbled !RCVD look the same
+            if(self.rcvd_str is not None):
+                self._print_error("ERROR: Firmware didn't understand the sent command: \n\tsent_str: " +
+                               fut.cmd_str + self._termination + "\n\trcvd_str: " + self.rcvd_str)
+            self._recover(fut, start, "expected !RCVD, got " + repr(self.rcvd_str))
             return
         elif(self.auto_print > 1):
             print('\t' + self.rcvd_str)
 
-    def _read(self):
-        '''Read from the serial com port using read_until()'''
-        if(self._com_delay_s > 0):
-            time.sleep(self._com_delay_s)
-        temp_str = self.com.read_until().decode()
-        if(self._enable_logging):
-            self._log.append(" _read:read_until : " + temp_str)
-        self.ret_str = temp_str[:-1]   # Remove line termination
+        if(not self._read(timeout)):
+            self._recover(fut, start, "no status line")
+            return
+        status_str = self.ret_str
+        data = None
+        if(fut.expect_data & self._is_okay(status_str)):
+            if(self._read(timeout)):
+                data = self._hex_to_bytes(self.ret_str)
+            if((data is None) or ((fut.nbytes_read > 0) & (len(data) != fut.nbytes_read))):
+                self._recover(fut, start, "bad data line " + repr(self.ret_str))
+                return
+            self.ret_str_data = self.ret_str
+        self._resolve(fut, status_str, data)
+
+    def _complete_frame(self, fut: Command_Future, start: float, timeout: float):
+        '''Binary protocol counterpart of the ASCII part of _complete_oldest()'''
+        raw = self._read_frame(timeout)
+        if(raw is None):
+            self._recover(fut, start, "no response frame")
+            return
+        try:
+            status, seq, payload = binary_protocol.decode_frame(raw)
+        except ValueError as e:
+            self._recover(fut, start, "bad response frame, " + str(e))
+            return
+        if(status == _BIN_STATUS.CRC_ERROR):
+            # The request was damaged on the way in and never ran, so any command can go again
+            if(fut.tries < self.max_retries):
+                fut.tries += 1
+                self.retry_count += 1
+                self._transmit(fut)
+            else:
+                self._print_error("ERROR: Firmware keeps rejecting the CRC of op=0x{:02X} {}".format(fut.opcode, fut.cmd_str))
+                self._resolve(fut, None, None)
+            return
+        if(seq != fut.seq):
+            self._recover(fut, start, "response sequence {} does not match request {}".format(seq, fut.seq))
+            return
+        if(status == _BIN_STATUS.INVALID):
+            self._print_error("ERROR: Firmware didn't understand the sent command: op=0x{:02X} {}".format(fut.opcode, fut.cmd_str))
+            self._resolve(fut, None, None)
+            return
+
+        status_str, data = self._frame_response(fut, status, payload)
+        self._resolve(fut, status_str, data)
+
+    def _frame_response(self, fut: Command_Future, status: int, payload) -> tuple:
+        '''(status_str, data) of a response frame that matched its request'''
+        if(fut.opcode == _BIN_OP.ASCII_CMD):
+            # Tunneled command, the payload holds the response lines that follow !RCVD
+            lines = payload.decode(errors='replace').split(self._termination)
+            status_str = lines[0]
+            data = None
+            if(fut.expect_data & self._is_okay(status_str) & (len(lines) > 1)):
+                data = self._hex_to_bytes(lines[1])
+        else:
+            status_str = _BIN_STATUS.NAMES.get(status, "STATUS_0x{:02X}".format(status))
+            data = payload
+        self.ret_str = status_str
         if(self.auto_print > 1):
-                print('\t' + self.ret_str)
+            print('\t' + status_str)
+        return (status_str, data)
+
+    def _recover(self, fut: Command_Future, start: float, reason: str):
+        '''
+        A response was lost or garbled. Everything still in flight is in an unknown state,
+        so the link is resynchronised, idempotent commands are sent again and the rest fail.
+        '''
+        self._print_error("\tERROR: Lost sync with the base board on '" + fut.cmd_str + "' : " + reason)
+        if(self.log is not None):
+            self.log.error(reason, fut._log_cmd, fut._log_cs, fut.seq)
+        in_flight = [fut] + list(self._pending)
+        self._pending.clear()
+        synced = self.resync()
+
+        self.recovery_count += 1
+        self.recovery_time_s = time.perf_counter() - start
+        self.recovery_time_total_s += self.recovery_time_s
+        self.recovery_time_max_s = max(self.recovery_time_max_s, self.recovery_time_s)
+        if(synced):
+            self._print_error("\tWARNING: Base board back in sync after {:.1f} ms".format(self.recovery_time_s * 1e3))
+        else:
+            self._print_error("\tCRIT ERROR: Base board did not answer the sync probe")
+
+        for x in in_flight:
+            if(synced & x.idempotent & (x.tries < self.max_retries)):
+                x.tries += 1
+                self.retry_count += 1
+                self._transmit(x)
+            else:
+                self._print_error("\tERROR: Response lost for '" + x.cmd_str + "'")
+                self._resolve(x, None, None)
+
+    @_locked
+    def resync(self) -> bool:
+        '''
+        Drop whatever is on the wire and realign on the reply to sync_cmd. Responses to
+        commands still in flight are lost, use drain() first when that matters.
+        Returns True once a probe reply has been seen.
+        '''
+        self.resync_count += 1
+        self.flush()
+        for attempt in range(self.resync_attempts):
+            self.com.reset_input_buffer()
+            if(self.line_reader is not None):
+                self.line_reader.reset()
+            if(self.fw_identity == ''):
+                # Without a known reply to match, let stale replies arrive and drop them too
+                time.sleep(self.resync_quiet_s)
+                self.com.reset_input_buffer()
+                if(self.line_reader is not None):
+                    self.line_reader.reset()
+
+            deadline = time.monotonic() + self.resync_timeout_s
+            if(self.protocol == 'binary'):
+                synced = self._resync_binary(deadline)
+            else:
+                synced = self._resync_ascii(deadline)
+            if(synced):
+                return True
+        self.resync_failures += 1
+        return False
+
+    def _resync_ascii(self, deadline: float) -> bool:
+        if(not self._write_bytes(self._sync_probe())):
+            return False
+        self.flush()
+        prev_line = None
+        while(True):
+            line = self._read_line("resync:read_until", max(deadline - time.monotonic(), 0.001))
+            if(line is None):
+                return False
+            if(self._is_sync_reply(prev_line, line)):
+                return True
+            prev_line = line
+
+    def _resync_binary(self, deadline: float) -> bool:
+        if(not self._write_bytes(self._sync_probe())):
+            return False
+        self.flush()
+        while(True):
+            raw = self._read_frame(max(deadline - time.monotonic(), 0.001))
+            if(raw is None):
+                return False
+            if(self._is_sync_frame(raw)):
+                return True
+
+    def _sync_probe(self) -> bytes:
+        '''sync_cmd encoded for the protocol in use, a binary probe takes the next sequence number'''
+        if(self.protocol == 'binary'):
+            self._sync_seq = self._seq
+            self._seq = (self._seq + 1) & 0xFF
+            # The leading delimiter ends whatever partial frame the firmware is holding
+            return binary_protocol.FRAME_DELIMITER + binary_protocol.encode_frame(
+                _BIN_OP.ASCII_CMD, self._sync_seq, self.sync_cmd.encode())
+        # The leading termination ends whatever partial line the firmware is holding
+        return (self._termination + self.sync_cmd + self._termination).encode()
+
+    def _is_sync_reply(self, prev_line: str, line: str) -> bool:
+        '''line, following prev_line, is the reply to an ASCII sync probe'''
+        if((prev_line == "!RCVD") & (not self._is_okay(line))):
+            return (self.fw_identity == '') or (line == self.fw_identity)
+        return False
+
+    def _is_sync_frame(self, raw) -> bool:
+        '''raw is the reply frame to the last binary sync probe'''
+        try:
+            status, rseq, payload = binary_protocol.decode_frame(raw)
+        except ValueError:
+            return False
+        return (rseq == self._sync_seq) & (status == _BIN_STATUS.OKAY)
+
+    def recovery_stats(self) -> dict:
+        '''Resync counters and latencies, for tracking link health over a session'''
+        mean = 0.0
+        if(self.recovery_count > 0):
+            mean = self.recovery_time_total_s / self.recovery_count
+        return {'recoveries': self.recovery_count,
+                'resyncs': self.resync_count,
+                'resync_failures': self.resync_failures,
+                'retries': self.retry_count,
+                'last_s': self.recovery_time_s,
+                'mean_s': mean,
+                'max_s': self.recovery_time_max_s}
+
+    def enable_logging(self, capacity=65536, payload_bytes=32, dump_on_error=0, dump_file=None) -> Transaction_Log:
+        '''
+        Record every command and response in a fixed size ring buffer, see Transaction_Log.
+        Returns the log, also kept in self.log.
+        '''
+        self.log = Transaction_Log(capacity, payload_bytes, dump_on_error, dump_file)
+        return self.log
+
+    def disable_logging(self):
+        self.log = None
+
+    def _log_command(self, fut: Command_Future):
+        fut._log_cmd, fut._log_cs, data = transaction_log.command_fields(fut.opcode, fut.payload, fut.cmd_str)
+        self.log.record(LOG_DIR.TX, fut._log_cmd, fut._log_cs, data, 0, fut.seq)
+
+    def _log_response(self, fut: Command_Future, status_str, data):
+        if(status_str is None):
+            status = LOG_STATUS.LOST
+        else:
+            status = LOG_STATUS.CODES.get(status_str, LOG_STATUS.TEXT)
+            if(status == LOG_STATUS.TEXT):
+                data = status_str.encode()
+        self.log.record(LOG_DIR.RX, fut._log_cmd, fut._log_cs, b'' if(data is None) else data, status, fut.seq)
+
+    def _resolve(self, fut: Command_Future, status_str, data):
+        if(self.log is not None):
+            self._log_response(fut, status_str, data)
+        if(fut._decode is None):
+            fut._set_result(status_str)
+        else:
+            fut._set_result(fut._decode(status_str, data))
+
+    def _print_error(self, msg: str):
+        if(self.print_errors):
+            print(msg)
+
+    def _hex_to_bytes(self, data_str: str):
+        try:
+            return bytes.fromhex(data_str)
+        except ValueError:
+            return None
+
+    def _is_okay(self, status_str: str) -> bool:
+        return (status_str == "OKAY") | (status_str == "KAY")
+
+    def _check_status(self, status_str: str, name: str) -> bool:
+        if(status_str is None):
+            return False
+        if(not self._is_okay(status_str)):
+            self._print_error("\tERROR: " + name + " Failed : " + status_str)
+            return False
+        elif(self.auto_print > 0):
+            print('\t' + status_str)
+        return True
+
+    def _decode_status(self, name: str):
+        '''Build a decoder for commands that only return a status line, True when it is good'''
+        def decode(status_str, data):
+            return self._check_status(status_str, name)
+        return decode
+
+    def _decode_data(self, name: str, nbytes: int, fail_value):
+        '''Build a decoder for commands that return nbytes of data after the status'''
+        def decode(status_str, data):
+            if(not self._check_status(status_str, name)):
+                return fail_value
+            if((data is None) or (len(data) != nbytes)):
+                self._print_error("\tERROR: Failed to return the correct number of bytes")
+                return []
+            if(self.return_bytes):
+                return data
+            return list(data)
+        return decode
 
     def get_device_info(self):
-        self._write("*IDN?")
-        self._read()
-        self.fw_identity = self.ret_str
-        self._write("*SN?")
-        self._read()
-        self.fw_serial_number = self.ret_str
-        self._write("*FW_VER?")
-        self._read()
-        self.fw_version = self.ret_str
-        self._write("*FW_DESC?")
-        self._read()
-        self.fw_description = self.ret_str
-        self._write("*FW_TIMESTAMP?")
-        self._read()
-        self.fw_timestamp = self.ret_str
+        # All five queries go out together when pipelining is enabled
+        idn = self.submit("*IDN?", idempotent=True)
+        sn = self.submit("*SN?", idempotent=True)
+        ver = self.submit("*FW_VER?", idempotent=True)
+        desc = self.submit("*FW_DESC?", idempotent=True)
+        stamp = self.submit("*FW_TIMESTAMP?", idempotent=True)
+        self.fw_identity = idn.result()
+        self.fw_serial_number = sn.result()
+        self.fw_version = ver.result()
+        self.fw_description = desc.result()
+        self.fw_timestamp = stamp.result()
 
         if(self.auto_print > 0):
             print(self.fw_identity)
@@ -126,327 +854,382 @@ class Base_Board_Rev3:
 
     def clk_reference(self) -> str:
         str_to_write = 'I2C:SI_LOCK?' # Assemble final string to be sent
-        self._write(str_to_write)
-
-        # Read back the return value from the interface
-        self._read()
+        ret_str = self.submit(str_to_write, idempotent=True).result()
+        if(ret_str is None):
+            ret_str = ''
 
         if(self.auto_print > 0):
-            print('\t' + self.ret_str)
-        return self.ret_str
-
-    def i2c_write(self, i2c_addr: int, data_array: list):
-        # Check the datatype of the array and range of each element
-        for i in data_array:
-            if(type(i) != int):
-                raise TypeError('Type in the list must be integer')
-            if(i < 0):
-                raise ValueError('Numbers in list must conform to the uint8 range, ' + str(i) + ' is negative')
-            if(i > 255):
-                raise ValueError('Numbers in list must conform to the uint8 range, ' + str(i) + ' is above 255')
-
-        write_size = len(data_array)
-        write_size_str = hex(write_size)[2:].rjust(2,'0') # Convert int number to valid hex
-        
-        hex_addr = hex(i2c_addr)[2:].rjust(2,'0') # Convert int number to valid hex
-
-        #Convert the uint8 array into a long string to be appened to the main string to write
-        data_str = self._byteArrayToStrHex(data_array)
-
+            print('\t' + ret_str)
+        return ret_str
+
+    def i2c_write_nowait(self, i2c_addr: int, data_array, callback=None) -> Command_Future:
+        data = self._to_bytes(data_array)
+        if(self.protocol == 'binary'):
+            return self._submit_frame(_BIN_OP.I2C_WRITE, bytes([i2c_addr]) + data, False,
+                                      self._decode_status("I2C_Write"), callback)
+
+        # Construct the main string to write to the VCP device, payload hex encoded in one pass
+        str_to_write = 'I2C:WRITE:%02x,%02x,%s' % (i2c_addr, len(data), data.hex().upper())
+        return self.submit(str_to_write, False, self._decode_status("I2C_Write"), callback)
+
+    def i2c_write(self, i2c_addr: int, data_array):
+        return self.i2c_write_nowait(i2c_addr, data_array).result()
+
+    def i2c_write_read_nowait(self, i2c_addr: int, nbytes_read: int, data_array, callback=None) -> Command_Future:
+        data = self._to_bytes(data_array)
+        # Writing no more than a register pointer and reading it back is safe to repeat
+        idempotent = (len(data) <= 1)
+        if(self.protocol == 'binary'):
+            payload = bytes([i2c_addr]) + nbytes_read.to_bytes(2, 'little') + data
+            return self._submit_frame(_BIN_OP.I2C_WRITE_READ, payload, True,
+                                      self._decode_data("I2C_Write_Read", nbytes_read, None), callback,
+                                      nbytes_read=nbytes_read, idempotent=idempotent)
+
+        # Construct the main string to write to the VCP device, payload hex encoded in one pass
+        str_to_write = 'I2C:WRITE_READ:%02x,%02x,%02x,%s' % (i2c_addr, len(data), nbytes_read, data.hex().upper())
+        return self.submit(str_to_write, True, self._decode_data("I2C_Write_Read", nbytes_read, None), callback,
+                           nbytes_read, idempotent)
+
+    def i2c_write_read(self, i2c_addr: int, nbytes_read: int, data_array) -> list:
+        return self.i2c_write_read_nowait(i2c_addr, nbytes_read, data_array).result()
+
+    def i2c_read_nowait(self, i2c_addr: int, num_bytes: int, callback=None) -> Command_Future:
+        if(self.protocol == 'binary'):
+            payload = bytes([i2c_addr]) + num_bytes.to_bytes(2, 'little')
+            return self._submit_frame(_BIN_OP.I2C_READ, payload, True,
+                                      self._decode_data("I2C_Read", num_bytes, []), callback, nbytes_read=num_bytes)
         # Construct the main string to write to the VCP device
-        str_to_write = 'I2C:WRITE:' + hex_addr + "," + write_size_str + ',' + data_str # Assemble final string to be sent
-        self._write(str_to_write)
-
-        # Read back the return value from the interface
-        self._read()
-        if(not((self.ret_str == "OKAY") | (self.ret_str == "KAY"))):
-            print("\tERROR: I2C_Write Failed : " + self.ret_str)
-            return
-        elif(self.auto_print > 0):
-            print('\t' + self.ret_str)
-
-    def i2c_write_read(self, i2c_addr: int, nbytes_read: int, data_array: list) -> list:
-        # Check the datatype of the array and range of each element
-        for i in data_array:
-            if(type(i) != int):
-                raise TypeError('Type in the list must be integer')
-            if(i < 0):
-                raise ValueError('Numbers in list must conform to the uint8 range, ' + str(i) + ' is negative')
-            if(i > 255):
-                raise ValueError('Numbers in list must conform to the uint8 range, ' + str(i) + ' is above 255')
-
-        write_size = len(data_array)
-        write_size_str = hex(write_size)[2:].rjust(2,'0') # Convert int number to valid hex
-        read_size_str = hex(nbytes_read)[2:].rjust(2,'0') # Convert int number to valid hex
-        hex_addr = hex(i2c_addr)[2:].rjust(2,'0') # Convert int number to valid hex
-
-        #Convert the uint8 array into a long string to be appened to the main string to write
-        data_str = self._byteArrayToStrHex(data_array)
-
-        # Construct the main string to write to the VCP device
-        str_to_write = 'I2C:WRITE_READ:' + hex_addr + "," + write_size_str + ',' + \
-                       read_size_str + ',' + data_str # Assemble final string to be sent
-        self._write(str_to_write)
-
-        # Read back the return value from the interface
-        self._read()
-        if(not((self.ret_str == "OKAY") | (self.ret_str == "KAY"))):
-            print("\tERROR: I2C_Write_Read Failed : " + self.ret_str)
-            return
-        elif(self.auto_print > 0):
-            print('\t' + self.ret_str)
-
-        # read the returned data
-        self._read()
-        if(len(self.ret_str) != (nbytes_read << 1)):
-            print("\tERROR: Failed to return the correct number of bytes")
-            return []
-
-        # convert the string into bytes
-        self.ret_str_data = self.ret_str
-        nBytes = int((len(self.ret_str_data))/2)
-        ret_array = [int(0)] * nBytes
-        data = self.ret_str_data
-        data2 = [data[i:i + 2] for i in range(0, len(data), 2)]
-        for i in range(len(ret_array)):
-                ret_array[i] = int(data2[i], base=16)
-        return ret_array
+        str_to_write = 'I2C:READ:%02x,%02x' % (i2c_addr, num_bytes)
+        return self.submit(str_to_write, True, self._decode_data("I2C_Read", num_bytes, []), callback, num_bytes)
 
     def i2c_read(self, i2c_addr: int, num_bytes: int) -> list:
-        read_size_str = hex(num_bytes)[2:].rjust(2,'0') # Convert int number to valid hex
-        hex_addr = hex(i2c_addr)[2:].rjust(2,'0') # Convert int number to valid hex
-
-        # Construct the main string to write to the VCP device
-        str_to_write = 'I2C:READ:' + hex_addr + "," + read_size_str # Assemble final string to be sent
-        self._write(str_to_write)
-
-        # Read back the return value from the interface
-        self._read()
-        if(not((self.ret_str == "OKAY") | (self.ret_str == "KAY"))):
-            print("\tERROR: I2C_Read Failed : " + self.ret_str)
-            return []
-        elif(self.auto_print > 0):
-            print('\t' + self.ret_str)
-
-        # read the returned data
-        self._read()
-        if(len(self.ret_str) != (num_bytes << 1)):
-            print("\tERROR: Failed to return the correct number of bytes")
-            return []
-
-        # convert the string into bytes
-        self.ret_str_data = self.ret_str
-        nBytes = int((len(self.ret_str_data))/2)
-        ret_array = [int(0)] * nBytes
-        data = self.ret_str_data
-        data2 = [data[i:i + 2] for i in range(0, len(data), 2)]
-        for i in range(len(ret_array)):
-                ret_array[i] = int(data2[i], base=16)
-        return ret_array
-
-    def i2c_scan_addr(self) -> list:
+        return self.i2c_read_nowait(i2c_addr, num_bytes).result()
+
+    def i2c_scan_addr_nowait(self, callback=None) -> Command_Future:
+        decode_data = self._decode_data("I2C Scan Addr", 128, [])
+        def decode(status_str, data):
+            ret_array = []
+            for x in decode_data(status_str, data):
+                if(x > 0):
+                    ret_array.append(x)
+            return ret_array
+        if(self.protocol == 'binary'):
+            return self._submit_frame(_BIN_OP.I2C_SCAN_ADDR, b'', True, decode, callback,
+                                      nbytes_read=128, idempotent=True)
         str_to_write = 'I2C:SCAN_ADDR'
-        self._write(str_to_write)
+        return self.submit(str_to_write, True, decode, callback, nbytes_read=128, idempotent=True)
 
-        # Read back the return value from the interface
-        self._read()
-        if(not((self.ret_str == "OKAY") | (self.ret_str == "KAY"))):
-            print("\tERROR: I2C Scan Addr Failed : " + self.ret_str)
-            return []
-        elif(self.auto_print > 0):
-            print('\t' + self.ret_str)
+    def i2c_scan_addr(self) -> list:
+        return self.i2c_scan_addr_nowait().result()
 
-        # read the returned data
-        self._read()
-        if(len(self.ret_str) != (128 << 1)):
-            print("\tERROR: Failed to return the correct number of bytes")
-            return []
+    def spi_write_nowait(self, chip_select: int, data_array, callback=None) -> Command_Future:
+        data = self._to_bytes(data_array)
+        if(self.protocol == 'binary'):
+            return self._submit_frame(_BIN_OP.SPI_WRITE, chip_select.to_bytes(4, 'little') + data, False,
+                                      self._decode_status("SPI_Write"), callback)
 
-        # convert the string into bytes
-        self.ret_str_data = self.ret_str
-        nBytes = int((len(self.ret_str_data))/2)
-        temp_array = [int(0)] * nBytes
-        data = self.ret_str_data
-        data2 = [data[i:i + 2] for i in range(0, len(data), 2)]
-        for i in range(len(temp_array)):
-                temp_array[i] = int(data2[i], base=16)
-        ret_array = []
-        for x in temp_array:
-            if(x > 0):
-                ret_array.append(x)
-        return ret_array
-        
-    def spi_write(self, chip_select: int, data_array: list):
-        # Check the datatype of the array and range of each element
-        for i in data_array:
-            if(type(i) != int):
-                raise TypeError('Type in the list must be integer')
-            if(i < 0):
-                raise ValueError('Numbers in list must conform to the uint8 range, ' + str(i) + ' is negative')
-            if(i > 255):
-                raise ValueError('Numbers in list must conform to the uint8 range, ' + str(i) + ' is above 255')
-
-        write_size = len(data_array)
-        write_size_str = hex(write_size)[2:].rjust(2,'0') # Convert int number to valid hex
-        
-        cs_str = hex(chip_select)[2:].rjust(2,'0') # Convert int number to valid hex
-
-        #Convert the uint8 array into a long string to be appened to the main string to write
-        data_str = self._byteArrayToStrHex(data_array)
+        # Construct the main string to write to the VCP device, payload hex encoded in one pass
+        str_to_write = 'SPI:WRITE:%02x,%02x,%s' % (chip_select, len(data), data.hex().upper())
+        return self.submit(str_to_write, False, self._decode_status("SPI_Write"), callback)
 
-        # Construct the main string to write to the VCP device
-        str_to_write = 'SPI:WRITE:' + cs_str + "," + write_size_str + ',' + data_str # Assemble final string to be sent
-        self._write(str_to_write)
+    def spi_write(self, chip_select: int, data_array):
+        return self.spi_write_nowait(chip_select, data_array).result()
 
-        # Read back the return value from the interface
-        self._read()
-        if(not((self.ret_str == "OKAY") | (self.ret_str == "KAY"))):
-            print("\tERROR: SPI_Write Failed : " + self.ret_str)
-            return
-        elif(self.auto_print > 0):
-            print('\t' + self.ret_str)
-
-    def spi_write_read(self, chip_select: int, nbytes_read: int, data_array: list) -> list:
-        # Check the datatype of the array and range of each element
-        for i in data_array:
-            if(type(i) != int):
-                raise TypeError('Type in the list must be integer')
-            if(i < 0):
-                raise ValueError('Numbers in list must conform to the uint8 range, ' + str(i) + ' is negative')
-            if(i > 255):
-                raise ValueError('Numbers in list must conform to the uint8 range, ' + str(i) + ' is above 255')
+    def spi_write_read_nowait(self, chip_select: int, nbytes_read: int, data_array, callback=None) -> Command_Future:
+        data = self._to_bytes(data_array)
         # Check the number of bytes to be write/read, we want the greater of the two
-        nbytes_write = len(data_array)
+        nbytes_write = len(data)
         if(nbytes_write > nbytes_read):
             nbytes_int = nbytes_write
         else:
             nbytes_int = nbytes_read
 
-        #copy data_array over to another array which is same length or longer
-        data_adjust = [0x00] * nbytes_int
-        for i in range(len(data_array)):
-            data_adjust[i] = data_array[i]
-
-        nbytes_str = hex(nbytes_int)[2:].rjust(2,'0') # Convert int number to valid hex
-        cs_str = hex(chip_select)[2:].rjust(2,'0') # Convert int number to valid hex
-
-        #Convert the uint8 array into a long string to be appened to the main string to write
-        data_str = self._byteArrayToStrHex(data_adjust)
-
-        # Construct the main string to write to the VCP device
-        str_to_write = 'SPI:WRITE_READ:' + cs_str + "," + nbytes_str + ',' + data_str # Assemble final string to be sent
-        self._write(str_to_write)
-
-        # Read back the return value from the interface
-        self._read()
-        if(not((self.ret_str == "OKAY") | (self.ret_str == "KAY"))):
-            print("\tERROR: SPI_Write_Read Failed : " + self.ret_str)
-            return
-        elif(self.auto_print > 0):
-            print('\t' + self.ret_str)
+        # pad the write out to the read length with zeros
+        if(nbytes_write < nbytes_int):
+            data = bytes(data).ljust(nbytes_int, b'\x00')
 
-        # read the returned data
-        self._read()
-        if(len(self.ret_str) != (nbytes_int << 1)):
-            print("\tERROR: Failed to return the correct number of bytes")
-            return []
+        if(self.protocol == 'binary'):
+            return self._submit_frame(_BIN_OP.SPI_WRITE_READ, chip_select.to_bytes(4, 'little') + data, True,
+                                      self._decode_data("SPI_Write_Read", nbytes_int, None), callback,
+                                      nbytes_read=nbytes_int)
 
-        # convert the string into bytes
-        self.ret_str_data = self.ret_str
-        nBytes = int((len(self.ret_str_data))/2)
-        ret_array = [int(0)] * nBytes
-        data = self.ret_str_data
-        data2 = [data[i:i + 2] for i in range(0, len(data), 2)]
-        for i in range(len(ret_array)):
-                ret_array[i] = int(data2[i], base=16)
-        return ret_array
+        # Construct the main string to write to the VCP device, payload hex encoded in one pass
+        str_to_write = 'SPI:WRITE_READ:%02x,%02x,%s' % (chip_select, nbytes_int, data.hex().upper())
+        return self.submit(str_to_write, True, self._decode_data("SPI_Write_Read", nbytes_int, None), callback,
+                           nbytes_int)
 
-    def spi_read(self, chip_select: int, num_bytes: int) -> list:
-        nbytes_str = hex(num_bytes)[2:].rjust(2,'0') # Convert int number to valid hex
-        cs_str = hex(chip_select)[2:].rjust(2,'0') # Convert int number to valid hex
+    def spi_write_read(self, chip_select: int, nbytes_read: int, data_array) -> list:
+        return self.spi_write_read_nowait(chip_select, nbytes_read, data_array).result()
 
+    def spi_read_nowait(self, chip_select: int, num_bytes: int, callback=None) -> Command_Future:
+        if(self.protocol == 'binary'):
+            payload = chip_select.to_bytes(4, 'little') + num_bytes.to_bytes(2, 'little')
+            return self._submit_frame(_BIN_OP.SPI_READ, payload, True,
+                                      self._decode_data("SPI_Read", num_bytes, []), callback, nbytes_read=num_bytes)
         # Construct the main string to write to the VCP device
-        str_to_write = 'SPI:READ:' + cs_str + "," + nbytes_str # Assemble final string to be sent
-        self._write(str_to_write)
+        str_to_write = 'SPI:READ:%02x,%02x' % (chip_select, num_bytes)
+        return self.submit(str_to_write, True, self._decode_data("SPI_Read", num_bytes, []), callback, num_bytes)
 
-                # Read back the return value from the interface
-        self._read()
-        if(not((self.ret_str == "OKAY") | (self.ret_str == "KAY"))):
-            print("\tERROR: SPI_Read Failed : " + self.ret_str)
-            return []
-        elif(self.auto_print > 0):
-            print('\t' + self.ret_str)
-
-        # read the returned data
-        self._read()
-        if(len(self.ret_str) != (num_bytes << 1)):
-            print("\tERROR: Failed to return the correct number of bytes")
-            return []
-
-        # convert the string into bytes
-        self.ret_str_data = self.ret_str
-        nBytes = int((len(self.ret_str_data))/2)
-        ret_array = [int(0)] * nBytes
-        data = self.ret_str_data
-        data2 = [data[i:i + 2] for i in range(0, len(data), 2)]
-        for i in range(len(ret_array)):
-                ret_array[i] = int(data2[i], base=16)
-        return ret_array
+    def spi_read(self, chip_select: int, num_bytes: int) -> list:
+        return self.spi_read_nowait(chip_select, num_bytes).result()
 
-    def spi_get_dev_stack(self) -> int:
+    def spi_get_dev_stack_nowait(self, callback=None) -> Command_Future:
         str_to_write = 'SPI:DEV_STACK'
-        self._write(str_to_write)
-        self._read()
-        if(not((self.ret_str == "OKAY") | (self.ret_str == "KAY"))):
-            print("\tERROR: SPI_get_dev_stack Failed : " + self.ret_str)
-            return None
-        # read the returned data
-        self._read()
         nBytes = 4
-        if(len(self.ret_str) != (nBytes << 1)):
-            print("\tERROR: Failed to return the correct number of bytes")
-            return None
-
-        # convert the string into bytes
-        self.ret_str_data = self.ret_str
-        ret_array = [int(0)] * nBytes
-        data = self.ret_str_data
-        data2 = [data[i:i + 2] for i in range(0, len(data), 2)]
-        for i in range(len(ret_array)):
-            ret_array[i] = int(data2[i], base=16)
+        decode_data = self._decode_data("SPI_get_dev_stack", nBytes, None)
+        def decode(status_str, data):
+            ret_array = decode_data(status_str, data)
+            if((ret_array is None) or (len(ret_array) != nBytes)):
+                return None
+            # All 32 slots, little endian
+            return int.from_bytes(bytes(ret_array), 'little')
+        if(self.protocol == 'binary'):
+            return self._submit_frame(_BIN_OP.SPI_DEV_STACK, b'', True, decode, callback,
+                                      nbytes_read=nBytes, idempotent=True)
+        return self.submit(str_to_write, True, decode, callback, nbytes_read=nBytes, idempotent=True)
 
-        return ret_array[0]
+    def spi_get_dev_stack(self) -> int:
+        return self.spi_get_dev_stack_nowait().result()
 
-    def spi_hard_reset(self, chip_select: int):
-        cs_str = hex(chip_select)[2:].rjust(2,'0') # Convert int number to valid hex
+    def spi_get_chip_selects(self) -> list:
+        '''Chip selects of the IF boards present, see chip_selects(), [] when DEV_STACK can not be read'''
+        dev_stack = self.spi_get_dev_stack()
+        if(dev_stack is None):
+            return []
+        return chip_selects(dev_stack)
 
+    def spi_hard_reset_nowait(self, chip_select: int, callback=None) -> Command_Future:
+        self.hard_resets += 1
+        if(self.protocol == 'binary'):
+            return self._submit_frame(_BIN_OP.SPI_HARD_RST, chip_select.to_bytes(4, 'little'), False,
+                                      self._decode_status("SPI Hard Reset"), callback)
         # Construct the main string to write to the VCP device
-        str_to_write = 'SPI:HARD_RST:' + cs_str # Assemble final string to be sent
-        self._write(str_to_write)
-
-        # Read back the return value from the interface
-        self._read()
-        if(not((self.ret_str == "OKAY") | (self.ret_str == "KAY"))):
-            print("\tERROR: SPI Hard Reset Failed : " + self.ret_str)
-            return
-        elif(self.auto_print > 0):
-            print('\t' + self.ret_str)
+        str_to_write = 'SPI:HARD_RST:%02x' % chip_select
+        return self.submit(str_to_write, False, self._decode_status("SPI Hard Reset"), callback)
 
-    def enable_periodic_checking(self):
-        self._write("*FW_START_PER")
-        self._read()
+    def spi_hard_reset(self, chip_select: int):
+        return self.spi_hard_reset_nowait(chip_select).result()
+
+    def batch_supported(self, bus='SPI') -> bool:
+        '''The firmware takes SPI:BATCH or I2C:BATCH, known once probe_capabilities() has run'''
+        return (self.capabilities is not None) and self.capabilities.supports(bus + ':BATCH:')
+
+    def _batch_limit(self) -> int:
+        '''
+        Request and reply bytes a batch command may carry, no more than the firmware was
+        seen to transfer when that is below the largest size probed
+        '''
+        if(self.capabilities is not None):
+            nbytes = self.capabilities.max_payload.get(self.protocol, 0)
+            if(0 < nbytes < capabilities.MAX_SPI_BYTES):
+                return min(nbytes, self.batch_max_bytes)
+        return self.batch_max_bytes
+
+    def _batch_items(self, bus: str, transactions) -> list:
+        '''Check the transactions of a batch, returns [(address, data bytes, nbytes_read)]'''
+        items = []
+        for addr, data_array, nbytes_read in transactions:
+            data = bytes(self._to_bytes(b'' if(data_array is None) else data_array))
+            if((bus == 'SPI') and (len(data) > 0) and (nbytes_read > 0)):
+                # Full duplex, the write is padded out to the read length as in spi_write_read()
+                nbytes_read = max(len(data), nbytes_read)
+                data = data.ljust(nbytes_read, b'\x00')
+            if((len(data) == 0) and (nbytes_read == 0)):
+                raise ValueError('Batch transaction to 0x%02X neither writes nor reads' % addr)
+            items.append((addr, data, nbytes_read))
+        return items
+
+    def _single_nowait(self, bus: str, item) -> Command_Future:
+        '''One batch transaction sent as its own command'''
+        addr, data, nbytes_read = item
+        if(bus == 'SPI'):
+            if(nbytes_read == 0):
+                return self.spi_write_nowait(addr, data)
+            if(len(data) == 0):
+                return self.spi_read_nowait(addr, nbytes_read)
+            return self.spi_write_read_nowait(addr, nbytes_read, data)
+        if(nbytes_read == 0):
+            return self.i2c_write_nowait(addr, data)
+        if(len(data) == 0):
+            return self.i2c_read_nowait(addr, nbytes_read)
+        return self.i2c_write_read_nowait(addr, nbytes_read, data)
+
+    def _batch_command_nowait(self, bus: str, items) -> Command_Future:
+        '''One SPI:BATCH / I2C:BATCH command, resolves to the result of every item'''
+        payload = binary_protocol.encode_batch(bus, items)
+        reads = [x[2] for x in items]
+        nbytes_read = len(reads) + sum(reads)
+        name = bus + "_Batch"
+        def decode(status_str, data):
+            if(not self._check_status(status_str, name)):
+                return None
+            try:
+                replies = binary_protocol.split_batch_reply(b'' if(data is None) else data, reads)
+            except ValueError as e:
+                self._print_error("\tERROR: " + name + " Failed : " + str(e))
+                return None
+            results = []
+            for (status, miso), (addr, mosi, nbytes) in zip(replies, items):
+                if(status != _BIN_STATUS.OKAY):
+                    self._print_error("\tERROR: %s to 0x%02X Failed : status 0x%02X" % (name, addr, status))
+                    results.append(False if(nbytes == 0) else None)
+                elif(nbytes == 0):
+                    results.append(True)
+                else:
+                    results.append(miso if(self.return_bytes) else list(miso))
+            return results
+        if(self.protocol == 'binary'):
+            opcode = _BIN_OP.SPI_BATCH if(bus == 'SPI') else _BIN_OP.I2C_BATCH
+            return self._submit_frame(opcode, payload, True, decode, nbytes_read=nbytes_read)
+        str_to_write = '%s:BATCH:%s' % (bus, payload.hex().upper())
+        return self.submit(str_to_write, True, decode, nbytes_read=nbytes_read)
+
+    def _batch_nowait(self, bus: str, transactions) -> list:
+        '''
+        Send the transactions of spi_batch() / i2c_batch() without waiting, returns
+        [(future, items, batched)] in order, a batch command per group of items that fits
+        in _batch_limit() or a single command for an item that does not
+        '''
+        items = self._batch_items(bus, transactions)
+        if(not self.batch_supported(bus)):
+            return [(self._single_nowait(bus, item), [item], False) for item in items]
+        limit = self._batch_limit()
+        sent = []
+        group = []
+        nbytes_request = 0
+        nbytes_reply = 0
+        for item in items:
+            request = binary_protocol.batch_request_size(bus, item[1], item[2])
+            reply = 1 + item[2]
+            if((len(group) > 0) and ((nbytes_request + request > limit) or (nbytes_reply + reply > limit))):
+                sent.append((self._batch_command_nowait(bus, group), group, True))
+                group, nbytes_request, nbytes_reply = [], 0, 0
+            if((request > limit) or (reply > limit)):
+                sent.append((self._single_nowait(bus, item), [item], False))
+                continue
+            group.append(item)
+            nbytes_request += request
+            nbytes_reply += reply
+        if(len(group) > 0):
+            sent.append((self._batch_command_nowait(bus, group), group, True))
+        return sent
+
+    def _batch_results(self, sent, results) -> list:
+        '''Result of every transaction from the results of the commands _batch_nowait() sent'''
+        out = []
+        for (fut, items, batched), result in zip(sent, results):
+            if(batched):
+                if(result is None):
+                    result = [False if(x[2] == 0) else None for x in items]
+                out += result
+            elif(items[0][2] == 0):
+                out.append(bool(result))
+            else:
+                # A failed single read returns [] or None
+                out.append(result if((result is not None) and (len(result) > 0)) else None)
+        return out
+
+    def spi_batch(self, transactions) -> list:
+        '''
+        Run a list of SPI transactions in as few round trips as the firmware allows
+            transactions : (chip_select, data_array, nbytes_read), data_array empty or None
+                           for a read, nbytes_read 0 for a write, both for a full duplex
+                           transfer as spi_write_read() does
+        Returns a result per transaction, in order, the data read or None when the read
+        failed and True or False for a write. When the firmware capabilities list SPI:BATCH
+        the transactions go out in batch commands, otherwise one command each, pipelined
+        up to pipeline_depth.
+        '''
+        sent = self._batch_nowait('SPI', transactions)
+        return self._batch_results(sent, [x[0].result() for x in sent])
+
+    def i2c_batch(self, transactions) -> list:
+        '''
+        I2C counterpart of spi_batch()
+            transactions : (i2c_addr, data_array, nbytes_read), both for a write then read
+                           as i2c_write_read() does
+        '''
+        sent = self._batch_nowait('I2C', transactions)
+        return self._batch_results(sent, [x[0].result() for x in sent])
+
+    def enable_periodic_checking(self, listen=True):
+        '''
+        Have the firmware push periodic reports, published through self.periodic
+            listen : start_periodic_listener(), so reports are read while the port is idle
+        '''
+        self.submit("*FW_START_PER", idempotent=True).result()
+        if(listen):
+            self.start_periodic_listener()
 
     def disable_periodic_checking(self):
-        self._write("*FW_STOP_PER")
-        self._read()
+        self.stop_periodic_listener()
+        self.submit("*FW_STOP_PER", idempotent=True).result()
+
+    def start_periodic_listener(self, interval_s=0.01):
+        '''
+        Read the port from a background thread whenever no command is in flight, so
+        periodic reports reach the subscribers of self.periodic without waiting for the
+        next command. interval_s is how often the idle port is checked.
+        '''
+        if((self._listener is not None) and self._listener.is_alive()):
+            return
+        self._listener_stop.clear()
+        self._listener = threading.Thread(target=self._listen, args=(interval_s,), daemon=True,
+                                          name='periodic listener ' + str(self.port))
+        self._listener.start()
 
-    def read_temp_C(self):
-        center_tempereature = self.tmp_center.read_temp_C()
-        power_temperature = self.tmp_power_converter.read_temp_C()
+    def stop_periodic_listener(self):
+        if(self._listener is None):
+            return
+        self._listener_stop.set()
+        if(self._listener is not threading.current_thread()):
+            self._listener.join()
+        self._listener = None
+
+    def _listen(self, interval_s: float):
+        with self.priority(PRIORITY.TELEMETRY):
+            while(not self._listener_stop.wait(interval_s)):
+                if(not self.com.is_open):
+                    return
+                # Checked without the port, a command in flight holds it until answered
+                if((self.com.in_waiting > 0) or ((self.line_reader is not None) and self.line_reader.lines_waiting())):
+                    self.poll_periodic()
+
+    @_locked
+    def poll_periodic(self) -> int:
+        '''
+        Read what has arrived while no command is in flight and publish the periodic
+        reports in it, returns how many were published
+        '''
+        count = self.periodic.count
+        while((len(self._pending) == 0) and ((self.com.in_waiting > 0) or
+              ((self.line_reader is not None) and self.line_reader.lines_waiting()))):
+            if(self.protocol == 'binary'):
+                raw = self._read_any_frame(self.response_timeout_s)
+                if((raw is not None) and periodic.is_report_frame(raw)):
+                    self.periodic.publish_frame(raw)
+                elif(raw is not None):
+                    self._print_error("\tWARNING: Base board sent a frame with no command in flight : " + raw.hex())
+            else:
+                line = self._read_any_line(self.response_timeout_s)
+                if((line is not None) and periodic.is_report_line(line)):
+                    self.periodic.publish_line(line)
+                elif(line is not None):
+                    self._print_error("\tWARNING: Base board sent a line with no command in flight : " + repr(line))
+        return self.periodic.count - count
+
+    def read_temp_C(self, max_age_s=None):
+        '''
+        [center, power converter] temperatures. Readings younger than one TMP275
+        conversion are served without I2C traffic, see TMP275.read_temp_C(). Sensors in
+        shutdown mode convert at the same time.
+        '''
+        for tmp in (self.tmp_center, self.tmp_power_converter):
+            if(tmp.shutdown and (not tmp.is_fresh(max_age_s))):
+                tmp.start_conversion()
+        center_tempereature = self.tmp_center.read_temp_C(max_age_s)
+        power_temperature = self.tmp_power_converter.read_temp_C(max_age_s)
         return [center_tempereature, power_temperature]
 
-    def read_temp_F(self):
-        center_tempereature = self.tmp_center.read_temp_F()
-        power_temperature = self.tmp_power_converter.read_temp_F()
-        return [center_tempereature, power_temperature]
-    
\ No newline at end of file
+    def read_temp_F(self, max_age_s=None):
+        return [None if(temp is None) else (temp * 1.8 + 32) for temp in self.read_temp_C(max_age_s)]
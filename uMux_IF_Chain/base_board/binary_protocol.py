@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+'''
+Module binary_protocol
+=================================
+Binary framing for the tyr command processor. Every request and response is one
+frame, COBS encoded and terminated by a 0x00 byte:
+
+    [opcode u8][seq u8][length u16 LE][payload ...][crc16 u16 LE]
+
+The CRC is CRC-16/CCITT-FALSE over the header and payload. In a response the opcode
+byte carries a _BIN_STATUS code and the sequence number echoes the request.
+
+Data bytes travel as-is instead of as two ASCII hex characters each, and a response
+is one frame instead of the !RCVD, status and data lines.
+'''
+# System level imports
+import binascii
+import re
+import struct
+
+class _BIN_OP:
+    SPI_WRITE       = 0x01  # payload: cs u32, data
+    SPI_READ        = 0x02  # payload: cs u32, nbytes u16
+    SPI_WRITE_READ  = 0x03  # payload: cs u32, data
+    SPI_DEV_STACK   = 0x04  # payload: none
+    SPI_HARD_RST    = 0x05  # payload: cs u32
+    SPI_BATCH       = 0x06  # payload: batch items with cs u32, see encode_batch()
+    I2C_WRITE       = 0x11  # payload: addr u8, data
+    I2C_READ        = 0x12  # payload: addr u8, nbytes u16
+    I2C_WRITE_READ  = 0x13  # payload: addr u8, nbytes u16, data
+    I2C_SCAN_ADDR   = 0x14  # payload: none
+    I2C_BATCH       = 0x15  # payload: batch items with addr u8, see encode_batch()
+    PROTO_ASCII     = 0x7E  # leave binary mode, payload: none
+    ASCII_CMD       = 0x7F  # tunnel an ASCII command line, reply payload is the response lines
+
+class _BIN_STATUS:
+    OKAY        = 0x00
+    NACK        = 0x01
+    INVALID     = 0x02
+    CRC_ERROR   = 0x03
+    PERIODIC    = 0x80  # unsolicited periodic report, not a response, see the periodic module
+
+    # Status line the ASCII protocol would have sent for each code
+    NAMES = {OKAY: "OKAY", NACK: "NACK", INVALID: "INVALID", CRC_ERROR: "CRC_ERROR"}
+
+# ASCII command used to ask the firmware to switch to binary framing and its reply
+NEGOTIATE_CMD = '*PROTO:BIN1'
+NEGOTIATE_REPLY = 'BIN1'
+
+FRAME_DELIMITER = b'\x00'
+# Batch items, [address][nbytes_write u16][nbytes_read u16][data], address bytes per bus
+BATCH_ADDR_BYTES = {'SPI': 4, 'I2C': 1}
+_BATCH_LENGTHS = struct.Struct('<HH')
+_HEADER = struct.Struct('<BBH')
+_CRC = struct.Struct('<H')
+_EMPTY_BLOCKS = re.compile(b'\x01+')
+_ZERO_RUNS = re.compile(b'\x00+')
+_FULL_BLOCK = re.compile(b'[^\x00]{254}')
+
+def crc16(data) -> int:
+    return binascii.crc_hqx(data, 0xFFFF)
+
+def cobs_encode(data) -> bytes:
+    '''
+    Consistent Overhead Byte Stuffing, the result contains no 0x00 bytes. With a leading
+    zero added each zero is replaced by the distance to the next one, so the work is
+    per run of zeros rather than per zero.
+    '''
+    data = bytes(data)
+    # chunk by chunk is quicker with few zeros, and needed to split up long runs without one
+    if((data.count(0) < 16) or (_FULL_BLOCK.search(data) is not None)):
+        return _cobs_encode_blocks(data)
+    buf = bytearray(1) + data
+    runs = [x.span() for x in _ZERO_RUNS.finditer(buf)]
+    runs.append((len(buf), None))
+    for i in range(len(runs) - 1):
+        start, end = runs[i]
+        buf[start:end - 1] = b'\x01' * (end - 1 - start)
+        buf[end - 1] = runs[i + 1][0] - (end - 1)
+    return bytes(buf)
+
+def _cobs_encode_blocks(data) -> bytes:
+    out = bytearray()
+    for chunk in data.split(b'\x00'):
+        while(len(chunk) >= 254):
+            out.append(0xFF)
+            out += chunk[:254]
+            chunk = chunk[254:]
+        out.append(len(chunk) + 1)
+        out += chunk
+    return bytes(out)
+
+def cobs_decode(data) -> bytes:
+    '''
+    Undo cobs_encode(). Every code byte after the first stands for a zero in the data,
+    unless it follows a full 254 byte block, so the code bytes are zeroed in place and
+    the stray ones dropped. A run of 0x01 codes is a run of zeros and is done in one step.
+    '''
+    buf = bytearray(data)
+    nbytes = len(buf)
+    drop = []           # code bytes that follow a full block and stand for nothing
+    after_full = False
+    idx = 0
+    while(idx < nbytes):
+        code = buf[idx]
+        if(code == 0):
+            raise ValueError('Malformed COBS block at byte ' + str(idx))
+        if(after_full):
+            drop.append(idx)
+        if(code == 1):
+            end = _EMPTY_BLOCKS.match(buf, idx).end()
+            buf[idx:end] = bytes(end - idx)
+            after_full = False
+            idx = end
+            continue
+        buf[idx] = 0
+        after_full = (code == 0xFF)
+        idx += code
+    if(idx > nbytes):
+        raise ValueError('Malformed COBS block, frame ends inside a block')
+    for idx in reversed(drop):
+        del buf[idx]
+    return bytes(buf[1:])
+
+def encode_frame(opcode: int, seq: int, payload=b'') -> bytes:
+    '''Build a complete frame, including the trailing delimiter, ready for the wire'''
+    body = _HEADER.pack(opcode, seq & 0xFF, len(payload)) + bytes(payload)
+    return cobs_encode(body + _CRC.pack(crc16(body))) + FRAME_DELIMITER
+
+def decode_frame(frame) -> tuple:
+    '''
+    Undo encode_frame(), the trailing delimiter is optional.
+    Returns (opcode, seq, payload), raises ValueError on a malformed frame or bad CRC.
+    '''
+    if(frame[-1:] == FRAME_DELIMITER):
+        frame = frame[:-1]
+    body = cobs_decode(frame)
+    if(len(body) < _HEADER.size + _CRC.size):
+        raise ValueError('Frame too short, ' + str(len(body)) + ' bytes')
+    (crc,) = _CRC.unpack_from(body, len(body) - _CRC.size)
+    body = body[:-_CRC.size]
+    if(crc16(body) != crc):
+        raise ValueError('Frame CRC mismatch')
+    opcode, seq, length = _HEADER.unpack_from(body)
+    payload = body[_HEADER.size:]
+    if(len(payload) != length):
+        raise ValueError('Frame length field {} does not match payload {}'.format(length, len(payload)))
+    return (opcode, seq, payload)
+
+def encode_batch(bus: str, items) -> bytes:
+    '''
+    Payload of a SPI_BATCH or I2C_BATCH request, the ASCII SPI:BATCH / I2C:BATCH
+    commands carry the same bytes hex encoded.
+        items : (address, data, nbytes_read), chip select for SPI and 7 bit address for I2C
+    The reply holds a _BIN_STATUS byte and nbytes_read bytes for every item, in order.
+    '''
+    nbytes = BATCH_ADDR_BYTES[bus]
+    out = bytearray()
+    for addr, data, nbytes_read in items:
+        out += addr.to_bytes(nbytes, 'little') + _BATCH_LENGTHS.pack(len(data), nbytes_read) + data
+    return bytes(out)
+
+def decode_batch(bus: str, payload) -> list:
+    '''Undo encode_batch(), returns [(address, data, nbytes_read)], raises ValueError when malformed'''
+    nbytes = BATCH_ADDR_BYTES[bus]
+    items = []
+    idx = 0
+    while(idx < len(payload)):
+        if(idx + nbytes + _BATCH_LENGTHS.size > len(payload)):
+            raise ValueError('Batch item header cut short at byte ' + str(idx))
+        addr = int.from_bytes(payload[idx:idx + nbytes], 'little')
+        nbytes_write, nbytes_read = _BATCH_LENGTHS.unpack_from(payload, idx + nbytes)
+        idx += nbytes + _BATCH_LENGTHS.size
+        if(idx + nbytes_write > len(payload)):
+            raise ValueError('Batch item data cut short at byte ' + str(idx))
+        items.append((addr, bytes(payload[idx:idx + nbytes_write]), nbytes_read))
+        idx += nbytes_write
+    return items
+
+def batch_request_size(bus: str, data, nbytes_read) -> int:
+    '''Bytes one item adds to a batch request'''
+    return BATCH_ADDR_BYTES[bus] + _BATCH_LENGTHS.size + len(data)
+
+def split_batch_reply(reply, reads) -> list:
+    '''
+    [(status, data)] of a batch reply, reads holds the nbytes_read of each item.
+    Raises ValueError when the reply does not match the items.
+    '''
+    if(len(reply) != len(reads) + sum(reads)):
+        raise ValueError('Batch reply of {} bytes, {} expected'.format(len(reply), len(reads) + sum(reads)))
+    out = []
+    idx = 0
+    for nbytes_read in reads:
+        out.append((reply[idx], bytes(reply[idx + 1:idx + 1 + nbytes_read])))
+        idx += 1 + nbytes_read
+    return out
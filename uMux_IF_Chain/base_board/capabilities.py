@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+'''
+Module capabilities
+=================================
+What a firmware build can do, found once by probing and then kept on disk. The base
+board is asked whether it takes the binary protocol, how large an SPI transfer a single
+command can carry and which optional commands it knows; IF boards are asked which of the
+optional _CMD opcodes their MCU answers. Results are cached by firmware version and
+serial number, so later sessions on the same firmware only look them up.
+'''
+# System level imports
+import os
+import time
+
+# local imports
+from uMux_IF_Chain.base_board import discovery
+
+# Where probe results are kept between sessions
+CACHE_FILE = os.path.join(os.path.expanduser('~'), '.uMux_IF_Chain', 'capabilities.json')
+
+# Largest SPI transfer a command can ask for, the ASCII length field is one byte
+MAX_SPI_BYTES = 0xFF
+
+# SPI transfer sizes tried for max_payload, in increasing order and no more than MAX_SPI_BYTES
+PAYLOAD_SIZES = (16, 64, 128, MAX_SPI_BYTES)
+
+# Read only base board queries that older firmware may not know, an empty batch touches no device
+OPTIONAL_QUERIES = ['I2C:SI_LOCK?', 'SPI:BATCH:', 'I2C:BATCH:']
+
+class Capabilities:
+    '''
+    Probe result for one firmware build
+        key         : cache key, firmware version and serial number
+        binary      : firmware takes the binary protocol
+        max_payload : {protocol: largest SPI transfer that worked, MAX_SPI_BYTES at most}
+        commands    : {command: supported} for optional commands
+        probe_s     : time the probe took
+    '''
+    def __init__(self, key=''):
+        self.key = key
+        self.binary = False
+        self.max_payload = {}
+        self.commands = {}
+        self.probe_s = 0.0
+        self.probed_at = ''
+
+    def __repr__(self):
+        return "Capabilities({}, binary={}, max_payload={}, commands={})".format(
+            self.key, self.binary, self.max_payload, self.commands)
+
+    def supports(self, command: str) -> bool:
+        return self.commands.get(command, False)
+
+    def to_dict(self) -> dict:
+        return {'binary': self.binary, 'max_payload': self.max_payload, 'commands': self.commands,
+                'probe_s': self.probe_s, 'probed_at': self.probed_at}
+
+    @classmethod
+    def from_dict(cls, key: str, entry: dict):
+        caps = cls(key)
+        caps.binary = entry.get('binary', False)
+        caps.max_payload = entry.get('max_payload', {})
+        caps.commands = entry.get('commands', {})
+        caps.probe_s = entry.get('probe_s', 0.0)
+        caps.probed_at = entry.get('probed_at', '')
+        return caps
+
+def firmware_key(bb) -> str:
+    '''Cache key of the base board firmware, get_device_info() has to have been read'''
+    return 'bb:' + '|'.join([bb.fw_identity, bb.fw_version, bb.fw_timestamp, bb.fw_serial_number])
+
+def lookup(key: str, cache_file=None) -> Capabilities:
+    '''Cached capabilities, None when this firmware has not been probed'''
+    entry = discovery.load_cache(cache_file or CACHE_FILE).get(key)
+    if(not isinstance(entry, dict)):
+        return None
+    return Capabilities.from_dict(key, entry)
+
+def store(caps: Capabilities, cache_file=None):
+    def update(cache):
+        cache[caps.key] = caps.to_dict()
+        return cache
+    discovery.update_cache(update, cache_file or CACHE_FILE)
+
+def _max_payload(bb, sizes) -> int:
+    '''
+    Largest SPI read of sizes the firmware carries out, on chip select 0 so no device is
+    touched. Sizes the protocol can not encode are never sent.
+    '''
+    best = 0
+    for nbytes in sizes:
+        if(nbytes > MAX_SPI_BYTES):
+            break
+        ret = bb.spi_read(0x00, nbytes)
+        if((ret is None) or (len(ret) != nbytes)):
+            break
+        best = nbytes
+    return best
+
+def probe_base_board(bb, sizes=PAYLOAD_SIZES) -> Capabilities:
+    '''
+    Probe the firmware behind a Base_Board_Rev3, which is left on the protocol it was
+    using. Firmware rejecting a probe is expected, the errors the base board would
+    print for it are turned off on this base board only while probing.
+    '''
+    start = time.perf_counter()
+    caps = Capabilities(firmware_key(bb))
+    protocol = bb.protocol
+    auto_print = bb.auto_print
+    print_errors = bb.print_errors
+    bb.auto_print = 0
+    bb.print_errors = False
+    try:
+        if(protocol == 'binary'):
+            bb.set_ascii_protocol()
+        caps.max_payload['ascii'] = _max_payload(bb, sizes)
+        for query in OPTIONAL_QUERIES:
+            # A rejected query resolves to None or an !INVALID reply
+            ret = bb.submit(query, idempotent=True).result()
+            caps.commands[query] = isinstance(ret, str) and (not ret.startswith('!INVALID'))
+        caps.binary = (bb.negotiate_protocol() == 'binary')
+        if(caps.binary):
+            caps.max_payload['binary'] = _max_payload(bb, sizes)
+            if(protocol != 'binary'):
+                bb.set_ascii_protocol()
+    finally:
+        bb.auto_print = auto_print
+        bb.print_errors = print_errors
+    caps.probe_s = time.perf_counter() - start
+    caps.probed_at = time.strftime('%Y-%m-%dT%H:%M:%S')
+    return caps
+
+def base_board_capabilities(bb, refresh=False, cache_file=None) -> Capabilities:
+    '''
+    Capabilities of the base board firmware, from the cache when this firmware version
+    and serial number have been probed before
+        refresh : probe again and replace the cached entry
+    '''
+    auto_print = bb.auto_print
+    bb.auto_print = 0
+    try:
+        if(bb.fw_version == ''):
+            bb.get_device_info()
+        caps = None if(refresh) else lookup(firmware_key(bb), cache_file)
+        # Entries written before a query was added to OPTIONAL_QUERIES, or by a probe that
+        # went past MAX_SPI_BYTES, are probed again
+        if((caps is None) or any(query not in caps.commands for query in OPTIONAL_QUERIES)
+           or any(nbytes > MAX_SPI_BYTES for nbytes in caps.max_payload.values())):
+            caps = probe_base_board(bb)
+            store(caps, cache_file)
+    finally:
+        bb.auto_print = auto_print
+    return caps
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+'''
+Module discovery
+=================================
+Finds base boards without being told their port. Candidate ports are enumerated with
+pyserial's list_ports, by the USB VID/PID in USB_IDS, and every candidate is asked
+*IDN? and *SN? at the same time with a short deadline, so a rack is identified in one
+round no longer than the slowest port instead of one 6 s timeout per wrong guess.
+Other USB serial ports are only written to when asked for with probe_all, they could
+be any device. Found boards are cached by serial number in a JSON file, which lets
+Base_Board_Rev3 open a board by serial number with the port string sn:<serial number>,
+and their ports are candidates from then on.
+'''
+# System level imports
+import concurrent.futures
+import json
+import os
+import tempfile
+import threading
+import time
+
+from serial.tools import list_ports
+
+# local imports
+from uMux_IF_Chain.base_board import transport
+
+# (VID, PID) pairs the base board firmware enumerates as, ports with these are probed without
+# asking. Add the IDs of the firmware build in use, until then only ports found with probe_all are
+USB_IDS = []
+
+# Where discover() keeps the serial number -> port map between sessions
+CACHE_FILE = os.path.join(os.path.expanduser('~'), '.uMux_IF_Chain', 'base_boards.json')
+
+# Held around every read-modify-write of a cache file, base boards are opened from several threads
+_cache_lock = threading.Lock()
+
+class Port_Info:
+    '''
+    What probing one port found
+        identity      : *IDN? reply, '' when the port did not answer like a base board
+        serial_number : *SN? reply
+        error         : why the probe failed, None when it didn't
+        elapsed_s     : wall time of the probe
+    '''
+    def __init__(self, port):
+        self.port = port
+        self.identity = ''
+        self.serial_number = ''
+        self.error = None
+        self.elapsed_s = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    def __repr__(self):
+        if(self.ok):
+            return "Port_Info({}, {!r}, {!r}, {:.3f} s)".format(self.port, self.identity, self.serial_number, self.elapsed_s)
+        return "Port_Info({}, ERROR {}, {:.3f} s)".format(self.port, self.error, self.elapsed_s)
+
+def candidate_ports(usb_ids=None, probe_all=False, cache_file=None) -> list:
+    '''
+    Device paths of the serial ports that could be a base board: those with a USB ID of
+    usb_ids and those a base board was found on before
+        usb_ids   : (VID, PID) pairs to accept, USB_IDS when None
+        probe_all : every USB serial port, probing writes to devices that may not be base boards
+    '''
+    if(usb_ids is None):
+        usb_ids = USB_IDS
+    known = set(load_cache(cache_file).values())
+    ports = []
+    for info in sorted(list_ports.comports(), key=lambda x: x.device):
+        if(info.vid is None):
+            continue
+        if(probe_all or ((info.vid, info.pid) in usb_ids) or (info.device in known)):
+            ports.append(info.device)
+    return ports
+
+def probe_port(port, timeout_s=0.25) -> Port_Info:
+    '''
+    Ask one port *IDN? and *SN? and wait at most timeout_s for both replies. Both
+    queries go out in one write, a base board answers each with !RCVD and the value.
+    '''
+    res = Port_Info(port)
+    start = time.perf_counter()
+    com = None
+    try:
+        com = transport.open_transport(port, timeout=timeout_s, write_timeout=timeout_s)
+        com.reset_input_buffer()
+        com.write(b'*IDN?\n*SN?\n')
+        deadline = start + timeout_s
+        buf = b''
+        while((buf.count(b'\n') < 4) and (time.perf_counter() < deadline)):
+            com.timeout = max(deadline - time.perf_counter(), 0.001)
+            buf += com.read(max(com.in_waiting, 1))
+        lines = [x.strip().decode('ascii', 'replace') for x in buf.split(b'\n')[:4]]
+        if((len(lines) == 4) and (lines[0] == '!RCVD') and (lines[2] == '!RCVD')):
+            res.identity = lines[1]
+            res.serial_number = lines[3]
+        else:
+            res.error = "no base board reply within {} s".format(timeout_s)
+    except Exception as e:
+        res.error = "{}: {}".format(type(e).__name__, e)
+    finally:
+        if(com is not None):
+            com.close()
+    res.elapsed_s = time.perf_counter() - start
+    return res
+
+def probe_ports(ports, timeout_s=0.25, max_workers=None) -> dict:
+    '''probe_port() on every port at once, returns {port: Port_Info}'''
+    ports = list(ports)
+    if(len(ports) == 0):
+        return {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers or len(ports)) as executor:
+        futs = {port: executor.submit(probe_port, port, timeout_s) for port in ports}
+        return {port: fut.result() for port, fut in futs.items()}
+
+def load_cache(cache_file=None) -> dict:
+    '''The cached {serial_number: port}, empty when there is no usable cache'''
+    try:
+        with open(cache_file or CACHE_FILE) as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if(not isinstance(cache, dict)):
+        return {}
+    return cache
+
+def save_cache(cache: dict, cache_file=None):
+    '''
+    Write the cache through a temporary file of its own in the same directory, so
+    concurrent writers never share one and a reader sees the old file or the new one
+    '''
+    cache_file = cache_file or CACHE_FILE
+    tmp = None
+    try:
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        with tempfile.NamedTemporaryFile('w', dir=os.path.dirname(cache_file), prefix=os.path.basename(cache_file) + '.',
+                                         suffix='.tmp', delete=False) as f:
+            tmp = f.name
+            json.dump(cache, f, indent=1, sort_keys=True)
+        os.replace(tmp, cache_file)
+    except OSError as e:
+        print("\tWARNING: Could not write the port cache " + cache_file + " : " + str(e))
+        if((tmp is not None) and os.path.exists(tmp)):
+            os.remove(tmp)
+
+def update_cache(update, cache_file=None):
+    '''
+    Load the cache, apply update(cache) and save what it returns, with no other thread
+    of this process writing the file in between
+    '''
+    with _cache_lock:
+        save_cache(update(load_cache(cache_file)), cache_file)
+
+def discover(ports=None, timeout_s=0.25, usb_ids=None, cache_file=None, probe_all=False) -> dict:
+    '''
+    Find every base board and update the cache. Returns {serial_number: Port_Info}
+    in port order.
+        ports     : ports to probe, candidate_ports(usb_ids, probe_all) when None
+        probe_all : probe every USB serial port, not only the known base board ones
+    '''
+    if(ports is None):
+        ports = candidate_ports(usb_ids, probe_all, cache_file)
+    found = {}
+    for port, res in probe_ports(ports, timeout_s).items():
+        if(res.ok):
+            found[res.serial_number] = res
+    def update(cache):
+        # A board that moved leaves a stale entry behind on its old port
+        probed = set(ports)
+        cache = {sn: port for sn, port in cache.items() if(port not in probed)}
+        cache.update({sn: res.port for sn, res in found.items()})
+        return cache
+    update_cache(update, cache_file)
+    return found
+
+def find_port(serial_number: str, timeout_s=0.25, usb_ids=None, cache_file=None, probe_all=False) -> str:
+    '''
+    Port of the base board with this serial number. The cached port is checked with a
+    single probe, the candidate ports are probed again only when that fails.
+    '''
+    port = load_cache(cache_file).get(serial_number)
+    if(port is not None):
+        if(probe_port(port, timeout_s).serial_number == serial_number):
+            return port
+    found = discover(None, timeout_s, usb_ids, cache_file, probe_all)
+    if(serial_number not in found):
+        raise IOError("No base board with serial number " + serial_number + " was found")
+    return found[serial_number].port
+
+def discover_ports(timeout_s=0.25, usb_ids=None, cache_file=None, probe_all=False) -> list:
+    '''Ports of every base board discover() finds, for scripts started without a port'''
+    found = discover(None, timeout_s, usb_ids, cache_file, probe_all)
+    if(len(found) == 0):
+        raise IOError("No base board was found, give its port on the command line or look on every USB "
+                      + "serial port with probe_all (--probe_all_ports)")
+    for sn, res in found.items():
+        print("Found " + res.identity + " " + sn + " on " + str(res.port))
+    return [res.port for res in found.values()]
@@ -0,0 +1,623 @@
+# -*- coding: utf-8 -*-
+'''
+Module firmware_sim
+=================================
+Local stand-in for the Base Board Rev3 tyr command processor and the MCUs on the
+uMux IF Boards Rev1. It speaks the same ASCII line protocol as the firmware so the
+host stack can be exercised and benchmarked without hardware, either in process
+through process() and the loop:// transport, over a pseudo terminal with serve_pty()
+or over TCP with serve_tcp(). The binary framed protocol from binary_protocol is
+understood once the host negotiates it.
+
+This is a behavioral model, the values it returns are plausible rather than exact.
+'''
+# System level imports
+import os
+import random
+import select
+import threading
+import time
+# Local imports
+from uMux_IF_Chain.base_board import binary_protocol
+from uMux_IF_Chain.base_board.binary_protocol import _BIN_OP, _BIN_STATUS
+from uMux_IF_Chain.uMux_IF import commands
+
+class If_Board_Sim:
+    '''Model of the MCU on one uMux IF Board Rev1, talks the 6 byte command protocol over SPI'''
+    # Kept local so the simulator does not depend on the host side classes
+    CMD_LEN = 6
+    W_GOOD = 0x1 << 0
+    R_GOOD = 0x1 << 1
+    INVALID = 0x1 << 2
+    I2C_NACK = 0x1 << 3
+    RST_DONE = 0x1 << 4
+    BUSY = 0x1 << 5
+    OVERHEAT = 0x1 << 7
+    # Seconds the MCU takes to carry out an opcode, the RET_VAL reads BUSY until then, 0x60
+    # is the 112 byte EEPROM data write. The slow commands of the table the host uses get a
+    # short stand in, not a measured time, set command_time_s to model a particular board
+    BUSY_TIME_S = 0.001
+    COMMAND_TIME_S = dict.fromkeys(commands.slow_opcodes(), BUSY_TIME_S)
+
+    def __init__(self, slot: int):
+        self.slot = slot
+        self.fwid = list(b'uMux_IF_Rev1 FW ')
+        self.cid = [0x10 + slot] + [0xA5] * 11
+        self.bsn = list('IFB-{:04d}'.format(slot).ljust(16, '\x00').encode())
+        self.eeprom = [0x00] * 112
+        self.eeprom[0:16] = self.bsn
+        self.synth_temp_C = 35.0 + slot
+        self.mcu_temp_C = 30.0 + slot
+        self.command_time_s = dict(self.COMMAND_TIME_S)
+        self.i2c_fault = False      # The MCU local I2C bus NACKs, temperature commands fail
+        self._busy_until = 0.0
+        self.power_on_reset()
+
+    def power_on_reset(self):
+        self.bb_loopback = 1
+        self.nulling_up = [8192, 8192]
+        self.nulling_dn = [8192, 8192]
+        self.temp_threshold_C = 100.0
+        self.synth_enabled = False
+        self.synth_regs = {}
+        self.synth_cal_done = False
+        self._reply = [0x00] * self.CMD_LEN
+        self._reply_extra = []
+        self._reply_taken = False
+        self._loopback_len = 0
+        self._loopback_prev = []
+        self._eeprom_pending = 0
+        self._status_flags = self.RST_DONE
+
+    def synth_locked(self) -> bool:
+        r0 = self.synth_regs.get(0, 0)
+        return self.synth_enabled & self.synth_cal_done & ((r0 & 0x1) == 0)
+
+    def transfer(self, mosi: list) -> list:
+        '''Full duplex SPI transfer, returns MISO'''
+        nbytes = len(mosi)
+        if(self._loopback_len > 0):
+            # Loopback mode returns the previous transfer with the status in the first byte
+            miso = (self._loopback_prev + [0x00] * nbytes)[:nbytes]
+            self._loopback_prev = [self.W_GOOD] + list(mosi[1:])
+            if((mosi[0] >> 1) != 0x51):
+                self._loopback_len = 0
+            return miso
+        miso = (self._reply + [0x00] * nbytes)[:nbytes]
+        self.write(mosi)
+        return miso
+
+    def read(self, nbytes: int) -> list:
+        if(time.monotonic() < self._busy_until):
+            return ([self.BUSY] + [0x00] * nbytes)[:nbytes]
+        # The RET_VAL is read first, a following read picks up any bulk data
+        if((self._reply_taken) & (len(self._reply_extra) > 0)):
+            miso = (self._reply_extra + [0x00] * nbytes)[:nbytes]
+            self._reply_extra = []
+            return miso
+        self._reply_taken = True
+        return (self._reply + [0x00] * nbytes)[:nbytes]
+
+    def write(self, mosi: list):
+        if(self._eeprom_pending > 0):
+            self.eeprom = (list(mosi) + [0x00] * 112)[:112]
+            self._eeprom_pending = 0
+            self._set_reply(self.W_GOOD)
+            self._busy_until = time.monotonic() + self.command_time_s.get(0x60, 0.0)
+            return
+        if(self._loopback_len > 0):
+            self.transfer(mosi)
+            return
+        if(len(mosi) < self.CMD_LEN):
+            self._set_reply(self.INVALID)
+            return
+        self._command(mosi)
+
+    def _set_reply(self, status: int, data=None):
+        reply = [0x00] * self.CMD_LEN
+        reply[0] = status | self._status_flags
+        if(max(self.synth_temp_C, self.mcu_temp_C) > self.temp_threshold_C):
+            reply[0] |= self.OVERHEAT
+        self._status_flags = 0
+        self._reply_taken = False
+        self._reply_extra = []
+        if(data is not None):
+            reply[1:1 + len(data)] = data
+        self._reply = reply
+
+    def _temp_bytes(self, temp_C: float) -> list:
+        val = int(round(temp_C / 0.0625)) << 4
+        return [(val >> 8) & 0xFF, val & 0xFF]
+
+    def _command(self, cmd: list):
+        opcode = cmd[0] >> 1
+        read = cmd[0] & 0x1
+        if(opcode != 0x60):
+            self._busy_until = time.monotonic() + self.command_time_s.get(opcode, 0.0)
+        W, R = self.W_GOOD, self.R_GOOD
+        if(opcode == 0x00):
+            self._set_reply(W)
+        elif(opcode in (0x10, 0x11, 0x12, 0x13)):
+            blob = {0x10: self.fwid, 0x11: self.cid, 0x12: self.bsn, 0x13: self.eeprom}[opcode]
+            self._set_reply(R, [len(blob)])
+            self._reply_extra = list(blob)
+        elif(opcode == 0x14):
+            if(read):
+                self._set_reply(R, [self.bb_loopback])
+            else:
+                self.bb_loopback = cmd[1] & 0x1
+                self._set_reply(W)
+        elif(opcode == 0x16):
+            if(cmd[1:5] == [0x55, 0x44, 0x33, 0x22]):
+                self.power_on_reset()
+            else:
+                self._set_reply(self.INVALID)
+        elif((opcode in (0x20, 0x21)) & self.i2c_fault):
+            self._set_reply(self.I2C_NACK)
+        elif(opcode == 0x20):
+            if(read):
+                self._set_reply(R, self._temp_bytes(self.temp_threshold_C) * 2)
+            else:
+                val = ((cmd[1] << 8) | cmd[2]) >> 4
+                self.temp_threshold_C = val * 0.0625
+                self._set_reply(W)
+        elif(opcode == 0x21):
+            self._set_reply(R, self._temp_bytes(self.synth_temp_C) + self._temp_bytes(self.mcu_temp_C))
+        elif(opcode in (0x31, 0x32)):
+            dac = self.nulling_up if(opcode == 0x31) else self.nulling_dn
+            if(read):
+                data = []
+                for val in dac:
+                    data += [((val << 2) >> 8) & 0xFF, (val << 2) & 0xFF]
+                self._set_reply(R, data)
+            else:
+                dac[0] = ((cmd[1] << 8) | cmd[2]) >> 2
+                dac[1] = ((cmd[3] << 8) | cmd[4]) >> 2
+                self._set_reply(W)
+        elif(opcode == 0x40):
+            self._set_reply(R, [0xFF if self.synth_locked() else 0x00])
+        elif(opcode == 0x41):
+            self.synth_cal_done = False
+            self._set_reply(W)
+        elif(opcode == 0x42):
+            self.synth_enabled = True
+            self._set_reply(W)
+        elif(opcode == 0x43):
+            if(read):
+                reg = cmd[1] & 0x7F
+                val = self.synth_regs.get(reg, 0)
+                # MUXOUT set to lock detect reads back the lock status instead of R0
+                if((reg == 0) & ((val >> 2) & 0x1 == 1)):
+                    val = 0xFFFF if self.synth_locked() else 0x0000
+                self._set_reply(R, [(val >> 8) & 0xFF, val & 0xFF])
+            else:
+                reg = cmd[1] & 0x7F
+                val = (cmd[2] << 8) | cmd[3]
+                self.synth_regs[reg] = val
+                if((reg == 0) & ((val >> 3) & 0x1 == 1)):
+                    self.synth_cal_done = True
+                self._set_reply(W)
+        elif(opcode == 0x44):
+            dump = []
+            for reg in sorted(self.synth_regs):
+                val = self.synth_regs[reg]
+                dump += [reg, (val >> 8) & 0xFF, val & 0xFF]
+            self._set_reply(R, [len(dump)])
+            self._reply_extra = dump
+        elif(opcode == 0x51):
+            self._set_reply(W)
+            self._loopback_len = cmd[1]
+            self._loopback_prev = []
+        elif(opcode == 0x60):
+            self._eeprom_pending = cmd[1]
+            self._set_reply(W, [cmd[1]])
+        else:
+            self._set_reply(self.INVALID)
+
+class Tmp275_Sim:
+    '''TMP275 on the base board local I2C bus'''
+    def __init__(self, temp_C: float):
+        self.temp_C = temp_C
+        self.config = 0x00
+        self._pointer = 0
+
+    def write(self, data: list):
+        if(len(data) == 0):
+            return
+        self._pointer = data[0] & 0x3
+        if((self._pointer == 1) & (len(data) > 1)):
+            self.config = data[1]
+
+    def read(self, nbytes: int) -> list:
+        if(self._pointer == 1):
+            data = [self.config]
+        else:
+            val = int(round(self.temp_C / 0.0625)) << 4
+            data = [(val >> 8) & 0xFF, val & 0xFF]
+        return (data + [0x00] * nbytes)[:nbytes]
+
+class Base_Board_Sim:
+    '''
+    Model of the Base Board Rev3 tyr command processor.
+        n_if_boards      : IF boards installed, filled from chip select 0x1 upwards
+        slots            : slot numbers 0 to 31 of the IF boards instead, for a sparse stack
+        response_delay_s : added before each response, stands in for USB latency
+        link_rate_Bps    : bytes per second both ways on the link, 0 for no limit
+        fault_rate       : fraction of responses that are dropped, garbled or cut short
+        fault_seed       : seed for the fault injection, None for a random one
+    '''
+    def __init__(self, n_if_boards=4, response_delay_s=0.0, link_rate_Bps=0.0, fault_rate=0.0, fault_seed=None,
+                 slots=None):
+        self.identity = 'Tyr Base_Board_Rev3 Simulator'
+        self.serial_number = 'SIM00001'
+        self.fw_version = '3.0.0-sim'
+        self.fw_description = 'uMux IF Chain base board firmware stand-in'
+        self.fw_timestamp = '2026-01-01T00:00:00'
+        self.response_delay_s = response_delay_s
+        self.link_rate_Bps = link_rate_Bps
+        self.fault_rate = fault_rate
+        self.faults = 0
+        self._fault_rng = random.Random(fault_seed)
+        self.if_boards = {}
+        if(slots is None):
+            slots = range(n_if_boards)
+        for slot in slots:
+            if((slot < 0) or (slot > 31)):
+                raise ValueError('IF board slot {} is outside the 32 bit DEV_STACK'.format(slot))
+            self.if_boards[0x1 << slot] = If_Board_Sim(slot)
+        self.i2c_devices = {0x48: Tmp275_Sim(28.5), 0x49: Tmp275_Sim(41.25)}
+        self.periodic = False
+        self.periodic_interval_s = 0.1  # Between reports while periodic checking is on
+        self.reports = 0
+        self._next_report = 0.0
+        self.commands = 0
+        self.spi_bytes = 0          # Bytes clocked on the IF board SPI bus, once for a write to several boards
+        self.protocol = 'ascii'     # 'binary' after the host sends NEGOTIATE_CMD
+        self.binary = True          # False stands in for firmware from before the binary protocol
+        self.max_payload = 1024     # Most data bytes a single SPI command takes
+        self._rx = bytearray()
+
+    def dev_stack(self) -> int:
+        stack = 0
+        for cs in self.if_boards:
+            stack |= cs
+        return stack
+
+    def process(self, data: bytes) -> bytes:
+        '''Feed bytes received from the host, returns the bytes the firmware sends back'''
+        self._rx += data
+        out = bytearray()
+        while(True):
+            binary = (self.protocol == 'binary')
+            idx = self._rx.find(binary_protocol.FRAME_DELIMITER if binary else b'\n')
+            if(idx < 0):
+                break
+            raw = bytes(self._rx[:idx])
+            del self._rx[:idx + 1]
+            if(self.response_delay_s > 0):
+                time.sleep(self.response_delay_s)
+            if(binary):
+                out += self._fault(self.frame(raw), binary_protocol.FRAME_DELIMITER)
+                continue
+            line = raw.decode(errors='replace').strip('\r')
+            if((line == binary_protocol.NEGOTIATE_CMD) & self.binary):
+                self.commands += 1
+                self.protocol = 'binary'
+                out += ('!RCVD\n' + binary_protocol.NEGOTIATE_REPLY + '\n').encode()
+                continue
+            reply = b''
+            for x in self.command(line):
+                reply += x.encode() + b'\n'
+            out += self._fault(reply, b'\n')
+        if(self.link_rate_Bps > 0):
+            time.sleep((len(data) + len(out)) / self.link_rate_Bps)
+        return bytes(out)
+
+    def _fault(self, reply: bytes, terminator: bytes) -> bytes:
+        '''Apply fault_rate to one response, as a noisy or overloaded link would'''
+        if((self.fault_rate <= 0) or (self._fault_rng.random() >= self.fault_rate)):
+            return reply
+        self.faults += 1
+        kind = self._fault_rng.randrange(3)
+        if(kind == 0):
+            return b''
+        idx = self._fault_rng.randrange(len(reply))
+        if(kind == 1):
+            return reply[:idx]
+        # A flipped bit that does not create or destroy a terminator
+        garbled = bytearray(reply)
+        if(garbled[idx] == terminator[0]):
+            idx = max(idx - 1, 0)
+        garbled[idx] ^= 0x40
+        if(garbled[idx] == terminator[0]):
+            garbled[idx] ^= 0x41
+        return bytes(garbled)
+
+    def frame(self, raw: bytes) -> bytes:
+        '''Execute one binary request frame, returns the encoded response frame'''
+        try:
+            opcode, seq, payload = binary_protocol.decode_frame(raw)
+        except ValueError:
+            return binary_protocol.encode_frame(_BIN_STATUS.CRC_ERROR, 0)
+        if(opcode == _BIN_OP.PROTO_ASCII):
+            self.commands += 1
+            self.protocol = 'ascii'
+            return binary_protocol.encode_frame(_BIN_STATUS.OKAY, seq)
+        try:
+            line = self._frame_to_line(opcode, payload)
+        except (ValueError, IndexError):
+            return binary_protocol.encode_frame(_BIN_STATUS.INVALID, seq)
+        lines = self.command(line)
+        if(lines[0] != '!RCVD'):
+            return binary_protocol.encode_frame(_BIN_STATUS.INVALID, seq)
+        if(opcode == _BIN_OP.ASCII_CMD):
+            return binary_protocol.encode_frame(_BIN_STATUS.OKAY, seq, '\n'.join(lines[1:]).encode())
+        status = _BIN_STATUS.NACK if(lines[1] == 'NACK') else _BIN_STATUS.OKAY
+        data = bytes.fromhex(lines[2]) if(len(lines) > 2) else b''
+        return binary_protocol.encode_frame(status, seq, data)
+
+    def _frame_to_line(self, opcode: int, payload: bytes) -> str:
+        '''The firmware shares one command handler, frames are mapped onto the ASCII commands'''
+        if(opcode == _BIN_OP.ASCII_CMD):
+            return payload.decode()
+        if(opcode == _BIN_OP.SPI_DEV_STACK):
+            return 'SPI:DEV_STACK'
+        if(opcode == _BIN_OP.I2C_SCAN_ADDR):
+            return 'I2C:SCAN_ADDR'
+        if(opcode == _BIN_OP.SPI_BATCH):
+            return 'SPI:BATCH:' + payload.hex()
+        if(opcode == _BIN_OP.I2C_BATCH):
+            return 'I2C:BATCH:' + payload.hex()
+        if((opcode & 0xF0) == 0x00):
+            if(len(payload) < 4):
+                raise ValueError('short payload')
+            cs = int.from_bytes(payload[:4], 'little')
+            data = payload[4:]
+            if(opcode == _BIN_OP.SPI_HARD_RST):
+                return 'SPI:HARD_RST:%02x' % cs
+            if(opcode == _BIN_OP.SPI_WRITE):
+                return 'SPI:WRITE:%02x,%02x,%s' % (cs, len(data), data.hex())
+            if(opcode == _BIN_OP.SPI_WRITE_READ):
+                return 'SPI:WRITE_READ:%02x,%02x,%s' % (cs, len(data), data.hex())
+            if(opcode == _BIN_OP.SPI_READ):
+                return 'SPI:READ:%02x,%02x' % (cs, int.from_bytes(data[:2], 'little'))
+        else:
+            addr = payload[0]
+            if(opcode == _BIN_OP.I2C_WRITE):
+                return 'I2C:WRITE:%02x,%02x,%s' % (addr, len(payload) - 1, payload[1:].hex())
+            nbytes = int.from_bytes(payload[1:3], 'little')
+            if(opcode == _BIN_OP.I2C_READ):
+                return 'I2C:READ:%02x,%02x' % (addr, nbytes)
+            if(opcode == _BIN_OP.I2C_WRITE_READ):
+                data = payload[3:]
+                return 'I2C:WRITE_READ:%02x,%02x,%02x,%s' % (addr, len(data), nbytes, data.hex())
+        raise ValueError('unknown opcode 0x{:02X}'.format(opcode))
+
+    def command(self, line: str) -> list:
+        '''Execute one command line, returns the response lines'''
+        self.commands += 1
+        try:
+            return ['!RCVD'] + self._dispatch(line)
+        except (ValueError, IndexError, KeyError):
+            return ['!INVALID:' + line]
+
+    def _hex_bytes(self, data_str: str, nbytes: int) -> list:
+        data = list(bytes.fromhex(data_str))
+        if(len(data) != nbytes):
+            raise ValueError('length mismatch')
+        return data
+
+    def _selected(self, cs: int) -> list:
+        return [self.if_boards[x] for x in self.if_boards if(x & cs)]
+
+    def _dispatch(self, line: str) -> list:
+        queries = {'*IDN?': self.identity, '*SN?': self.serial_number, '*FW_VER?': self.fw_version,
+                   '*FW_DESC?': self.fw_description, '*FW_TIMESTAMP?': self.fw_timestamp}
+        if(line in queries):
+            return [queries[line]]
+        if(line == '*FW_START_PER'):
+            self.periodic = True
+            self._next_report = time.monotonic() + self.periodic_interval_s
+            return ['OKAY']
+        if(line == '*FW_STOP_PER'):
+            self.periodic = False
+            return ['OKAY']
+        if(line == 'I2C:SI_LOCK?'):
+            return ['LOCKED']
+
+        fields = line.split(':')
+        if(len(fields) < 2):
+            raise ValueError(line)
+        bus, cmd = fields[0], fields[1]
+        args = fields[2].split(',') if(len(fields) > 2) else []
+        if(cmd == 'BATCH'):
+            return self._batch(bus, bytes.fromhex(fields[2]))
+
+        if(bus == 'SPI'):
+            if(cmd == 'DEV_STACK'):
+                return ['OKAY', self.dev_stack().to_bytes(4, 'little').hex().upper()]
+            cs = int(args[0], 16)
+            boards = self._selected(cs)
+            if(cmd == 'HARD_RST'):
+                for board in boards:
+                    board.power_on_reset()
+                return ['OKAY']
+            nbytes = int(args[1], 16)
+            if(nbytes > self.max_payload):
+                raise ValueError('payload too long')
+            self.spi_bytes += nbytes
+            if(cmd == 'WRITE'):
+                data = self._hex_bytes(args[2], nbytes)
+                for board in boards:
+                    board.write(data)
+                return ['OKAY']
+            if(cmd == 'READ'):
+                miso = [0xFF] * nbytes
+                if(len(boards) == 1):
+                    miso = boards[0].read(nbytes)
+                return ['OKAY', bytes(miso).hex().upper()]
+            if(cmd == 'WRITE_READ'):
+                data = self._hex_bytes(args[2], nbytes)
+                miso = [0xFF] * nbytes
+                if(len(boards) == 1):
+                    miso = boards[0].transfer(data)
+                return ['OKAY', bytes(miso).hex().upper()]
+        elif(bus == 'I2C'):
+            if(cmd == 'SCAN_ADDR'):
+                scan = [0x00] * 128
+                for addr in self.i2c_devices:
+                    scan[addr] = addr
+                return ['OKAY', bytes(scan).hex().upper()]
+            addr = int(args[0], 16)
+            dev = self.i2c_devices.get(addr)
+            if(dev is None):
+                return ['NACK']
+            if(cmd == 'WRITE'):
+                dev.write(self._hex_bytes(args[2], int(args[1], 16)))
+                return ['OKAY']
+            if(cmd == 'READ'):
+                nbytes = int(args[1], 16)
+                return ['OKAY', bytes(dev.read(nbytes)).hex().upper()]
+            if(cmd == 'WRITE_READ'):
+                nbytes_write = int(args[1], 16)
+                nbytes = int(args[2], 16)
+                dev.write(self._hex_bytes(args[3], nbytes_write))
+                return ['OKAY', bytes(dev.read(nbytes)).hex().upper()]
+        raise ValueError(line)
+
+    def _batch(self, bus: str, payload: bytes) -> list:
+        '''
+        SPI:BATCH / I2C:BATCH, the items of binary_protocol.encode_batch() run in order
+        in one command. An item with data and nbytes_read is a full duplex transfer on SPI
+        and a write then read on I2C.
+        '''
+        if(bus not in binary_protocol.BATCH_ADDR_BYTES):
+            raise ValueError(bus)
+        items = binary_protocol.decode_batch(bus, payload)
+        if((len(payload) > self.max_payload) or (sum(1 + x[2] for x in items) > self.max_payload)):
+            raise ValueError('batch too long')
+        reply = bytearray()
+        for addr, data, nbytes_read in items:
+            status = _BIN_STATUS.OKAY
+            miso = []
+            if(bus == 'SPI'):
+                boards = self._selected(addr)
+                self.spi_bytes += max(len(data), nbytes_read)
+                if((len(data) > 0) and (nbytes_read > 0)):
+                    if(len(data) != nbytes_read):
+                        raise ValueError('full duplex length mismatch')
+                    miso = boards[0].transfer(list(data)) if(len(boards) == 1) else [0xFF] * nbytes_read
+                elif(len(data) > 0):
+                    for board in boards:
+                        board.write(list(data))
+                else:
+                    miso = boards[0].read(nbytes_read) if(len(boards) == 1) else [0xFF] * nbytes_read
+            else:
+                dev = self.i2c_devices.get(addr)
+                if(dev is None):
+                    status = _BIN_STATUS.NACK
+                    miso = [0x00] * nbytes_read
+                else:
+                    if(len(data) > 0):
+                        dev.write(list(data))
+                    if(nbytes_read > 0):
+                        miso = dev.read(nbytes_read)
+            reply += bytes([status]) + bytes(miso)
+        if(len(reply) == 0):
+            return ['OKAY']
+        return ['OKAY', bytes(reply).hex().upper()]
+
+    def periodic_report(self) -> bytes:
+        '''The next periodic report, encoded for the protocol in use, see the periodic module'''
+        self._next_report = max(self._next_report + self.periodic_interval_s, time.monotonic())
+        locked = all(board.synth_locked() for board in self.if_boards.values())
+        line = 'PER:{}:TEMP_CENTER={:.4f},TEMP_POWER={:.4f},SI_LOCK=1,SYNTH_LOCK={:d},DEV_STACK=0x{:08X}'.format(
+            self.reports, self.i2c_devices[0x48].temp_C, self.i2c_devices[0x49].temp_C, locked, self.dev_stack())
+        self.reports += 1
+        if(self.protocol == 'binary'):
+            return binary_protocol.encode_frame(_BIN_STATUS.PERIODIC, self.reports - 1, line.encode())
+        return (line + '\n').encode()
+
+    def due_report(self) -> bytes:
+        '''periodic_report() when one is due, b'' otherwise, for transports that poll the simulator'''
+        if(self.periodic and (time.monotonic() >= self._next_report)):
+            return self.periodic_report()
+        return b''
+
+    def _serve(self, fd: int, recv, send):
+        '''Answer what recv() returns until it comes back empty, with periodic reports in between'''
+        while(True):
+            if(self.periodic):
+                wait = self._next_report - time.monotonic()
+                if(wait <= 0):
+                    send(self.periodic_report())
+                    continue
+                if(len(select.select([fd], [], [], wait)[0]) == 0):
+                    continue
+            try:
+                data = recv(65536)
+            except OSError:
+                return
+            if(len(data) == 0):
+                return
+            out = self.process(data)
+            if(len(out) > 0):
+                send(out)
+
+    def serve_fd(self, fd: int):
+        '''Serve the firmware side of a pseudo terminal until the host side goes away'''
+        try:
+            self._serve(fd, lambda n: os.read(fd, n), lambda data: os.write(fd, data))
+        except OSError:
+            return
+
+    def serve_socket(self, sock):
+        '''Serve connections accepted on a listening socket, one at a time'''
+        while(True):
+            conn, _ = sock.accept()
+            with conn:
+                try:
+                    self._serve(conn.fileno(), conn.recv, conn.sendall)
+                except OSError:
+                    pass
+
+    def serve_tcp(self, port=0, separate_process=False) -> str:
+        '''
+        Start serving on a local TCP port, 0 picks a free one, and return a socket://
+        URL that can be handed to Base_Board_Rev3(port=...). Stands in for a serial to
+        network bridge. separate_process is the same as for serve_pty().
+        '''
+        import socket
+        sock = socket.create_server(('127.0.0.1', port))
+        self._tcp_socket = sock
+        if(separate_process):
+            import multiprocessing
+            proc = multiprocessing.get_context('fork').Process(target=self.serve_socket, args=(sock,), daemon=True)
+            proc.start()
+            self._tcp_process = proc
+        else:
+            thread = threading.Thread(target=self.serve_socket, args=(sock,), daemon=True)
+            thread.start()
+        return 'socket://127.0.0.1:{}'.format(sock.getsockname()[1])
+
+    def serve_pty(self, separate_process=False) -> str:
+        '''
+        Start serving on a new pseudo terminal and return the device path, which can be
+        handed to Base_Board_Rev3(port=...). Served from a daemon thread, or a forked
+        process when separate_process is set so benchmarks only see host CPU time.
+        The simulator state is then owned by the child. POSIX only.
+        '''
+        import pty
+        import tty
+        master, slave = pty.openpty()
+        tty.setraw(slave)
+        self._pty_slave = slave     # keep the slave end open so the master stays valid
+        if(separate_process):
+            import multiprocessing
+            proc = multiprocessing.get_context('fork').Process(target=self.serve_fd, args=(master,), daemon=True)
+            proc.start()
+            self._pty_process = proc
+        else:
+            thread = threading.Thread(target=self.serve_fd, args=(master,), daemon=True)
+            thread.start()
+        return os.ttyname(slave)
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+'''
+Module line_reader
+=================================
+Buffered receive path for the tyr command processor. Instead of one read_until()
+per response line, everything the port has waiting is pulled in with a single
+read into a reusable bytearray and lines are split out of that buffer. Deadlines are
+kept here with time.monotonic(), the port timeout is never changed: pyserial
+reconfigures the port on every assignment.
+'''
+# System level imports
+import select
+import time
+
+class Line_Reader:
+    '''
+    Drop in for the pyserial read_until() used by Base_Board_Rev3.
+        com        : object with pyserial style read(), in_waiting and timeout, the
+                     read_some() of the transport module backends is used when present
+        terminator : line termination in bytes
+        chunk_size : most bytes pulled from the port with one read
+        poll_s     : while less than the port timeout is left until a deadline, a blocking
+                     read could overrun it. A port with a file descriptor (pyserial on POSIX)
+                     is then waited on with select(), others have in_waiting checked this often
+    '''
+    def __init__(self, com, terminator=b'\n', chunk_size=4096, poll_s=0.0002):
+        self.com = com
+        self.terminator = terminator
+        self.chunk_size = chunk_size
+        self.poll_s = poll_s
+        self._buf = bytearray()
+        self._pos = 0           # Start of the unconsumed data in self._buf
+        self._read_some = getattr(com, 'read_some', None)
+        # Statistics
+        self.reads = 0          # Calls made to the port read()
+        self.lines = 0          # Lines handed back
+
+    def read_until(self, timeout=None) -> bytes:
+        '''
+        Return the next line including its terminator. Like pyserial, whatever was
+        received is returned without a terminator when the timeout expires.
+            timeout : seconds to wait for the line, None uses the port timeout
+        '''
+        idx = self._buf.find(self.terminator, self._pos)
+        if(idx < 0):
+            if(timeout is None):
+                timeout = self.com.timeout
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while(idx < 0):
+                search_from = len(self._buf)
+                if(not self._fill(deadline)):
+                    return self._take(len(self._buf))
+                idx = self._buf.find(self.terminator, search_from)
+        self.lines += 1
+        return self._take(idx + len(self.terminator))
+
+    def lines_waiting(self) -> bool:
+        '''True when a complete line is already buffered'''
+        return self._buf.find(self.terminator, self._pos) >= 0
+
+    def reset(self):
+        '''Drop anything buffered, used together with reset_input_buffer() on the port'''
+        self._buf.clear()
+        self._pos = 0
+
+    def _fileno(self):
+        # Asked each time, the port may have been closed and opened again
+        try:
+            return self.com.fileno()
+        except (AttributeError, OSError, ValueError):
+            return None
+
+    def _take(self, end: int) -> bytes:
+        line = bytes(self._buf[self._pos:end])
+        self._pos = end
+        # Compact once the consumed head is large, the bytearray keeps its allocation
+        if(self._pos == len(self._buf)):
+            self._buf.clear()
+            self._pos = 0
+        elif(self._pos > self.chunk_size):
+            del self._buf[:self._pos]
+            self._pos = 0
+        return line
+
+    def _fill(self, deadline) -> bool:
+        '''
+        Pull everything the port has waiting, waiting for the first byte until deadline,
+        a time.monotonic() or None for no limit. False on timeout
+        '''
+        if(self._read_some is not None):
+            timeout = None if(deadline is None) else max(deadline - time.monotonic(), 0)
+            data = self._read_some(self.chunk_size, timeout)
+            self.reads += 1
+            self._buf += data
+            return len(data) > 0
+        nbytes = self.com.in_waiting
+        while(nbytes == 0):
+            left = None if(deadline is None) else deadline - time.monotonic()
+            if((left is not None) and (left <= 0)):
+                return False
+            if((left is None) or ((self.com.timeout is not None) and (left >= self.com.timeout))):
+                # The port timeout ends the read before the deadline, nothing arriving in it is not a timeout yet
+                data = self.com.read(1)
+                self.reads += 1
+                if(len(data) > 0):
+                    self._buf += data
+                    nbytes = self.com.in_waiting
+                    if(nbytes == 0):
+                        return True
+                elif(deadline is None):
+                    return False
+                continue
+            fd = self._fileno()
+            if(fd is not None):
+                select.select([fd], [], [], left)
+            else:
+                time.sleep(min(self.poll_s, left))
+            nbytes = self.com.in_waiting
+        data = self.com.read(min(nbytes, self.chunk_size))
+        self.reads += 1
+        self._buf += data
+        return len(data) > 0
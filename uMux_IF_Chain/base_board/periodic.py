@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+'''
+Module periodic
+=================================
+Unsolicited status reports the firmware sends while periodic checking is enabled with
+*FW_START_PER. They arrive on the same port as the command responses, in between them,
+so the receive paths of the base board classes take them out of the stream before it
+is matched against the commands in flight, and hand them to a Periodic_Monitor that
+parses them and publishes the samples to its subscribers.
+
+A report is one line in the ASCII protocol
+
+    PER:<count>:<NAME>=<value>,<NAME>=<value>,...
+
+and in the binary protocol a frame with status _BIN_STATUS.PERIODIC, the report count
+as sequence number and the same line, without termination, as payload. Values are
+decimal or 0x prefixed hex integers, decimal numbers or text.
+'''
+# System level imports
+import collections
+import threading
+import time
+
+# local imports
+from uMux_IF_Chain.base_board import binary_protocol
+from uMux_IF_Chain.base_board.binary_protocol import _BIN_STATUS
+
+PREFIX = 'PER:'
+
+class Periodic_Sample:
+    '''
+    One parsed report
+        count  : report counter of the firmware, gaps are lost reports
+        t      : time.time() the report was read
+        fields : {NAME: value}
+        line   : the report as received
+    '''
+    def __init__(self, count: int, fields: dict, line: str, t=None):
+        self.count = count
+        self.fields = fields
+        self.line = line
+        self.t = time.time() if(t is None) else t
+
+    def __getitem__(self, name: str):
+        return self.fields[name]
+
+    def get(self, name: str, default=None):
+        return self.fields.get(name, default)
+
+    def __repr__(self):
+        return "Periodic_Sample({}, {})".format(self.count, self.fields)
+
+def _value(text: str):
+    try:
+        return int(text, 0)
+    except ValueError:
+        pass
+    try:
+        return float(text)
+    except ValueError:
+        return text
+
+def is_report_line(line: str) -> bool:
+    return line.startswith(PREFIX)
+
+def is_report_frame(raw) -> bool:
+    '''
+    raw is a periodic report frame. A status byte other than 0x00 is the first byte
+    after the COBS code byte, so this needs no decoding.
+    '''
+    return (len(raw) > 1) and (raw[0] > 1) and (raw[1] == _BIN_STATUS.PERIODIC)
+
+def parse_line(line: str) -> Periodic_Sample:
+    '''Periodic_Sample of a report line without termination, None when it is malformed'''
+    fields = line.split(':', 2)
+    if((len(fields) != 3) or (fields[0] + ':' != PREFIX)):
+        return None
+    try:
+        count = int(fields[1])
+    except ValueError:
+        return None
+    values = {}
+    for item in fields[2].split(','):
+        name, sep, text = item.partition('=')
+        if((sep == '') or (name == '')):
+            return None
+        values[name] = _value(text)
+    return Periodic_Sample(count, values, line)
+
+def parse_frame(raw) -> Periodic_Sample:
+    '''Periodic_Sample of a report frame, None when it is malformed'''
+    try:
+        status, seq, payload = binary_protocol.decode_frame(raw)
+    except ValueError:
+        return None
+    if(status != _BIN_STATUS.PERIODIC):
+        return None
+    return parse_line(payload.decode(errors='replace'))
+
+class Periodic_Monitor:
+    '''
+    Publishes the reports taken out of the receive path to subscribers and keeps the
+    latest ones.
+        history : samples kept in samples
+    Subscribers are called on the thread that read the report, with the port held, so
+    they should be short and must not send commands to the base board.
+    '''
+    def __init__(self, history=1000):
+        self.samples = collections.deque(maxlen=history)
+        self.count = 0                  # reports published
+        self.lost = 0                   # gaps in the firmware report counter
+        self.errors = 0                 # reports that could not be parsed
+        self._subscribers = []
+        self._cond = threading.Condition()
+
+    @property
+    def latest(self) -> Periodic_Sample:
+        '''Most recent sample, None before the first report'''
+        with self._cond:
+            return self.samples[-1] if(len(self.samples) > 0) else None
+
+    def subscribe(self, fn):
+        '''fn(sample) is called for every report from now on, returns fn'''
+        self._subscribers.append(fn)
+        return fn
+
+    def unsubscribe(self, fn):
+        if(fn in self._subscribers):
+            self._subscribers.remove(fn)
+
+    def wait(self, timeout=None) -> Periodic_Sample:
+        '''
+        Block until the next report is published and return it, None on timeout. Some
+        thread has to be reading the port, see Base_Board_Rev3.start_periodic_listener().
+        '''
+        with self._cond:
+            count = self.count
+            if(not self._cond.wait_for(lambda: self.count != count, timeout)):
+                return None
+            return self.samples[-1]
+
+    def publish_line(self, line: str):
+        self._publish(parse_line(line), line)
+
+    def publish_frame(self, raw):
+        self._publish(parse_frame(raw), repr(bytes(raw)))
+
+    def _publish(self, sample: Periodic_Sample, raw: str):
+        if(sample is None):
+            self.errors += 1
+            print("\tWARNING: Malformed periodic report from the base board : " + raw)
+            return
+        with self._cond:
+            if((len(self.samples) > 0) and (sample.count > self.samples[-1].count + 1)):
+                self.lost += sample.count - self.samples[-1].count - 1
+            self.samples.append(sample)
+            self.count += 1
+            self._cond.notify_all()
+        for fn in list(self._subscribers):
+            try:
+                fn(sample)
+            except Exception as e:
+                print("\tERROR: Periodic report subscriber {} failed : {}".format(getattr(fn, '__name__', fn), e))
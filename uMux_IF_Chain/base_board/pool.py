@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+'''
+Module pool
+=================================
+Racks carry several base boards, each on its own port. Base_Board_Pool opens all of
+them and runs the same piece of work on every port at once in worker threads, so
+bringing up a rack takes as long as its slowest port rather than the sum of all of
+them. Results and errors are collected per port in Port_Result objects.
+'''
+# System level imports
+import concurrent.futures
+import time
+import traceback
+
+# local imports
+from uMux_IF_Chain.base_board.base_board_rev3 import Base_Board_Rev3
+from uMux_IF_Chain.uMux_IF import uMux_IF_Rev1
+
+class Port_Result:
+    '''
+    Outcome of one job on one port
+        value     : what the job returned, None when it raised
+        error     : the exception it raised as a string, None when it didn't
+        elapsed_s : wall time of the job
+    '''
+    def __init__(self, port):
+        self.port = port
+        self.value = None
+        self.error = None
+        self.traceback = ''
+        self.elapsed_s = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    def __repr__(self):
+        if(self.ok):
+            return "Port_Result({}, {!r}, {:.3f} s)".format(self.port, self.value, self.elapsed_s)
+        return "Port_Result({}, ERROR {}, {:.3f} s)".format(self.port, self.error, self.elapsed_s)
+
+def _run_job(port, fn, args, kwargs) -> Port_Result:
+    res = Port_Result(port)
+    start = time.perf_counter()
+    try:
+        res.value = fn(*args, **kwargs)
+    except Exception as e:
+        res.error = "{}: {}".format(type(e).__name__, e)
+        res.traceback = traceback.format_exc()
+    res.elapsed_s = time.perf_counter() - start
+    return res
+
+def _run_on_port(port, protocol, fn, args, kwargs) -> Port_Result:
+    '''Worker process side of run_in_processes(), the port is opened and closed here'''
+    def job():
+        bb = Base_Board_Rev3(port, protocol)
+        bb.auto_print = 0
+        try:
+            return fn(bb, *args, **kwargs)
+        finally:
+            bb.close()
+    return _run_job(port, job, (), {})
+
+def run_in_processes(ports, fn, *args, protocol='ascii', max_workers=None, **kwargs) -> dict:
+    '''
+    Run fn(bb, *args, **kwargs) for every port, each in a worker process that opens its
+    own Base_Board_Rev3, for CPU heavy work that threads would serialise. fn, its
+    arguments and its result have to be picklable, so fn must be a module level function.
+    The ports must not be open anywhere else. Returns {port: Port_Result}.
+    '''
+    ports = list(ports)
+    with concurrent.futures.ProcessPoolExecutor(max_workers or len(ports)) as executor:
+        futs = {port: executor.submit(_run_on_port, port, protocol, fn, args, kwargs) for port in ports}
+        return {port: fut.result() for port, fut in futs.items()}
+
+class Base_Board_Pool:
+    '''
+    One Base_Board_Rev3 per port with work run on all of them in parallel threads.
+        ports       : ports as taken by Base_Board_Rev3
+        protocol    : as for Base_Board_Rev3
+        max_workers : worker threads, one per port by default
+    Ports that fail to open are left out of boards, their errors are in open_errors.
+    '''
+    def __init__(self, ports, protocol='ascii', max_workers=None):
+        self.ports = list(ports)
+        self.boards = {}        # port -> Base_Board_Rev3, in the order of ports
+        self.open_errors = {}   # port -> Port_Result of the failed open
+        self.auto_print = 1
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers or max(1, len(self.ports)))
+        opened = self._run(self.ports, lambda port: Base_Board_Rev3(port, protocol))
+        for port, res in opened.items():
+            if(res.ok):
+                res.value.auto_print = 0
+                self.boards[port] = res.value
+            else:
+                print("\tERROR: Failed to open base board on " + str(port) + " : " + res.error)
+                self.open_errors[port] = res
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return len(self.boards)
+
+    def __getitem__(self, port) -> Base_Board_Rev3:
+        return self.boards[port]
+
+    def close(self):
+        '''Close every base board and stop the worker threads'''
+        self.map(Base_Board_Rev3.close)
+        self._executor.shutdown()
+
+    def _run(self, ports, fn, *args, **kwargs) -> dict:
+        futs = {port: self._executor.submit(_run_job, port, fn, (port,) + args, kwargs) for port in ports}
+        return {port: fut.result() for port, fut in futs.items()}
+
+    def map(self, fn, *args, **kwargs) -> dict:
+        '''
+        Run fn(bb, *args, **kwargs) on every open base board in parallel and wait for all
+        of them. Returns {port: Port_Result}, an exception on one port doesn't stop the others.
+        '''
+        return self._run(list(self.boards), lambda port, *a, **kw: fn(self.boards[port], *a, **kw),
+                         *args, **kwargs)
+
+    def errors(self, results: dict) -> dict:
+        '''The failed entries of a map() result'''
+        return {port: res for port, res in results.items() if(not res.ok)}
+
+    def report(self, results: dict, name: str):
+        '''Print one line per port for a map() result'''
+        for port, res in results.items():
+            if(res.ok):
+                print("\t{} : {} : {!r} ({:.3f} s)".format(name, port, res.value, res.elapsed_s))
+            else:
+                print("\tERROR: {} : {} : {}".format(name, port, res.error))
+
+    def get_device_info(self) -> dict:
+        '''Read the firmware information of every base board, the values are fw_identity'''
+        def job(bb):
+            bb.get_device_info()
+            return bb.fw_identity
+        return self.map(job)
+
+    def spi_get_dev_stack(self) -> dict:
+        return self.map(Base_Board_Rev3.spi_get_dev_stack)
+
+    def if_boards(self, dev_stacks=None) -> dict:
+        '''
+        UMux_IF_Rev1 objects for the IF boards of every base board, {port: [UMux_IF_Rev1, ...]}
+            dev_stacks : {port: dev_stack}, read from the base boards when None
+        '''
+        if(dev_stacks is None):
+            dev_stacks = {port: res.value for port, res in self.spi_get_dev_stack().items() if(res.ok)}
+        ifb = {}
+        for port, dev_stack in dev_stacks.items():
+            if(dev_stack is None):
+                continue
+            ifb[port] = uMux_IF_Rev1.if_boards(self.boards[port], dev_stack)
+        return ifb
+
+    def synth_init(self, ifb=None) -> dict:
+        '''
+        synth_init() on every IF board, the base boards in parallel and the IF boards of one
+        base board in turn. The values are the number of IF boards initialised.
+            ifb : from if_boards(), found from the device stacks when None
+        '''
+        if(ifb is None):
+            ifb = self.if_boards()
+        def job(bb):
+            boards = ifb.get(bb.port, [])
+            for x in boards:
+                x.synth_init()
+            return len(boards)
+        return self.map(job)
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+'''
+Module scheduler
+=================================
+Priority scheduling of the threads sharing one base board. Command_Scheduler takes
+the place of the base board io lock, so whoever waits for the port is served in
+priority order instead of whichever thread happens to grab the lock first, and a
+long bulk loop gives way to an operator command between two of its commands.
+Each priority class can also be rate limited and the time commands wait for the
+port is kept per class.
+'''
+# System level imports
+import collections
+import contextlib
+import heapq
+import itertools
+import threading
+import time
+
+class PRIORITY:
+    CONTROL     = 0     # interactive control, an operator setting a frequency
+    TELEMETRY   = 1     # periodic monitoring, temperatures and lock status
+    BULK        = 2     # test and bulk traffic, loopback bursts and register dumps
+
+    NAMES = {CONTROL: "control", TELEMETRY: "telemetry", BULK: "bulk"}
+
+class _Token_Bucket:
+    '''rate_hz commands per second on average, up to burst back to back'''
+    def __init__(self, rate_hz: float, burst: int):
+        self.rate_hz = rate_hz
+        self.burst = burst
+        self._tokens = float(burst)
+        self._stamp = time.monotonic()
+
+    def take(self) -> float:
+        '''Take a token, returns 0 or the seconds to wait before asking again'''
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._stamp) * self.rate_hz)
+        self._stamp = now
+        if(self._tokens >= 1):
+            self._tokens -= 1
+            return 0.0
+        return (1 - self._tokens) / self.rate_hz
+
+class Command_Scheduler:
+    '''
+    Reentrant lock that hands the base board to the waiting thread of the highest
+    priority class, first come first served within a class. A thread's class is set
+    with priority(), threads that never set one are default_class.
+        n_samples : recent waits kept per class for the percentiles in stats()
+    '''
+    def __init__(self, default_class=PRIORITY.CONTROL, n_samples=4096):
+        self.default_class = default_class
+        self._mutex = threading.Lock()
+        self._owner = None              # thread ident holding the port
+        self._depth = 0                 # reentrant acquisitions by the owner
+        self._waiters = []              # heap of (class, arrival, ident, gate)
+        self._arrival = itertools.count()
+        self._local = threading.local()
+        self._buckets = {}              # class -> _Token_Bucket, rate limited classes only
+        self._n_samples = n_samples
+        self.reset_stats()
+
+    def acquire(self) -> bool:
+        me = threading.get_ident()
+        with self._mutex:
+            if(self._owner == me):
+                self._depth += 1
+                return True
+            if(self._owner is None):
+                self._owner = me
+                self._depth = 1
+                return True
+            gate = threading.Lock()
+            gate.acquire()
+            heapq.heappush(self._waiters, (self.current_class(), next(self._arrival), me, gate))
+        # release() makes us the owner before it opens the gate
+        gate.acquire()
+        return True
+
+    def release(self):
+        with self._mutex:
+            if(self._owner != threading.get_ident()):
+                raise RuntimeError('cannot release un-acquired lock')
+            self._depth -= 1
+            if(self._depth > 0):
+                return
+            if(len(self._waiters) == 0):
+                self._owner = None
+                return
+            # straight to the next in line, the releasing thread can't barge back in
+            _, _, ident, gate = heapq.heappop(self._waiters)
+            self._owner = ident
+            self._depth = 1
+            gate.release()
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, *exc):
+        self.release()
+
+    def owned(self) -> bool:
+        '''The calling thread holds the port'''
+        return self._owner == threading.get_ident()
+
+    def current_class(self) -> int:
+        return getattr(self._local, 'priority', self.default_class)
+
+    @contextlib.contextmanager
+    def priority(self, priority_class: int):
+        '''
+        Run the commands of this thread in priority_class for the duration, use as
+            with sched.priority(PRIORITY.BULK):
+        '''
+        if(priority_class not in PRIORITY.NAMES):
+            raise ValueError('Unknown priority class ' + str(priority_class))
+        prev = self.current_class()
+        self._local.priority = priority_class
+        try:
+            yield
+        finally:
+            self._local.priority = prev
+
+    def set_rate_limit(self, priority_class: int, rate_hz, burst=1):
+        '''
+        Allow priority_class no more than rate_hz commands per second, with bursts of up
+        to burst commands. rate_hz None removes the limit. A limited class waits without
+        holding the port, the other classes carry on.
+        '''
+        if(priority_class not in PRIORITY.NAMES):
+            raise ValueError('Unknown priority class ' + str(priority_class))
+        with self._mutex:
+            if(rate_hz is None):
+                self._buckets.pop(priority_class, None)
+            elif((rate_hz <= 0) or (burst < 1)):
+                raise ValueError('rate_hz must be positive and burst at least 1')
+            else:
+                self._buckets[priority_class] = _Token_Bucket(rate_hz, burst)
+
+    @contextlib.contextmanager
+    def admit(self):
+        '''
+        Hold the port for one command. The wait for a rate limit token and for the port
+        is recorded against the class of the calling thread. Commands issued while the
+        thread already holds the port are part of the same turn and are not counted.
+        '''
+        if(self.owned()):
+            with self:
+                yield
+            return
+        cls = self.current_class()
+        start = time.perf_counter()
+        while(True):
+            with self._mutex:
+                bucket = self._buckets.get(cls)
+                delay = 0.0 if(bucket is None) else bucket.take()
+            if(delay == 0):
+                break
+            time.sleep(delay)
+        with self:
+            self._record(cls, time.perf_counter() - start)
+            yield
+
+    def _record(self, cls: int, wait_s: float):
+        stats = self._stats[cls]
+        stats['count'] += 1
+        stats['total_s'] += wait_s
+        stats['max_s'] = max(stats['max_s'], wait_s)
+        stats['samples'].append(wait_s)
+
+    def reset_stats(self):
+        self._stats = {cls: {'count': 0, 'total_s': 0.0, 'max_s': 0.0,
+                             'samples': collections.deque(maxlen=self._n_samples)}
+                       for cls in PRIORITY.NAMES}
+
+    def stats(self) -> dict:
+        '''
+        Queue wait per class name: commands, mean_s, p50_s, p99_s and max_s. The
+        percentiles cover the last n_samples commands of the class.
+        '''
+        ret = {}
+        for cls, name in PRIORITY.NAMES.items():
+            stats = self._stats[cls]
+            samples = sorted(stats['samples'])
+            n = len(samples)
+            ret[name] = {'commands': stats['count'],
+                         'mean_s': stats['total_s'] / stats['count'] if(stats['count'] > 0) else 0.0,
+                         'p50_s': samples[(n - 1) // 2] if(n > 0) else 0.0,
+                         'p99_s': samples[(99 * (n - 1)) // 100] if(n > 0) else 0.0,
+                         'max_s': stats['max_s']}
+        return ret
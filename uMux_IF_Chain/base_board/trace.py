@@ -0,0 +1,311 @@
+# -*- coding: utf-8 -*-
+'''
+Module trace
+=================================
+Byte level capture and replay of the conversation with a base board. Recording_Transport
+wraps the transport of a real session and streams every chunk written and read to a
+trace file. Replay_Transport is a backend that plays a trace back to the host stack,
+answering each command the host sends with what the firmware sent at the time, at the
+recorded pace or as fast as possible. Trace files are read through mmap, so captures
+larger than memory can be replayed and inspected.
+
+File layout, little endian:
+
+    header  : b'UMXTRACE', version u16, reserved u16, start time f8 (time.time())
+    records : t f8 (seconds since the start), direction u8, length u32, data
+'''
+# System level imports
+import collections
+import mmap
+import select
+import struct
+import time
+
+# local imports
+from uMux_IF_Chain.base_board import transport
+
+MAGIC = b'UMXTRACE'
+VERSION = 1
+_HEADER = struct.Struct('<8sHHd')
+_RECORD = struct.Struct('<dBI')
+
+class TRACE_DIR:
+    TX      = 0     # host to base board
+    RX      = 1     # base board to host
+    RESET   = 2     # host dropped its receive buffer, no data
+
+    NAMES = {TX: "TX", RX: "RX", RESET: "RESET"}
+
+class Recording_Transport(transport.Transport):
+    '''
+    Pass everything through to another transport and record it to a trace file.
+        port       : port string as taken by Base_Board_Rev3, or a transport object
+        trace_file : path of the trace, overwritten
+        flush_s    : longest time a record is held in the file buffer
+    Use as Base_Board_Rev3(Recording_Transport('/dev/ttyACM0', 'session.trace')).
+    '''
+    def __init__(self, port, trace_file: str, timeout=6, write_timeout=6, flush_s=1.0):
+        self._inner = transport.open_transport(port, timeout, write_timeout)
+        self.trace_file = trace_file
+        self.flush_s = flush_s
+        self.records = 0                # records written
+        self._start = time.perf_counter()
+        self._last_flush = self._start
+        self._file = open(trace_file, 'wb', buffering=1 << 16)
+        self._file.write(_HEADER.pack(MAGIC, VERSION, 0, time.time()))
+        self._inner_read_some = getattr(self._inner, 'read_some', None)
+
+    @property
+    def timeout(self):
+        return self._inner.timeout
+
+    @timeout.setter
+    def timeout(self, value):
+        self._inner.timeout = value
+
+    @property
+    def write_timeout(self):
+        return self._inner.write_timeout
+
+    @write_timeout.setter
+    def write_timeout(self, value):
+        self._inner.write_timeout = value
+
+    @property
+    def is_open(self) -> bool:
+        return self._inner.is_open
+
+    @property
+    def in_waiting(self) -> int:
+        return self._inner.in_waiting
+
+    def open(self):
+        self._inner.open()
+
+    def close(self):
+        self._inner.close()
+        if(not self._file.closed):
+            self._file.close()
+
+    def fileno(self) -> int:
+        return self._inner.fileno()
+
+    def flush(self):
+        self._inner.flush()
+        self._file.flush()
+
+    def write(self, data) -> int:
+        nbytes = self._inner.write(data)
+        self._record(TRACE_DIR.TX, bytes(data[:nbytes]))
+        return nbytes
+
+    def read(self, size=1) -> bytes:
+        return self._record(TRACE_DIR.RX, self._inner.read(size))
+
+    def read_some(self, size: int, timeout=transport._PORT_TIMEOUT) -> bytes:
+        if(self._inner_read_some is not None):
+            return self._record(TRACE_DIR.RX, self._inner_read_some(size, timeout))
+        nbytes = self._inner.in_waiting
+        if(nbytes > 0):
+            return self.read(min(size, nbytes))
+        if(timeout is transport._PORT_TIMEOUT):
+            return self.read(1)
+        # pyserial, changing its timeout reconfigures the port so wait on its descriptor instead
+        try:
+            fd = self._inner.fileno()
+        except (AttributeError, OSError, ValueError):
+            return self._read_within(1, timeout)
+        readable, _, _ = select.select([fd], [], [], timeout)
+        if(len(readable) == 0):
+            return b''
+        return self.read(min(size, max(self._inner.in_waiting, 1)))
+
+    def reset_input_buffer(self):
+        self._inner.reset_input_buffer()
+        self._record(TRACE_DIR.RESET, b'')
+
+    def _record(self, direction: int, data: bytes) -> bytes:
+        if((len(data) == 0) & (direction != TRACE_DIR.RESET)):
+            return data
+        now = time.perf_counter()
+        self._file.write(_RECORD.pack(now - self._start, direction, len(data)))
+        self._file.write(data)
+        self.records += 1
+        # Keep the file current enough to survive a crash in the middle of an incident
+        if(now - self._last_flush > self.flush_s):
+            self._file.flush()
+            self._last_flush = now
+        return data
+
+class Trace_Reader:
+    '''
+    Read only view of a trace file through mmap, only the pages being looked at are
+    loaded. A record cut short by a crash while recording ends the trace.
+    '''
+    def __init__(self, trace_file: str):
+        self.trace_file = trace_file
+        with open(trace_file, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if(len(self._map) < _HEADER.size):
+            raise ValueError(trace_file + ' is too short to be a trace')
+        magic, version, reserved, self.start_time = _HEADER.unpack_from(self._map)
+        if(magic != MAGIC):
+            raise ValueError(trace_file + ' is not a trace file')
+        if(version != VERSION):
+            raise ValueError(trace_file + ' is trace version ' + str(version) + ', expected ' + str(VERSION))
+
+    def __iter__(self):
+        return self.records()
+
+    def close(self):
+        self._map.close()
+
+    def records(self):
+        '''Yield (t, direction, data) in order, data is a memoryview into the file'''
+        view = memoryview(self._map)
+        size = len(self._map)
+        offset = _HEADER.size
+        while(offset + _RECORD.size <= size):
+            t, direction, length = _RECORD.unpack_from(self._map, offset)
+            offset += _RECORD.size
+            if(offset + length > size):
+                break
+            yield (t, direction, view[offset:offset + length])
+            offset += length
+
+    def summary(self) -> dict:
+        '''Record and byte counts per direction and the length of the capture'''
+        stats = {'records': 0, 'tx_bytes': 0, 'rx_bytes': 0, 'resets': 0, 'duration_s': 0.0}
+        for t, direction, data in self.records():
+            stats['records'] += 1
+            if(direction == TRACE_DIR.TX):
+                stats['tx_bytes'] += len(data)
+            elif(direction == TRACE_DIR.RX):
+                stats['rx_bytes'] += len(data)
+            else:
+                stats['resets'] += 1
+            stats['duration_s'] = t
+        return stats
+
+    def dump(self, n=None):
+        '''Print the first n records, all of them when None'''
+        for i, (t, direction, data) in enumerate(self.records()):
+            if((n is not None) and (i >= n)):
+                break
+            print("{:12.6f} {:<5} {:5d} {!r}".format(t, TRACE_DIR.NAMES.get(direction, '?'), len(data), bytes(data[:64])))
+
+class Replay_Transport(transport.Transport):
+    '''
+    Base board stand in that plays back a trace. Each time the host has written the bytes
+    of a recorded TX record, the RX records that followed it become readable.
+        trace_file : trace from Recording_Transport
+        speed      : 1.0 releases responses with their recorded delay after the command,
+                     2.0 twice as fast, 0 at once
+        verify     : count and report host writes that differ from the recording
+    Nothing arrives without a write at speed 0, so reads never wait on the timeout then.
+    '''
+    def __init__(self, trace_file: str, speed=0.0, verify=True, timeout=None, write_timeout=None):
+        super().__init__(timeout, write_timeout)
+        self.speed = speed
+        self.verify = verify
+        self.mismatches = 0             # TX records the host wrote differently
+        self.overrun_bytes = 0          # bytes written after the trace ran out
+        self._reader = Trace_Reader(trace_file)
+        self._records = self._reader.records()
+        self._tx = None                 # rest of the TX record being matched
+        self._tx_t = 0.0                # its time in the trace
+        self._tx_mismatch = False
+        self._rx = bytearray()          # released and not read yet
+        self._scheduled = collections.deque()   # (due, data) not released yet, in order
+        self._anchor = (time.perf_counter(), 0.0)  # host time and trace time of the last command
+        self._open = True
+        self._advance()
+
+    @property
+    def is_open(self) -> bool:
+        return self._open
+
+    @property
+    def in_waiting(self) -> int:
+        self._release()
+        return len(self._rx)
+
+    @property
+    def finished(self) -> bool:
+        '''The whole trace has been played'''
+        return (self._records is None) & (len(self._scheduled) == 0)
+
+    def open(self):
+        self._open = True
+
+    def close(self):
+        self._open = False
+
+    def write(self, data) -> int:
+        nwritten = len(data)
+        data = memoryview(bytes(data))
+        while(len(data) > 0):
+            if(self._tx is None):
+                self.overrun_bytes += len(data)
+                break
+            nbytes = min(len(data), len(self._tx))
+            if(self.verify & (data[:nbytes] != self._tx[:nbytes]) & (not self._tx_mismatch)):
+                self._tx_mismatch = True
+                self.mismatches += 1
+                if(self.mismatches == 1):
+                    print("\tWARNING: Replay differs from the recording, host wrote {!r} where the trace has {!r}".format(
+                        bytes(data[:nbytes]), bytes(self._tx[:nbytes])))
+            data = data[nbytes:]
+            self._tx = self._tx[nbytes:]
+            if(len(self._tx) == 0):
+                # responses are timed from the moment the host finished the command
+                self._anchor = (time.perf_counter(), self._tx_t)
+                self._tx = None
+                self._advance()
+        return nwritten
+
+    def read(self, size=1) -> bytes:
+        self._release()
+        if((len(self._rx) == 0) & (self.timeout != 0)):
+            if(len(self._scheduled) > 0):
+                wait = self._scheduled[0][0] - time.perf_counter()
+                if((self.timeout is None) or (wait <= self.timeout)):
+                    time.sleep(max(wait, 0))
+                    self._release()
+            elif(self.speed > 0):
+                # at the recorded pace a lost response costs the host its timeout, as it did
+                time.sleep(self.timeout or 0)
+        return self._read_available(size)
+
+    def reset_input_buffer(self):
+        self._release()
+        self._rx.clear()
+
+    def _read_available(self, size: int) -> bytes:
+        self._release()
+        data = bytes(self._rx[:size])
+        del self._rx[:size]
+        return data
+
+    def _release(self):
+        now = time.perf_counter()
+        while((len(self._scheduled) > 0) and (self._scheduled[0][0] <= now)):
+            self._rx += self._scheduled.popleft()[1]
+
+    def _advance(self):
+        '''Schedule the RX records up to the next TX record, which the host has to write next'''
+        if(self._records is None):
+            return
+        host_t, trace_t = self._anchor
+        for t, direction, data in self._records:
+            if(direction == TRACE_DIR.TX):
+                self._tx = data
+                self._tx_t = t
+                self._tx_mismatch = False
+                return
+            if(direction == TRACE_DIR.RX):
+                due = host_t
+                if(self.speed > 0):
+                    due += max(t - trace_t, 0) / self.speed
+                self._scheduled.append((due, bytes(data)))
+        self._records = None
@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+'''
+Module transaction_log
+=================================
+Fixed size record of the traffic with a base board, cheap enough to leave enabled for
+days. Every command and every response is one fixed length binary record in a NumPy
+ring buffer, so memory use is set when the log is created and the oldest records are
+overwritten once it is full. A record holds
+
+    t        time.time() of the record
+    dir      LOG_DIR, command sent, response received or an error event
+    cmd      _BIN_OP code of the command, ASCII commands are mapped to the same codes
+    status   LOG_STATUS of a response
+    seq      binary protocol sequence number, 0 for ASCII
+    cs       chip select of SPI commands, address of I2C commands
+    length   payload bytes before truncation
+    payload  data written, data read or the text of other commands, cut at payload_bytes
+'''
+# System level imports
+import struct
+import time
+
+import numpy as np
+
+# local imports
+from uMux_IF_Chain.base_board.binary_protocol import _BIN_OP, _BIN_STATUS
+
+class LOG_DIR:
+    TX      = 0     # command sent
+    RX      = 1     # response read back
+    EVENT   = 2     # lost response or port, the payload holds the reason
+
+    NAMES = {TX: "TX", RX: "RX", EVENT: "EV"}
+
+class LOG_STATUS:
+    OKAY        = _BIN_STATUS.OKAY
+    NACK        = _BIN_STATUS.NACK
+    INVALID     = _BIN_STATUS.INVALID
+    CRC_ERROR   = _BIN_STATUS.CRC_ERROR
+    TEXT        = 0xFE  # the response is a text reply (*IDN? ...), kept in the payload
+    LOST        = 0xFF  # no usable response
+
+    NAMES = {OKAY: "OKAY", NACK: "NACK", INVALID: "INVALID", CRC_ERROR: "CRC_ERROR", TEXT: "TEXT", LOST: "LOST"}
+    # Status line -> code, KAY is how the firmware sometimes sends OKAY
+    CODES = {"OKAY": OKAY, "KAY": OKAY, "NACK": NACK, "INVALID": INVALID, "CRC_ERROR": CRC_ERROR}
+
+# Bytes of the chip select or address at the start of a binary payload
+_ADDR_BYTES = {_BIN_OP.SPI_WRITE: 4, _BIN_OP.SPI_READ: 4, _BIN_OP.SPI_WRITE_READ: 4, _BIN_OP.SPI_HARD_RST: 4,
+               _BIN_OP.I2C_WRITE: 1, _BIN_OP.I2C_READ: 1, _BIN_OP.I2C_WRITE_READ: 1}
+# Where the written data starts in a binary payload, for the commands that carry some, batches log all items
+_DATA_OFFSET = {_BIN_OP.SPI_WRITE: 4, _BIN_OP.SPI_WRITE_READ: 4, _BIN_OP.I2C_WRITE: 1, _BIN_OP.I2C_WRITE_READ: 3,
+                _BIN_OP.SPI_BATCH: 0, _BIN_OP.I2C_BATCH: 0}
+# ASCII BUS:CMD names of the commands with a binary opcode
+_ASCII_OPS = {'SPI:WRITE': _BIN_OP.SPI_WRITE, 'SPI:READ': _BIN_OP.SPI_READ, 'SPI:WRITE_READ': _BIN_OP.SPI_WRITE_READ,
+              'SPI:DEV_STACK': _BIN_OP.SPI_DEV_STACK, 'SPI:HARD_RST': _BIN_OP.SPI_HARD_RST,
+              'I2C:WRITE': _BIN_OP.I2C_WRITE, 'I2C:READ': _BIN_OP.I2C_READ,
+              'I2C:WRITE_READ': _BIN_OP.I2C_WRITE_READ, 'I2C:SCAN_ADDR': _BIN_OP.I2C_SCAN_ADDR,
+              'SPI:BATCH': _BIN_OP.SPI_BATCH, 'I2C:BATCH': _BIN_OP.I2C_BATCH}
+_OP_NAMES = {v: k for k, v in vars(_BIN_OP).items() if(not k.startswith('_'))}
+
+def record_dtype(payload_bytes=32) -> np.dtype:
+    '''NumPy dtype of one record, packed, the same layout the log writes with struct'''
+    return np.dtype([('t', '<f8'), ('dir', 'u1'), ('cmd', 'u1'), ('status', 'u1'), ('seq', 'u1'),
+                     ('cs', '<u4'), ('length', '<u2'), ('payload', 'u1', (payload_bytes,))])
+
+def command_fields(opcode, payload, cmd_str: str) -> tuple:
+    '''
+    (cmd, cs, data) of a command for its TX record. opcode is None for an ASCII line,
+    commands without a binary opcode are logged as ASCII_CMD with their text.
+    '''
+    if((opcode is not None) and (opcode != _BIN_OP.ASCII_CMD)):
+        nbytes = _ADDR_BYTES.get(opcode, 0)
+        cs = int.from_bytes(payload[:nbytes], 'little')
+        offset = _DATA_OFFSET.get(opcode)
+        return (opcode, cs, b'' if(offset is None) else payload[offset:])
+    fields = cmd_str.split(':', 2)
+    cmd = _ASCII_OPS.get(':'.join(fields[:2]))
+    if(cmd is None):
+        return (_BIN_OP.ASCII_CMD, 0, cmd_str.encode())
+    args = fields[2].split(',') if(len(fields) > 2) else []
+    try:
+        cs = int(args[0], 16) if((cmd in _ADDR_BYTES) and (len(args) > 0)) else 0
+        data = bytes.fromhex(args[-1]) if((cmd in _DATA_OFFSET) and (len(args) > 0)) else b''
+    except ValueError:
+        return (_BIN_OP.ASCII_CMD, 0, cmd_str.encode())
+    return (cmd, cs, data)
+
+def format_records(records) -> list:
+    '''One line of text per record, for records() or a log read back with load()'''
+    lines = []
+    for rec in records:
+        payload = bytes(rec['payload'][:min(rec['length'], len(rec['payload']))])
+        more = '...' if(rec['length'] > len(payload)) else ''
+        if((rec['dir'] == LOG_DIR.EVENT) or (rec['cmd'] == _BIN_OP.ASCII_CMD) or (rec['status'] == LOG_STATUS.TEXT)):
+            text = repr(payload.decode(errors='replace')) + more
+        else:
+            text = payload.hex().upper() + more
+        stamp = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(rec['t'])) + '.{:06d}'.format(int(rec['t'] % 1 * 1e6))
+        status = LOG_STATUS.NAMES.get(int(rec['status']), '0x{:02X}'.format(rec['status'])) if(rec['dir'] == LOG_DIR.RX) else ''
+        lines.append("{} {} {:<14} seq={:<3d} cs=0x{:02X} {:<9} len={:<4d} {}".format(
+            stamp, LOG_DIR.NAMES.get(int(rec['dir']), '?'), _OP_NAMES.get(int(rec['cmd']), '0x{:02X}'.format(rec['cmd'])),
+            rec['seq'], rec['cs'], status, rec['length'], text))
+    return lines
+
+def load(path: str) -> np.ndarray:
+    '''Records saved with Transaction_Log.save() to a .npy file'''
+    return np.load(path)
+
+class Transaction_Log:
+    '''
+    Ring buffer of traffic records, see the module description.
+        capacity      : records kept, the oldest are overwritten
+        payload_bytes : payload bytes kept per record
+        dump_on_error : records printed (or written to dump_file) when a response or
+                        the port is lost, 0 for none
+    '''
+    def __init__(self, capacity=65536, payload_bytes=32, dump_on_error=0, dump_file=None):
+        self.capacity = capacity
+        self.payload_bytes = payload_bytes
+        self.dump_on_error = dump_on_error
+        self.dump_file = dump_file      # file dump_on_error appends to, None prints
+        self.count = 0                  # records written since the log was created or cleared
+        self._buf = np.zeros(capacity, record_dtype(payload_bytes))
+        self._raw = memoryview(self._buf).cast('B')
+        self._struct = struct.Struct('<dBBBBIH{}s'.format(payload_bytes))
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def record(self, direction: int, cmd: int, cs: int, payload=b'', status=0, seq=0):
+        '''Add one record, overwriting the oldest once the log is full'''
+        self._struct.pack_into(self._raw, (self.count % self.capacity) * self._struct.size, time.time(),
+                               direction, cmd, status, seq, cs & 0xFFFFFFFF, min(len(payload), 0xFFFF),
+                               bytes(payload[:self.payload_bytes]))
+        self.count += 1
+
+    def error(self, reason: str, cmd=_BIN_OP.ASCII_CMD, cs=0, seq=0):
+        '''Record an error event and dump the records leading up to it if dump_on_error is set'''
+        self.record(LOG_DIR.EVENT, cmd, cs, reason.encode(), 0, seq)
+        if(self.dump_on_error > 0):
+            self.dump(self.dump_on_error, self.dump_file)
+
+    def clear(self):
+        self.count = 0
+
+    def records(self, n=None) -> np.ndarray:
+        '''Copy of the last n records, all of them when None, oldest first'''
+        n = len(self) if(n is None) else min(n, len(self))
+        end = self.count % self.capacity
+        if(n <= end):
+            return self._buf[end - n:end].copy()
+        return np.concatenate((self._buf[self.capacity - (n - end):], self._buf[:end]))
+
+    def filter(self, cs=None, cmd=None, direction=None, n=None) -> np.ndarray:
+        '''
+        Records matching every given field, oldest first
+            cs        : chip select mask, a record matches when it shares a bit with it
+            cmd       : _BIN_OP code
+            direction : LOG_DIR code
+            n         : search only the last n records
+        '''
+        rec = self.records(n)
+        keep = np.ones(len(rec), dtype=bool)
+        if(cs is not None):
+            keep &= (rec['cs'] & cs) != 0
+        if(cmd is not None):
+            keep &= rec['cmd'] == cmd
+        if(direction is not None):
+            keep &= rec['dir'] == direction
+        return rec[keep]
+
+    def dump(self, n=None, file=None, records=None):
+        '''
+        Print the last n records, or append them to file
+            records : records to print instead, from filter() for example
+        '''
+        if(records is None):
+            records = self.records(n)
+        lines = format_records(records)
+        if(file is None):
+            print('\n'.join(lines))
+            return
+        with open(file, 'a') as f:
+            f.write('\n'.join(lines) + '\n')
+
+    def save(self, path: str, records=None):
+        '''Export the log, binary records to a .npy file and text to anything else'''
+        if(records is None):
+            records = self.records()
+        if(path.endswith('.npy')):
+            np.save(path, records)
+            return
+        with open(path, 'w') as f:
+            f.write('\n'.join(format_records(records)) + '\n')
@@ -0,0 +1,385 @@
+# -*- coding: utf-8 -*-
+'''
+Module transport
+=================================
+Byte transports the base board can be driven over. Base_Board_Rev3 only needs a
+small part of the pyserial Serial interface, described by Transport below, so
+serial.Serial is used as-is for ordinary ports and the other backends implement
+the same calls. open_transport() picks one from the port string:
+
+    /dev/ttyACM0, COM3        pyserial
+    raw:/dev/ttyACM0          raw termios file descriptor, Linux and macOS
+    socket://host:port        TCP, for serial to network bridges
+    loop://                   in process firmware simulator, no port needed
+    replay:session.trace      plays back a trace recorded with trace.Recording_Transport
+'''
+# System level imports
+import os
+import select
+import socket
+import struct
+import time
+
+import serial
+try:
+    import fcntl
+    import termios
+except ImportError:
+    # Windows, where only the pyserial, TCP and loopback transports are available
+    fcntl = None
+    termios = None
+
+# read_some() waits the port timeout when no other is given
+_PORT_TIMEOUT = object()
+
+class Transport:
+    '''
+    The part of the pyserial Serial interface Base_Board_Rev3 uses.
+        timeout       : seconds read() waits for the requested bytes, None waits forever
+        write_timeout : seconds write() waits for the port to take the data, None waits forever
+    '''
+    def __init__(self, timeout=None, write_timeout=None):
+        self.timeout = timeout
+        self.write_timeout = write_timeout
+
+    @property
+    def is_open(self) -> bool:
+        raise NotImplementedError
+
+    @property
+    def in_waiting(self) -> int:
+        '''Bytes that can be read without blocking'''
+        raise NotImplementedError
+
+    def open(self):
+        raise NotImplementedError
+
+    def close(self):
+        raise NotImplementedError
+
+    def fileno(self) -> int:
+        '''File descriptor that turns readable when data arrives, for event loops'''
+        raise OSError(type(self).__name__ + ' has no file descriptor')
+
+    def write(self, data) -> int:
+        raise NotImplementedError
+
+    def read(self, size=1) -> bytes:
+        '''Return size bytes, or fewer if the timeout expires first'''
+        raise NotImplementedError
+
+    def read_some(self, size: int, timeout=_PORT_TIMEOUT) -> bytes:
+        '''
+        Return whatever has arrived, up to size bytes, waiting up to timeout for the
+        first byte. Not part of pyserial, Line_Reader uses it when it is there.
+            timeout : seconds, None waits forever, the port timeout when not given
+        '''
+        if(self.in_waiting == 0):
+            if(timeout is _PORT_TIMEOUT):
+                return self.read(1)
+            return self._read_within(1, timeout)
+        return self._read_available(size)
+
+    def reset_input_buffer(self):
+        '''Drop everything received but not read yet'''
+        while(self.in_waiting > 0):
+            self._read_available(self.in_waiting)
+
+    def read_until(self, expected=b'\n', size=None) -> bytes:
+        '''Same as pyserial, used when Base_Board_Rev3 runs without its Line_Reader'''
+        line = bytearray()
+        deadline = None if(self.timeout is None) else time.monotonic() + self.timeout
+        while((size is None) or (len(line) < size)):
+            if(deadline is None):
+                data = self.read(1)
+            else:
+                data = self._read_within(1, deadline - time.monotonic())
+            if(len(data) == 0):
+                break
+            line += data
+            if(line.endswith(expected)):
+                break
+        return bytes(line)
+
+    def flush(self):
+        '''Writes go straight to the operating system, nothing is held back'''
+        pass
+
+    def _read_within(self, size: int, timeout) -> bytes:
+        prev_timeout = self.timeout
+        self.timeout = None if(timeout is None) else max(timeout, 0)
+        try:
+            return self.read(size)
+        finally:
+            self.timeout = prev_timeout
+
+    def _read_available(self, size: int) -> bytes:
+        raise NotImplementedError
+
+class Raw_Fd_Transport(Transport):
+    '''
+    A tty driven straight through its file descriptor. The port is put in raw mode with
+    VMIN = 1 and VTIME = 0, so a read returns as soon as anything has arrived, and the
+    driver is asked for ASYNC_LOW_LATENCY to skip the receive buffer flush delay.
+    Timeouts are handled with poll(), each read is one poll and one read system call.
+        path : device path, /dev/ttyACM0 for example
+    '''
+    ASYNC_LOW_LATENCY = 0x1 << 13
+    _SERIAL_FLAGS_OFFSET = 16   # int type, int line, unsigned int port, int irq, int flags
+
+    def __init__(self, path: str, timeout=None, write_timeout=None):
+        super().__init__(timeout, write_timeout)
+        self.path = path
+        self.fd = None
+        self.low_latency = False    # The driver accepted ASYNC_LOW_LATENCY
+        self._poll = None
+        self.open()
+
+    @property
+    def is_open(self) -> bool:
+        return self.fd is not None
+
+    def fileno(self) -> int:
+        return self.fd
+
+    @property
+    def in_waiting(self) -> int:
+        return struct.unpack('I', fcntl.ioctl(self.fd, termios.FIONREAD, b'\x00' * 4))[0]
+
+    def open(self):
+        # O_NONBLOCK so the open does not wait on carrier detect
+        fd = os.open(self.path, os.O_RDWR | os.O_NOCTTY | os.O_NONBLOCK)
+        try:
+            iflag, oflag, cflag, lflag, ispeed, ospeed, cc = termios.tcgetattr(fd)
+            # cfmakeraw()
+            iflag &= ~(termios.IGNBRK | termios.BRKINT | termios.PARMRK | termios.ISTRIP |
+                       termios.INLCR | termios.IGNCR | termios.ICRNL | termios.IXON | termios.IXOFF)
+            oflag &= ~termios.OPOST
+            lflag &= ~(termios.ECHO | termios.ECHONL | termios.ICANON | termios.ISIG | termios.IEXTEN)
+            cflag &= ~(termios.CSIZE | termios.PARENB)
+            cflag |= termios.CS8 | termios.CREAD | termios.CLOCAL
+            cc[termios.VMIN] = 1
+            cc[termios.VTIME] = 0
+            termios.tcsetattr(fd, termios.TCSANOW, [iflag, oflag, cflag, lflag, ispeed, ospeed, cc])
+            # Blocking from here on, poll() applies the timeouts
+            fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) & ~os.O_NONBLOCK)
+            self.low_latency = self._set_low_latency(fd)
+            termios.tcflush(fd, termios.TCIFLUSH)
+        except Exception:
+            os.close(fd)
+            raise
+        self.fd = fd
+        self._poll = select.poll()
+        self._poll.register(fd, select.POLLIN)
+
+    def close(self):
+        if(self.fd is not None):
+            os.close(self.fd)
+            self.fd = None
+            self._poll = None
+
+    def write(self, data) -> int:
+        view = memoryview(data).cast('B')
+        nbytes = 0
+        while(nbytes < len(view)):
+            if(self.write_timeout is not None):
+                _, writable, _ = select.select([], [self.fd], [], self.write_timeout)
+                if(len(writable) == 0):
+                    break
+            nbytes += os.write(self.fd, view[nbytes:])
+        return nbytes
+
+    def read(self, size=1) -> bytes:
+        data = self._read_available(size) if(self.in_waiting > 0) else b''
+        if(len(data) == size):
+            return data
+        data = bytearray(data)
+        deadline = None if(self.timeout is None) else time.monotonic() + self.timeout
+        while(len(data) < size):
+            if(deadline is None):
+                ready = self._poll.poll()
+            else:
+                remaining = deadline - time.monotonic()
+                if(remaining <= 0):
+                    break
+                ready = self._poll.poll(-(-remaining * 1000 // 1))
+            if(len(ready) == 0):
+                break
+            chunk = os.read(self.fd, size - len(data))
+            if(len(chunk) == 0):
+                break   # the other end hung up
+            data += chunk
+        return bytes(data)
+
+    def read_some(self, size: int, timeout=_PORT_TIMEOUT) -> bytes:
+        if(timeout is _PORT_TIMEOUT):
+            timeout = self.timeout
+        if(timeout is None):
+            ready = self._poll.poll()
+        else:
+            ready = self._poll.poll(timeout * 1000)
+        if(len(ready) == 0):
+            return b''
+        return os.read(self.fd, size)
+
+    def reset_input_buffer(self):
+        termios.tcflush(self.fd, termios.TCIFLUSH)
+
+    def _read_available(self, size: int) -> bytes:
+        return os.read(self.fd, size)
+
+    def _set_low_latency(self, fd: int) -> bool:
+        if(not hasattr(termios, 'TIOCGSERIAL')):   # Linux only
+            return False
+        try:
+            # struct serial_struct, the kernel copies no more than its own size
+            buf = bytearray(128)
+            fcntl.ioctl(fd, termios.TIOCGSERIAL, buf, True)
+            (flags,) = struct.unpack_from('i', buf, self._SERIAL_FLAGS_OFFSET)
+            struct.pack_into('i', buf, self._SERIAL_FLAGS_OFFSET, flags | self.ASYNC_LOW_LATENCY)
+            fcntl.ioctl(fd, termios.TIOCSSERIAL, buf)
+        except OSError:
+            # pseudo terminals and some USB drivers do not take the serial ioctls
+            return False
+        return True
+
+class Tcp_Transport(Transport):
+    '''
+    A serial port behind a network bridge (ser2net, RFC 2217 servers in raw mode, ...),
+    with Nagle turned off so each command goes out right away.
+        host, port : address of the bridge
+    '''
+    def __init__(self, host: str, port: int, timeout=None, write_timeout=None):
+        super().__init__(timeout, write_timeout)
+        self.host = host
+        self.port = port
+        self.sock = None
+        self.open()
+
+    @property
+    def is_open(self) -> bool:
+        return self.sock is not None
+
+    def fileno(self) -> int:
+        return self.sock.fileno()
+
+    @property
+    def in_waiting(self) -> int:
+        readable, _, _ = select.select([self.sock], [], [], 0)
+        if(len(readable) == 0):
+            return 0
+        nbytes = len(self.sock.recv(65536, socket.MSG_PEEK))
+        if(nbytes == 0):
+            # Readable with nothing to read, the bridge closed the connection. Reporting
+            # 0 would leave Line_Reader polling a dead socket until its deadline and beyond
+            raise serial.SerialException('Connection to {}:{} closed by the other end'.format(self.host, self.port))
+        return nbytes
+
+    def open(self):
+        self.sock = socket.create_connection((self.host, self.port), timeout=self.write_timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.sock.settimeout(None)
+
+    def close(self):
+        if(self.sock is not None):
+            self.sock.close()
+            self.sock = None
+
+    def write(self, data) -> int:
+        self.sock.settimeout(self.write_timeout)
+        try:
+            self.sock.sendall(data)
+        except socket.timeout:
+            return 0
+        finally:
+            self.sock.settimeout(None)
+        return len(data)
+
+    def read(self, size=1) -> bytes:
+        data = bytearray()
+        deadline = None if(self.timeout is None) else time.monotonic() + self.timeout
+        while(len(data) < size):
+            remaining = None
+            if(deadline is not None):
+                remaining = max(deadline - time.monotonic(), 0)
+            readable, _, _ = select.select([self.sock], [], [], remaining)
+            if(len(readable) == 0):
+                break
+            chunk = self.sock.recv(size - len(data))
+            if(len(chunk) == 0):
+                break   # the bridge closed the connection
+            data += chunk
+        return bytes(data)
+
+    def _read_available(self, size: int) -> bytes:
+        return self.sock.recv(size)
+
+class Loopback_Transport(Transport):
+    '''
+    Connects straight to a firmware simulator in this process, every write is answered
+    before it returns. Nothing else arrives later but the periodic reports of the
+    simulator, which are picked up when the port is looked at, so reads never wait on
+    the timeout.
+        sim : firmware_sim.Base_Board_Sim, a default one when None
+    '''
+    def __init__(self, sim=None, timeout=None, write_timeout=None):
+        super().__init__(timeout, write_timeout)
+        if(sim is None):
+            from uMux_IF_Chain.base_board.firmware_sim import Base_Board_Sim
+            sim = Base_Board_Sim()
+        self.sim = sim
+        self._rx = bytearray()
+        self._open = True
+
+    @property
+    def is_open(self) -> bool:
+        return self._open
+
+    @property
+    def in_waiting(self) -> int:
+        self._rx += self.sim.due_report()
+        return len(self._rx)
+
+    def open(self):
+        self._open = True
+
+    def close(self):
+        self._open = False
+
+    def write(self, data) -> int:
+        self._rx += self.sim.due_report()
+        self._rx += self.sim.process(bytes(data))
+        return len(data)
+
+    def read(self, size=1) -> bytes:
+        return self._read_available(size)
+
+    def reset_input_buffer(self):
+        self._rx.clear()
+
+    def _read_available(self, size: int) -> bytes:
+        self._rx += self.sim.due_report()
+        data = bytes(self._rx[:size])
+        del self._rx[:size]
+        return data
+
+def open_transport(port, timeout=None, write_timeout=None):
+    '''
+    Open the transport a port string asks for, see the module description. Anything
+    that is not a string is taken to be a transport object already and returned as-is.
+    '''
+    if(not isinstance(port, str)):
+        return port
+    if(port.startswith('raw:')):
+        return Raw_Fd_Transport(port[len('raw:'):], timeout, write_timeout)
+    if(port.startswith('socket://')):
+        host, _, tcp_port = port[len('socket://'):].rpartition(':')
+        if((host == '') or (not tcp_port.isdigit())):
+            raise ValueError('Expected socket://host:port, not ' + port)
+        return Tcp_Transport(host, int(tcp_port), timeout, write_timeout)
+    if(port.startswith('replay:')):
+        from uMux_IF_Chain.base_board.trace import Replay_Transport
+        return Replay_Transport(port[len('replay:'):], 0.0, True, timeout, write_timeout)
+    if(port == 'loop://'):
+        return Loopback_Transport(None, timeout, write_timeout)
+    return serial.Serial(port=port, timeout=timeout, write_timeout=write_timeout)
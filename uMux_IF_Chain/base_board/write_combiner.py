@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+'''
+Module write_combiner
+=================================
+Packs queued command lines into full USB CDC packets before handing them to the
+serial port. Each call to the serial port write becomes its own USB transfer,
+so many short command lines cost many mostly empty packets on the bus.
+'''
+# System level imports
+import threading
+import time
+
+class Write_Combiner:
+    '''
+    Sits between Base_Board_Rev3 and the serial port for writes only.
+        com         : object with a pyserial style write()
+        packet_size : USB packet size to fill, 64 for full speed, 512 for high speed
+        deadline_s  : longest time a partial packet is held before it is sent anyway
+    One flusher thread lives as long as the combiner and sends partial packets whose
+    deadline has passed, a write() past the deadline sends them too. All port writes are
+    made holding the combiner lock. close() stops the flusher.
+    '''
+    def __init__(self, com, packet_size=64, deadline_s=0.002):
+        if(packet_size <= 0):
+            raise ValueError('packet_size must be positive, ' + str(packet_size) + ' is not')
+        self.com = com
+        self.packet_size = packet_size
+        self.deadline_s = deadline_s
+        self._buf = bytearray()
+        self._cond = threading.Condition(threading.Lock())
+        self._due = None        # time.monotonic() the partial packet has to be sent by
+        self._closed = False
+        # Statistics
+        self.lines_sent = 0     # Command lines handed to write()
+        self.packets_sent = 0   # USB packets the combined writes occupy
+        self.writes = 0         # Calls made to the serial port write()
+        self.bytes_sent = 0
+        self.bytes_queued = 0   # Running count of bytes handed to write(), marks a line's position
+        self._flusher = threading.Thread(target=self._flush_loop, name='Write_Combiner flusher', daemon=True)
+        self._flusher.start()
+
+    def write(self, data) -> int:
+        '''Queue data, full packets are written out right away. Returns the number of bytes queued'''
+        with self._cond:
+            self._buf += data
+            self.bytes_queued += len(data)
+            self.lines_sent += 1
+            if((self._due is not None) and (time.monotonic() >= self._due)):
+                # The flusher has not got to it yet
+                nfull = len(self._buf)
+            else:
+                nfull = (len(self._buf) // self.packet_size) * self.packet_size
+            if(nfull > 0):
+                self._write_out(nfull)
+            if(len(self._buf) == 0):
+                self._due = None
+            elif(self._due is None):
+                # only the first partial byte starts the deadline
+                self._due = time.monotonic() + self.deadline_s
+                self._cond.notify()
+        return len(data)
+
+    def flush(self, through=None):
+        '''
+        Write out everything that is queued, including a partial packet. When through
+        is given only enough whole packets are written to get that bytes_queued position
+        onto the wire, the rest keeps waiting for more lines or the deadline.
+        '''
+        with self._cond:
+            if(through is None):
+                nbytes = len(self._buf)
+            else:
+                nbytes = through - (self.bytes_queued - len(self._buf))
+                nbytes = -(-nbytes // self.packet_size) * self.packet_size
+                nbytes = min(nbytes, len(self._buf))
+            if(nbytes <= 0):
+                return
+            self._write_out(nbytes)
+            if(len(self._buf) == 0):
+                self._due = None
+
+    def close(self):
+        '''Send what is queued and stop the flusher thread'''
+        self.flush()
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        if(self._flusher is not threading.current_thread()):
+            self._flusher.join()
+
+    def reset_counters(self):
+        self.lines_sent = 0
+        self.packets_sent = 0
+        self.writes = 0
+        self.bytes_sent = 0
+
+    def lines_per_packet(self) -> float:
+        if(self.packets_sent == 0):
+            return 0.0
+        return self.lines_sent / self.packets_sent
+
+    def _write_out(self, nbytes: int):
+        # caller holds self._cond
+        ret = self.com.write(self._buf[:nbytes])
+        if(ret != nbytes):
+            print("\tCRIT ERROR: Write_Combiner failed to send all of the bytes within the timeout period!!")
+        del self._buf[:nbytes]
+        self.writes += 1
+        self.bytes_sent += nbytes
+        self.packets_sent += -(-nbytes // self.packet_size)
+
+    def _flush_loop(self):
+        with self._cond:
+            while(not self._closed):
+                if(self._due is None):
+                    self._cond.wait()
+                    continue
+                wait = self._due - time.monotonic()
+                if(wait > 0):
+                    # a write() or flush() may send the packet, or start a new deadline, meanwhile
+                    self._cond.wait(wait)
+                    continue
+                self._due = None
+                if(len(self._buf) > 0):
+                    self._write_out(len(self._buf))
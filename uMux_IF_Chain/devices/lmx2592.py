@@ -78,38 +78,65 @@ class _PLL_Config:
         return float(self.Freq)
 
 class LMX2592:
-    def __init__(self, func_spi_write: Callable, func_spi_read: Callable, ref_freq_MHz) -> None:
+    def __init__(self, func_spi_write: Callable, func_spi_read: Callable, ref_freq_MHz,
+                 func_spi_write_many=None, func_spi_read_many=None) -> None:
+        '''
+            func_spi_write_many : optional, writes a list of registers in one go
+            func_spi_read_many  : optional, returns the values of a list of registers
+        Without them registers go one func_spi_write / func_spi_read call at a time.
+        '''
         self._spi_write = func_spi_write
         self._spi_read = func_spi_read
+        self._spi_write_many = func_spi_write_many
+        self._spi_read_many = func_spi_read_many
         self._ref_freq_MHz = ref_freq_MHz
         self._pll = _PLL_Config(self._ref_freq_MHz)
         self._R0 = _R0()
         self.debug = 0
 
+    # Registers get_Frequency_MHz() reads, in order
+    _FREQ_REGS = (_REG.PLL_DEN_HIGH, _REG.PLL_DEN_LOW, _REG.PLL_NUM_HIGH, _REG.PLL_NUM_LOW,
+                  _REG.PLL_N, _REG.PLL_VCO_2X)
+
     def get_Frequency_MHz(self) -> float:
         if(self.debug):
             print(self.get_Frequency_MHz.__qualname__+"()")
-
-        temp = self._spi_read(_REG.PLL_DEN_HIGH)
+        return self._freq_from_regs(self._read_many(self._FREQ_REGS))
+
+    def _write_many(self, writes: list) -> None:
+        if(self._spi_write_many is not None):
+            self._spi_write_many(writes)
+            return
+        for data in writes:
+            self._spi_write(data)
+
+    def _read_many(self, regs) -> list:
+        if(self._spi_read_many is not None):
+            return self._spi_read_many(list(regs))
+        return [self._spi_read(reg) for reg in regs]
+
+    def _freq_from_regs(self, regs: list) -> float:
+        '''Frequency from the values of the _FREQ_REGS registers'''
+        temp = regs[0]
         Den = temp[0] << 24 | temp[1] << 16
-        temp = self._spi_read(_REG.PLL_DEN_LOW)
+        temp = regs[1]
         Den += temp[0] << 8 | temp[1] << 0
         if(self.debug):
             print("\tDen = {}".format(Den))
 
-        temp = self._spi_read(_REG.PLL_NUM_HIGH)
+        temp = regs[2]
         Num = temp[0] << 24 | temp[1] << 16
-        temp = self._spi_read(_REG.PLL_NUM_LOW)
+        temp = regs[3]
         Num += temp[0] << 8 | temp[1] << 0
         if(self.debug):
             print("\tNum = {}".format(Num))
             
-        temp = self._spi_read(_REG.PLL_N)
+        temp = regs[4]
         N = temp[0] << 7 | temp[1] >> 1
         if(self.debug):
             print("\t  N = {}".format(N))
             
-        temp = self._spi_read(_REG.PLL_VCO_2X)
+        temp = regs[5]
         if(temp[1] & 0x1):
             vco_2x = True
         else:
@@ -127,6 +154,15 @@ class LMX2592:
         Den
         Num
         '''
+        real_freq, writes = self._freq_writes(Freq_MHz)
+        self._write_many(writes)
+
+        self._R0.cur = self._spi_read(self._R0.REG_NUM)
+        self._spi_write(self._fcal_write())
+        return real_freq
+
+    def _freq_writes(self, Freq_MHz: float) -> tuple:
+        '''Returns (real_freq, register writes) for set_Frequency_MHz(), before the calibration'''
         if(self.debug):
             print(self.set_Frequency_MHz.__qualname__+"({} MHz)".format(Freq_MHz))
 
@@ -134,29 +170,30 @@ class LMX2592:
         if(self.debug):
             print("\treal_freq = {}".format(real_freq))
 
+        writes = []
         data = [0x00] * 3
         data[0] = _REG.PLL_DEN_HIGH
         data[1] = (self._pll.Den >> 24 ) & 0xFF
         data[2] = (self._pll.Den >> 16 ) & 0xFF
-        self._spi_write(data)
+        writes.append(list(data))
         data[0] = _REG.PLL_DEN_LOW
         data[1] = (self._pll.Den >> 8 ) & 0xFF
         data[2] = (self._pll.Den >> 0 ) & 0xFF
-        self._spi_write(data)
+        writes.append(list(data))
 
         data[0] = _REG.PLL_NUM_HIGH
         data[1] = (self._pll.Num >> 24 ) & 0xFF
         data[2] = (self._pll.Num >> 16 ) & 0xFF
-        self._spi_write(data)
+        writes.append(list(data))
         data[0] = _REG.PLL_NUM_LOW
         data[1] = (self._pll.Num >> 8 ) & 0xFF
         data[2] = (self._pll.Num >> 0 ) & 0xFF
-        self._spi_write(data)
+        writes.append(list(data))
 
         data[0] = _REG.PLL_N
         data[1] = ((self._pll.N << _REG_38.PLL_N_SHIFT) >> 8 ) & 0xFF
         data[2] = ((self._pll.N << _REG_38.PLL_N_SHIFT) >> 0 ) & 0xFF       
-        self._spi_write(data)
+        writes.append(list(data))
 
         data[0] = _REG.PLL_VCO_2X
         data[1] = 0x00
@@ -165,24 +202,22 @@ class LMX2592:
             data[2] =  data[2] | 0x01
         else:
             data[2] =  (data[2] & (~0x01)) & 0xFF
-        self._spi_write(data)
+        writes.append(list(data))
+        return (real_freq, writes)
 
-        self._R0.cur = self._spi_read(self._R0.REG_NUM)
+    def _fcal_write(self) -> list:
+        '''R0 write that starts a frequency calibration, from the R0 value in self._R0.cur'''
+        data = [0x00] * 3
         data[0] = self._R0.REG_NUM
         data[1] = self._R0.cur[0]
         data[2] = self._R0.cur[1] | (self._R0.FCAL_EN << self._R0.BIT_FCAL_EN)
-        self._spi_write(data)
-        return real_freq
+        return data
 
     def trigger_cal(self) -> None:
         if(self.debug):
             print(self.trigger_cal.__qualname__+"()")
-        data_out = [0x00] * 3
-        data_in = self._spi_read(0x00)
-        data_out[0] = self._R0.REG_NUM
-        data_out[1] = data_in[0]
-        data_out[2] = data_in[1] | (self._R0.FCAL_EN << self._R0.BIT_FCAL_EN)
-        self._spi_write(data_out)
+        self._R0.cur = self._spi_read(0x00)
+        self._spi_write(self._fcal_write())
 
     def is_locked(self) -> bool:
         if(self.debug):
@@ -192,95 +227,95 @@ class LMX2592:
         which will refelct the clock status. Then it will need to set it back to outputing
         the read back data.
         '''
-        data = [0x00] * 3
         # read current state of R0
         self._R0.cur = self._spi_read(self._R0.REG_NUM)
-        # Assembly instruction to set the MUXOUT bit
-        data[0] = self._R0.REG_NUM
-        data[1] = self._R0.cur[0]
-        data[2] = self._R0.cur[1] | (self._R0.MUXOUT_LOCK_DETECT << self._R0.BIT_MUXOUT_SEL)
-        data[2] = data[2] & ~(self._R0.MASK_FCAL_EN)
+        lock_detect, restore = self._lock_detect_writes()
         # change the MUXOUT bit
-        self._spi_write(data)
+        self._spi_write(lock_detect)
         # read the lock status of the LMX
         status = self._spi_read(self._R0.REG_NUM)
-        # prepare data to set back to what it was, except for the FCAL_EN bit, we don't want to trigger another calibration
-        data[2] = self._R0.cur[1] & ~(self._R0.MASK_FCAL_EN)
-        self._spi_write(data)
+        self._spi_write(restore)
         
         if(status[0] == 0xFF):
             return True
         return False
 
+    def _lock_detect_writes(self) -> tuple:
+        '''R0 writes that switch MUXOUT to lock detect and back, from the R0 value in self._R0.cur'''
+        data = [0x00] * 3
+        # Assembly instruction to set the MUXOUT bit
+        data[0] = self._R0.REG_NUM
+        data[1] = self._R0.cur[0]
+        data[2] = self._R0.cur[1] | (self._R0.MUXOUT_LOCK_DETECT << self._R0.BIT_MUXOUT_SEL)
+        data[2] = data[2] & ~(self._R0.MASK_FCAL_EN)
+        restore = list(data)
+        # prepare data to set back to what it was, except for the FCAL_EN bit, we don't want to trigger another calibration
+        restore[2] = self._R0.cur[1] & ~(self._R0.MASK_FCAL_EN)
+        return (data, restore)
+
     def synth_init(self) -> None:
+        self._write_many(self._init_writes())
+
+    def _init_writes(self) -> list:
+        '''Register writes of the TICS Pro init file for the reference frequency'''
         if(self.debug):
             print(self.synth_init.__qualname__+"()")
 
         if(self._ref_freq_MHz == 100):
             SYTNH_CONFIG_FILE = 'lmx2592_init_100MHz_Ref.txt'
-            text = importlib.resources.read_text("uMux_IF_Chain.devices.tics_synth_init", SYTNH_CONFIG_FILE)
-            data_file = list(csv.reader(text.splitlines(), delimiter='\t'))
-
-            if(self.debug):
-                print("\t Loaded file \"{}\" to init".format(SYTNH_CONFIG_FILE))
-
-            data = [0x00] * 3
-            for reg in data_file:
-                if(self.debug > 1):
-                    print("\t{}".format(reg[0]))
-                reg_val = int(reg[1], base=16)
-                data[0] = 0xFF & (reg_val >> 16)
-                data[1] = 0xFF & (reg_val >> 8)
-                data[2] = 0xFF & (reg_val >> 0)
-                self._spi_write(data)
-
         elif(self._ref_freq_MHz == 200):
             SYTNH_CONFIG_FILE = 'lmx2592_init_200MHz_Ref.txt'
-            text = importlib.resources.read_text("uMux_IF_Chain.devices.tics_synth_init", SYTNH_CONFIG_FILE)
-            data_file = list(csv.reader(text.splitlines(), delimiter='\t'))
-
-            if(self.debug):
-                print("\t Loaded file \"{}\" to init".format(SYTNH_CONFIG_FILE))
-
-            data = [0x00] * 3
-            for reg in data:
-                if(self.debug > 1):
-                    print("\t{}".format(reg[0]))
-                reg_val = int(reg[1], base=16)
-                data[0] = 0xFF & (reg_val >> 16)
-                data[1] = 0xFF & (reg_val >> 8)
-                data[2] = 0xFF & (reg_val >> 0)
-                self._spi_write(data)
-
         else:
             print("The software does not know what to do when there is a Ref Freq of {} MHz".format(self._ref_freq_MHz))
+            return []
+
+        text = importlib.resources.read_text("uMux_IF_Chain.devices.tics_synth_init", SYTNH_CONFIG_FILE)
+        data_file = list(csv.reader(text.splitlines(), delimiter='\t'))
+
+        if(self.debug):
+            print("\t Loaded file \"{}\" to init".format(SYTNH_CONFIG_FILE))
+
+        writes = []
+        # The 200 MHz branch walks the 3 byte data buffer of synth_init(), not the file
+        rows = data_file if(self._ref_freq_MHz == 100) else [0x00] * 3
+        for reg in rows:
+            if(self.debug > 1):
+                print("\t{}".format(reg[0]))
+            reg_val = int(reg[1], base=16)
+            writes.append([0xFF & (reg_val >> 16), 0xFF & (reg_val >> 8), 0xFF & (reg_val >> 0)])
+        return writes
     
     def powerdown_bit(self) -> None:
         if(self.debug):
             print(self.powerdown_bit.__qualname__+"()")
-        data = [0x00] * 3
         self._R0.cur = self._spi_read(self._R0.REG_NUM)
-        data[0] = self._R0.REG_NUM
-        data[1] = self._R0.cur[0]
-        data[2] = self._R0.cur[1] | self._R0.MASK_POWERDOWN
-        self._spi_write(data)
+        self._spi_write(self._r0_write(self._R0.MASK_POWERDOWN, True))
 
     def powerup_bit(self) -> None:
         if(self.debug):
             print(self.powerup_bit.__qualname__+"()")
-        data = [0x00] * 3
         self._R0.cur = self._spi_read(self._R0.REG_NUM)
+        self._spi_write(self._r0_write(self._R0.MASK_POWERDOWN, False))
+
+    def _r0_write(self, mask: int, set_bits: bool) -> list:
+        '''R0 write with the mask bits set or cleared, from the R0 value in self._R0.cur'''
+        data = [0x00] * 3
         data[0] = self._R0.REG_NUM
         data[1] = self._R0.cur[0]
-        data[2] = self._R0.cur[1] & ~self._R0.MASK_POWERDOWN
-        self._spi_write(data)
+        if(set_bits):
+            data[2] = self._R0.cur[1] | mask
+        else:
+            data[2] = self._R0.cur[1] & ~mask
+        return data
 
     def powerdown_get(self) -> bool:
         if(self.debug):
             print(self.powerdown_get.__qualname__+"()")
             
         self._R0.cur = self._spi_read(self._R0.REG_NUM)
+        return self._powerdown_from_r0()
 
+    def _powerdown_from_r0(self) -> bool:
         if(self._R0.cur[1] & self._R0.MASK_POWERDOWN):
             if(self.debug):
                 print("    powerdown bit is High : Shutdown")
@@ -289,3 +324,70 @@ class LMX2592:
             if(self.debug):
                 print("    powerdown bit is Low : Online")
             return False
+
+class Async_LMX2592(LMX2592):
+    '''
+    LMX2592 for the asyncio client, func_spi_write and func_spi_read are coroutine
+    functions and the methods are coroutines. The register math is shared with LMX2592.
+    '''
+    async def get_Frequency_MHz(self) -> float:
+        if(self.debug):
+            print(self.get_Frequency_MHz.__qualname__+"()")
+        return self._freq_from_regs(await self._read_many(self._FREQ_REGS))
+
+    async def _write_many(self, writes: list) -> None:
+        if(self._spi_write_many is not None):
+            await self._spi_write_many(writes)
+            return
+        for data in writes:
+            await self._spi_write(data)
+
+    async def _read_many(self, regs) -> list:
+        if(self._spi_read_many is not None):
+            return await self._spi_read_many(list(regs))
+        return [await self._spi_read(reg) for reg in regs]
+
+    async def set_Frequency_MHz(self, Freq_MHz: float) -> float:
+        real_freq, writes = self._freq_writes(Freq_MHz)
+        await self._write_many(writes)
+
+        self._R0.cur = await self._spi_read(self._R0.REG_NUM)
+        await self._spi_write(self._fcal_write())
+        return real_freq
+
+    async def trigger_cal(self) -> None:
+        if(self.debug):
+            print(self.trigger_cal.__qualname__+"()")
+        self._R0.cur = await self._spi_read(0x00)
+        await self._spi_write(self._fcal_write())
+
+    async def is_locked(self) -> bool:
+        if(self.debug):
+            print(self.is_locked.__qualname__+"()")
+        self._R0.cur = await self._spi_read(self._R0.REG_NUM)
+        lock_detect, restore = self._lock_detect_writes()
+        await self._spi_write(lock_detect)
+        status = await self._spi_read(self._R0.REG_NUM)
+        await self._spi_write(restore)
+        return status[0] == 0xFF
+
+    async def synth_init(self) -> None:
+        await self._write_many(self._init_writes())
+
+    async def powerdown_bit(self) -> None:
+        if(self.debug):
+            print(self.powerdown_bit.__qualname__+"()")
+        self._R0.cur = await self._spi_read(self._R0.REG_NUM)
+        await self._spi_write(self._r0_write(self._R0.MASK_POWERDOWN, True))
+
+    async def powerup_bit(self) -> None:
+        if(self.debug):
+            print(self.powerup_bit.__qualname__+"()")
+        self._R0.cur = await self._spi_read(self._R0.REG_NUM)
+        await self._spi_write(self._r0_write(self._R0.MASK_POWERDOWN, False))
+
+    async def powerdown_get(self) -> bool:
+        if(self.debug):
+            print(self.powerdown_get.__qualname__+"()")
+        self._R0.cur = await self._spi_read(self._R0.REG_NUM)
+        return self._powerdown_from_r0()
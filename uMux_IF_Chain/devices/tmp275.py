@@ -5,29 +5,117 @@ Module Tyr_Serial_IF
 This module is responsible for communicating with any development board
 that contains a tyr command processor.
 '''
+# System level imports
+import time
 
 class TMP275:
+    # Typical conversion time in seconds at each resolution in bits, set by R1:R0 of the configuration register
+    CONVERSION_TIME_S = {9: 0.0275, 10: 0.055, 11: 0.110, 12: 0.220}
+    _CFG_SD = 0x1 << 0      # Shutdown, converts only when asked to with _CFG_OS
+    _CFG_OS = 0x1 << 7      # One-shot conversion while shut down
+
     def __init__(self, i2c_addr=0x24):
         self.i2c_addr = i2c_addr    # 7 bit i2c address
         self.write = None
         self.write_read = None
+        self.resolution = 9         # Bits, the power on default until config_device() sets it
+        self.shutdown = False       # Shut down between one-shot conversions, see config_device()
+        self.max_age_s = None       # Readings younger than this are served from the cache, None for one conversion time
+        self.i2c_reads = 0          # Temperature register reads sent over I2C
+        self.cache_hits = 0         # Readings served without one
+        self._temp_C = None
+        self._temp_t = 0.0
+        self._ready_t = None        # When the one-shot conversion in progress is done
 
     def link_methods(self, write, write_read):
         self.write = write
         self.write_read = write_read
 
-    def config_device(self):
-        config_byte = 0x60
-        self.write(self.i2c_addr, [0x01, config_byte])
+    @property
+    def conversion_time_s(self) -> float:
+        '''How long the TMP275 takes to update its temperature register at the configured resolution'''
+        return self.CONVERSION_TIME_S[self.resolution]
 
-    def read_temp_C(self):
-        val = self.write_read(self.i2c_addr, 0x2, [0x00])
-        val_float = (val[0] << 4) | (val[1] >> 4)   # Map bits
-        val_float *= 0.0625     # Scale to Degree C
-        return val_float
+    def config_byte(self, one_shot=False) -> int:
+        '''Configuration register value for the resolution and shutdown settings'''
+        config_byte = (self.resolution - 9) << 5
+        if(self.shutdown):
+            config_byte |= self._CFG_SD
+            if(one_shot):
+                config_byte |= self._CFG_OS
+        return config_byte
+
+    def config_device(self, resolution=12, shutdown=False):
+        '''
+        Write the configuration register
+            resolution : 9 to 12 bits, each bit doubles the conversion time
+            shutdown   : convert only when read, lowers self heating and supply current
+        '''
+        if(resolution not in self.CONVERSION_TIME_S):
+            print("\tERROR: TMP275 resolution must be 9 to 12 bits, not " + str(resolution))
+            return
+        self.resolution = resolution
+        self.shutdown = shutdown
+        self.write(self.i2c_addr, [0x01, self.config_byte()])
+        self.invalidate()
+
+    def invalidate(self):
+        '''Forget the cached reading, the next read goes to the device'''
+        self._temp_C = None
+
+    def is_fresh(self, max_age_s=None) -> bool:
+        '''
+        The cached reading is younger than max_age_s
+            max_age_s : None for self.max_age_s, or one conversion time when that is None too
+        '''
+        if(max_age_s is None):
+            max_age_s = self.conversion_time_s if(self.max_age_s is None) else self.max_age_s
+        return (self._temp_C is not None) and (time.monotonic() - self._temp_t < max_age_s)
+
+    def cached_temp_C(self, max_age_s=None):
+        '''The last reading if is_fresh(max_age_s), None when the device has to be read'''
+        if(not self.is_fresh(max_age_s)):
+            return None
+        self.cache_hits += 1
+        return self._temp_C
+
+    def start_conversion(self) -> float:
+        '''Start a one-shot conversion in shutdown mode, returns the seconds until it is done'''
+        self.write(self.i2c_addr, [0x01, self.config_byte(one_shot=True)])
+        self._ready_t = time.monotonic() + self.conversion_time_s
+        return self.conversion_time_s
+
+    def store_temp_C(self, data):
+        '''Convert a temperature register read and keep it as the cached reading, None for a failed read'''
+        self.i2c_reads += 1
+        if((data is None) or (len(data) != 2)):
+            return None
+        self._temp_C = self.convert_int2temp_C(data)
+        self._temp_t = time.monotonic()
+        return self._temp_C
+
+    def read_temp_C(self, max_age_s=None):
+        '''
+        Temperature in C. A reading younger than max_age_s, one conversion time by
+        default, is returned without touching the bus, the register could not have
+        changed yet. In shutdown mode a one-shot conversion is started and waited for.
+            max_age_s : 0 always reads the device
+        '''
+        temp = self.cached_temp_C(max_age_s)
+        if(temp is not None):
+            return temp
+        if(self.shutdown):
+            # A conversion may have been started already, to overlap it with other work
+            if(self._ready_t is None):
+                self.start_conversion()
+            time.sleep(max(self._ready_t - time.monotonic(), 0))
+            self._ready_t = None
+        return self.store_temp_C(self.write_read(self.i2c_addr, 0x2, [0x00]))
 
-    def read_temp_F(self):
-        temp = self.read_temp_C()
+    def read_temp_F(self, max_age_s=None):
+        temp = self.read_temp_C(max_age_s)
+        if(temp is None):
+            return None
         temp = (temp * 1.8 + 32)
         return temp
 
@@ -40,4 +128,3 @@ class TMP275:
         val_float = self.convert_int2temp_C(data)
         val_float = val_float * 1.8 + 32
         return val_float
-    
@@ -15,6 +15,7 @@ import binascii
 # the main classes here
 from uMux_IF_Chain.uMux_IF import uMux_IF_Rev1
 from uMux_IF_Chain.base_board import base_board_rev3
+from uMux_IF_Chain.base_board import discovery
 
 # Indexes for the main array hiolding all of the sliders
 IDX_STRINGVAR = 1
@@ -29,8 +30,9 @@ CMD_DELAY = 0.01
 
 def main():
     parser = argparse.ArgumentParser()
-    parser.add_argument("com_port", help="Com Port to communicate with Base Board")
+    parser.add_argument("com_port", help="Com Port or sn:<serial number> of the Base Board, the first one found when left out", nargs='?')
     parser.add_argument("-v", "--verbosity", help="Set terminal debugging verbosity", action="count", default=0)
+    parser.add_argument("-a", "--probe_all_ports", help="Look for base boards on every USB serial port, not only known ones, when no port is given", action="store_true")
     parser.add_argument("-t", "--test", help="Allows running without hardware", action="store_true")
     args = parser.parse_args()
 
@@ -220,6 +222,8 @@ def main():
 
     if(args.test == False):
         # Create base board interface class and set debug message level
+        if(args.com_port is None):
+            args.com_port = discovery.discover_ports(probe_all=args.probe_all_ports)[0]
         bb = base_board_rev3.Base_Board_Rev3(args.com_port)
         bb.get_device_info()
         if(args.verbosity == 0):
@@ -231,12 +235,10 @@ def main():
         
         # Determine what IF_Boards Rev1 are present
         dev_stack = bb.spi_get_dev_stack()
-        print("DEV_STACK : 0x" + hex(dev_stack).upper()[2:])
-        n_ifb = dev_stack.bit_length()
-        ifb = [0x00] * n_ifb
-        # Instantiate classes for the IF_Boards Rev1
-        for i in range(dev_stack.bit_length()):
-            ifb[i] = uMux_IF_Rev1.UMux_IF_Rev1(bb, 0x1 << i)
+        print("DEV_STACK : 0x{:08X}".format(dev_stack))
+        # Instantiate classes for the IF_Boards Rev1, only for the slots in use
+        ifb = uMux_IF_Rev1.if_boards(bb, dev_stack)
+        for i in range(len(ifb)):
             if(args.verbosity == 0):
                 ifb[i].debug = 0
             elif(args.verbosity == 1):
@@ -16,20 +16,47 @@ import csv
 # the main classes here
 from uMux_IF_Chain.uMux_IF import uMux_IF_Rev1
 from uMux_IF_Chain.base_board import base_board_rev3
+from uMux_IF_Chain.base_board import discovery
+from uMux_IF_Chain.base_board import pool as base_board_pool
 
 
 def main():
     parser = argparse.ArgumentParser()
-    parser.add_argument("com_port", help="Com Port to communicate with Base Board")
+    parser.add_argument("com_port", help="Com Port(s) or sn:<serial number> of Base Board(s), several are brought up in parallel, found automatically when left out", nargs='*')
     parser.add_argument("-v", "--verbosity", help="Set terminal debugging verbosity", action="count", default=0)
+    parser.add_argument("-a", "--probe_all_ports", help="Look for base boards on every USB serial port, not only known ones, when no port is given", action="store_true")
     parser.add_argument("-i", "--iPython", help="Drops into an iPython interface (Always active)", action="store_true", default=True)
     parser.add_argument("-s", "--skip_startup", help="Skips startup r/w, only creates objects", action="store_true", default=0)
     parser.add_argument("-c", "--cards", help="Ignore auto detect of cards, takes in Hex Chip Select byte: 0x01 up to 0xFF", default="0xFF")
     args = parser.parse_args()
+    if(len(args.com_port) == 0):
+        args.com_port = discovery.discover_ports(probe_all=args.probe_all_ports)
+
+    # Several base boards are opened and read in parallel, bb and ifb are then the first one
+    pool = None
+    ifbs = {}
+    if(len(args.com_port) > 1):
+        pool = base_board_pool.Base_Board_Pool(args.com_port)
+        if(args.skip_startup == False):
+            pool.report(pool.get_device_info(), "get_device_info")
+            dev_stacks = {port: res.value for port, res in pool.spi_get_dev_stack().items() if(res.ok)}
+        else:
+            dev_stacks = {port: int(args.cards, 16) for port in pool.boards}
+        ifbs = pool.if_boards(dev_stacks)
+        for port in pool.boards:
+            pool[port].auto_print = min(args.verbosity, 2)
+            for x in ifbs.get(port, []):
+                x.debug = min(args.verbosity, 2)
+        print("")
+        for port, stack in ifbs.items():
+            print("{} : {} IF boards".format(port, len(stack)))
 
     # Create base board interface class and set debug message level
-    bb = base_board_rev3.Base_Board_Rev3(args.com_port)
-    if(~args.skip_startup == False):
+    if(pool is None):
+        bb = base_board_rev3.Base_Board_Rev3(args.com_port[0])
+    else:
+        bb = pool[args.com_port[0]]
+    if((~args.skip_startup == False) and (pool is None)):
         bb.get_device_info()
 
     if(args.verbosity == 0):
@@ -43,17 +70,17 @@ def main():
 
     dev_stack = int(args.cards, 16)
 
-    if(args.skip_startup == False):
+    if(pool is not None):
+        dev_stack = dev_stacks.get(args.com_port[0]) or 0
+    elif(args.skip_startup == False):
     # Determine what IF_Boards Rev1 are present
         dev_stack = bb.spi_get_dev_stack()
 
-    print("DEV_STACK : 0x" + hex(dev_stack).upper()[2:])
-    n_ifb = dev_stack.bit_length()
-    ifb = [0x00] * n_ifb
-
-    # Instantiate classes for the IF_Boards Rev1
+    print("DEV_STACK : 0x{:08X}".format(dev_stack))
+    # Instantiate classes for the IF_Boards Rev1, only for the slots in use
+    ifb = uMux_IF_Rev1.if_boards(bb, dev_stack)
+    n_ifb = len(ifb)
     for i in range(n_ifb):
-        ifb[i] = uMux_IF_Rev1.UMux_IF_Rev1(bb, 0x1 << i)
         if(args.verbosity == 0):
             ifb[i].debug = 0
         elif(args.verbosity == 1):
@@ -68,9 +95,11 @@ def main():
            + "           cards = {}\n".format(dev_stack) \
            + "Defined Classes:\n" \
            + "        bb = base_board_rev3.Base_Board_Rev3(args.com_port)\n" \
-           + "     n_ifb = dev_stack.bit_length()\n" \
-           + "     for i in range(n_ifb):\n" \
-           + "        ifb[i] = uMux_IF_Rev1.UMux_IF_Rev1(bb, 0x1 << i)\n\n"
+           + "       ifb = uMux_IF_Rev1.if_boards(bb, dev_stack), ifb[i].slot is the slot\n"
+    if(pool is not None):
+        banner += "      pool = base_board_pool.Base_Board_Pool(args.com_port)\n" \
+                + "      ifbs = pool.if_boards(), {port: [ifb, ...]}\n"
+    banner += "\n"
     print(banner)
     IPython.start_ipython(argv=[], user_ns=locals())
 
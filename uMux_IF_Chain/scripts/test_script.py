@@ -18,6 +18,8 @@ import binascii
 # the main classes here
 from uMux_IF_Chain.uMux_IF import uMux_IF_Rev1
 from uMux_IF_Chain.base_board import base_board_rev3
+from uMux_IF_Chain.base_board import discovery
+from uMux_IF_Chain.base_board import pool as base_board_pool
 
 # SYTNH_CONFIG_FILE = '../../HexRegisterValues.txt'
 TICS_FILE = 'HexRegisterValues.txt'
@@ -274,56 +276,68 @@ class uMux_IF_Unit_Test:
 
         self.read_all_information(bb, ifb)
 
-def main():
-    parser = argparse.ArgumentParser()
-    parser.add_argument("com_port", help="Com Port to communicate with Base Board")
-    parser.add_argument("-n", "--num_itter", help="Set the number of itterations to run through test suite (not used yet)", default=1)
-    parser.add_argument("-s", "--skip_running", help="Skip automatically starting tests", action="store_true", default=0)
-    parser.add_argument("-i", "--iPython", help="Drops into an iPython interface", action="store_true", default=0)
-    parser.add_argument("-v", "--verbosity", help="Set terminal debugging verbosity", action="count", default=0)
-    
-    args = parser.parse_args()
-    
-    # Create base board interface class and set debug message level
-    bb = base_board_rev3.Base_Board_Rev3(args.com_port)
+def setup_port(bb, verbosity):
+    '''Find the IF boards on one base board and build their classes'''
     bb.get_device_info()
-    if(args.verbosity == 0):
+    if(verbosity == 0):
         bb.auto_print = 0
-    elif(args.verbosity == 1):
+    elif(verbosity == 1):
         bb.auto_print = 1
-    elif(args.verbosity == 2):
+    elif(verbosity == 2):
         bb.auto_print = 2
 
-    print("")
-
     # Determine what IF_Boards Rev1 are present
     dev_stack = bb.spi_get_dev_stack()
-    print("DEV_STACK : 0x" + hex(dev_stack).upper()[2:])
-    n_ifb = dev_stack.bit_length()
-    ifb = [0x00] * n_ifb
-
-    # Instantiate classes for the IF_Boards Rev1
-    for i in range(dev_stack.bit_length()):
-        ifb[i] = uMux_IF_Rev1.UMux_IF_Rev1(bb, 0x1 << i)
-        if(args.verbosity == 0):
+    print("{} DEV_STACK : 0x{:08X}".format(bb.port, dev_stack))
+
+    # Instantiate classes for the IF_Boards Rev1, only for the slots in use
+    ifb = uMux_IF_Rev1.if_boards(bb, dev_stack)
+    for i in range(len(ifb)):
+        if(verbosity == 0):
             ifb[i].debug = 0
-        elif(args.verbosity == 1):
+        elif(verbosity == 1):
             ifb[i].debug = 1
-        elif(args.verbosity == 2):
+        elif(verbosity == 2):
             ifb[i].debug = 2
         # Not a fan of adding an array to each class, but here we are
         ifb[i].test_results = []     
+    return ifb
 
-    unit_test = uMux_IF_Unit_Test()
-    unit_test.read_all_information(bb, ifb)
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("com_port", help="Com Port(s) or sn:<serial number> of Base Board(s), several are tested in parallel, found automatically when left out", nargs='*')
+    parser.add_argument("-n", "--num_itter", help="Set the number of itterations to run through test suite (not used yet)", default=1)
+    parser.add_argument("-s", "--skip_running", help="Skip automatically starting tests", action="store_true", default=0)
+    parser.add_argument("-i", "--iPython", help="Drops into an iPython interface", action="store_true", default=0)
+    parser.add_argument("-v", "--verbosity", help="Set terminal debugging verbosity", action="count", default=0)
+    parser.add_argument("-a", "--probe_all_ports", help="Look for base boards on every USB serial port, not only known ones, when no port is given", action="store_true")
+    
+    args = parser.parse_args()
+    if(len(args.com_port) == 0):
+        args.com_port = discovery.discover_ports(probe_all=args.probe_all_ports)
     
-    if(args.skip_running == False):
-        print("-"*60)
-        print("Running Test Suite")
-        print("\n")
-        unit_test.run_test_suite(bb, ifb)
-        print("-"*60)
-        print("Finished Test Suite")
+    # Create base board interface classes, one per port
+    pool = base_board_pool.Base_Board_Pool(args.com_port)
+    unit_test = uMux_IF_Unit_Test()
+
+    def test_port(bb):
+        ifb = setup_port(bb, args.verbosity)
+        unit_test.read_all_information(bb, ifb)
+        if(args.skip_running == False):
+            print("-"*60)
+            print("Running Test Suite on " + str(bb.port))
+            print("\n")
+            unit_test.run_test_suite(bb, ifb)
+            print("-"*60)
+            print("Finished Test Suite on " + str(bb.port))
+        return ifb
+
+    results = pool.map(test_port)
+    pool.report(pool.errors(results), "test_port")
+    ifbs = {port: res.value for port, res in results.items() if(res.ok)}
+    # The first port keeps the names used with a single base board
+    bb = pool.boards.get(args.com_port[0])
+    ifb = ifbs.get(args.com_port[0], [])
     
     if(args.iPython == True):
         import IPython
@@ -0,0 +1,345 @@
+# -*- coding: utf-8 -*-
+'''
+Module async_uMux_IF_Rev1
+=================================
+asyncio version of UMux_IF_Rev1 for use with an Async_Base_Board. The methods are
+coroutines and the waits between a command and the read of its RET_VAL are
+asyncio.sleep(), so other IF boards and base boards keep going in the meantime. A
+RET_VAL with MASK_BUSY is polled again with backoff, as in UMux_IF_Rev1._read_ret().
+'''
+# System level imports
+import asyncio
+import functools
+import time
+
+# local imports
+from uMux_IF_Chain.devices import tmp275
+from uMux_IF_Chain.devices import lmx2592
+from uMux_IF_Chain.base_board import base_board_rev3
+from uMux_IF_Chain.uMux_IF import commands
+from uMux_IF_Chain.uMux_IF.uMux_IF_Rev1 import _CMD, _CMDS, _RET_VAL, Board_Health
+
+def _transaction(method):
+    '''
+    Run the coroutine as one transaction on the shared base board. The lock is not
+    reentrant, only public methods take it and they don't call each other.
+    '''
+    @functools.wraps(method)
+    async def wrapper(self, *args, **kwargs):
+        async with self._bb.transaction(self._cs):
+            return await method(self, *args, **kwargs)
+    return wrapper
+
+async def if_boards(base_board, dev_stack=None, debug=0) -> list:
+    '''uMux_IF_Rev1.if_boards() for an Async_Base_Board'''
+    if(dev_stack is None):
+        dev_stack = (await base_board.spi_get_dev_stack()) or 0
+    boards = []
+    for cs in base_board_rev3.chip_selects(dev_stack):
+        boards.append(Async_UMux_IF_Rev1(base_board, cs))
+        boards[-1].debug = debug
+    return boards
+
+class Async_UMux_IF_Rev1:
+    def __init__(self, base_board, chip_select):
+        self._cs = chip_select
+        self._bb = base_board
+        self.slot = chip_select.bit_length() - 1
+        self._dac_nbits = 14
+        self.debug = 1
+        self.firmware_id = []
+        self.unique_id = []
+        self.board_serial_number = []
+        self.health = Board_Health(chip_select)
+        self._delay = 0.0
+        self._delay_i2c = 0.0
+        self.busy_poll_s = 50e-6
+        self.busy_poll_max_s = 0.05
+        self.busy_timeout_s = 1.0
+        self.busy_polls = 0
+        self._tmp = tmp275.TMP275(0x48)
+        self._lmx = lmx2592.Async_LMX2592(self._synth_write_array, self._synth_read_array, 100,
+                                          self._synth_write_many, self._synth_read_many)
+
+    async def _write(self, data: list[int]) -> None:
+        await self._bb.spi_write(self._cs, data)
+        if(self.debug):
+            print("Async_UMux_IF_Rev1._write(): _cs={} data={} : {}".format(self._cs, list(data), commands.describe(data)))
+
+    async def _read(self, nBytes: int) -> list[int]:
+        ret = await self._bb.spi_read(self._cs, nBytes)
+        if(self.debug):
+            print("Async_UMux_IF_Rev1._read():  _cs={} nBytes={} ret={}".format(self._cs, nBytes, ret))
+        return ret
+
+    async def _command(self, data: list[int], delay=None) -> list[int]:
+        '''Send a command and read back its RET_VAL, None when the exchange was lost'''
+        await self._write(data)
+        ret = await self._read_ret(self._delay if(delay is None) else delay)
+        if((ret is None) or (len(ret) != _RET_VAL.RET_LEN)):
+            return None
+        return ret
+
+    def _track(self, ret: list[int]) -> list[int]:
+        if((ret is not None) and (len(ret) == _RET_VAL.RET_LEN)):
+            self.health.update(ret[0])
+        return ret
+
+    async def _read_ret(self, delay=0.0, timeout_s=None) -> list[int]:
+        '''UMux_IF_Rev1._read_ret(), the RET_VAL once the MCU is no longer busy'''
+        if(timeout_s is None):
+            timeout_s = self.busy_timeout_s
+        if(delay > 0):
+            await asyncio.sleep(delay)
+        deadline = time.monotonic() + timeout_s
+        interval = self.busy_poll_s
+        while(True):
+            ret = await self._read(_RET_VAL.RET_LEN)
+            if((ret is None) or (len(ret) == 0) or (not ret[0] & _RET_VAL.MASK_BUSY)):
+                return self._track(ret)
+            self.busy_polls += 1
+            wait = min(interval, deadline - time.monotonic())
+            if(wait <= 0):
+                print("\tERROR: IF board _cs={} still busy after {} s".format(self._cs, timeout_s))
+                return self._track(ret)
+            await asyncio.sleep(wait)
+            interval = min(interval * 2, self.busy_poll_max_s)
+
+    async def _query(self, cmd_array: list[int], delay: float) -> list[int]:
+        '''UMux_IF_Rev1._query(), read commands are sent again when the exchange is lost'''
+        for attempt in range(self._bb.max_retries + 1):
+            ret = await self._command(cmd_array, delay)
+            if(ret is not None):
+                return ret
+        return None
+
+    async def _query_bulk(self, cmd_array: list[int]) -> list[int]:
+        '''_query() for reads whose RET_VAL announces the size of the data that follows'''
+        for attempt in range(self._bb.max_retries + 1):
+            ret = await self._query(cmd_array, self._delay)
+            if(ret is None):
+                return None
+            if(ret[0] & _RET_VAL.MASK_READ_GOOD != _RET_VAL.MASK_READ_GOOD):
+                print("Failed to understand command, RET_VAL is not READ_GOOD")
+                return None
+            data = await self._read(ret[1])
+            if((data is not None) and (len(data) == ret[1])):
+                return data
+        return None
+
+    async def _write_checked(self, data: list[int]) -> bool:
+        ret = await self._command(data)
+        if((ret is not None) and (ret[0] & _RET_VAL.MASK_WRITE_GOOD)):
+            return True
+        print("Write Failed")
+        return False
+
+    def _dac_cmd(self, name: str, dac_val_I: int, dac_val_Q: int) -> bytes:
+        # The DACs take 14 bits, left justified in the 16 bit fields
+        return _CMDS[name, _CMD.W].encode((dac_val_I << 2) & 0xFFFF, (dac_val_Q << 2) & 0xFFFF)
+
+    async def _dac_get(self, name: str) -> tuple[int, int]:
+        cmd = _CMDS[name, _CMD.R]
+        status, dac_val_I, dac_val_Q = cmd.decode(await self._command(cmd.encode()))
+        if(status & _RET_VAL.MASK_READ_GOOD):
+            return (dac_val_I >> 2, dac_val_Q >> 2)
+        print("Write Failed")
+        return (None, None)
+
+    @_transaction
+    async def mcu_reset(self) -> None:
+        self.health.expect_reset()
+        await self._write(_CMDS['FW_SOFT_RST', _CMD.W].encode(0x55443322))
+
+    @_transaction
+    async def base_band_loop_back_enable(self) -> None:
+        await self._write_checked(_CMDS['FW_BB_LB', _CMD.W].encode(0x01))
+
+    @_transaction
+    async def base_band_loop_back_disable(self) -> None:
+        await self._write_checked(_CMDS['FW_BB_LB', _CMD.W].encode(0x00))
+
+    @_transaction
+    async def base_band_loop_back_get(self) -> bool:
+        cmd = _CMDS['FW_BB_LB', _CMD.R]
+        status, enable = cmd.decode(await self._command(cmd.encode()))
+        if(status & _RET_VAL.MASK_READ_GOOD):
+            if(enable == 0x01):
+                return True
+            elif(enable == 0x00):
+                return False
+        else:
+            print("Write Failed")
+
+    @_transaction
+    async def nulling_up_set(self, dac_val_I: int, dac_val_Q: int) -> None:
+        if((dac_val_I > 2**self._dac_nbits) or (dac_val_Q > 2**self._dac_nbits)):
+            print("Value too high: dac_val_I")
+            return
+        if((dac_val_I < 0) or (dac_val_Q < 0)):
+            return
+        await self._write_checked(self._dac_cmd('NULLING_UP', dac_val_I, dac_val_Q))
+
+    @_transaction
+    async def nulling_up_get(self) -> tuple[int, int]:
+        return await self._dac_get('NULLING_UP')
+
+    @_transaction
+    async def nulling_dn_set(self, dac_val_I: int, dac_val_Q: int) -> None:
+        if(dac_val_I > (2**self._dac_nbits - 1)):
+            print("Value too high: dac_val_I")
+            return
+        if(dac_val_Q > 2**self._dac_nbits):
+            print("Value too high: dac_val_Q")
+            return
+        await self._write_checked(self._dac_cmd('NULLING_DN', dac_val_I, dac_val_Q))
+
+    @_transaction
+    async def nulling_dn_get(self) -> tuple[int, int]:
+        return await self._dac_get('NULLING_DN')
+
+    @_transaction
+    async def synth_init(self) -> None:
+        if(not await self._write_checked(_CMDS['SYNTH_INIT', _CMD.W].encode())):
+            return
+        await self._lmx.synth_init()
+        # register writes may still be in flight on the base board pipeline
+        await self._bb.drain()
+
+    @_transaction
+    async def synth_lock_status(self) -> bool:
+        cmd = _CMDS['SYNTH_SR', _CMD.R]
+        status, locked = cmd.decode(await self._query(cmd.encode(), self._delay))
+        if(status & _RET_VAL.MASK_READ_GOOD):
+            return locked == 0xFF
+        print("Write Failed")
+        return None
+
+    @_transaction
+    async def synth_reset(self):
+        return await self._write_checked(_CMDS['SYNTH_RST', _CMD.W].encode())
+
+    @_transaction
+    async def synth_get_Frequency_MHz(self) -> float:
+        return await self._lmx.get_Frequency_MHz()
+
+    @_transaction
+    async def synth_set_Frequency_MHz(self, Freq_MHz) -> float:
+        real_freq_MHz = await self._lmx.set_Frequency_MHz(Freq_MHz)
+        if(real_freq_MHz != Freq_MHz):
+            print("WARNING: Requested Frequency is not exactly equal to the Real Frequency\n"
+                + "\tRequested Frequency = {} MHz\n".format(Freq_MHz)
+                + "\t     Real Frequency = {} MHz\n".format(real_freq_MHz))
+        return real_freq_MHz
+
+    @_transaction
+    async def synth_powerdown_bit(self) -> None:
+        await self._lmx.powerdown_bit()
+
+    @_transaction
+    async def synth_powerup_bit(self) -> None:
+        await self._lmx.powerup_bit()
+
+    @_transaction
+    async def synth_powerdown_get(self) -> bool:
+        return await self._lmx.powerdown_get()
+
+    async def _synth_write_array(self, data: list[int]) -> None:
+        array = _CMDS['SYNTH_WRITE', _CMD.W].encode(data[0], bytes(data[1:3]))
+        ret = await self._command(array)
+        if((ret is None) or (not ret[0] & _RET_VAL.MASK_WRITE_GOOD)):
+            print("_synth_write_array Failed : \n"
+                + "\t  _cs={}\n".format(self._cs)
+                + "\t data={}\n".format(data)
+                + "\tarray={}\n".format(array)
+                + "\t  ret={}\n".format(ret))
+
+    async def _commands_batch(self, cmds: list) -> list:
+        '''UMux_IF_Rev1._commands_batch(), the commands and their RET_VAL reads as one batch'''
+        transactions = []
+        for cmd in cmds:
+            transactions.append((self._cs, cmd, 0))
+            transactions.append((self._cs, None, _RET_VAL.RET_LEN))
+        rets = (await self._bb.spi_batch(transactions))[1::2]
+        if(self.debug):
+            print("Async_UMux_IF_Rev1._commands_batch(): _cs={} commands={}".format(self._cs, len(cmds)))
+        return [self._track(ret) for ret in rets]
+
+    async def _synth_write_many(self, writes: list) -> None:
+        if(self._delay != 0):
+            for data in writes:
+                await self._synth_write_array(data)
+            return
+        cmd = _CMDS['SYNTH_WRITE', _CMD.W]
+        cmds = [cmd.encode(data[0], bytes(data[1:3])) for data in writes]
+        for data, ret in zip(writes, await self._commands_batch(cmds)):
+            if((ret is None) or (not ret[0] & _RET_VAL.MASK_WRITE_GOOD)):
+                print("_synth_write_many Failed : \n"
+                    + "\t  _cs={}\n".format(self._cs)
+                    + "\t data={}\n".format(data)
+                    + "\t  ret={}\n".format(ret))
+
+    async def _synth_read_many(self, regs: list) -> list:
+        if(self._delay != 0):
+            return [await self._synth_read_array(reg) for reg in regs]
+        cmd = _CMDS['SYNTH_WRITE', _CMD.R]
+        cmds = [cmd.encode(reg & 0xFF) for reg in regs]
+        values = []
+        for reg, ret in zip(regs, await self._commands_batch(cmds)):
+            status, value = cmd.decode(ret)
+            if(status & _RET_VAL.MASK_READ_GOOD):
+                values.append(list(value))
+                continue
+            print("_synth_read_many Failed : \n"
+                + "\t  _cs={}\n".format(self._cs)
+                + "\t  reg={}\n".format(reg)
+                + "\t  ret={}\n".format(ret))
+            values.append(None)
+        return values
+
+    async def _synth_read_array(self, reg: int) -> list[int]:
+        cmd = _CMDS['SYNTH_WRITE', _CMD.R]
+        status, value = cmd.decode(await self._command(cmd.encode(reg & 0xFF)))
+        if(status & _RET_VAL.MASK_READ_GOOD):
+            return list(value)
+        print("_synth_read_array Failed : \n"
+            + "\t  _cs={}\n".format(self._cs)
+            + "\t  reg={}\n".format(reg)
+            + "\tstatus={}\n".format(status))
+
+    async def _read_temperatures(self, convert) -> tuple[float, float]:
+        cmd = _CMDS['TEMP_READ', _CMD.R]
+        status, synth, mcu = cmd.decode(await self._query(cmd.encode(), self._delay + self._delay_i2c))
+        if(status & _RET_VAL.MASK_READ_GOOD):
+            return (convert(synth), convert(mcu))
+        print("Read Local Tempereatures Failed")
+        return (None, None)
+
+    @_transaction
+    async def read_temperatures_F(self) -> tuple[float, float]:
+        return await self._read_temperatures(self._tmp.convert_int2temp_F)
+
+    @_transaction
+    async def read_temperatures_C(self) -> tuple[float, float]:
+        return await self._read_temperatures(self._tmp.convert_int2temp_C)
+
+    @_transaction
+    async def read_FWID(self):
+        ret = await self._query_bulk(_CMDS['FW_ID', _CMD.R].encode())
+        if(ret is not None):
+            self.firmware_id = ret
+        return ret
+
+    @_transaction
+    async def read_CID(self):
+        ret = await self._query_bulk(_CMDS['FW_CID', _CMD.R].encode())
+        if(ret is not None):
+            self.unique_id = ret
+        return ret
+
+    @_transaction
+    async def read_BSN(self):
+        ret = await self._query_bulk(_CMDS['FW_BSN', _CMD.R].encode())
+        if(ret is not None):
+            self.board_serial_number = ret
+        return ret
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+'''
+Module commands
+=================================
+The 6 byte command protocol of the IF board MCU as one table. A command is written as
+
+    [opcode << 1 | R/W][5 argument bytes]
+
+and answered with a 6 byte RET_VAL, [status][5 reply bytes]. Each row of TABLE gives
+the opcode, direction, the struct format and names of the argument and reply fields,
+whether the MCU may still be busy carrying the command out when its RET_VAL is read and
+whether it goes over the MCU local I2C bus. The rows are compiled once into a Command per opcode and direction
+holding a struct.Struct for each side, so encoding a command is one pack and decoding
+its RET_VAL one unpack. Formats are big endian, unused bytes are zero.
+'''
+# System level imports
+import functools
+import struct
+
+R = 0x01
+W = 0x00
+CMD_LEN = 6
+RET_LEN = 6
+
+# Optional opcodes are only probed, see UMux_IF_Rev1.probe_capabilities(), reads of the
+# firmware blobs reply with the length of the data that follows the RET_VAL. slow marks the
+# commands the host has always waited extra for before reading the RET_VAL, _delay_i2c for
+# the temperature reads and 10 s for the EEPROM data that follows PROG_EEPROM. There is no
+# MCU timing spec to give a figure, _read_ret() polls MASK_BUSY for however long they take
+#    name              opcode  R/W  args    arg fields              reply    reply fields               slow    i2c
+TABLE = [
+    ('NULL',            0x00,  W,   '',     (),                     '',      (),                        False,  False),
+    ('ISR',             0x01,  R,   '',     (),                     '',      (),                        False,  False),
+    ('ISR_MASK',        0x02,  R,   '',     (),                     '',      (),                        False,  False),
+    ('MON_CTRL',        0x03,  R,   '',     (),                     '',      (),                        False,  False),
+    ('FW_ID',           0x10,  R,   '',     (),                     'B',     ('nbytes',),               False,  False),
+    ('FW_CID',          0x11,  R,   '',     (),                     'B',     ('nbytes',),               False,  False),
+    ('FW_BSN',          0x12,  R,   '',     (),                     'B',     ('nbytes',),               False,  False),
+    ('FW_EEPROM',       0x13,  R,   '',     (),                     'B',     ('nbytes',),               False,  False),
+    ('FW_BB_LB',        0x14,  W,   'B',    ('enable',),            '',      (),                        False,  False),
+    ('FW_BB_LB',        0x14,  R,   '',     (),                     'B',     ('enable',),               False,  False),
+    ('FW_PIN_CTRL',     0x15,  R,   '',     (),                     '',      (),                        False,  False),
+    ('FW_SOFT_RST',     0x16,  W,   'I',    ('key',),               '',      (),                        False,  False),
+    ('TEMP_THLD',       0x20,  W,   'HH',   ('synth', 'mcu'),       '',      (),                        False,  True),
+    ('TEMP_THLD',       0x20,  R,   '',     (),                     '2s2s',  ('synth', 'mcu'),          True,   True),
+    ('TEMP_READ',       0x21,  R,   '',     (),                     '2s2s',  ('synth', 'mcu'),          True,   True),
+    ('NULLING_CTRL',    0x30,  R,   '',     (),                     '',      (),                        False,  False),
+    ('NULLING_UP',      0x31,  W,   'HH',   ('dac_I', 'dac_Q'),     '',      (),                        False,  False),
+    ('NULLING_UP',      0x31,  R,   '',     (),                     'HH',    ('dac_I', 'dac_Q'),        False,  False),
+    ('NULLING_DN',      0x32,  W,   'HH',   ('dac_I', 'dac_Q'),     '',      (),                        False,  False),
+    ('NULLING_DN',      0x32,  R,   '',     (),                     'HH',    ('dac_I', 'dac_Q'),        False,  False),
+    ('SYNTH_SR',        0x40,  R,   '',     (),                     'B',     ('locked',),               False,  False),
+    ('SYNTH_RST',       0x41,  W,   '',     (),                     '',      (),                        False,  False),
+    ('SYNTH_INIT',      0x42,  W,   '',     (),                     '',      (),                        False,  False),
+    ('SYNTH_WRITE',     0x43,  W,   'B2s',  ('reg', 'value'),       '',      (),                        False,  False),
+    ('SYNTH_WRITE',     0x43,  R,   'B',    ('reg',),               '2s',    ('value',),                False,  False),
+    ('SYNTH_REG_DUMP',  0x44,  R,   '',     (),                     'B',     ('nbytes',),               False,  False),
+    ('SPI_LOOPBACK',    0x51,  W,   'B',    ('nbytes',),            '',      (),                        False,  False),
+    ('PROG_EEPROM',     0x60,  W,   'B',    ('nbytes',),            'B',     ('nbytes',),               True,   False),
+]
+
+class Command:
+    '''
+    One row of TABLE, compiled
+        name, opcode, rw : command and direction, R or W
+        arg_fields       : names of the values encode() takes, in order
+        reply_fields     : names of the values decode() returns after the status
+        slow             : the RET_VAL may read BUSY for a while, see TABLE
+        i2c              : carried out over the MCU local I2C bus
+    encode(*values) returns the 6 command bytes with the argument fields set to values.
+    '''
+    def __init__(self, name, opcode, rw, args, arg_fields, reply, reply_fields, slow, i2c):
+        self.name = name
+        self.opcode = opcode
+        self.rw = rw
+        self.code = (opcode << 1) | rw  # First byte of the command
+        self.arg_fields = arg_fields
+        self.reply_fields = reply_fields
+        self.slow = slow
+        self.i2c = i2c
+        self._args = struct.Struct('>B' + args + 'x' * (CMD_LEN - 1 - struct.calcsize('>' + args)))
+        self._reply = struct.Struct('>B' + reply + 'x' * (RET_LEN - 1 - struct.calcsize('>' + reply)))
+        self._failed = (0,) + (None,) * len(reply_fields)
+        # The first byte bound in, so encoding is the pack call alone
+        self.encode = functools.partial(self._args.pack, self.code)
+
+    def __repr__(self):
+        return "Command({}, {})".format(self.name, 'R' if(self.rw == R) else 'W')
+
+    def decode(self, ret) -> tuple:
+        '''
+        (status, reply fields...) of a RET_VAL. A RET_VAL that was lost or came back short
+        decodes as status 0 and None fields, so it reads as a failed command.
+        '''
+        try:
+            return self._reply.unpack_from(bytes(ret))
+        except (TypeError, struct.error):
+            return self._failed
+
+    def args(self, data) -> dict:
+        '''{field: value} of the argument bytes of a command written'''
+        return dict(zip(self.arg_fields, self._args.unpack_from(bytes(data))[1:]))
+
+COMMANDS = {}       # {(name, R/W): Command}
+BY_CODE = {}        # {first command byte: Command}
+for _row in TABLE:
+    _cmd = Command(*_row)
+    COMMANDS[_cmd.name, _cmd.rw] = _cmd
+    BY_CODE[_cmd.code] = _cmd
+del _row, _cmd
+
+def lookup(name: str, rw: int) -> Command:
+    return COMMANDS[name, rw]
+
+def from_bytes(data) -> Command:
+    '''Command of the bytes written to an IF board, None when the opcode is not in TABLE'''
+    if(len(data) == 0):
+        return None
+    return BY_CODE.get(data[0])
+
+def describe(data) -> str:
+    '''Readable form of a command written, for traces and debug output'''
+    cmd = from_bytes(data) if(len(data) == CMD_LEN) else None
+    if(cmd is None):
+        return "DATA[{}]".format(len(data))
+    fields = ' '.join("{}=0x{}".format(name, value.hex() if(isinstance(value, bytes)) else "{:X}".format(value))
+                      for name, value in cmd.args(data).items())
+    return "{} {} {}".format(cmd.name, 'R' if(cmd.rw == R) else 'W', fields).rstrip()
+
+def slow_opcodes() -> set:
+    '''Opcodes with a slow row, see TABLE'''
+    return {cmd.opcode for cmd in COMMANDS.values() if(cmd.slow)}
@@ -6,6 +6,11 @@ This module is responsible for communicating with any development board
 that contains a tyr command processor.
 '''
 # System level imports
+import collections
+import concurrent.futures
+import contextlib
+import functools
+import threading
 import time
 
 import numpy as np
@@ -14,6 +19,11 @@ import numpy as np
 # from devices import tmp275
 from uMux_IF_Chain.devices import tmp275
 from uMux_IF_Chain.devices import lmx2592
+from uMux_IF_Chain.uMux_IF import commands
+from uMux_IF_Chain.base_board.scheduler import PRIORITY
+from uMux_IF_Chain.base_board import capabilities
+from uMux_IF_Chain.base_board import base_board_rev3
+from uMux_IF_Chain.base_board.capabilities import Capabilities
 
 class _CMD:
     R = 0x01
@@ -58,6 +68,115 @@ class _RET_VAL:
     MASK_RSVD =         0x1 << 6
     MASK_OVERHEAT =     0x1 << 7
 
+class HEALTH_EVENT:
+    OVERHEAT            = 'overheat'            # MASK_OVERHEAT set, the reply before did not have it
+    OVERHEAT_CLEARED    = 'overheat_cleared'
+    MCU_RESET           = 'mcu_reset'           # MASK_MCU_RST_DONE after the first RET_VAL, not asked for with mcu_reset()
+    I2C_NACK            = 'i2c_nack'
+    INVALID_CMD         = 'invalid_cmd'
+
+class Board_Health:
+    '''
+    Health of one IF board, decoded from the status byte of every RET_VAL the host reads
+    anyway, so keeping it costs no serial traffic.
+        chip_select : board the RET_VALs come from
+    Subscribers are called as fn(health, event, status) on the thread that read the RET_VAL,
+    with the board transaction held, so they must not send commands to the board.
+    '''
+    def __init__(self, chip_select: int):
+        self.chip_select = chip_select
+        self.replies = 0            # RET_VALs decoded
+        self.overheating = False    # MASK_OVERHEAT in the last RET_VAL
+        self.overheat_replies = 0
+        self.i2c_nacks = 0
+        self.invalid_cmds = 0
+        self.mcu_resets = 0         # MASK_MCU_RST_DONE seen, asked for or not
+        self.unexpected_resets = 0
+        self.last_status = None
+        self.last_t = 0.0           # time.time() of the last RET_VAL
+        self._expected = 0          # status bits that are not reported, see expected()
+        self._reset_expected = False
+        self._subscribers = []
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return "Board_Health(cs=0x{:X}, {})".format(self.chip_select, self.summary())
+
+    def subscribe(self, fn):
+        '''fn(health, event, status) is called for every HEALTH_EVENT from now on, returns fn'''
+        self._subscribers.append(fn)
+        return fn
+
+    def unsubscribe(self, fn):
+        if(fn in self._subscribers):
+            self._subscribers.remove(fn)
+
+    def expect_reset(self):
+        '''The next MASK_MCU_RST_DONE follows a reset the host asked for, it is no MCU_RESET event'''
+        self._reset_expected = True
+
+    @contextlib.contextmanager
+    def expected(self, mask: int):
+        '''Status bits in mask are neither counted nor reported inside the block, probing for invalid commands'''
+        self._expected |= mask
+        try:
+            yield self
+        finally:
+            self._expected &= ~mask
+
+    def summary(self) -> dict:
+        return {'replies': self.replies, 'overheating': self.overheating, 'overheat_replies': self.overheat_replies,
+                'i2c_nacks': self.i2c_nacks, 'invalid_cmds': self.invalid_cmds, 'mcu_resets': self.mcu_resets,
+                'unexpected_resets': self.unexpected_resets}
+
+    def update(self, status: int):
+        '''Decode the status byte of a RET_VAL'''
+        status &= ~self._expected
+        events = []
+        with self._lock:
+            self.replies += 1
+            self.last_status = status
+            self.last_t = time.time()
+            overheat = (status & _RET_VAL.MASK_OVERHEAT) != 0
+            if(overheat):
+                self.overheat_replies += 1
+            if(overheat != self.overheating):
+                self.overheating = overheat
+                events.append(HEALTH_EVENT.OVERHEAT if(overheat) else HEALTH_EVENT.OVERHEAT_CLEARED)
+            if(status & _RET_VAL.MASK_I2C_NACK):
+                self.i2c_nacks += 1
+                events.append(HEALTH_EVENT.I2C_NACK)
+            if(status & _RET_VAL.MASK_INVALID_CMD):
+                self.invalid_cmds += 1
+                events.append(HEALTH_EVENT.INVALID_CMD)
+            if(status & _RET_VAL.MASK_MCU_RST_DONE):
+                self.mcu_resets += 1
+                # The first RET_VAL of a session carries the power on reset
+                if(self._reset_expected or (self.replies == 1)):
+                    self._reset_expected = False
+                else:
+                    self.unexpected_resets += 1
+                    events.append(HEALTH_EVENT.MCU_RESET)
+        for event in events:
+            if(event == HEALTH_EVENT.OVERHEAT):
+                print("\tWARNING: IF board _cs=0x{:X} reports overheating".format(self.chip_select))
+            elif(event == HEALTH_EVENT.MCU_RESET):
+                print("\tWARNING: IF board _cs=0x{:X} MCU reset unexpectedly".format(self.chip_select))
+            for fn in list(self._subscribers):
+                try:
+                    fn(self, event, status)
+                except Exception as e:
+                    print("\tERROR: Board health subscriber {} failed : {}".format(getattr(fn, '__name__', fn), e))
+
+# Compiled entries of the command table, {(name, R/W): Command}, see the commands module
+_CMDS = commands.COMMANDS
+
+# Cached state that synth register writes change, see UMux_IF_Rev1.invalidate()
+_SYNTH_STATE = ('freq', 'powerdown')
+
+# Opcodes an IF board MCU may or may not implement, see probe_capabilities()
+_OPTIONAL_CMDS = ('ISR', 'ISR_MASK', 'MON_CTRL', 'FW_PIN_CTRL', 'NULLING_CTRL')
+
 class _GPIO:
     PIN_Slave_nINT      = 0x1 << 0
     PIN_Vref_En         = 0x1 << 1
@@ -70,244 +189,901 @@ class _GPIO:
     PIN_EEPROM_nWP      = 0x1 << 8
 
 
+# Returned by the stand-ins of Deferred_Batch when the board has to be accessed for real
+_LIVE = object()
+
+class _Cannot_Defer(Exception):
+    '''Raised in a recorded call that needs the board itself, the rest of the call is left to the live replay'''
+    pass
+
+class _Deferred_Call:
+    def __init__(self, method, args, kwargs):
+        self.method = method
+        self.args = args
+        self.kwargs = kwargs
+        self.future = concurrent.futures.Future()
+        self.log = []               # [('W', data) or ('R', nbytes)] the call sends, in order
+        self.partial = False        # The rest of the call depends on data read from the board
+
+class _Recorder:
+    '''
+    Stands in for the board while a deferred call is recorded. A write command is answered
+    with a good RET_VAL, the call stops at the first read whose data it needs.
+    '''
+    track = False                   # Made up RET_VALs are kept out of the board health
+
+    def __init__(self, call: _Deferred_Call):
+        self.call = call
+        self.last_cmd = None
+
+    def write(self, data) -> bool:
+        self.call.log.append(('W', list(data)))
+        self.last_cmd = data
+        return True
+
+    def read(self, nbytes: int, delay: float):
+        # A read that has to wait, or would find the MCU busy, is left to the live replay
+        cmd = None if(self.last_cmd is None) else commands.from_bytes(self.last_cmd)
+        if((delay > 0) or ((cmd is not None) and cmd.slow)):
+            self.call.partial = True
+            raise _Cannot_Defer()
+        self.call.log.append(('R', nbytes))
+        if((self.last_cmd is None) or (self.last_cmd[0] & _CMD.R)):
+            self.call.partial = True
+            raise _Cannot_Defer()
+        return [_RET_VAL.MASK_WRITE_GOOD] + [0x00] * (nbytes - 1)
+
+    def direct(self):
+        # Exchanges that bypass the RET_VAL protocol, e.g. spi_loopback(), are never recorded
+        self.call.partial = True
+        raise _Cannot_Defer()
+
+class _Replayer:
+    '''
+    Stands in for the board while a deferred call runs again on the replies of the batch.
+    Once the call leaves what was recorded, or the MCU was busy, the rest of it is live.
+    '''
+    track = True
+
+    def __init__(self, call: _Deferred_Call, replies: list):
+        self.pending = collections.deque(zip(call.log, replies))
+        self.live = False
+
+    def write(self, data) -> bool:
+        if((not self.live) and (len(self.pending) > 0) and (self.pending[0][0] == ('W', list(data)))):
+            self.pending.popleft()
+            return True
+        self.live = True
+        return False
+
+    def read(self, nbytes: int, delay: float):
+        if((not self.live) and (len(self.pending) > 0) and (self.pending[0][0] == ('R', nbytes))):
+            ret = self.pending.popleft()[1]
+            if((ret is None) or ((len(ret) > 0) and (ret[0] & _RET_VAL.MASK_BUSY))):
+                self.live = True
+            return ret
+        self.live = True
+        return _LIVE
+
+    def direct(self):
+        self.live = True
+
+class Deferred_Batch:
+    '''
+    Calls of an IF board made inside a with block, sent together when it exits, see
+    UMux_IF_Rev1.batch(). Attributes the batch does not have are looked up on the board,
+    so b.nulling_up_set() and ifb.nulling_up_set() are the same inside the block.
+        round_trips : base board batches sent
+        live_calls  : calls that had to finish one command at a time
+    '''
+    def __init__(self, board):
+        self.board = board
+        self.round_trips = 0
+        self.live_calls = 0
+        self.thread = threading.get_ident()
+        self.flushing = False
+        self._depth = 0             # Nested with blocks, the outermost one sends the calls
+        self._calls = []
+
+    def __getattr__(self, name: str):
+        return getattr(self.board, name)
+
+    def __enter__(self):
+        self._depth += 1
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._depth -= 1
+        if(self._depth > 0):
+            return False
+        self.board._batch = None
+        if(exc_type is None):
+            self.flush()
+        else:
+            for call in self._calls:
+                call.future.cancel()
+        return False
+
+    def deferred(self) -> bool:
+        '''Calls made now are deferred, only the thread that opened the batch defers them'''
+        return (not self.flushing) and (threading.get_ident() == self.thread)
+
+    def defer(self, method, args, kwargs) -> concurrent.futures.Future:
+        call = _Deferred_Call(method, args, kwargs)
+        self._calls.append(call)
+        return call.future
+
+    def flush(self):
+        '''
+        Send the deferred calls, each one is recorded against a stand-in for the board,
+        the commands of all of them go out in a single base board batch and the calls run
+        again on the replies to set their futures. A call that needs data read from the
+        board is sent up to that read, its batch is sent and the call finishes live.
+        A call that raises while it is recorded is not sent, its future gets the exception.
+        '''
+        calls, self._calls = self._calls, []
+        board = self.board
+        self.flushing = True
+        try:
+            with board._bb.transaction(board._cs):
+                group = []
+                saved = board._cache_snapshot()
+                for call in calls:
+                    if(not call.future.set_running_or_notify_cancel()):
+                        continue
+                    before = board._cache_snapshot()
+                    try:
+                        self._record(call)
+                    except Exception as e:
+                        board._cache_restore(before)
+                        call.future.set_exception(e)
+                        continue
+                    group.append(call)
+                    if(call.partial):
+                        board._cache_restore(saved)
+                        self._send(group)
+                        group = []
+                        saved = board._cache_snapshot()
+                board._cache_restore(saved)
+                self._send(group)
+        finally:
+            self.flushing = False
+
+    def _record(self, call: _Deferred_Call):
+        board = self.board
+        # Recording answers are made up, the call prints what it has to say when it is replayed
+        saved = (board.debug, board._lmx.debug, board.print_errors)
+        board.debug = 0
+        board._lmx.debug = 0
+        board.print_errors = False
+        board._io = _Recorder(call)
+        try:
+            call.method(board, *call.args, **call.kwargs)
+        except _Cannot_Defer:
+            pass
+        finally:
+            board._io = None
+            board.debug, board._lmx.debug, board.print_errors = saved
+
+    def _send(self, group: list):
+        board = self.board
+        transactions = []
+        for call in group:
+            for kind, item in call.log:
+                transactions.append((board._cs, item, 0) if(kind == 'W') else (board._cs, None, item))
+        replies = []
+        if(len(transactions) > 0):
+            replies = board._bb.spi_batch(transactions)
+            self.round_trips += 1
+            if(board.debug):
+                print("uMux_IF_Rev1.batch(): _cs={} calls={} transactions={}".format(board._cs, len(group), len(transactions)))
+        for call in group:
+            board._io = _Replayer(call, replies[:len(call.log)])
+            replies = replies[len(call.log):]
+            try:
+                call.future.set_result(call.method(board, *call.args, **call.kwargs))
+            except Exception as e:
+                call.future.set_exception(e)
+            finally:
+                if(board._io.live):
+                    self.live_calls += 1
+                board._io = None
+
+class _Not_Broadcast(Exception):
+    pass
+
+class _Broadcaster:
+    '''
+    Stands in for the board while a Broadcast_Group call runs. Write commands go to every
+    board of the group in one SPI transaction on the chip select mask and their RET_VALs
+    are read from each board. Anything with per board replies raises _Not_Broadcast.
+    '''
+    track = False                   # The boards of the group track their own RET_VALs
+
+    def __init__(self, group):
+        self.group = group
+
+    def write(self, data) -> bool:
+        cmd = commands.from_bytes(data) if(len(data) == _CMD.CMD_LEN) else None
+        if((cmd is None) or (cmd.rw != _CMD.W)):
+            raise _Not_Broadcast()
+        self.group._bb.spi_write(self.group.mask, data)
+        self.group.broadcasts += 1
+        if(self.group.debug):
+            print("Broadcast_Group._write(): mask=0x{:X} : {}".format(self.group.mask, commands.describe(data)))
+        return True
+
+    def read(self, nbytes: int, delay: float):
+        if(nbytes != _RET_VAL.RET_LEN):
+            raise _Not_Broadcast()
+        if(delay > 0):
+            time.sleep(delay)
+        return self.group._rets(self.group._bb.spi_batch(self.group._ret_reads()))
+
+    def direct(self):
+        raise _Not_Broadcast()
+
+    def commands(self, cmds: list) -> list:
+        '''
+        UMux_IF_Rev1._commands_batch() as one base board batch of broadcasts. Without
+        verify_each only the RET_VALs of the last command are read and stand for all of them.
+        '''
+        group = self.group
+        nboards = len(group.boards)
+        transactions = []
+        for idx, cmd in enumerate(cmds):
+            write = commands.from_bytes(cmd) if(len(cmd) == _CMD.CMD_LEN) else None
+            if((write is None) or (write.rw != _CMD.W)):
+                raise _Not_Broadcast()
+            transactions.append((group.mask, cmd, 0))
+            if(group.verify_each or (idx == len(cmds) - 1)):
+                transactions += group._ret_reads()
+        replies = group._bb.spi_batch(transactions)
+        group.broadcasts += len(cmds)
+        rets = []
+        pos = 0
+        for idx in range(len(cmds)):
+            pos += 1
+            if(group.verify_each or (idx == len(cmds) - 1)):
+                rets.append(group._rets(replies[pos:pos + nboards]))
+                pos += nboards
+        return rets if(group.verify_each) else rets[-1:] * len(cmds)
+
+# UMux_IF_Rev1 methods made of write commands only, which Broadcast_Group sends to all of
+# its boards at once, and the cached state each changes, all of it when empty
+_BROADCAST = {'mcu_reset': (),
+              'base_band_loop_back_enable': ('loopback',),
+              'base_band_loop_back_disable': ('loopback',),
+              'nulling_up_set': ('nulling_up',),
+              'nulling_dn_set': ('nulling_dn',),
+              'synth_init': _SYNTH_STATE,
+              'synth_reset': _SYNTH_STATE}
+
+class Broadcast_Group:
+    '''
+    IF boards of one base board driven as one, see broadcast(). The chip select is a bit
+    mask, so a write to the OR of the chip selects reaches every board in one SPI
+    transaction. The methods in _BROADCAST and synth_set_Frequency_MHz() are sent that
+    way, the RET_VAL of each command is then read from every board and the first one
+    that is not good is returned. Other UMux_IF_Rev1 methods, and a call that turns out to
+    need per board replies, run on each board in turn and return a list.
+        boards      : UMux_IF_Rev1 of the same base board
+        verify_each : read the RET_VALs of every command of a synth register stream, otherwise only of the last
+        broadcasts  : commands written to all boards at once
+        fallbacks   : broadcast calls that ran per board instead
+        last_rets   : RET_VAL of each board for the last command read back
+    '''
+    def __init__(self, boards: list, verify_each=True):
+        self.boards = list(boards)
+        if(len(self.boards) == 0):
+            raise ValueError('Broadcast_Group needs at least one IF board')
+        self._bb = self.boards[0]._bb
+        if(any(board._bb is not self._bb for board in self.boards)):
+            print("\tERROR: Broadcast_Group boards are on different base boards")
+        self.mask = 0
+        for board in self.boards:
+            self.mask |= board._cs
+        self.verify_each = verify_each
+        self.debug = 0
+        self.broadcasts = 0
+        self.fallbacks = 0
+        self.last_rets = []
+        # Runs the UMux_IF_Rev1 methods on the mask, its I/O goes through a _Broadcaster
+        self._proxy = UMux_IF_Rev1(self._bb, self.mask)
+        self._proxy.debug = 0
+        self._proxy.cache_max_age_s = 0
+
+    def __repr__(self):
+        return "Broadcast_Group(mask=0x{:X}, boards={})".format(self.mask, len(self.boards))
+
+    def __getattr__(self, name: str):
+        if(name.startswith('_')):
+            raise AttributeError(name)
+        def each(*args, **kwargs):
+            return [getattr(board, name)(*args, **kwargs) for board in self.boards]
+        return each
+
+    def _transaction(self) -> contextlib.ExitStack:
+        '''Hold the transaction of every board and of the mask, in chip select order so groups cannot deadlock'''
+        stack = contextlib.ExitStack()
+        for cs in sorted(set([board._cs for board in self.boards] + [self.mask])):
+            stack.enter_context(self._bb.transaction(cs))
+        return stack
+
+    def _ret_reads(self) -> list:
+        return [(board._cs, None, _RET_VAL.RET_LEN) for board in self.boards]
+
+    def _rets(self, replies: list) -> list[int]:
+        '''Track the RET_VAL read from each board, polling the busy ones, and return the worst'''
+        rets = []
+        for board, ret in zip(self.boards, replies):
+            if((ret is not None) and (len(ret) > 0) and (ret[0] & _RET_VAL.MASK_BUSY)):
+                ret = board._read_ret()
+            else:
+                board._track(ret)
+            rets.append(ret)
+        self.last_rets = rets
+        for ret in rets:
+            if((ret is None) or (len(ret) != _RET_VAL.RET_LEN) or (not ret[0] & _RET_VAL.MASK_WRITE_GOOD)):
+                return ret
+        return rets[0]
+
+    def _run(self, fn, names: tuple):
+        '''fn(proxy) with broadcast I/O, then the state it cached is handed to the boards'''
+        proxy = self._proxy
+        proxy._state.clear()
+        proxy._delay = max(board._delay for board in self.boards)
+        proxy._delay_i2c = max(board._delay_i2c for board in self.boards)
+        proxy._io = _Broadcaster(self)
+        try:
+            result = fn(proxy)
+        finally:
+            proxy._io = None
+        for board in self.boards:
+            board.invalidate(*names)
+            board._state.update(proxy._state)
+        return result
+
+    def _broadcast(self, name: str, *args):
+        with self._transaction():
+            if(name == 'mcu_reset'):
+                for board in self.boards:
+                    board.health.expect_reset()
+            try:
+                return self._run(lambda proxy: getattr(proxy, name)(*args), _BROADCAST[name])
+            except _Not_Broadcast:
+                self.fallbacks += 1
+            return [getattr(board, name)(*args) for board in self.boards]
+
+    def mcu_reset(self) -> None:
+        return self._broadcast('mcu_reset')
+
+    def base_band_loop_back_enable(self) -> None:
+        return self._broadcast('base_band_loop_back_enable')
+
+    def base_band_loop_back_disable(self) -> None:
+        return self._broadcast('base_band_loop_back_disable')
+
+    def nulling_up_set(self, dac_val_I: int, dac_val_Q: int) -> None:
+        return self._broadcast('nulling_up_set', dac_val_I, dac_val_Q)
+
+    def nulling_dn_set(self, dac_val_I: int, dac_val_Q: int) -> None:
+        return self._broadcast('nulling_dn_set', dac_val_I, dac_val_Q)
+
+    def synth_init(self) -> None:
+        return self._broadcast('synth_init')
+
+    def synth_reset(self) -> bool:
+        return self._broadcast('synth_reset')
+
+    def synth_set_Frequency_MHz(self, Freq_MHz) -> float:
+        '''
+        The frequency registers are broadcast, the calibration that follows reads R0 back
+        so it is triggered on each board. When the synths of the group would not be sent
+        the same register writes, each board is set on its own.
+        '''
+        with self._transaction():
+            # Each synth model works the registers out for itself and keeps its own state
+            results = [board._lmx._freq_writes(Freq_MHz) for board in self.boards]
+            real_freq_MHz, writes = results[0]
+            try:
+                if(any(result != results[0] for result in results[1:])):
+                    raise _Not_Broadcast()
+                self._run(lambda proxy: proxy._synth_write_many(writes), _SYNTH_STATE)
+            except _Not_Broadcast:
+                self.fallbacks += 1
+                return self.__getattr__('synth_set_Frequency_MHz')(Freq_MHz)[0]
+            for board in self.boards:
+                board._lmx.trigger_cal()
+                board._store('freq', real_freq_MHz)
+        if(real_freq_MHz != Freq_MHz):
+            print("WARNING: Requested Frequency is not exactly equal to the Real Frequency\n"
+                + "\tRequested Frequency = {} MHz\n".format(Freq_MHz)
+                + "\t     Real Frequency = {} MHz\n".format(real_freq_MHz))
+        return real_freq_MHz
+
+def broadcast(boards: list, verify_each=True) -> Broadcast_Group:
+    '''
+    Group IF boards of one base board so writes go to all of them in one SPI transaction,
+    initialising a stack then costs the traffic of one board
+        group = broadcast(if_boards(bb))
+        group.synth_init()
+        group.synth_set_Frequency_MHz(5000)
+    '''
+    return Broadcast_Group(boards, verify_each)
+
+def _transaction(method):
+    '''
+    Run the method as one transaction on the shared base board, other threads can use
+    other IF boards in between but not this one. Inside a batch() block the call is
+    deferred and a future of its result is returned instead.
+    '''
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if((self._batch is not None) and self._batch.deferred()):
+            return self._batch.defer(method, args, kwargs)
+        with self._bb.transaction(self._cs):
+            return method(self, *args, **kwargs)
+    return wrapper
+
+def _bulk_priority(method):
+    '''Run the method in the bulk priority class, so it gives way to control of other IF boards'''
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._bb.priority(PRIORITY.BULK):
+            return method(self, *args, **kwargs)
+    return wrapper
+
+def if_boards(base_board, dev_stack=None, debug=0) -> list:
+    '''
+    UMux_IF_Rev1 of every IF board in a DEV_STACK mask, lowest slot first. Empty slots get
+    no object, the list index is not the slot, see UMux_IF_Rev1.slot.
+        dev_stack : read from the base board when None
+        debug     : debug level of the new objects
+    '''
+    if(dev_stack is None):
+        dev_stack = base_board.spi_get_dev_stack() or 0
+    boards = []
+    for cs in base_board_rev3.chip_selects(dev_stack):
+        boards.append(UMux_IF_Rev1(base_board, cs))
+        boards[-1].debug = debug
+    return boards
+
 class UMux_IF_Rev1:
     def __init__(self, base_board, chip_select):
         self._cs = chip_select
         self._bb = base_board
+        self.slot = chip_select.bit_length() - 1    # Position in the stack, for a single board chip select
         self._dac_nbits = 14
         self.debug = 1
+        self.print_errors = True    # Print errors and warnings, off while a deferred call is recorded
         self.firmware_id = []
         self.unique_id = []
         self.board_serial_number = []
         self.eeprom = []
-        self._delay = 0.0
-        self._delay_i2c = 0.0
+        self.capabilities = None    # Capabilities of the MCU firmware, see probe_capabilities()
+        self.health = Board_Health(chip_select)     # Decoded from every RET_VAL read
+        self.health.subscribe(self._on_health)
+        # Write-through cache of the state the host sets, see _cached()
+        self.cache_max_age_s = None # Cached state older than this is read again, None for no limit, 0 turns it off
+        self.cache_hits = 0         # Reads served from the cache
+        self.writes_skipped = 0     # Writes that would not have changed anything
+        self._state = {}            # {name: (value, time.monotonic())}
+        self._hard_resets = base_board.hard_resets
+        self._batch = None          # Deferred_Batch open on this board, see batch()
+        self._io = None             # Stand-in for the board while a deferred call is recorded or replayed
+        self._delay = 0.0           # Wait before the first read of a RET_VAL
+        self._delay_i2c = 0.0       # Added for commands the MCU carries out over I2C
+        # A RET_VAL with MASK_BUSY is read again, first after busy_poll_s, then at twice the
+        # interval each time up to busy_poll_max_s, until busy_timeout_s has passed
+        self.busy_poll_s = 50e-6
+        self.busy_poll_max_s = 0.05
+        self.busy_timeout_s = 1.0
+        self.busy_polls = 0         # RET_VAL reads that found the MCU busy
+        self.busy_writes = 0        # Pipelined synth writes whose RET_VAL read busy, they are not read again
+        self.write_failures = 0     # Synth writes whose RET_VAL was lost or not good
         self._tmp = tmp275.TMP275(0x48)
-        self._lmx = lmx2592.LMX2592(self._synth_write_array, self._synth_read_array, 100)
+        self._lmx = lmx2592.LMX2592(self._synth_write_array, self._synth_read_array, 100,
+                                    self._synth_write_many, self._synth_read_many)
 
     def _write(self, data: list[int]) -> None:
+        if((self._io is not None) and self._io.write(data)):
+            return
         self._bb.spi_write(self._cs, data)
         if(self.debug):
-            print("uMux_IF_Rev1._write(): _cs={} data={}".format(self._cs, data))
+            print("uMux_IF_Rev1._write(): _cs={} data={} : {}".format(self._cs, list(data), commands.describe(data)))
 
     def _read(self, nBytes: int) -> list[int]:
+        if(self._io is not None):
+            ret = self._io.read(nBytes, 0.0)
+            if(ret is not _LIVE):
+                return ret
         ret = self._bb.spi_read(self._cs, nBytes)
         if(self.debug):
             print("uMux_IF_Rev1._read():  _cs={} nBytes={} ret={}".format(self._cs, nBytes, ret))
         return ret
 
+    def _print_error(self, msg: str):
+        if(self.print_errors):
+            print(msg)
+
+    def invalidate(self, *names):
+        '''Forget the cached state of names, all of it when none are given, the next access goes to the board'''
+        if(len(names) == 0):
+            self._state.clear()
+        for name in names:
+            self._state.pop(name, None)
+
+    def _cached(self, name: str, max_age_s=None):
+        '''
+        Cached value of name, None when the board has to be asked. The cache is dropped when
+        the base board has hard reset IF boards since it was filled.
+            max_age_s : None for cache_max_age_s
+        '''
+        if(self._hard_resets != self._bb.hard_resets):
+            self._hard_resets = self._bb.hard_resets
+            self.invalidate()
+        if(max_age_s is None):
+            max_age_s = self.cache_max_age_s
+        entry = self._state.get(name)
+        if((entry is None) or ((max_age_s is not None) and (time.monotonic() - entry[1] >= max_age_s))):
+            return None
+        return entry[0]
+
+    def _cache_hit(self, name: str, max_age_s=None):
+        '''_cached() for a read, counted in cache_hits'''
+        value = self._cached(name, max_age_s)
+        if(value is not None):
+            self.cache_hits += 1
+        return value
+
+    def _unchanged(self, name: str, value) -> bool:
+        '''Writing value would not change the cached state, counted in writes_skipped'''
+        if(self._cached(name) != value):
+            return False
+        self.writes_skipped += 1
+        return True
+
+    def _store(self, name: str, value):
+        '''Cache what was written to or read from the board, returns value'''
+        if(value is None):
+            self.invalidate(name)
+        else:
+            self._state[name] = (value, time.monotonic())
+        return value
+
+    def _cache_snapshot(self) -> tuple:
+        return (dict(self._state), self.cache_hits, self.writes_skipped, self.health._reset_expected)
+
+    def _cache_restore(self, snapshot: tuple):
+        self._state, self.cache_hits, self.writes_skipped, self.health._reset_expected = snapshot
+        self._state = dict(self._state)
+
+    def batch(self) -> Deferred_Batch:
+        '''
+        Defer the calls made on this board inside a with block, each returns a future and
+        they all go out when the block exits, in as few base board round trips as the
+        firmware allows, see Base_Board_Rev3.spi_batch(). Calls that read data back, gets
+        and synth read-modify-writes, end a round trip at the read. The futures are only
+        done once the block has exited.
+            with ifb.batch() as b:
+                b.nulling_up_set(100, 200)
+                freq = b.synth_set_Frequency_MHz(5000)
+            print(freq.result())
+        A batch already open on the board is returned when batch() is called inside it.
+        '''
+        if(self._batch is None):
+            self._batch = Deferred_Batch(self)
+        return self._batch
+
+    def _on_health(self, health, event, status):
+        if(event == HEALTH_EVENT.MCU_RESET):
+            self.invalidate()
+
+    def _track(self, ret: list[int]) -> list[int]:
+        '''Feed the status byte of a RET_VAL to the board health, returns ret'''
+        if((self._io is not None) and (not self._io.track)):
+            return ret
+        if((ret is not None) and (len(ret) == _RET_VAL.RET_LEN)):
+            self.health.update(ret[0])
+        return ret
+
+    def _read_ret(self, delay=0.0, timeout_s=None) -> list[int]:
+        '''
+        Read the RET_VAL of the command just written, once the MCU has carried it out.
+        While the MCU reports MASK_BUSY the RET_VAL is read again with exponential backoff,
+        so the wait follows the actual processing time of the command.
+            delay     : wait before the first read
+            timeout_s : give up after this long, busy_timeout_s when None
+        Returns the last RET_VAL read, still BUSY on timeout, None when the read was lost.
+        '''
+        if(timeout_s is None):
+            timeout_s = self.busy_timeout_s
+        if(self._io is not None):
+            ret = self._io.read(_RET_VAL.RET_LEN, delay)
+            if((ret is not _LIVE) and ((ret is None) or (len(ret) == 0) or (not ret[0] & _RET_VAL.MASK_BUSY))):
+                return self._track(ret)
+        if(delay > 0):
+            time.sleep(delay)
+        deadline = time.monotonic() + timeout_s
+        interval = self.busy_poll_s
+        while(True):
+            ret = self._read(_RET_VAL.RET_LEN)
+            if((ret is None) or (len(ret) == 0) or (not ret[0] & _RET_VAL.MASK_BUSY)):
+                return self._track(ret)
+            self.busy_polls += 1
+            wait = min(interval, deadline - time.monotonic())
+            if(wait <= 0):
+                self._print_error("\tERROR: IF board _cs={} still busy after {} s".format(self._cs, timeout_s))
+                return self._track(ret)
+            time.sleep(wait)
+            interval = min(interval * 2, self.busy_poll_max_s)
+
+    def _command(self, cmd: commands.Command, *values) -> tuple:
+        '''
+        Write a command of the commands table and decode its RET_VAL, waiting _delay first,
+        and _delay_i2c too for commands the MCU carries out over I2C
+        Returns (status, reply fields...), status 0 when the RET_VAL was lost
+        '''
+        self._write(cmd.encode(*values))
+        return cmd.decode(self._read_ret(self._delay + self._delay_i2c if(cmd.i2c) else self._delay))
+
+    def _query_command(self, cmd: commands.Command, *values) -> tuple:
+        '''_command() for reads, sent again when the base board loses the exchange, see _query()'''
+        return cmd.decode(self._query(cmd.encode(*values), self._delay + self._delay_i2c if(cmd.i2c) else self._delay))
+
+    @_transaction
+    def _write_read_ret_nowait(self, data: list[int], callback) -> None:
+        '''
+        Queue the command and the read of its RET_VAL on the base board pipeline,
+        callback(ret) is called once the RET_VAL has been read back
+        '''
+        self._bb.spi_write_nowait(self._cs, data)
+        self._bb.spi_read_nowait(self._cs, _RET_VAL.RET_LEN, lambda fut: callback(self._track(fut.result())))
+        if(self.debug):
+            print("uMux_IF_Rev1._write_read_ret_nowait(): _cs={} data={}".format(self._cs, data))
+
+    @_transaction
+    def _query(self, cmd_array: list[int], delay: float) -> list[int]:
+        '''
+        Send a read command and return its RET_VAL. Reads leave the IF board as it was, so
+        when the base board loses the exchange the command is sent again. None once
+        the base board retries run out.
+        '''
+        for attempt in range(self._bb.max_retries + 1):
+            self._write(cmd_array)
+            ret = self._read_ret(delay)
+            if((ret is not None) and (len(ret) == _RET_VAL.RET_LEN)):
+                return ret
+        return None
+
+    @_transaction
+    def _query_bulk(self, cmd_array: list[int]) -> list[int]:
+        '''_query() for reads whose RET_VAL announces the size of the data that follows'''
+        for attempt in range(self._bb.max_retries + 1):
+            ret = self._query(cmd_array, self._delay)
+            if(ret is None):
+                return None
+            if(ret[0] & _RET_VAL.MASK_READ_GOOD != _RET_VAL.MASK_READ_GOOD):
+                self._print_error("Failed to understand command, RET_VAL is not READ_GOOD")
+                return None
+            data = self._read(ret[1])
+            if((data is not None) and (len(data) == ret[1])):
+                return data
+        return None
+
     def _write_read(self, nBytes_read: int, data: list[int]) -> list[int]:
+        if(self._io is not None):
+            self._io.direct()
         ret = self._bb.spi_write_read(self._cs, nBytes_read, data)
         if(self.debug):
             print("uMux_IF_Rev1._write_read(): _cs={} nBytes={}\n\tdata={}\n\tret={}" \
                   .format(self._cs, nBytes_read, data, ret))
         return ret
 
+    @_transaction
     def mcu_reset(self) -> None:
-        data = [0x00] * _CMD.CMD_LEN
-        data[0] = (_CMD.FW_SOFT_RST << 1) | _CMD.W
-        data[1] = 0x55
-        data[2] = 0x44
-        data[3] = 0x33
-        data[4] = 0x22
-        self._write(data)
+        self.health.expect_reset()
+        self.invalidate()
+        self._write(_CMDS['FW_SOFT_RST', _CMD.W].encode(0x55443322))
         return None
 
+    @_transaction
     def base_band_loop_back_enable(self) -> None:
-        data = [0x00] * _CMD.CMD_LEN
-        data[0] = (_CMD.FW_BB_LB << 1) | _CMD.W
-        data[1] = 0x01
-        self._write(data)
-        time.sleep(self._delay)
-        ret = self._read(_RET_VAL.RET_LEN)
-        if(ret[0] & _RET_VAL.MASK_WRITE_GOOD):
+        if(self._unchanged('loopback', True)):
+            return
+        status, = self._command(_CMDS['FW_BB_LB', _CMD.W], 0x01)
+        if(status & _RET_VAL.MASK_WRITE_GOOD):
+            self._store('loopback', True)
             return
         else:
-            print("Write Failed")
+            self.invalidate('loopback')
+            self._print_error("Write Failed")
 
+    @_transaction
     def base_band_loop_back_disable(self) -> None:
-        data = [0x00] * _CMD.CMD_LEN
-        data[0] = (_CMD.FW_BB_LB << 1) | _CMD.W
-        data[1] = 0x00
-        self._write(data)
-        time.sleep(self._delay)
-        ret = self._read(_RET_VAL.RET_LEN)
-        if(ret[0] & _RET_VAL.MASK_WRITE_GOOD):
+        if(self._unchanged('loopback', False)):
+            return
+        status, = self._command(_CMDS['FW_BB_LB', _CMD.W], 0x00)
+        if(status & _RET_VAL.MASK_WRITE_GOOD):
+            self._store('loopback', False)
             return
         else:
-            print("Write Failed")
+            self.invalidate('loopback')
+            self._print_error("Write Failed")
 
-    def base_band_loop_back_get(self) -> bool:
-        data = [0x00] * _CMD.CMD_LEN
-        data[0] = (_CMD.FW_BB_LB << 1) | _CMD.R
-        self._write(data)
-        time.sleep(self._delay)
-        ret = self._read(_RET_VAL.RET_LEN)
-        if(ret[0] & _RET_VAL.MASK_READ_GOOD):
-            if(ret[1] == 0x01):
-                return True
-            elif(ret[1] == 0x00):
-                return False
+    @_transaction
+    def base_band_loop_back_get(self, max_age_s=None) -> bool:
+        cached = self._cache_hit('loopback', max_age_s)
+        if(cached is not None):
+            return cached
+        status, enable = self._command(_CMDS['FW_BB_LB', _CMD.R])
+        if(status & _RET_VAL.MASK_READ_GOOD):
+            if(enable == 0x01):
+                return self._store('loopback', True)
+            elif(enable == 0x00):
+                return self._store('loopback', False)
         else:
-            print("Write Failed")
+            self._print_error("Write Failed")
 
+    @_transaction
     def nulling_up_set(self, dac_val_I: int, dac_val_Q: int) -> None:
         if(dac_val_I > 2**self._dac_nbits):
-            print("Value too high: dac_val_I")
+            self._print_error("Value too high: dac_val_I")
             return
         elif(dac_val_I < 0):
             return
 
         if(dac_val_Q > 2**self._dac_nbits):
-            print("Value too high: dac_val_I")
+            self._print_error("Value too high: dac_val_I")
             return
         elif(dac_val_Q < 0):
             return
 
-        data = [0x00] * _CMD.CMD_LEN
-        temp_int = dac_val_I << 2
-        data[0] = (_CMD.NULLING_UP << 1) | _CMD.W
-        data[1] = (temp_int & 0xFF00) >> 8
-        data[2] = (temp_int & 0x00FF) >> 0
-        temp_int = dac_val_Q << 2
-        data[3] = (temp_int & 0xFF00) >> 8
-        data[4] = (temp_int & 0x00FF) >> 0
-        self._write(data)
-        time.sleep(self._delay)
-        ret = self._read(_RET_VAL.RET_LEN)
-        if(ret[0] & _RET_VAL.MASK_WRITE_GOOD):
+        if(self._unchanged('nulling_up', (dac_val_I, dac_val_Q))):
+            return
+        # The DACs take 14 bits, left justified in the 16 bit fields
+        status, = self._command(_CMDS['NULLING_UP', _CMD.W], (dac_val_I << 2) & 0xFFFF, (dac_val_Q << 2) & 0xFFFF)
+        if(status & _RET_VAL.MASK_WRITE_GOOD):
+            self._store('nulling_up', (dac_val_I, dac_val_Q))
             return
         else:
-            print("Write Failed")
+            self.invalidate('nulling_up')
+            self._print_error("Write Failed")
     
-    def nulling_up_get(self) -> tuple[int, int]:
-        data = [0x00] * _CMD.CMD_LEN
-        data[0] = (_CMD.NULLING_UP << 1) | _CMD.R
-        self._write(data)
-        time.sleep(self._delay)
-        ret = self._read(_RET_VAL.RET_LEN)
-        if(ret[0] & _RET_VAL.MASK_READ_GOOD):
-            dac_val_I = ((ret[1] << 8) | ret[2]) >> 2
-            dac_val_Q = ((ret[3] << 8) | ret[4]) >> 2
-            return (dac_val_I, dac_val_Q)
+    @_transaction
+    def nulling_up_get(self, max_age_s=None) -> tuple[int, int]:
+        cached = self._cache_hit('nulling_up', max_age_s)
+        if(cached is not None):
+            return cached
+        status, dac_val_I, dac_val_Q = self._command(_CMDS['NULLING_UP', _CMD.R])
+        if(status & _RET_VAL.MASK_READ_GOOD):
+            return self._store('nulling_up', (dac_val_I >> 2, dac_val_Q >> 2))
         else:
-            print("Write Failed")
+            self._print_error("Write Failed")
             return (None, None)
 
+    @_transaction
     def nulling_dn_set(self, dac_val_I: int, dac_val_Q: int) -> None:
         if(dac_val_I > (2**self._dac_nbits - 1)):
-            print("Value too high: dac_val_I")
+            self._print_error("Value too high: dac_val_I")
             return
         elif(dac_val_I < 0):
             pass
 
         if(dac_val_Q > 2**self._dac_nbits):
-            print("Value too high: dac_val_Q")
+            self._print_error("Value too high: dac_val_Q")
             return
         elif(dac_val_Q < 0):
             pass
 
-        data = [0x00] * _CMD.CMD_LEN
-        temp_int = dac_val_I << 2
-        data[0] = (_CMD.NULLING_DN << 1) | _CMD.W
-        data[1] = (temp_int & 0xFF00) >> 8
-        data[2] = (temp_int & 0x00FF) >> 0
-        temp_int = dac_val_Q << 2
-        data[3] = (temp_int & 0xFF00) >> 8
-        data[4] = (temp_int & 0x00FF) >> 0
-        self._write(data)
-        time.sleep(self._delay)
-        ret = self._read(_RET_VAL.RET_LEN)
-        if(ret[0] & _RET_VAL.MASK_WRITE_GOOD):
+        if(self._unchanged('nulling_dn', (dac_val_I, dac_val_Q))):
+            return
+        # The DACs take 14 bits, left justified in the 16 bit fields
+        status, = self._command(_CMDS['NULLING_DN', _CMD.W], (dac_val_I << 2) & 0xFFFF, (dac_val_Q << 2) & 0xFFFF)
+        if(status & _RET_VAL.MASK_WRITE_GOOD):
+            self._store('nulling_dn', (dac_val_I, dac_val_Q))
             return
         else:
-            print("Write Failed")
+            self.invalidate('nulling_dn')
+            self._print_error("Write Failed")
 
-    def nulling_dn_get(self) -> tuple[int, int]:
-        data = [0x00] * _CMD.CMD_LEN
-        data[0] = (_CMD.NULLING_DN << 1) | _CMD.R
-        self._write(data)
-        time.sleep(self._delay)
-        ret = self._read(_RET_VAL.RET_LEN)
-        if(ret[0] & _RET_VAL.MASK_READ_GOOD):
-            dac0 = ((ret[1] << 8) | ret[2]) >> 2
-            dac1 = ((ret[3] << 8) | ret[4]) >> 2
-            return (dac0, dac1)
+    @_transaction
+    def nulling_dn_get(self, max_age_s=None) -> tuple[int, int]:
+        cached = self._cache_hit('nulling_dn', max_age_s)
+        if(cached is not None):
+            return cached
+        status, dac0, dac1 = self._command(_CMDS['NULLING_DN', _CMD.R])
+        if(status & _RET_VAL.MASK_READ_GOOD):
+            return self._store('nulling_dn', (dac0 >> 2, dac1 >> 2))
         else:
-            print("Write Failed")
+            self._print_error("Write Failed")
             return(None, None)
 
+    @_transaction
     def synth_init(self) -> None:
-        data = [0x00] * _CMD.CMD_LEN
-        data[0] = (_CMD.SYNTH_INIT << 1) | _CMD.W
-        self._write(data)
-        time.sleep(self._delay)
-        ret = self._read(_RET_VAL.RET_LEN)
-        if(ret[0] & _RET_VAL.MASK_WRITE_GOOD):
+        status, = self._command(_CMDS['SYNTH_INIT', _CMD.W])
+        if(status & _RET_VAL.MASK_WRITE_GOOD):
             pass
         else:
-            print("Write Failed")
+            self._print_error("Write Failed")
             return
+        self.invalidate(*_SYNTH_STATE)
         self._lmx.synth_init()
+        # register writes may still be in flight on the base board pipeline
+        self._bb.drain()
 
+    @_transaction
     def synth_lock_status(self) -> bool:
-        data = [0x00] * _CMD.CMD_LEN
-        data[0] = (_CMD.SYNTH_SR << 1) | _CMD.R
-        self._write(data)
-        time.sleep(self._delay)
-        ret = self._read(_RET_VAL.RET_LEN)
-        if(ret[0] & _RET_VAL.MASK_READ_GOOD):
-            if(ret[1] == 0xFF):
+        status, locked = self._query_command(_CMDS['SYNTH_SR', _CMD.R])
+        if(status & _RET_VAL.MASK_READ_GOOD):
+            if(locked == 0xFF):
                 return True
             else:
                 return False
         else:
-            print("Write Failed")
+            self._print_error("Write Failed")
             return None
 
+    @_transaction
     def synth_reset(self):
-        data = [0x00] * _CMD.CMD_LEN
-        data[0] = (_CMD.SYNTH_RST << 1) | _CMD.W
-        self._write(data)
-        time.sleep(self._delay)
-        ret = self._read(_RET_VAL.RET_LEN)
-        if(ret[0] & _RET_VAL.MASK_WRITE_GOOD):
+        self.invalidate(*_SYNTH_STATE)
+        status, = self._command(_CMDS['SYNTH_RST', _CMD.W])
+        if(status & _RET_VAL.MASK_WRITE_GOOD):
             return True
         else:
-            print("Write Failed")
+            self._print_error("Write Failed")
             return False
 
-    def synth_get_Frequency_MHz(self) -> float:
+    @_transaction
+    def synth_get_Frequency_MHz(self, max_age_s=None) -> float:
+        cached = self._cache_hit('freq', max_age_s)
+        if(cached is not None):
+            return cached
         real_freq_MHz = self._lmx.get_Frequency_MHz()
-        return real_freq_MHz
+        return self._store('freq', real_freq_MHz)
 
+    @_transaction
     def synth_set_Frequency_MHz(self, Freq_MHz) -> float:
+        '''
+        Always retunes and recalibrates the synth, setting the frequency it is already at
+        again is how a relock is forced. Only synth_get_Frequency_MHz() uses the cache.
+        '''
         real_freq_MHz = self._lmx.set_Frequency_MHz(Freq_MHz)
         if(real_freq_MHz != Freq_MHz):
-            print("WARNING: Requested Frequency is not exactly equal to the Real Frequency\n"
+            self._print_error("WARNING: Requested Frequency is not exactly equal to the Real Frequency\n"
                 + "\tRequested Frequency = {} MHz\n".format(Freq_MHz)
                 + "\t     Real Frequency = {} MHz\n".format(real_freq_MHz))
-        return real_freq_MHz
+        return self._store('freq', real_freq_MHz)
 
+    @_transaction
     def synth_powerdown_bit(self) -> None:
+        if(self._unchanged('powerdown', True)):
+            return
         self._lmx.powerdown_bit()
+        self._store('powerdown', True)
 
+    @_transaction
     def synth_powerup_bit(self) -> None:
+        if(self._unchanged('powerdown', False)):
+            return
         self._lmx.powerup_bit()
+        self._store('powerdown', False)
 
-    def synth_powerdown_get(self) -> bool:
-        return self._lmx.powerdown_get()
+    @_transaction
+    def synth_powerdown_get(self, max_age_s=None) -> bool:
+        cached = self._cache_hit('powerdown', max_age_s)
+        if(cached is not None):
+            return cached
+        return self._store('powerdown', self._lmx.powerdown_get())
 
+    @_bulk_priority
+    @_transaction
     def synth_reg_dump(self, print_to_console_only = False):
-        cmd_array = [0x00] * _CMD.CMD_LEN
-        cmd_array[0] = (_CMD.SYNTH_REG_DUMP << 1) | _CMD.R
-        self._write(cmd_array)
-        time.sleep(self._delay)
-        ret = self._read(_RET_VAL.RET_LEN)
-        if(ret[0] & _RET_VAL.MASK_READ_GOOD != _RET_VAL.MASK_READ_GOOD):
-            print("Failed to understand command, RET_VAL is not READ_GOOD")
+        status, reg_dump_size = self._command(_CMDS['SYNTH_REG_DUMP', _CMD.R])
+        if(status & _RET_VAL.MASK_READ_GOOD != _RET_VAL.MASK_READ_GOOD):
+            self._print_error("Failed to understand command, RET_VAL is not READ_GOOD")
             return None
-        reg_dump_size = ret[1]
         ret = self._read(reg_dump_size)
 
         ret = np.reshape(ret, (-1, 3))
@@ -318,199 +1094,264 @@ class UMux_IF_Rev1:
         else:
             return ret
 
+    @_transaction
     def _synth_write_int(self, data: int) -> None:
-        array = [0x0] * _CMD.CMD_LEN
-        array[0] = (_CMD.SYNTH_WRITE << 1) | _CMD.W
-        array[1] = (data >> 16) & 0xFF
-        array[2] = (data >> 8) & 0xFF
-        array[3] = (data >> 0) & 0xFF
-        self._write(array)
-        time.sleep(self._delay)
-        ret = self._read(_RET_VAL.RET_LEN)
-        if(ret[0] & _RET_VAL.MASK_WRITE_GOOD):
+        self.invalidate(*_SYNTH_STATE)
+        status, = self._command(_CMDS['SYNTH_WRITE', _CMD.W], (data >> 16) & 0xFF, (data & 0xFFFF).to_bytes(2, 'big'))
+        if(status & _RET_VAL.MASK_WRITE_GOOD):
             return
         else:
-            print("_synth_write_int Failed : \n"
+            self._print_error("_synth_write_int Failed : \n"
                 + "\t _cs={}\n".format(self._cs)
                 + "\tdata=0x{}\n".format(data)
-                + "\t ret=0x{}\n".format(ret))
+                + "\t ret=0x{}\n".format(status))
 
+    @_transaction
     def _synth_write_array(self, data: list[int]) -> None:
-        array = [0x0] * _CMD.CMD_LEN
-        array[0] = (_CMD.SYNTH_WRITE << 1) | _CMD.W
-        array[1] = data[0]
-        array[2] = data[1]
-        array[3] = data[2]
-        self._write(array)
-        time.sleep(self._delay)
-        ret = self._read(_RET_VAL.RET_LEN)
-        if(ret[0] & _RET_VAL.MASK_WRITE_GOOD):
-            return
-        else:
-            print("_synth_write_array Failed : \n"
+        self.invalidate(*_SYNTH_STATE)
+        array = _CMDS['SYNTH_WRITE', _CMD.W].encode(data[0], bytes(data[1:3]))
+
+        def check(ret):
+            # Pipelined, this runs on the thread that drains the base board, so it must not raise
+            if((ret is not None) and (len(ret) > 0)):
+                if(ret[0] & _RET_VAL.MASK_BUSY):
+                    # Not read again, the MCU was still carrying the write out
+                    self.busy_writes += 1
+                    self._print_error("\tWARNING: IF board _cs={} still busy after the synth write {}".format(self._cs, data))
+                    return
+                if(ret[0] & _RET_VAL.MASK_WRITE_GOOD):
+                    return
+            self.write_failures += 1
+            self._print_error("_synth_write_array Failed : \n"
                 + "\t  _cs={}\n".format(self._cs)
                 + "\t data={}\n".format(data)
                 + "\tarray={}\n".format(array)
                 + "\t  ret={}\n".format(ret))
 
-    def _synth_read_array(self, reg: int) -> list[int]:
-        array = [0x0] * _CMD.CMD_LEN
-        array[0] = (_CMD.SYNTH_WRITE << 1) | _CMD.R
-        array[1] = reg & 0xFF
+        # With a pipelined base board there is no need to wait on each register write
+        if((self._bb.pipeline_depth > 1) & (self._delay == 0) & (self._io is None)):
+            self._write_read_ret_nowait(array, check)
+            return
+
         self._write(array)
-        time.sleep(self._delay)
-        ret = self._read(_RET_VAL.RET_LEN)
-        if(ret[0] & _RET_VAL.MASK_READ_GOOD):
-            return ret[1:3]
-        else:
-            print("_synth_read_array Failed : \n"
+        check(self._read_ret(self._delay))
+
+    @_transaction
+    def _commands_batch(self, cmds: list) -> list:
+        '''
+        Send the commands, each followed by the read of its RET_VAL, as one base board
+        batch, see Base_Board_Rev3.spi_batch(). Returns the RET_VALs, None for a lost one.
+        '''
+        if(isinstance(self._io, _Broadcaster)):
+            return self._io.commands(cmds)
+        if(self._io is not None):
+            # Recorded or replayed one command at a time, inside a batch() block they share its round trip
+            rets = []
+            for cmd in cmds:
+                self._write(cmd)
+                rets.append(self._read_ret())
+            return rets
+        transactions = []
+        for cmd in cmds:
+            transactions.append((self._cs, cmd, 0))
+            transactions.append((self._cs, None, _RET_VAL.RET_LEN))
+        rets = self._bb.spi_batch(transactions)[1::2]
+        if(self.debug):
+            print("uMux_IF_Rev1._commands_batch(): _cs={} commands={}".format(self._cs, len(cmds)))
+        return [self._track(ret) for ret in rets]
+
+    @_transaction
+    def _synth_write_many(self, writes: list) -> None:
+        '''_synth_write_array() of every write, batched when the MCU needs no delay to answer'''
+        self.invalidate(*_SYNTH_STATE)
+        if(self._delay != 0):
+            for data in writes:
+                self._synth_write_array(data)
+            return
+        cmd = _CMDS['SYNTH_WRITE', _CMD.W]
+        cmds = [cmd.encode(data[0], bytes(data[1:3])) for data in writes]
+        for data, ret in zip(writes, self._commands_batch(cmds)):
+            if((ret is None) or (not ret[0] & _RET_VAL.MASK_WRITE_GOOD)):
+                self._print_error("_synth_write_many Failed : \n"
+                    + "\t  _cs={}\n".format(self._cs)
+                    + "\t data={}\n".format(data)
+                    + "\t  ret={}\n".format(ret))
+
+    @_transaction
+    def _synth_read_many(self, regs: list) -> list:
+        '''_synth_read_array() of every register, batched when the MCU needs no delay to answer'''
+        if(self._delay != 0):
+            return [self._synth_read_array(reg) for reg in regs]
+        cmd = _CMDS['SYNTH_WRITE', _CMD.R]
+        cmds = [cmd.encode(reg & 0xFF) for reg in regs]
+        values = []
+        for reg, ret in zip(regs, self._commands_batch(cmds)):
+            status, value = cmd.decode(ret)
+            if(status & _RET_VAL.MASK_READ_GOOD):
+                values.append(list(value))
+                continue
+            self._print_error("_synth_read_many Failed : \n"
                 + "\t  _cs={}\n".format(self._cs)
                 + "\t  reg={}\n".format(reg)
-                + "\tarray={}\n".format(array)
                 + "\t  ret={}\n".format(ret))
+            values.append(None)
+        return values
+
+    @_transaction
+    def _synth_read_array(self, reg: int) -> list[int]:
+        status, value = self._command(_CMDS['SYNTH_WRITE', _CMD.R], reg & 0xFF)
+        if(status & _RET_VAL.MASK_READ_GOOD):
+            return list(value)
+        else:
+            self._print_error("_synth_read_array Failed : \n"
+                + "\t  _cs={}\n".format(self._cs)
+                + "\t  reg={}\n".format(reg)
+                + "\tstatus={}\n".format(status))
 
+    @_transaction
     def _synth_read_int(self, reg: int) -> int:
-        array = [0x0] * _CMD.CMD_LEN
-        array[0] = (_CMD.SYNTH_WRITE << 1) | _CMD.R
-        array[1] = reg & 0xFF
-        self._write(array)
-        time.sleep(self._delay)
-        ret = self._read(_RET_VAL.RET_LEN)
-        if(ret[0] & _RET_VAL.MASK_READ_GOOD):
-            return int((ret[1] << 8) | ret[2])
+        status, value = self._command(_CMDS['SYNTH_WRITE', _CMD.R], reg & 0xFF)
+        if(status & _RET_VAL.MASK_READ_GOOD):
+            return int.from_bytes(value, 'big')
         else:
-            print("_synth_read_int Failed : \n"
+            self._print_error("_synth_read_int Failed : \n"
                 + "\t _cs={}\n".format(self._cs)
                 + "\t reg={}\n".format(reg)
-                + "\t ret={}\n".format(ret))
+                + "\t ret={}\n".format(status))
             return []
 
+    @_transaction
     def read_temperatures_F(self) -> tuple[float, float]:
-        array = [0x00] * _CMD.CMD_LEN
-        array[0] = (_CMD.TEMP_READ << 1) | _CMD.R
-        self._write(array)
-        time.sleep(self._delay + self._delay_i2c)
-        ret = self._read(_RET_VAL.RET_LEN)
-        if(ret[0] & _RET_VAL.MASK_READ_GOOD):
-            synth_temp_F = self._tmp.convert_int2temp_F(ret[1:3])
-            mcu_temp_F = self._tmp.convert_int2temp_F(ret[3:5])
+        status, synth, mcu = self._query_command(_CMDS['TEMP_READ', _CMD.R])
+        if(status & _RET_VAL.MASK_READ_GOOD):
+            synth_temp_F = self._tmp.convert_int2temp_F(synth)
+            mcu_temp_F = self._tmp.convert_int2temp_F(mcu)
             return (synth_temp_F, mcu_temp_F)
         else:
-            print("Read Local Tempereatures Failed")
+            self._print_error("Read Local Tempereatures Failed")
             return (None, None)
 
+    @_transaction
     def read_temperatures_C(self) -> tuple[float, float]:
-        array = [0x00] * _CMD.CMD_LEN
-        array[0] = (_CMD.TEMP_READ << 1) | _CMD.R
-        self._write(array)
-        time.sleep(self._delay + self._delay_i2c)
-        ret = self._read(_RET_VAL.RET_LEN)
-        if(ret[0] & _RET_VAL.MASK_READ_GOOD):
-            synth_temp_F = self._tmp.convert_int2temp_C(ret[1:3])
-            mcu_temp_F = self._tmp.convert_int2temp_C(ret[3:5])
+        status, synth, mcu = self._query_command(_CMDS['TEMP_READ', _CMD.R])
+        if(status & _RET_VAL.MASK_READ_GOOD):
+            synth_temp_F = self._tmp.convert_int2temp_C(synth)
+            mcu_temp_F = self._tmp.convert_int2temp_C(mcu)
             return (synth_temp_F, mcu_temp_F)
         else:
-            print("Read Local Tempereatures Failed")
+            self._print_error("Read Local Tempereatures Failed")
             return (None, None)
 
+    @_bulk_priority
+    @_transaction
     def spi_loopback(self, nBytes: int, nItter: int) -> int:
         import random
         if(nBytes > 255):
-            print("nBytes can not be greater than 255")
+            self._print_error("nBytes can not be greater than 255")
 
         failed_compares = 0
 
-        cmd_array = [0x00] * _CMD.CMD_LEN
-        cmd_array[0] = (_CMD.SPI_LOOPBACK << 1) | _CMD.W
-        cmd_array[1] = nBytes
-        self._write(cmd_array)
-        time.sleep(self._delay)
-        ret = self._read(_RET_VAL.RET_LEN)
-        if(ret[0] & _RET_VAL.MASK_WRITE_GOOD != 1):
-            print("Failed to understand command, RET_VAL is not WRITE_GOOD")
+        status, = self._command(_CMDS['SPI_LOOPBACK', _CMD.W], nBytes & 0xFF)
+        if(status & _RET_VAL.MASK_WRITE_GOOD != 1):
+            self._print_error("Failed to understand command, RET_VAL is not WRITE_GOOD")
             return None
         
-        data_array = [random.randint(0, 255) for p in range(0, nBytes)]
-        data_array[0] = (_CMD.SPI_LOOPBACK << 1) | _CMD.W
+        # bytearrays go straight through the base board hex codec
+        data_array = bytearray(random.randbytes(nBytes))
+        data_array[0] = _CMDS['SPI_LOOPBACK', _CMD.W].code
         time.sleep(self._delay)
         ret = self._write_read(nBytes, data_array)
         i = 0
         while(i <= nItter):
             prev_data = data_array
             prev_data[0] = _RET_VAL.MASK_WRITE_GOOD
-            data_array = [random.randint(0, 255) for p in range(0, nBytes)]
-            data_array[0] = (_CMD.SPI_LOOPBACK << 1) | _CMD.W
+            data_array = bytearray(random.randbytes(nBytes))
+            data_array[0] = _CMDS['SPI_LOOPBACK', _CMD.W].code
             ret = self._write_read(nBytes, data_array)
             if(self.debug):
                 print("\tprev_data={}\n\tret_data={}".format(prev_data, ret))
-            if(prev_data != ret):
+            if((ret is None) or (prev_data != bytes(ret))):
                 failed_compares += 1
             i += 1
         
         prev_data = data_array
         prev_data[0] = _RET_VAL.MASK_WRITE_GOOD
-        data_array = [random.randint(0, 255) for p in range(0, nBytes)]
-        data_array[0] = (_CMD.NULL << 1) | _CMD.W
+        data_array = bytearray(random.randbytes(nBytes))
+        data_array[0] = _CMDS['NULL', _CMD.W].code
         ret = self._write_read(nBytes, data_array)
         if(self.debug):
             print("\tprev_data={}\n\tret_data={}".format(prev_data, ret))
-        if(prev_data != ret):
+        if((ret is None) or (prev_data != bytes(ret))):
             failed_compares += 1
 
         return failed_compares
 
+    @_transaction
+    def probe_capabilities(self, refresh=False) -> Capabilities:
+        '''
+        Find which optional opcodes (_OPTIONAL_CMDS) the MCU firmware answers, by sending
+        each as a read and checking the RET_VAL for MASK_INVALID_CMD. Cached by firmware
+        ID and board serial number like the base board capabilities.
+            refresh : probe again even when cached
+        '''
+        fwid = self.firmware_id if(len(self.firmware_id) > 0) else self.read_FWID()
+        bsn = self.board_serial_number if(len(self.board_serial_number) > 0) else self.read_BSN()
+        if((fwid is None) or (bsn is None)):
+            self._print_error("\tERROR: probe_capabilities could not identify the IF board on _cs={}".format(self._cs))
+            return None
+        key = 'ifb:' + bytes(fwid).hex() + '|' + bytes(bsn).hex()
+        caps = None if(refresh) else capabilities.lookup(key)
+        if(caps is None):
+            start = time.perf_counter()
+            caps = Capabilities(key)
+            for name in _OPTIONAL_CMDS:
+                with self.health.expected(_RET_VAL.MASK_INVALID_CMD):
+                    status, = self._query_command(_CMDS[name, _CMD.R])
+                caps.commands[name] = ((not status & _RET_VAL.MASK_INVALID_CMD)
+                                       and (status & _RET_VAL.MASK_READ_GOOD != 0))
+            caps.probe_s = time.perf_counter() - start
+            caps.probed_at = time.strftime('%Y-%m-%dT%H:%M:%S')
+            capabilities.store(caps)
+        self.capabilities = caps
+        return caps
+
+    def supports(self, command: str) -> bool:
+        '''Whether the MCU firmware implements an optional opcode, probed on first use'''
+        if(self.capabilities is None):
+            if(self.probe_capabilities() is None):
+                return False
+        return self.capabilities.supports(command)
+
+    @_transaction
     def read_FWID(self):
-        cmd_array = [0x00] * _CMD.CMD_LEN
-        cmd_array[0] = (_CMD.FW_ID << 1) | _CMD.R
-        self._write(cmd_array)
-        time.sleep(self._delay)
-        ret = self._read(_RET_VAL.RET_LEN)
-        if(ret[0] & _RET_VAL.MASK_READ_GOOD != _RET_VAL.MASK_READ_GOOD):
-            print("Failed to understand command, RET_VAL is not READ_GOOD")
+        ret = self._query_bulk(_CMDS['FW_ID', _CMD.R].encode())
+        if(ret is None):
             return None
-        fwid_size = ret[1]   # Firmware returns the CID size (96 Bits, 12 bytes, 3 words)
-        ret = self._read(fwid_size)
         self.firmware_id = ret
         return ret
 
+    @_transaction
     def read_CID(self):
-        cmd_array = [0x00] * _CMD.CMD_LEN
-        cmd_array[0] = (_CMD.FW_CID << 1) | _CMD.R
-        self._write(cmd_array)
-        time.sleep(self._delay)
-        ret = self._read(_RET_VAL.RET_LEN)
-        if(ret[0] & _RET_VAL.MASK_READ_GOOD != _RET_VAL.MASK_READ_GOOD):
-            print("Failed to understand command, RET_VAL is not READ_GOOD")
+        ret = self._query_bulk(_CMDS['FW_CID', _CMD.R].encode())
+        if(ret is None):
             return None
-        cid_size = ret[1]   # Firmware returns the CID size (96 Bits, 12 bytes, 3 words)
-        ret = self._read(cid_size)
         self.unique_id = ret
         return ret
 
+    @_transaction
     def read_BSN(self):
-        cmd_array = [0x00] * _CMD.CMD_LEN
-        cmd_array[0] = (_CMD.FW_BSN << 1) | _CMD.R
-        self._write(cmd_array)
-        time.sleep(self._delay)
-        ret = self._read(_RET_VAL.RET_LEN)
-        if(ret[0] & _RET_VAL.MASK_READ_GOOD != _RET_VAL.MASK_READ_GOOD):
-            print("Failed to understand command, RET_VAL is not READ_GOOD")
+        ret = self._query_bulk(_CMDS['FW_BSN', _CMD.R].encode())
+        if(ret is None):
             return None
-        bsn_size = ret[1]   # Firmware returns the CID size (96 Bits, 12 bytes, 3 words)
-        ret = self._read(bsn_size)
         self.board_serial_number = ret
         return ret
 
+    @_transaction
     def read_eeprom(self, print_human_readable=False):
-        cmd_array = [0x00] * _CMD.CMD_LEN
-        cmd_array[0] = (_CMD.FW_EEPROM << 1) | _CMD.R
-        self._write(cmd_array)
-        time.sleep(self._delay)
-        ret = self._read(_RET_VAL.RET_LEN)
-        if(ret[0] & _RET_VAL.MASK_READ_GOOD != _RET_VAL.MASK_READ_GOOD):
-            print("Failed to understand command, RET_VAL is not READ_GOOD")
+        status, eeprom_size = self._command(_CMDS['FW_EEPROM', _CMD.R])
+        if(status & _RET_VAL.MASK_READ_GOOD != _RET_VAL.MASK_READ_GOOD):
+            self._print_error("Failed to understand command, RET_VAL is not READ_GOOD")
             return None
-        eeprom_size = ret[1]
         ret = self._read(eeprom_size)
         data_len = len(ret)
         nfields = int(data_len/16)
@@ -525,33 +1366,34 @@ class UMux_IF_Rev1:
                 print("  " + text_array[idx])
         return text_array
 
+    @_transaction
     def _write_eeprom(self, bsn, mcu_pn, freq_range, mixer_pn, synth_pn, bb_pn, lo_leak_pn):
         if(len(bsn) > 16):
-            print("BSN is too long")
+            self._print_error("BSN is too long")
             return
         
         if(len(mcu_pn) > 16):
-            print("mcu_pn is too long")
+            self._print_error("mcu_pn is too long")
             return
 
         if(len(freq_range) > 16):
-            print("freq_range is too long")
+            self._print_error("freq_range is too long")
             return
 
         if(len(mixer_pn) > 16):
-            print("mixer_pn is too long")
+            self._print_error("mixer_pn is too long")
             return
         
         if(len(synth_pn) > 16):
-            print("synth_pn is too long")
+            self._print_error("synth_pn is too long")
             return
         
         if(len(bb_pn) > 16):
-            print("bb_pn is too long")
+            self._print_error("bb_pn is too long")
             return
 
         if(len(lo_leak_pn) > 16):
-            print("lo_leak_pn is too long")
+            self._print_error("lo_leak_pn is too long")
             return
 
         print("All entries are less than 16 bytes length")
@@ -568,52 +1410,38 @@ class UMux_IF_Rev1:
 
         final_bytes = bytearray(final_string, "utf8")
 
-        cmd_array = [0x00] * _CMD.CMD_LEN
-        cmd_array[0] = (_CMD.PROG_EEPROM << 1) | _CMD.W
-        cmd_array[1] = 112
-        self._write(cmd_array)
-        time.sleep(self._delay)
-        ret = self._read(_RET_VAL.RET_LEN)
-        if(ret[0] & _RET_VAL.MASK_WRITE_GOOD != _RET_VAL.MASK_WRITE_GOOD):
-            print("Failed to understand command, RET_VAL is not WRITE_GOOD")
+        status, nbytes = self._command(_CMDS['PROG_EEPROM', _CMD.W], 112)
+        if(status & _RET_VAL.MASK_WRITE_GOOD != _RET_VAL.MASK_WRITE_GOOD):
+            self._print_error("Failed to understand command, RET_VAL is not WRITE_GOOD")
             return None
-        if(ret[1] != len(final_bytes)):
-            print("Device did not return the expected number of bytes for the next step")
+        if(nbytes != len(final_bytes)):
+            self._print_error("Device did not return the expected number of bytes for the next step")
             return None
 
         self._write(final_bytes)
-        time.sleep(10)
-        ret = self._read(_RET_VAL.RET_LEN)
+        ret = self._read_ret(timeout_s=10)
         if(ret[0] & _RET_VAL.MASK_WRITE_GOOD != _RET_VAL.MASK_WRITE_GOOD):
-            print("Something went wrong during writing to the EEPROM")
+            self._print_error("Something went wrong during writing to the EEPROM")
             return None
 
+    @_transaction
     def _read_temp_threshold(self):
-        array = [0x00] * _CMD.CMD_LEN
-        array[0] = (_CMD.TEMP_THLD << 1) | _CMD.R
-        self._write(array)
-        time.sleep(self._delay + self._delay_i2c)
-        ret = self._read(_RET_VAL.RET_LEN)
-        if(ret[0] & _RET_VAL.MASK_READ_GOOD):
-            synth_temp_F = self._tmp.convert_int2temp_C(ret[1:3])
-            mcu_temp_F = self._tmp.convert_int2temp_C(ret[3:5])
+        status, synth, mcu = self._command(_CMDS['TEMP_THLD', _CMD.R])
+        if(status & _RET_VAL.MASK_READ_GOOD):
+            synth_temp_F = self._tmp.convert_int2temp_C(synth)
+            mcu_temp_F = self._tmp.convert_int2temp_C(mcu)
             return (synth_temp_F, mcu_temp_F)
         else:
-            print("Read threshold Tempereatures Failed")
+            self._print_error("Read threshold Tempereatures Failed")
             return (None, None)
 
+    @_transaction
     def _write_temp_threshold(self, temp_C):
-        array = [0x00] * _CMD.CMD_LEN
-        array[0] = (_CMD.TEMP_THLD << 1) | _CMD.W
-        temp_var = int(temp_C / 0.0625)
-        array[1] = 0xFF & (temp_var >> 4)
-        array[2] = 0xFF & (temp_var << 4)
-        array[3] = array[1]
-        array[4] = array[2]
-        self._write(array)
-        ret = self._read(_RET_VAL.RET_LEN)
-        if(ret[0] & _RET_VAL.MASK_WRITE_GOOD != _RET_VAL.MASK_WRITE_GOOD):
-            print("Was unable to set temperature threshold")
+        # 12 bit TMP275 format, left justified
+        temp_var = (int(temp_C / 0.0625) << 4) & 0xFFFF
+        status, = self._command(_CMDS['TEMP_THLD', _CMD.W], temp_var, temp_var)
+        if(status & _RET_VAL.MASK_WRITE_GOOD != _RET_VAL.MASK_WRITE_GOOD):
+            self._print_error("Was unable to set temperature threshold")
             return
         else:
             return